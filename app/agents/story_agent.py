@@ -1,12 +1,25 @@
 # 物語生成エージェント
 
+import asyncio
 import logging
-from typing import Dict, List, Any
+import time
+from typing import AsyncIterator, Dict, List, Any, Optional
 from sqlalchemy.orm import Session
-from app.services.ai.gemini_client import get_gemini_client
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.core.rate_limit import RouteBudgetExceeded
+from app.database.session import SessionLocal
+from app.services.ai.gemini_client import StructuredOutputError, get_gemini_client
 from app.services.vision_analysis import vision_service
+from app.services.question_bank import lookup_questions
+from app.services.similarity_index import find_similar_questions
+from app.services.local_validator import compact_interview, pre_validate
+from app.services.validation_store import validation_fingerprint, validation_store
 from app.models.story_question import StoryQuestion
-from app.schemas.story_question import StoryQuestionCreate
+from app.models.story_answer import StoryAnswer
+from app.models.book import Book
+from app.models.book_page import BookPage
+from app.schemas.llm_output import OutlineOutput, QuestionSetOutput, ValidationOutput
 
 logger = logging.getLogger(__name__)
 
@@ -46,7 +59,8 @@ class StoryAgent:
     async def generate_questions(self, asset_id: int, missing_elements: List[str]) -> List[Dict[str, Any]]:
         """不足要素を基に質問を生成"""
         try:
-            vision_analysis = vision_service.get_analysis_result(asset_id)
+            # 同期の DB アクセスはイベントループを止めないようにスレッドで実行
+            vision_analysis = await asyncio.to_thread(vision_service.get_analysis_result, asset_id)
             if not vision_analysis:
                 return [{
                     "target_element": "主人公",
@@ -56,6 +70,19 @@ class StoryAgent:
                     "followups": ["なまえは なに？"]
                 }]
             
+            # 質問バンクでカバーできる場合は LLM を呼ばない
+            bank_questions = lookup_questions(asset_id, vision_analysis.get("tags", []), missing_elements)
+            if bank_questions:
+                logger.info(f"質問バンクから質問を返します (asset_id: {asset_id}, 質問数: {len(bank_questions)})")
+                return bank_questions
+            
+            # 類似した過去画像の質問を再利用できる場合も LLM を呼ばない
+            similar_questions = await asyncio.to_thread(
+                find_similar_questions, asset_id, vision_analysis.get("tags", []), missing_elements
+            )
+            if similar_questions:
+                return similar_questions
+            
             # --- 新しい質問生成ロジック ---
             system_message = """あなたは「物語の穴うめインタビュアー（3〜6歳向け）」です。
 
@@ -121,50 +148,13 @@ class StoryAgent:
 必ずJSON形式のみで回答してください。
 """
             
-            response = await self.gemini.generate_creative_text(prompt, system_message)
-            print(f"=== DEBUG: Gemini応答の長さ: {len(response)}文字 ===")
-            print(f"=== DEBUG: Gemini応答（最初の500文字）: {response[:500]} ===")
-            print(f"=== DEBUG: Gemini応答（最後の500文字）: {response[-500:]} ===")
-            logger.info(f"Gemini応答の長さ: {len(response)}文字")
-            logger.info(f"Gemini応答（最初の500文字）: {response[:500]}")
-            logger.info(f"Gemini応答（最後の500文字）: {response[-500:]}")
-            
-            try:
-                parsed_response = self.gemini._parse_json_response(response)
-                print(f"=== DEBUG: パース結果: {parsed_response} ===")
-                logger.info(f"パース結果: {parsed_response}")
-                
-                # 新しい形式の質問を返す
-                questions = parsed_response.get("questions", [])
-                
-                # 質問が空の場合のフォールバック
-                if not questions:
-                    logger.warning("質問が生成されませんでした。フォールバック質問を使用します。")
-                    questions = [
-                        {
-                            "target_element": "主人公",
-                            "reason": "フォールバック質問",
-                            "question": "この えの しゅじんこうは だれかな？",
-                            "type": "open",
-                            "followups": ["なまえは なに？"]
-                        }
-                    ]
-                
-                return questions
-                
-            except Exception as parse_error:
-                logger.error(f"JSON解析エラー: {str(parse_error)}")
-                logger.error(f"Gemini応答全体: {response}")
-                return [
-                    {
-                        "target_element": "主人公",
-                        "reason": "JSON解析エラー",
-                        "question": "この えの しゅじんこうは だれかな？",
-                        "type": "open",
-                        "followups": ["なまえは なに？"]
-                    }
-                ]
+            result = await self.gemini.generate_structured(prompt, system_message, QuestionSetOutput,
+                                                           creative=True, task="questions")
+            logger.info(f"質問を生成しました (asset_id: {asset_id}, 質問数: {len(result.questions)})")
+            return [question.model_dump(exclude_none=True) for question in result.questions]
             
+        except RouteBudgetExceeded:
+            raise  # フォールバックの質問を保存せず、429 で再送してもらう
         except Exception as e:
             logger.error(f"質問生成エラー (asset_id: {asset_id}): {str(e)}")
             return [
@@ -224,13 +214,21 @@ class StoryAgent:
             db.rollback()
             raise e
     
-    async def validate_collected_information(self, image_id: int, questions: List[Dict[str, Any]], answers: List[Dict[str, Any]]) -> Dict[str, Any]:
-        """収集した情報の品質を検証"""
+    async def validate_collected_information(self, image_id: int, questions: List[Dict[str, Any]], answers: List[Dict[str, Any]],
+                                             vision_analysis: Optional[Dict[str, Any]] = None, force: bool = False) -> Dict[str, Any]:
+        """
+        収集した情報の品質を検証（vision_analysis を渡した場合は DB から読み直さない）
+        
+        先にルールで検証し、明らかに不足・明らかに十分な場合は LLM を呼ばずにその結果を返す。
+        それ以外は、質問・回答・解析結果が前回の検証から変わっていなければ保存済みの結果を返し（force=True の場合は再検証）、
+        変わっていればルールでの判定内容を渡して LLM で検証する。
+        """
         try:
             logger.info(f"情報検証開始 (image_id: {image_id}, 質問数: {len(questions)}, 回答数: {len(answers)})")
             
             # Vision解析結果を取得
-            vision_analysis = vision_service.get_analysis_result(image_id)
+            if vision_analysis is None:
+                vision_analysis = vision_service.get_analysis_result(image_id)
             if not vision_analysis:
                 return {
                     "status": "error",
@@ -238,6 +236,39 @@ class StoryAgent:
                     "validation_result": None
                 }
             
+            local = None
+            if settings.local_validation_enabled:
+                start = time.perf_counter()
+                local = pre_validate(questions, answers)
+                metrics.observe("story.local_validation", time.perf_counter() - start)
+                metrics.increment("story.local_validation.hit" if local.decisive else "story.local_validation.miss")
+                if local.decisive:
+                    logger.info(f"ルールで検証しました (image_id: {image_id}, 判定: {local.verdict})")
+                    return {
+                        "status": "success",
+                        "image_id": image_id,
+                        "validation_result": local.validation_result,
+                        "meta": local.meta,
+                        "message": "情報検証が完了しました（ルールによる判定）"
+                    }
+            
+            fingerprint = None
+            if settings.validation_cache_enabled:
+                fingerprint = validation_fingerprint(questions, answers, vision_analysis)
+                if force:
+                    metrics.increment("story.validation_cache.bypass")
+                else:
+                    stored = await asyncio.to_thread(validation_store.get, image_id, fingerprint)
+                    if stored is not None:
+                        logger.info(f"保存済みの検証結果を返します (image_id: {image_id})")
+                        return {
+                            "status": "success",
+                            "image_id": image_id,
+                            "validation_result": stored["validation_result"],
+                            "meta": {**stored.get("meta", {}), "cached": True},
+                            "message": "情報検証が完了しました（保存済みの結果）"
+                        }
+            
             # 検証用のプロンプトを作成
             system_message = """あなたは「3-6歳向け物語作成の情報品質チェッカー」です。
 
@@ -300,7 +331,25 @@ class StoryAgent:
 # 出力は純粋なJSON形式のみ。```jsonで囲まず、他の説明も不要。"""
 
             # ユーザーメッセージを作成
-            prompt = f"""
+            if local is not None:
+                # ルールで判定済みの完全性は渡すだけにし、質問・回答は要約して送る
+                completeness = local.validation_result["completeness"]
+                findings = "\n".join(f"- {finding}" for finding in local.findings) or "- なし"
+                prompt = f"""
+画像のタグ: {vision_analysis.get("tags", [])}
+
+インタビュー（[要素] 質問 → 回答）:
+{compact_interview(questions, answers)}
+
+ルールによる事前判定（完全性はこの判定を使います）:
+- 完全性: {completeness["score"]}点（充足: {"、".join(completeness["sufficient_elements"]) or "なし"} / 不足: {"、".join(completeness["missing_elements"]) or "なし"}）
+{findings}
+
+上記を前提に、物語の一貫性と年齢適切性を中心に、3-6歳向け物語作成に必要な情報の品質を検証してください。
+必ずJSON形式のみで回答してください。
+"""
+            else:
+                prompt = f"""
 画像解析結果: {vision_analysis}
 
 生成された質問:
@@ -313,60 +362,36 @@ class StoryAgent:
 必ずJSON形式のみで回答してください。
 """
             
-            response = await self.gemini.generate_creative_text(prompt, system_message)
-            logger.info(f"情報検証Gemini応答: {response[:500]}...")
-            
             try:
-                parsed_response = self.gemini._parse_json_response(response)
-                logger.info(f"情報検証結果: {parsed_response}")
-                
+                parsed = await self.gemini.generate_structured(prompt, system_message, ValidationOutput,
+                                                               creative=True, task="validation")
+            except StructuredOutputError:
+                if local is None:
+                    raise
+                # 修正を依頼しても応答がスキーマに合わない場合は、ルールによる判定を返す（保存はしない）
+                logger.warning(f"LLM の検証結果が得られないため、ルールによる判定を返します (image_id: {image_id})")
                 return {
                     "status": "success",
                     "image_id": image_id,
-                    "validation_result": parsed_response.get("validation_result", {}),
-                    "meta": parsed_response.get("meta", {}),
-                    "message": "情報検証が完了しました"
-                }
-                
-            except Exception as parse_error:
-                logger.error(f"情報検証JSON解析エラー: {str(parse_error)}")
-                logger.error(f"Gemini応答全体: {response}")
-                
-                # フォールバック検証結果
-                return {
-                    "status": "partial_success",
-                    "image_id": image_id,
-                    "validation_result": {
-                        "overall_score": 70,
-                        "completeness": {
-                            "score": 70,
-                            "missing_elements": ["詳細な検証が必要"],
-                            "sufficient_elements": ["基本情報は収集済み"]
-                        },
-                        "age_appropriateness": {
-                            "score": 80,
-                            "issues": [],
-                            "strengths": ["回答が収集されている"]
-                        },
-                        "story_coherence": {
-                            "score": 70,
-                            "issues": ["詳細な検証が必要"],
-                            "suggestions": ["情報の再確認を推奨"]
-                        },
-                        "recommendations": [
-                            "回答の詳細を確認してください",
-                            "不足している情報があれば追加してください"
-                        ],
-                        "ready_for_story": True
-                    },
-                    "meta": {
-                        "total_questions": len(questions),
-                        "answered_questions": len(answers),
-                        "validation_timestamp": "2024-01-01T00:00:00Z"
-                    },
-                    "message": "情報検証が完了しました（簡易版）"
+                    "validation_result": local.validation_result,
+                    "meta": {**local.meta, "llm_failed": True},
+                    "message": "情報検証が完了しました（ルールによる判定）"
                 }
             
+            result = parsed.model_dump()
+            if local is not None:
+                result["validation_result"]["completeness"] = local.validation_result["completeness"]
+                result["meta"] = {**local.meta, **result["meta"], "validated_by": "llm"}
+            if fingerprint is not None:
+                await asyncio.to_thread(validation_store.save, image_id, fingerprint, result)
+            
+            return {
+                "status": "success",
+                "image_id": image_id,
+                **result,
+                "message": "情報検証が完了しました"
+            }
+            
         except Exception as e:
             logger.error(f"情報検証エラー (image_id: {image_id}): {str(e)}")
             return {
@@ -376,6 +401,178 @@ class StoryAgent:
                 "message": "情報検証中にエラーが発生しました"
             }
 
+    def load_interview(self, db: Session, image_id: int) -> List[Dict[str, Any]]:
+        """画像の質問と回答を対にして取得（未回答の質問は answer が None）"""
+        questions = db.query(StoryQuestion).filter(StoryQuestion.image_id == image_id).order_by(StoryQuestion.id).all()
+        answers = (
+            db.query(StoryAnswer)
+            .join(StoryQuestion)
+            .filter(StoryQuestion.image_id == image_id)
+            .order_by(StoryAnswer.id)
+            .all()
+        )
+        latest = {answer.question_id: answer for answer in answers}  # 同じ質問への回答は最新のもの
+        interview = []
+        for question in questions:
+            answer = latest.get(question.id)
+            interview.append({
+                "target_element": question.target_element,
+                "question": question.question_text,
+                "answer": (answer.selected_option or answer.answer_text) if answer else None,
+                "followup_answers": answer.followup_answers if answer else None,
+            })
+        return interview
+    
+    async def generate_outline(self, image_id: int, interview: List[Dict[str, Any]], page_count: int) -> Dict[str, Any]:
+        """インタビュー結果から絵本の構成（タイトルとページごとのあらすじ）を生成"""
+        vision_analysis = await asyncio.to_thread(vision_service.get_analysis_result, image_id) or {}
+        
+        system_message = f"""あなたは「3-6歳向け絵本の構成作家」です。
+子どもへのインタビューの回答を基に、{page_count}ページの絵本の構成を考えてください。
+
+# 重要な指示
+あなたの回答は必ず以下のJSON形式で出力してください。```jsonで囲まず、純粋なJSONのみを出力してください。
+
+{{
+  "title": "ポチの だいぼうけん",
+  "pages": [
+    {{"page_number": 1, "summary": "こうえんで げんきな いぬの ポチが あそんでいる"}},
+    {{"page_number": 2, "summary": "ポチが ないている ことりを みつける"}}
+  ]
+}}
+
+# 構成の基準
+- 子どもの回答（主人公・舞台・気持ち・問題・解決）をできるだけそのまま使う
+- はじまり → 問題 → 解決 → おしまい の流れにする
+- pages はちょうど {page_count} 件
+- タイトルとあらすじはひらがな中心"""
+        
+        prompt = f"""
+画像のタグ: {vision_analysis.get("tags", [])}
+
+インタビュー（質問と子どもの回答）:
+{interview}
+"""
+        result = await self.gemini.generate_structured(prompt, system_message, OutlineOutput,
+                                                       creative=True, task="outline")
+        pages = [page.model_dump() for page in result.pages[:page_count]]
+        for number, page in enumerate(pages, start=1):
+            page["page_number"] = number
+        return {"title": result.title, "pages": pages}
+    
+    async def generate_page_caption(self, outline: Dict[str, Any], page: Dict[str, Any]) -> str:
+        """1ページ分の本文を生成（前後のページのあらすじを渡して流れをつなげる）"""
+        system_message = """あなたは「3-6歳向け絵本の文章作家」です。
+絵本の1ページ分の本文を書いてください。
+
+# 基準
+- ひらがな中心、1〜3文の短い文
+- 単語の間は読みやすいように空白で区切る
+- 本文のみを出力（説明や記号は不要）"""
+        
+        pages = outline["pages"]
+        index = page["page_number"] - 1
+        previous = pages[index - 1]["summary"] if index > 0 else "（なし。最初のページ）"
+        following = pages[index + 1]["summary"] if index + 1 < len(pages) else "（なし。最後のページ）"
+        prompt = f"""
+タイトル: {outline["title"]}
+全体の構成: {[p["summary"] for p in pages]}
+
+前のページ: {previous}
+このページ（{page["page_number"]} / {len(pages)}）: {page["summary"]}
+次のページ: {following}
+"""
+        response = await self.gemini.generate_creative_text(prompt, system_message, task="caption")
+        return response.strip().strip("「」\"")
+    
+    def save_book(self, title: str, captions: Dict[int, str], image_ids: List[int], user_id: Optional[int]) -> int:
+        """Book と全 BookPage を1トランザクションで保存（同期処理のため asyncio.to_thread から呼ぶ）"""
+        db = SessionLocal()
+        try:
+            book = Book(title=title, user_id=user_id)
+            book.pages = [
+                BookPage(
+                    image_id=image_ids[(number - 1) % len(image_ids)],
+                    page_number=number,
+                    caption=captions[number]
+                )
+                for number in sorted(captions)
+            ]
+            db.add(book)
+            db.commit()
+            return book.id
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+    
+    async def generate_book(self, image_id: int, interview: List[Dict[str, Any]], page_count: int,
+                            image_ids: List[int], title: Optional[str] = None,
+                            user_id: Optional[int] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        インタビュー結果から絵本を生成する
+        
+        構成を1回の LLM 呼び出しで作り、ページ本文はセマフォで同時実行数を制限しながら並行生成する。
+        ページは完成した順にイベントとして返し、最後に Book と全 BookPage を1トランザクションで保存する。
+        
+        Yields:
+            Dict: outline / page / book / error のイベント
+        """
+        start = time.perf_counter()
+        try:
+            outline = await self.generate_outline(image_id, interview, page_count)
+        except Exception as e:
+            logger.error(f"絵本構成の生成エラー (image_id: {image_id}): {str(e)}")
+            yield {"event": "error", "message": "絵本の構成の生成中にエラーが発生しました"}
+            return
+        metrics.observe("story_generation.outline", time.perf_counter() - start)
+        if title:
+            outline["title"] = title
+        yield {"event": "outline", "title": outline["title"], "pages": outline["pages"]}
+        
+        semaphore = asyncio.Semaphore(settings.story_page_concurrency)
+        
+        async def write_page(page: Dict[str, Any]) -> Dict[str, Any]:
+            async with semaphore:
+                page_start = time.perf_counter()
+                try:
+                    caption = await self.generate_page_caption(outline, page)
+                    fallback = not caption
+                except Exception as e:
+                    logger.warning(f"ページ本文の生成エラー (image_id: {image_id}, page: {page['page_number']}): {str(e)}")
+                    caption, fallback = "", True
+                metrics.observe("story_generation.page", time.perf_counter() - page_start)
+            if fallback:
+                # 本文が作れなかったページはあらすじをそのまま使う
+                metrics.increment("story_generation.page_fallback")
+                caption = page["summary"]
+            return {"event": "page", "page_number": page["page_number"], "caption": caption, "fallback": fallback}
+        
+        tasks = [asyncio.create_task(write_page(page)) for page in outline["pages"]]
+        captions = {}
+        try:
+            for next_page in asyncio.as_completed(tasks):
+                event = await next_page
+                captions[event["page_number"]] = event["caption"]
+                yield event
+        finally:
+            # クライアントが切断した場合は残りの生成を止める
+            for task in tasks:
+                task.cancel()
+        
+        try:
+            book_id = await asyncio.to_thread(self.save_book, outline["title"], captions, image_ids, user_id)
+        except Exception as e:
+            logger.error(f"絵本の保存エラー (image_id: {image_id}): {str(e)}")
+            yield {"event": "error", "message": "絵本の保存中にエラーが発生しました"}
+            return
+        
+        elapsed = time.perf_counter() - start
+        metrics.observe("story_generation.total", elapsed)
+        logger.info(f"絵本生成完了 (image_id: {image_id}, book_id: {book_id}, ページ数: {len(captions)}, {elapsed:.2f}秒)")
+        yield {"event": "book", "book_id": book_id, "title": outline["title"], "page_count": len(captions)}
+
 # シングルトンインスタンス（遅延初期化）
 _story_agent = None
 
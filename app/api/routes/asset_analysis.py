@@ -1,6 +1,7 @@
 from fastapi import APIRouter, HTTPException, status
-from typing import Dict, Any
-from app.services.vision_analysis import vision_service
+import asyncio
+from app.services.vision_analysis import vision_service, analysis_payload, ANALYSIS_PROFILES, DEFAULT_PROFILE
+from app.schemas.asset_analysis import AssetAnalysisResponse
 import logging
 
 logger = logging.getLogger(__name__)
@@ -8,25 +9,35 @@ logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/api/assets", tags=["asset-analysis"])
 
 
-@router.post("/{id}/analyze", response_model=Dict[str, Any])
-async def analyze_asset(id: int):
+@router.post("/{id}/analyze", response_model=AssetAnalysisResponse, response_model_exclude_none=True)
+async def analyze_asset(id: int, profile: str = DEFAULT_PROFILE, verbose: bool = False):
     """
     指定されたアセットを Google Cloud Vision API で解析し、結果をデータベースに保存する
     
+    解析済みの場合は、指定プロファイルに不足している特徴だけを追加で取得する。
+    
     Args:
         id: 解析対象のアセットID
+        profile: 解析プロファイル（fast = ラベルのみ, standard = ラベル + オブジェクト, full = 全特徴）
+        verbose: True の場合は Vision の生データ（raw）も返す
         
     Returns:
-        Dict: 解析結果（tags, palette, geometry）
+        AssetAnalysisResponse: 解析結果（tags, palette, geometry, profile, features）
     """
+    if profile not in ANALYSIS_PROFILES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"不明な解析プロファイルです: {profile}（{', '.join(ANALYSIS_PROFILES)} のいずれかを指定してください）"
+        )
+    
     try:
-        logger.info(f"アセット解析開始 (id: {id})")
+        logger.info(f"アセット解析開始 (id: {id}, profile: {profile})")
         
-        # Vision API で画像を解析
-        analysis_result = vision_service.analyze_image(id)
+        # Vision API で画像を解析（Vision API・ローカル計算の待ちと DB アクセスはイベントループを止めないようスレッドで実行）
+        analysis_result = await asyncio.to_thread(vision_service.analyze_image, id, profile)
         
         # 解析結果をデータベースに保存
-        save_success = vision_service.save_analysis_result(id, analysis_result)
+        save_success = await asyncio.to_thread(vision_service.save_analysis_result, id, analysis_result)
         
         if not save_success:
             raise HTTPException(
@@ -39,7 +50,7 @@ async def analyze_asset(id: int):
         return {
             "id": id,
             "status": "success",
-            "analysis": analysis_result
+            "analysis": analysis_payload(analysis_result, verbose)
         }
         
     except ValueError as e:
@@ -56,22 +67,23 @@ async def analyze_asset(id: int):
         )
 
 
-@router.get("/{id}/features", response_model=Dict[str, Any])
-async def get_asset_features(id: int):
+@router.get("/{id}/features", response_model=AssetAnalysisResponse, response_model_exclude_none=True)
+async def get_asset_features(id: int, verbose: bool = False):
     """
     指定されたアセットの保存済み解析結果を取得する
     
     Args:
         id: 対象のアセットID
+        verbose: True の場合は Vision の生データ（raw）も返す
         
     Returns:
-        Dict: 保存済みの解析結果
+        AssetAnalysisResponse: 保存済みの解析結果
     """
     try:
         logger.info(f"アセット特徴取得開始 (id: {id})")
         
         # 保存済みの解析結果を取得
-        analysis_result = vision_service.get_analysis_result(id)
+        analysis_result = vision_service.get_analysis_result(id, include_raw=verbose)
         
         if analysis_result is None:
             raise HTTPException(
@@ -84,7 +96,7 @@ async def get_asset_features(id: int):
         return {
             "id": id,
             "status": "success",
-            "analysis": analysis_result
+            "analysis": analysis_payload(analysis_result, verbose)
         }
         
     except ValueError as e:
@@ -0,0 +1,181 @@
+from fastapi import APIRouter, HTTPException, status, Depends, Request
+from fastapi.responses import FileResponse, StreamingResponse
+from typing import List, Optional
+from urllib.parse import quote
+from sqlalchemy.orm import Session
+from app.database.session import SessionLocal, ReadSessionLocal
+from app.models.book import Book
+from app.schemas.book import BookResponse, BookPageResponse, BookRenderResponse
+from app.services.book_renderer import book_render_service, RENDERED_DIR_NAME
+from app.services.book_export import book_export_service, EXPORT_FORMATS
+from app.services.page_renderer import PAGE_TEMPLATES
+import logging
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/api/books", tags=["book"])
+
+def get_db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+# 読み取り専用（リードレプリカ）
+def get_read_db():
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+def page_responses(request: Request, book: Book) -> List[BookPageResponse]:
+    """ページ一覧（描画済みのページには配信URLを付ける）"""
+    base_url = str(request.base_url).rstrip("/")
+    pages = []
+    for page in book.pages:
+        response = BookPageResponse.model_validate(page)
+        if page.rendered_filename:
+            response.rendered_url = f"{base_url}/uploads/{RENDERED_DIR_NAME}/{page.rendered_filename}"
+        pages.append(response)
+    return pages
+
+@router.get("/{id}", response_model=BookResponse)
+async def get_book(id: int, request: Request, db: Session = Depends(get_read_db)):
+    """
+    本とページ一覧を取得
+
+    Args:
+        id: 本のID
+
+    Returns:
+        BookResponse: 本の情報とページ一覧
+    """
+    book = db.query(Book).filter(Book.id == id).first()
+    if book is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"本 {id} が見つかりません")
+
+    return BookResponse(
+        id=book.id,
+        title=book.title,
+        user_id=book.user_id,
+        created_at=book.created_at,
+        pages=page_responses(request, book)
+    )
+
+@router.post("/{id}/render", response_model=BookRenderResponse)
+async def render_book(
+    id: int,
+    request: Request,
+    template: Optional[str] = None,
+    force: bool = False,
+    db: Session = Depends(get_db)
+):
+    """
+    本の全ページを描画（画像とキャプションを合成）
+
+    内容が変わっていないページは描画済みの画像を再利用する。
+
+    Args:
+        id: 本のID
+        template: レイアウトテンプレート（caption_bottom / caption_overlay / square。未指定の場合は設定値）
+        force: True の場合はキャッシュを使わずに描画し直す
+
+    Returns:
+        BookRenderResponse: 描画結果とページ一覧
+    """
+    if template is not None and template not in PAGE_TEMPLATES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"不明なテンプレートです: {template}（{', '.join(PAGE_TEMPLATES)} のいずれかを指定してください）"
+        )
+
+    try:
+        logger.info(f"本の描画開始 (id: {id}, template: {template})")
+
+        result = await book_render_service.render_book(db, id, template, force)
+
+        return {
+            "id": id,
+            "status": "success",
+            "template": result["template"],
+            "rendered": result["rendered"],
+            "cached": result["cached"],
+            "pages": page_responses(request, result["book"])
+        }
+
+    except ValueError as e:
+        logger.warning(f"本の描画エラー (id: {id}): {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=str(e)
+        )
+    except Exception as e:
+        logger.error(f"本の描画エラー (id: {id}): {str(e)}")
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="本の描画中にエラーが発生しました"
+        )
+
+@router.get("/{id}/export")
+async def export_book(
+    id: int,
+    format: str = "pdf",
+    template: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    本を PDF / ZIP で書き出す
+
+    ページ画像を1ページずつ読み込みながら送信するため、メモリ使用量はページ数によらない。
+    同じ内容の書き出しは保存済みのファイルを返し、Range リクエスト（再開）にも対応する。
+
+    Args:
+        id: 本のID
+        format: pdf / zip
+        template: 指定した場合はこのテンプレートで描画し直す（未指定の場合は描画済みのページを使う）
+
+    Returns:
+        application/pdf または application/zip
+    """
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"不明な形式です: {format}（{', '.join(EXPORT_FORMATS)} のいずれかを指定してください）"
+        )
+    if template is not None and template not in PAGE_TEMPLATES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"不明なテンプレートです: {template}（{', '.join(PAGE_TEMPLATES)} のいずれかを指定してください）"
+        )
+
+    try:
+        logger.info(f"本の書き出し開始 (id: {id}, format: {format})")
+
+        export = await book_export_service.prepare(db, id, format, template)
+
+    except ValueError as e:
+        logger.warning(f"本の書き出しエラー (id: {id}): {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=str(e)
+        )
+    except Exception as e:
+        logger.error(f"本の書き出しエラー (id: {id}): {str(e)}")
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="本の書き出し中にエラーが発生しました"
+        )
+
+    if export["cached"]:
+        return FileResponse(export["path"], media_type=export["media_type"], filename=export["filename"])
+
+    # 初回は逐次生成して送信（同時にキャッシュを作成）
+    return StreamingResponse(
+        book_export_service.stream(export),
+        media_type=export["media_type"],
+        headers={"Content-Disposition": f"attachment; filename*=utf-8''{quote(export['filename'])}"}
+    )
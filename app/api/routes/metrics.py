@@ -0,0 +1,16 @@
+from fastapi import APIRouter
+from typing import Dict, Any
+from app.core.metrics import metrics
+
+router = APIRouter(prefix="/api/metrics", tags=["metrics"])
+
+
+@router.get("", response_model=Dict[str, Any])
+async def get_metrics():
+    """
+    プロセス内メトリクスを取得する
+    
+    Returns:
+        Dict: カウンター、ゲージ、ヒット率、レイテンシ要約
+    """
+    return metrics.snapshot()
@@ -1,11 +1,21 @@
-from fastapi import APIRouter, HTTPException, status, Depends
-from typing import Dict, List, Any
+from fastapi import APIRouter, HTTPException, status, Depends, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from typing import AsyncIterator, Dict, List, Any
+import asyncio
+import json
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from app.database.session import SessionLocal
 from app.agents.story_agent import get_story_agent
+from app.services.interview_session import InterviewSession
+from app.services.validation_store import validation_store
+from app.services.vision_analysis import analysis_payload
 from app.models.story_answer import StoryAnswer
-from app.schemas.story_answer import AnswerSubmissionRequest, StoryAnswerCreate
+from app.models.upload_image import UploadImage
+from app.core.config import settings
+from app.core.rate_limit import charge_route_budget
+from app.schemas.story_answer import AnswerSubmissionRequest
+from app.schemas.story import StoryAnalysisResponse, QuestionsResponse, AnswersResponse, ValidationResponse, GenerateStoryRequest
 import logging
 
 logger = logging.getLogger(__name__)
@@ -22,16 +32,17 @@ def get_db():
     finally:
         db.close()
 
-@router.post("/{id}/analyze", response_model=Dict[str, Any])
-async def analyze_image_for_story(id: int):
+@router.post("/{id}/analyze", response_model=StoryAnalysisResponse, response_model_exclude_none=True)
+async def analyze_image_for_story(id: int, verbose: bool = False):
     """
     画像を物語生成用に分析
     
     Args:
         id: 画像のID
+        verbose: True の場合は Vision の解析結果（vision_analysis）も返す
         
     Returns:
-        Dict: 分析結果と不足要素
+        StoryAnalysisResponse: 分析結果と不足要素
     """
     try:
         logger.info(f"物語分析開始 (id: {id})")
@@ -46,6 +57,11 @@ async def analyze_image_for_story(id: int):
             )
         
         logger.info(f"物語分析完了 (id: {id})")
+        
+        # Vision の解析結果は /api/assets/{id}/features で取得できるため既定では返さない
+        vision_analysis = result.pop("vision_analysis", None)
+        if verbose and vision_analysis:
+            result["vision_analysis"] = analysis_payload(vision_analysis, verbose)
         return result
         
     except HTTPException:
@@ -57,10 +73,11 @@ async def analyze_image_for_story(id: int):
             detail="物語分析中にエラーが発生しました"
         )
 
-@router.post("/{id}/questions", response_model=Dict[str, Any])
+@router.post("/{id}/questions", response_model=QuestionsResponse, response_model_exclude_none=True)
 async def generate_story_questions(
     id: int,
     request: QuestionsRequest,
+    verbose: bool = False,
     db: Session = Depends(get_db)
 ):
     """
@@ -69,10 +86,11 @@ async def generate_story_questions(
     Args:
         id: 画像のID
         request: 不足要素のリストを含むリクエストボディ
+        verbose: True の場合は保存前の生成結果（questions）も返す
         db: データベースセッション
         
     Returns:
-        Dict: 生成された質問とDB保存結果
+        QuestionsResponse: DB保存された質問
     """
     try:
         logger.info(f"質問生成開始 (id: {id})")
@@ -83,13 +101,15 @@ async def generate_story_questions(
         # 質問をDBに保存
         saved_questions = await story_agent.save_questions_to_db(db, id, questions)
         
-        return {
+        response = {
             "id": id,
             "missing_elements": request.missing_elements,
-            "questions": questions,
             "saved_questions": saved_questions,
             "status": "success"
         }
+        if verbose:
+            response["questions"] = questions
+        return response
         
     except Exception as e:
         logger.error(f"質問生成エラー (id: {id}): {str(e)}")
@@ -98,7 +118,7 @@ async def generate_story_questions(
             detail="質問生成中にエラーが発生しました"
         )
 
-@router.post("/answers", response_model=Dict[str, Any])
+@router.post("/answers", response_model=AnswersResponse, response_model_exclude_none=True)
 async def submit_story_answers(
     request: AnswerSubmissionRequest,
     db: Session = Depends(get_db)
@@ -111,7 +131,7 @@ async def submit_story_answers(
         db: データベースセッション
         
     Returns:
-        Dict: 保存結果
+        AnswersResponse: 保存結果
     """
     try:
         logger.info(f"回答保存開始 (回答数: {len(request.answers)})")
@@ -142,6 +162,9 @@ async def submit_story_answers(
                 "created_at": db_answer.created_at
             })
         
+        # 回答が変わったので保存済みの検証結果を破棄（回答と同じトランザクション）
+        validation_store.invalidate(db, [answer.question_id for answer in request.answers])
+        
         # トランザクションをコミット
         db.commit()
         
@@ -161,20 +184,24 @@ async def submit_story_answers(
             detail="回答保存中にエラーが発生しました"
         )
 
-@router.post("/{id}/validate", response_model=Dict[str, Any])
+@router.post("/{id}/validate", response_model=ValidationResponse, response_model_exclude_none=True)
 async def validate_collected_information(
     id: int,
+    force: bool = False,
     db: Session = Depends(get_db)
 ):
     """
     収集した情報の品質を検証
     
+    質問・回答が前回の検証から変わっていなければ、LLM を呼ばずに保存済みの結果を返す。
+    
     Args:
         id: 画像のID
+        force: True の場合は保存済みの結果を使わずに検証し直す
         db: データベースセッション
         
     Returns:
-        Dict: 検証結果
+        ValidationResponse: 検証結果
     """
     try:
         logger.info(f"情報検証開始 (id: {id})")
@@ -218,7 +245,7 @@ async def validate_collected_information(
         # 情報検証を実行
         story_agent = get_story_agent()
         validation_result = await story_agent.validate_collected_information(
-            id, questions_data, answers_data
+            id, questions_data, answers_data, force=force
         )
         
         if validation_result["status"] == "error":
@@ -238,4 +265,166 @@ async def validate_collected_information(
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="情報検証中にエラーが発生しました"
-        )
\ No newline at end of file
+        )
+
+async def ndjson(events: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[bytes]:
+    """イベントを1行1 JSON（NDJSON）に変換"""
+    async for event in events:
+        yield (json.dumps(event, ensure_ascii=False) + "\n").encode("utf-8")
+
+@router.post("/{id}/generate")
+async def generate_story_book(
+    id: int,
+    request: GenerateStoryRequest,
+    db: Session = Depends(get_db)
+):
+    """
+    インタビュー結果から絵本（Book と BookPage）を生成
+    
+    構成を作った後、ページ本文を並行して生成し、完成したページから順に NDJSON で返す。
+    
+    Args:
+        id: 画像のID
+        request: ページ数・タイトル・ページに使う画像など
+        db: データベースセッション
+        
+    Returns:
+        application/x-ndjson: outline → page（完成順）→ book のイベント（失敗時は error）
+    """
+    # 同期の DB アクセスはイベントループを止めないようにスレッドで実行
+    interview = await asyncio.to_thread(get_story_agent().load_interview, db, id)
+    if not interview:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="指定された画像の質問が見つかりません"
+        )
+    if not any(item["answer"] for item in interview):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="回答がまだありません。先に /answers で回答を保存してください"
+        )
+    
+    image_ids = request.image_ids or [id]
+    found = await asyncio.to_thread(
+        lambda: {image_id for (image_id,) in db.query(UploadImage.id).filter(UploadImage.id.in_(image_ids))}
+    )
+    missing = [image_id for image_id in image_ids if image_id not in found]
+    if missing:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"画像が見つかりません: {missing}"
+        )
+    
+    # 生成は必ず LLM を呼ぶため、ストリームを始める前にルート全体のバケットを消費する（足りなければ 429）
+    await charge_route_budget()
+    
+    logger.info(f"絵本生成開始 (id: {id}, 回答数: {sum(1 for item in interview if item['answer'])})")
+    
+    # ストリーミング中はリクエストのセッションが閉じられるため、保存はエージェント側のセッションで行う
+    events = get_story_agent().generate_book(
+        id,
+        interview,
+        request.page_count or settings.story_page_count,
+        image_ids,
+        title=request.title,
+        user_id=request.user_id
+    )
+    return StreamingResponse(ndjson(events), media_type="application/x-ndjson")
+
+
+async def send_next_question(websocket: WebSocket, session: InterviewSession) -> bool:
+    """次の質問を送る（全問回答済みなら False）"""
+    question = session.next_question()
+    if question is None:
+        return False
+    await websocket.send_json({"type": "question", "question": question})
+    return True
+
+async def send_validation(websocket: WebSocket, session: InterviewSession, force: bool = False) -> None:
+    validation = await session.validate(force=force)
+    await websocket.send_json({
+        "type": "validation",
+        "status": validation.get("status"),
+        "validation_result": validation.get("validation_result"),
+        "message": validation.get("message")
+    })
+
+@router.websocket("/{id}/interview")
+async def interview_session(websocket: WebSocket, id: int):
+    """
+    インタビューを1本の WebSocket で進める
+    
+    接続中は解析結果・質問・回答をメモリに保持し、回答は受け取った時点で確定して DB へはまとめて書き込む。
+    
+    クライアント → サーバー:
+        {"type": "answer", "question_id": 1, "answer_text": "...", "selected_option": null, "followup_answers": null}
+        {"type": "validate", "force": false}  LLM による検証を要求（force=true の場合は保存済みの結果を使わない）
+        {"type": "end"}       回答を保存して終了
+    
+    サーバー → クライアント:
+        session（開始時の状態）/ question（次の質問）/ ack / progress（ローカルの途中経過）/
+        validation（全問回答時または要求時）/ error / end
+    """
+    await websocket.accept()
+    session = InterviewSession(id, get_story_agent())
+    try:
+        await session.start()
+    except ValueError as e:
+        await websocket.send_json({"type": "error", "message": str(e)})
+        await websocket.close(code=4404)
+        return
+    except Exception as e:
+        logger.error(f"インタビュー開始エラー (id: {id}): {str(e)}")
+        await websocket.send_json({"type": "error", "message": "インタビューの開始中にエラーが発生しました"})
+        await websocket.close(code=1011)
+        return
+    
+    flusher = asyncio.create_task(session.run_flusher())
+    try:
+        await websocket.send_json({
+            "type": "session",
+            "image_id": id,
+            "tags": session.vision_analysis.get("tags", []),
+            "questions": session.questions,
+            "progress": session.progress()
+        })
+        if not await send_next_question(websocket, session):
+            await send_validation(websocket, session)
+        
+        while True:
+            try:
+                message = json.loads(await websocket.receive_text())
+            except ValueError:
+                await websocket.send_json({"type": "error", "message": "JSON 形式のメッセージを送ってください"})
+                continue
+            if not isinstance(message, dict):
+                await websocket.send_json({"type": "error", "message": "メッセージは JSON オブジェクトで送ってください"})
+                continue
+            
+            kind = message.get("type")
+            if kind == "answer":
+                try:
+                    answer = await session.record_answer(message)
+                except ValueError as e:
+                    await websocket.send_json({"type": "error", "message": str(e)})
+                    continue
+                await websocket.send_json({"type": "ack", "question_id": answer["question_id"]})
+                await websocket.send_json({"type": "progress", **session.progress()})
+                if not await send_next_question(websocket, session):
+                    await send_validation(websocket, session)
+            elif kind == "validate":
+                await send_validation(websocket, session, force=bool(message.get("force")))
+            elif kind == "end":
+                break
+            else:
+                await websocket.send_json({"type": "error", "message": f"不明なメッセージです: {kind}"})
+    
+    except WebSocketDisconnect:
+        logger.info(f"インタビュー切断 (id: {id})")
+        return
+    finally:
+        flusher.cancel()
+        await session.flush()
+    
+    await websocket.send_json({"type": "end", "answered": len(session.answers)})
+    await websocket.close()
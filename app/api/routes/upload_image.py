@@ -1,17 +1,19 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Request
+import asyncio
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Request, BackgroundTasks
 from pathlib import Path
-from app.database.session import SessionLocal
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.database.session import SessionLocal, ReadSessionLocal
 from app.schemas.upload_image import UploadImageResponse
-from app.models.upload_image import UploadImage
 from app.services.upload_image import UploadImageService
 from app.services.remove_bg import RemoveBgStorage
+from app.services.upload_validation import UploadRejected, validate_file
 from sqlalchemy.orm import Session
 
 router = APIRouter()
 
 """ 保存先とサービス初期化 """
-BASE_DIR = Path(__file__).resolve().parents[2]
-UPLOAD_DIR = BASE_DIR / "uploads"
+UPLOAD_DIR = Path(settings.upload_dir)
 
 # サービス初期化
 upload_image_service = UploadImageService(UPLOAD_DIR)
@@ -24,15 +26,25 @@ def get_db():
     finally:
         db.close()
 
+# 読み取り専用（リードレプリカ）
+def get_read_db():
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
 
 """ 画像をアップロードするエンドポイント """
 @router.post("/upload", response_model=UploadImageResponse)
 async def upload_file(
     request: Request, 
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...), 
     remove_bg: bool = False,
     db: Session = Depends(get_db)
 ):
+    # ファイル I/O・remove.bg・DB 保存はスレッドで行い、他のリクエストを止めない
     try:
         # ファイル名の検証
         if not file.filename:
@@ -42,36 +54,36 @@ async def upload_file(
         
         # 背景削除が有効な場合
         if remove_bg:
-            # ファイルを一時的にリセット
-            file.file.seek(0)
+            # 有料 API に送る前に形式・サイズ・寸法を検証（先頭に戻す）
+            await asyncio.to_thread(validate_file, file.file)
             # 背景削除して保存
-            filename, size = remove_bg_storage.save_with_bg_removed(file.file, file.filename)
-            url = f"{base_url}/uploads/{filename}"
-            
-            # DB保存
-            img = UploadImage(
-                filename=filename,
-                url=url,
-                content_type="image/png",  # 背景削除後はPNG
-                size_bytes=size,
-                user_id=None
-            )
-            db.add(img)
-            db.commit()
-            db.refresh(img)
+            filename, size = await asyncio.to_thread(remove_bg_storage.save_with_bg_removed, file.file, file.filename)
             
-            return img
+            # DB保存（失敗した場合は保存したファイルを残さない）
+            try:
+                img = await upload_image_service.create_record(
+                    db,
+                    filename=filename,
+                    url=f"{base_url}/uploads/{filename}",
+                    content_type="image/png",  # 背景削除後はPNG
+                    size_bytes=size
+                )
+            except Exception:
+                (UPLOAD_DIR / filename).unlink(missing_ok=True)
+                raise
         else:
             # 通常のアップロード
-            uploaded_image = upload_image_service.save_image(
-                db=db,
-                file=file.file,
-                filename=file.filename,
-                content_type=file.content_type,
-                public_base=base_url
-            )
-            return uploaded_image
+            img = await upload_image_service.save_image(db, file=file.file, public_base=base_url)
+        
+        # 知覚ハッシュ（類似画像の検出用）は応答の後に計算
+        background_tasks.add_task(upload_image_service.update_phash, img.id, UPLOAD_DIR / img.filename)
+        return img
         
+    except HTTPException:
+        raise
+    except UploadRejected as e:
+        metrics.increment(f"upload.rejected.{e.status_code}")
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
@@ -79,7 +91,7 @@ async def upload_file(
 
 """ 画像一覧を取得するエンドポイント """
 @router.get("/images", response_model=list[UploadImageResponse])
-def list_images(db: Session = Depends(get_db)):
+def list_images(db: Session = Depends(get_read_db)):
     try:
         return upload_image_service.list_images(db)
     except Exception as e:
@@ -1,6 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
-from app.database.session import SessionLocal
+from app.database.session import SessionLocal, ReadSessionLocal
 from app.schemas import user as schemas
 from app.services import user as services
 
@@ -14,6 +14,14 @@ def get_db():
     finally:
         db.close()
 
+# 読み取り専用のDB依存性（リードレプリカ）
+def get_read_db():
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
 """ ユーザー作成のエンドポイント """
 @router.post("/users", response_model=schemas.UserResponse)
 def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
@@ -34,5 +42,5 @@ def login_user(user: schemas.UserLogin, db: Session = Depends(get_db)):
 
 """ ユーザー一覧取得のエンドポイント """
 @router.get("/users", response_model=list[schemas.UserResponse])
-def get_users(db: Session = Depends(get_db)):
+def get_users(db: Session = Depends(get_read_db)):
     return services.get_users(db)
\ No newline at end of file
@@ -0,0 +1,90 @@
+"""
+リクエスト本文のサイズ制限
+
+FastAPI はエンドポイントを呼ぶ前に multipart 本文をすべて受け取って一時ファイルに書き出すため、
+エンドポイント内の確認では大きすぎるアップロードの受信コストを避けられない。
+対象のパスでは Content-Length を見て本文を読む前に 413 を返し、
+Content-Length のない（chunked の）本文は受信中に数えて上限を超えた時点で打ち切る。
+"""
+
+import re
+from typing import List, Tuple
+from fastapi import HTTPException
+from app.core.config import settings
+from app.core.metrics import metrics
+
+# multipart の境界・ヘッダー分の余裕
+MULTIPART_OVERHEAD = 64 * 1024
+
+# (パス, 上限を返す関数)。上限は設定の変更に追従させるため呼び出し時に評価する
+BODY_LIMITS: List[Tuple["re.Pattern[str]", object]] = [
+    (re.compile(r"/upload"), lambda: settings.upload_max_bytes + MULTIPART_OVERHEAD),
+]
+
+
+class BodyTooLarge(HTTPException):
+    """受信中に上限を超えた（本文の解析中に送出されるため、FastAPI が 413 の応答に変換する）"""
+
+    def __init__(self, limit: int):
+        super().__init__(status_code=413, detail=f"リクエストが大きすぎます（上限 {limit // (1024 * 1024)}MB）")
+
+
+async def _reject(send, limit: int) -> None:
+    body = f'{{"detail":"リクエストが大きすぎます（上限 {limit // (1024 * 1024)}MB）"}}'.encode()
+    await send({
+        "type": "http.response.start",
+        "status": 413,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()),
+                    (b"connection", b"close")],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class BodySizeLimitMiddleware:
+    """対象のパスの本文が上限を超える場合に 413 を返す ASGI ミドルウェア"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("POST", "PUT", "PATCH"):
+            await self.app(scope, receive, send)
+            return
+        limit = next((get_limit() for pattern, get_limit in BODY_LIMITS if pattern.fullmatch(scope["path"])), None)
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        for name, value in scope.get("headers", []):
+            if name == b"content-length":
+                if not value.isdigit() or int(value) > limit:
+                    metrics.increment("upload.rejected.413")
+                    await _reject(send, limit)
+                    return
+                break
+
+        received = 0
+        started = False
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    metrics.increment("upload.rejected.413")
+                    raise BodyTooLarge(limit)
+            return message
+
+        async def tracked_send(message):
+            nonlocal started
+            if message["type"] == "http.response.start":
+                started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracked_send)
+        except BodyTooLarge:
+            if started:
+                raise
+            await _reject(send, limit)
@@ -0,0 +1,517 @@
+"""
+Idempotency-Key による再送の重複排除
+
+モバイルクライアントはタイムアウト時に同じリクエストを再送する。対象のエンドポイントに
+Idempotency-Key ヘッダーが付いている場合、最初の実行結果（ステータス・本文）を記録し、
+同じキーの再送には処理を実行せずに記録した応答を返す（Idempotent-Replayed: true）。
+
+    - 最初の実行が終わる前に届いた再送は、結果が記録されるまで待ってから同じ応答を返す
+    - 同じキーで内容の異なるリクエストは 422
+    - 5xx や例外で終わった実行は記録せず、再送で実行し直せるようにする
+
+キーは呼び出し元（X-User-Id、なければ接続元 IP）ごとに分けて扱い、別のクライアントが
+同じキーを使っても衝突しない。
+
+記録先は idempotency_keys テーブル（複数プロセス・複数台で共有）と、
+プロセス内のメモリ（単一プロセスの開発環境向け）を設定で切り替える。
+期限切れの記録は lifespan の定期処理（IDEMPOTENCY_PURGE_INTERVAL）で削除する。
+"""
+
+import asyncio
+import hashlib
+import logging
+import re
+import tempfile
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from app.core.config import settings
+from app.core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = "idempotency-key"
+REPLAYED_HEADER = "idempotent-replayed"
+MAX_KEY_LENGTH = 255
+
+# 対象のエンドポイント（メソッド, パス）
+IDEMPOTENT_ROUTES: List[Tuple[str, "re.Pattern[str]"]] = [
+    ("POST", re.compile(r"/upload")),
+    ("POST", re.compile(r"/api/story/\d+/questions")),
+    ("POST", re.compile(r"/api/story/answers")),
+]
+
+# ハッシュを計算する間、本文をメモリに置く上限（超えた分は一時ファイルに書き出す）
+_SPOOL_MEMORY_BYTES = 1024 * 1024
+_REPLAY_CHUNK_BYTES = 64 * 1024
+# multipart の区切りやフォームの他の項目の分として、アップロードの上限に上乗せする本文の大きさ
+_BODY_OVERHEAD_BYTES = 64 * 1024
+
+
+@dataclass
+class StoredResponse:
+    status_code: int
+    content_type: Optional[str]
+    body: bytes
+
+
+@dataclass
+class Claim:
+    """begin の結果。response があれば再送、mismatch なら内容の不一致、どちらもなければ実行する"""
+    response: Optional[StoredResponse] = None
+    mismatch: bool = False
+    in_progress: bool = False  # 待ち時間内に最初の実行が終わらなかった
+
+
+class MemoryIdempotencyStore:
+    """プロセス内の記録（イベントループ内でのみ使う）"""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._entries: Dict[Tuple[str, str], dict] = {}
+
+    def _evict(self, now: float) -> None:
+        expired = [k for k, entry in self._entries.items() if entry["expires"] <= now]
+        for k in expired:
+            del self._entries[k]
+
+    async def begin(self, scope: str, key: str, fingerprint: str, timeout: float) -> Claim:
+        deadline = time.monotonic() + timeout
+        while True:
+            now = time.monotonic()
+            self._evict(now)
+            entry = self._entries.get((scope, key))
+            if entry is None:
+                self._entries[(scope, key)] = {
+                    "fingerprint": fingerprint,
+                    "response": None,
+                    "done": asyncio.Event(),
+                    "expires": now + self.ttl,
+                }
+                return Claim()
+            if entry["fingerprint"] != fingerprint:
+                return Claim(mismatch=True)
+            if entry["response"] is not None:
+                return Claim(response=entry["response"])
+            # 実行中: 完了（または取り消し）を待ってから確認し直す
+            try:
+                await asyncio.wait_for(entry["done"].wait(), timeout=max(0.0, deadline - now))
+            except asyncio.TimeoutError:
+                return Claim(in_progress=True)
+
+    async def complete(self, scope: str, key: str, response: StoredResponse) -> None:
+        entry = self._entries.get((scope, key))
+        if entry is not None:
+            entry["response"] = response
+            entry["done"].set()
+
+    async def release(self, scope: str, key: str) -> None:
+        entry = self._entries.pop((scope, key), None)
+        if entry is not None:
+            entry["done"].set()
+
+    async def purge_expired(self) -> int:
+        """期限切れの記録を削除（定期実行用）"""
+        before = len(self._entries)
+        self._evict(time.monotonic())
+        return before - len(self._entries)
+
+
+class DatabaseIdempotencyStore:
+    """
+    idempotency_keys テーブルによる記録
+
+    一意制約付きの INSERT でキーを確保し、確保できなかった再送は完了するまでポーリングする。
+    同じプロセス内の再送はイベントで即座に起こす。
+    processing のまま lock_timeout を過ぎた行は、実行したプロセスが落ちたとみなして引き継ぐ。
+    """
+
+    def __init__(self, ttl: float, lock_timeout: float, poll_interval: float = 0.05):
+        self.ttl = ttl
+        self.lock_timeout = lock_timeout
+        self.poll_interval = poll_interval
+        self._local: Dict[Tuple[str, str], asyncio.Event] = {}
+
+    def _try_claim(self, scope: str, key: str, fingerprint: str):
+        from sqlalchemy.exc import IntegrityError
+        from app.database.session import SessionLocal
+        from app.models.idempotency_key import IdempotencyKey
+
+        now = datetime.utcnow()
+        db = SessionLocal()
+        try:
+            db.add(IdempotencyKey(scope=scope, key=key, fingerprint=fingerprint, status="processing", created_at=now))
+            try:
+                db.commit()
+                return Claim()
+            except IntegrityError:
+                db.rollback()
+
+            row = db.query(IdempotencyKey).filter(IdempotencyKey.scope == scope, IdempotencyKey.key == key).first()
+            if row is None:
+                return None  # 取り消された直後。確保し直す
+            if row.created_at < now - timedelta(seconds=self.ttl):
+                db.delete(row)  # 期限切れの記録は使わない
+                db.commit()
+                return None
+            if row.fingerprint != fingerprint:
+                return Claim(mismatch=True)
+            if row.status == "completed":
+                return Claim(response=StoredResponse(row.status_code, row.content_type, row.response_body or b""))
+            if row.created_at < now - timedelta(seconds=self.lock_timeout):
+                # 実行したプロセスが完了も取り消しもしないまま止まった。条件付き更新で1つだけ引き継ぐ
+                taken = (
+                    db.query(IdempotencyKey)
+                    .filter(IdempotencyKey.id == row.id, IdempotencyKey.created_at == row.created_at,
+                            IdempotencyKey.status == "processing")
+                    .update({IdempotencyKey.created_at: now}, synchronize_session=False)
+                )
+                db.commit()
+                if taken:
+                    logger.warning(f"処理中のまま止まった Idempotency-Key を引き継ぎます ({scope}, {key})")
+                    return Claim()
+            return Claim(in_progress=True)
+        finally:
+            db.close()
+
+    async def begin(self, scope: str, key: str, fingerprint: str, timeout: float) -> Claim:
+        deadline = time.monotonic() + timeout
+        interval = self.poll_interval
+        while True:
+            claim = await asyncio.to_thread(self._try_claim, scope, key, fingerprint)
+            if claim is None:
+                continue
+            if not claim.in_progress:
+                if claim.response is None and not claim.mismatch:
+                    self._local[(scope, key)] = asyncio.Event()
+                return claim
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return claim
+            event = self._local.get((scope, key))
+            try:
+                if event is not None:
+                    await asyncio.wait_for(event.wait(), timeout=remaining)
+                else:
+                    await asyncio.sleep(min(interval, remaining))
+                    interval = min(interval * 2, 1.0)
+            except asyncio.TimeoutError:
+                pass
+
+    def _complete(self, scope: str, key: str, response: StoredResponse) -> None:
+        from app.database.session import SessionLocal
+        from app.models.idempotency_key import IdempotencyKey
+
+        db = SessionLocal()
+        try:
+            db.query(IdempotencyKey).filter(IdempotencyKey.scope == scope, IdempotencyKey.key == key).update(
+                {
+                    IdempotencyKey.status: "completed",
+                    IdempotencyKey.status_code: response.status_code,
+                    IdempotencyKey.content_type: response.content_type,
+                    IdempotencyKey.response_body: response.body,
+                    IdempotencyKey.completed_at: datetime.utcnow(),
+                },
+                synchronize_session=False,
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    def _release(self, scope: str, key: str) -> None:
+        from app.database.session import SessionLocal
+        from app.models.idempotency_key import IdempotencyKey
+
+        db = SessionLocal()
+        try:
+            db.query(IdempotencyKey).filter(
+                IdempotencyKey.scope == scope, IdempotencyKey.key == key, IdempotencyKey.status == "processing"
+            ).delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    async def complete(self, scope: str, key: str, response: StoredResponse) -> None:
+        try:
+            await asyncio.to_thread(self._complete, scope, key, response)
+        finally:
+            self._wake(scope, key)
+
+    async def release(self, scope: str, key: str) -> None:
+        try:
+            await asyncio.to_thread(self._release, scope, key)
+        finally:
+            self._wake(scope, key)
+
+    def _wake(self, scope: str, key: str) -> None:
+        event = self._local.pop((scope, key), None)
+        if event is not None:
+            event.set()
+
+    async def purge_expired(self) -> int:
+        """期限切れの記録を削除（定期実行用）"""
+        return await asyncio.to_thread(self._purge_expired)
+
+    def _purge_expired(self) -> int:
+        from app.database.session import SessionLocal
+        from app.models.idempotency_key import IdempotencyKey
+
+        db = SessionLocal()
+        try:
+            cutoff = datetime.utcnow() - timedelta(seconds=self.ttl)
+            deleted = db.query(IdempotencyKey).filter(IdempotencyKey.created_at < cutoff).delete(synchronize_session=False)
+            db.commit()
+            return deleted
+        finally:
+            db.close()
+
+
+_store = None
+
+
+def get_idempotency_store():
+    """設定（idempotency_backend）に応じた記録先のシングルトンを取得"""
+    global _store
+    if _store is None:
+        if settings.idempotency_backend == "memory":
+            _store = MemoryIdempotencyStore(settings.idempotency_ttl)
+        elif settings.idempotency_backend == "database":
+            _store = DatabaseIdempotencyStore(settings.idempotency_ttl, settings.idempotency_lock_timeout)
+        else:
+            raise ValueError(f"不明な idempotency_backend です: {settings.idempotency_backend}（database / memory）")
+    return _store
+
+
+def set_idempotency_store(store) -> None:
+    """記録先を差し替える（ベンチマーク・開発用）"""
+    global _store
+    _store = store
+
+
+def _headers(scope) -> Dict[bytes, bytes]:
+    return {name.lower(): value for name, value in scope.get("headers", [])}
+
+
+def caller_identity(scope) -> str:
+    """
+    キーを分ける呼び出し元（X-User-Id、なければ接続元 IP）
+
+    モバイル回線では再送のたびに接続元 IP が変わりうるため、X-User-Id がある場合は IP を含めない。
+    scope 列の長さに収めるためハッシュにする。
+    """
+    user_id = _headers(scope).get(b"x-user-id")
+    if user_id:
+        identity = b"user:" + user_id
+    else:
+        client = scope.get("client")
+        identity = b"ip:" + (client[0] if client else "unknown").encode("latin-1")
+    return hashlib.sha256(identity).hexdigest()[:32]
+
+
+class _BoundaryStrippingDigest:
+    """multipart の境界文字列を除いた本文のハッシュ（再送で境界文字列が変わっても同じ値になる）"""
+
+    def __init__(self, digest, delimiter: Optional[bytes]):
+        self.digest = digest
+        self.delimiter = delimiter
+        self._carry = b""
+
+    def update(self, chunk: bytes) -> None:
+        if not self.delimiter:
+            self.digest.update(chunk)
+            return
+        data = (self._carry + chunk).replace(self.delimiter, b"")
+        # チャンクの境目にまたがる境界文字列のために末尾を次のチャンクまで持ち越す
+        keep = len(self.delimiter) - 1
+        self._carry = data[-keep:] if keep else b""
+        self.digest.update(data[:len(data) - len(self._carry)])
+
+    def finish(self) -> str:
+        self.digest.update(self._carry)
+        self._carry = b""
+        return self.digest.hexdigest()
+
+
+def _multipart_delimiter(content_type: bytes) -> Optional[bytes]:
+    for param in content_type.split(b";")[1:]:
+        name, _, value = param.strip().partition(b"=")
+        if name.strip().lower() == b"boundary" and value:
+            return b"--" + value.strip().strip(b'"')
+    return None
+
+
+def _is_idempotent_route(method: str, path: str) -> bool:
+    return any(method == route_method and pattern.fullmatch(path) for route_method, pattern in IDEMPOTENT_ROUTES)
+
+
+async def _send_json(send, status_code: int, body: bytes, extra_headers=()) -> None:
+    await send({
+        "type": "http.response.start",
+        "status": status_code,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()), *extra_headers],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class IdempotencyMiddleware:
+    """
+    Idempotency-Key 付きのリクエストの結果を記録・再送する ASGI ミドルウェア
+
+    リクエストの同一性（fingerprint）はメソッド・パス・クエリと本文の内容で判定する。
+    multipart の境界文字列は再送ごとに変わりうるため、ハッシュから除く。
+    本文はハッシュの計算のために読み切り（大きい本文は一時ファイルに置き）、後段に渡し直す。
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = _headers(scope)
+        key = headers.get(IDEMPOTENCY_HEADER.encode())
+        if key is None or not _is_idempotent_route(scope["method"], scope["path"]):
+            await self.app(scope, receive, send)
+            return
+
+        key = key.decode("latin-1").strip()
+        if not key or len(key) > MAX_KEY_LENGTH:
+            await _send_json(send, 400, f'{{"detail":"Idempotency-Key は1〜{MAX_KEY_LENGTH}文字で指定してください"}}'.encode())
+            return
+
+        read = await self._read_body(receive, headers)
+        if read is None:
+            await _send_json(send, 413, '{"detail":"リクエストの本文が大きすぎます"}'.encode())
+            return
+        spool, size, body_digest = read
+        try:
+            await self._handle(scope, self._replay_body(spool, size, receive), send, key, body_digest)
+        finally:
+            spool.close()
+
+    async def _handle(self, scope, receive, send, key: str, body_digest: str) -> None:
+        # 呼び出し元ごとにキーを分ける
+        route = f"{scope['method']} {scope['path']} {caller_identity(scope)}"
+        fingerprint = hashlib.sha256(
+            f"{scope['method']} {scope['path']}?".encode() + scope.get("query_string", b"") + b"\0body=" + body_digest.encode()
+        ).hexdigest()
+        store = get_idempotency_store()
+
+        start = time.perf_counter()
+        claim = await store.begin(route, key, fingerprint, settings.idempotency_wait_timeout)
+        if claim.mismatch:
+            metrics.increment("idempotency.mismatch")
+            await _send_json(send, 422, '{"detail":"この Idempotency-Key は内容の異なるリクエストで使用済みです"}'.encode())
+            return
+        if claim.in_progress:
+            metrics.increment("idempotency.in_progress")
+            await _send_json(send, 409, '{"detail":"同じ Idempotency-Key のリクエストを処理中です。しばらくしてから再送してください"}'.encode(),
+                             [(b"retry-after", b"1")])
+            return
+        if claim.response is not None:
+            metrics.increment("idempotency.replay")
+            metrics.observe("idempotency.replay_wait", time.perf_counter() - start)
+            await self._replay(send, claim.response)
+            return
+
+        metrics.increment("idempotency.execute")
+        await self._execute(scope, receive, send, store, route, key)
+
+    async def _read_body(self, receive, headers):
+        """
+        本文を読み切ってハッシュを計算する
+
+        Returns:
+            (本文を置いた一時ファイル, 本文の大きさ, 本文のハッシュ)。上限を超えた場合は None
+        """
+        limit = settings.upload_max_bytes + _BODY_OVERHEAD_BYTES
+        content_type = headers.get(b"content-type", b"")
+        delimiter = None
+        if content_type.split(b";")[0].strip().lower() == b"multipart/form-data":
+            delimiter = _multipart_delimiter(content_type)
+        digest = _BoundaryStrippingDigest(hashlib.sha256(), delimiter)
+        spool = tempfile.SpooledTemporaryFile(max_size=_SPOOL_MEMORY_BYTES)
+        size = 0
+        try:
+            while True:
+                message = await receive()
+                if message["type"] != "http.request":
+                    break
+                chunk = message.get("body", b"")
+                size += len(chunk)
+                if size > limit:
+                    spool.close()
+                    return None
+                digest.update(chunk)
+                # 一時ファイルへの書き出しでイベントループを止めないよう、メモリを超える分はスレッドで書く
+                if size > _SPOOL_MEMORY_BYTES:
+                    await asyncio.to_thread(spool.write, chunk)
+                else:
+                    spool.write(chunk)
+                if not message.get("more_body", False):
+                    break
+        except BaseException:
+            spool.close()
+            raise
+        spool.seek(0)
+        return spool, size, digest.finish()
+
+    @staticmethod
+    def _replay_body(spool, size: int, receive):
+        """読み切った本文を後段に渡し直す receive"""
+        done = False
+
+        async def replay_receive():
+            nonlocal done
+            if not done:
+                if size > _SPOOL_MEMORY_BYTES:
+                    chunk = await asyncio.to_thread(spool.read, _REPLAY_CHUNK_BYTES)
+                else:
+                    chunk = spool.read(_REPLAY_CHUNK_BYTES)
+                more = len(chunk) == _REPLAY_CHUNK_BYTES
+                done = not more
+                return {"type": "http.request", "body": chunk, "more_body": more}
+            return await receive()
+
+        return replay_receive
+
+    async def _replay(self, send, response: StoredResponse) -> None:
+        headers = [(b"content-length", str(len(response.body)).encode()), (REPLAYED_HEADER.encode(), b"true")]
+        if response.content_type:
+            headers.append((b"content-type", response.content_type.encode("latin-1")))
+        await send({"type": "http.response.start", "status": response.status_code, "headers": headers})
+        await send({"type": "http.response.body", "body": response.body})
+
+    async def _execute(self, scope, receive, send, store, route: str, key: str) -> None:
+        status_code = None
+        content_type = None
+        body = []
+
+        async def capture(message):
+            nonlocal status_code, content_type
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                for name, value in message.get("headers", []):
+                    if name.lower() == b"content-type":
+                        content_type = value.decode("latin-1")
+            elif message["type"] == "http.response.body":
+                body.append(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, capture)
+        except BaseException:
+            await asyncio.shield(store.release(route, key))
+            raise
+
+        if status_code is None or status_code >= 500:
+            # サーバー側の失敗は記録せず、再送で実行し直す
+            await store.release(route, key)
+            return
+        try:
+            await store.complete(route, key, StoredResponse(status_code, content_type, b"".join(body)))
+        except Exception as e:
+            logger.error(f"Idempotency-Key の結果の記録エラー ({route}, {key}): {str(e)}")
+            await store.release(route, key)
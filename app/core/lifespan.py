@@ -0,0 +1,137 @@
+"""
+アプリケーションのライフサイクル管理
+
+重いクライアント（DB接続、Vision、Gemini）と索引の読み込みを起動時にまとめて並行実行し、
+終了時にプロセスプールを停止する。設定されている場合はストレージ保守と、
+Idempotency-Key の期限切れの記録の削除を定期実行する。
+"""
+
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI
+from sqlalchemy import text
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.core.process_pool import shutdown_process_pool
+
+logger = logging.getLogger(__name__)
+
+
+def _warm_database():
+    from app.database.session import get_engine
+
+    with get_engine().connect() as connection:
+        connection.execute(text("SELECT 1"))
+
+
+def _warm_vision():
+    from app.services.vision_analysis import vision_service
+
+    vision_service.client
+
+
+def _warm_gemini():
+    from app.services.ai.gemini_client import get_gemini_client
+
+    if settings.google_api_key:
+        get_gemini_client()
+
+
+def _warm_question_indexes():
+    from app.services.question_bank import get_question_bank
+    from app.services.similarity_index import get_similarity_index
+
+    get_question_bank()
+    get_similarity_index()
+
+
+WARMUP_TASKS = {
+    "database": _warm_database,
+    "vision": _warm_vision,
+    "gemini": _warm_gemini,
+    "question_indexes": _warm_question_indexes,
+}
+
+
+async def _run_warmup_task(name: str, task) -> None:
+    start = time.perf_counter()
+    try:
+        await asyncio.to_thread(task)
+        logger.info(f"ウォームアップ完了: {name} ({time.perf_counter() - start:.2f}秒)")
+    except Exception as e:
+        # ウォームアップの失敗で起動を止めない（初回利用時に再試行される）
+        logger.warning(f"ウォームアップ失敗: {name}: {str(e)}")
+    finally:
+        metrics.observe(f"startup.warmup.{name}", time.perf_counter() - start)
+
+
+async def warm_up() -> None:
+    """重いクライアントと索引を並行して初期化する"""
+    start = time.perf_counter()
+    await asyncio.gather(*(_run_warmup_task(name, task) for name, task in WARMUP_TASKS.items()))
+    metrics.observe("startup.warmup", time.perf_counter() - start)
+
+
+async def run_storage_maintenance(interval: float) -> None:
+    """ストレージ保守を一定間隔で実行（失敗しても次の回に再試行）"""
+    from app.services.storage_maintenance import storage_maintenance
+
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(storage_maintenance.run)
+        except Exception as e:
+            logger.error(f"ストレージ保守エラー: {str(e)}")
+            metrics.increment("storage.maintenance_errors")
+
+
+async def run_idempotency_purge(interval: float) -> None:
+    """Idempotency-Key の期限切れの記録を一定間隔で削除（失敗しても次の回に再試行）"""
+    from app.core.idempotency import get_idempotency_store
+
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            deleted = await get_idempotency_store().purge_expired()
+            metrics.increment("idempotency.purged", deleted)
+            if deleted:
+                logger.info(f"期限切れの Idempotency-Key を削除しました ({deleted}件)")
+        except Exception as e:
+            logger.error(f"Idempotency-Key の削除エラー: {str(e)}")
+            metrics.increment("idempotency.purge_errors")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    FastAPI の lifespan ハンドラ
+
+    warmup_mode:
+        background  起動をブロックせずにウォームアップ（未完了の間は初回利用時に遅延初期化）
+        blocking    ウォームアップ完了後にリクエストの受付を開始
+        off         ウォームアップしない
+    """
+    warmup_task = None
+    if settings.warmup_mode == "blocking":
+        await warm_up()
+    elif settings.warmup_mode == "background":
+        warmup_task = asyncio.create_task(warm_up())
+
+    maintenance_task = None
+    if settings.storage_maintenance_interval > 0:
+        maintenance_task = asyncio.create_task(run_storage_maintenance(settings.storage_maintenance_interval))
+    purge_task = None
+    if settings.idempotency_purge_interval > 0:
+        purge_task = asyncio.create_task(run_idempotency_purge(settings.idempotency_purge_interval))
+
+    yield
+
+    if warmup_task is not None and not warmup_task.done():
+        warmup_task.cancel()
+    if maintenance_task is not None:
+        maintenance_task.cancel()
+    if purge_task is not None:
+        purge_task.cancel()
+    shutdown_process_pool()
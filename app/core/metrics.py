@@ -0,0 +1,106 @@
+"""
+プロセス内メトリクス
+
+カウンター・現在値（ゲージ）・レイテンシ観測値をメモリ上に保持し、/api/metrics で公開する。
+"""
+
+import threading
+from collections import defaultdict, deque
+from typing import Any, Deque, Dict, Optional
+
+# レイテンシ観測値の保持件数（直近のみ）
+_MAX_OBSERVATIONS = 1024
+
+
+def _percentile(sorted_values, q: float) -> float:
+    """ソート済みの値から百分位数を計算"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(q * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+class Metrics:
+    """スレッドセーフな簡易メトリクスレジストリ"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = defaultdict(float)
+        self._observations: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=_MAX_OBSERVATIONS))
+        self._gauges: Dict[str, float] = {}
+
+    def increment(self, name: str, value: float = 1) -> None:
+        """カウンターを加算"""
+        with self._lock:
+            self._counters[name] += value
+
+    def set_gauge(self, name: str, value: float) -> None:
+        """現在値（使用量など）を設定"""
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name: str, value: float) -> None:
+        """観測値（レイテンシなど）を記録"""
+        with self._lock:
+            self._observations[name].append(value)
+
+    def counter(self, name: str) -> float:
+        """カウンターの現在値を取得"""
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def hit_rate(self, prefix: str) -> Optional[float]:
+        """`{prefix}.hit` と `{prefix}.miss` からヒット率を計算"""
+        with self._lock:
+            hits = self._counters.get(f"{prefix}.hit", 0)
+            misses = self._counters.get(f"{prefix}.miss", 0)
+        total = hits + misses
+        if total == 0:
+            return None
+        return hits / total
+
+    def summary(self, name: str) -> Dict[str, float]:
+        """観測値の要約（件数・平均・p50/p95/p99）"""
+        with self._lock:
+            values = sorted(self._observations.get(name, ()))
+        if not values:
+            return {"count": 0, "mean": 0.0, "p50": 0.0, "p95": 0.0, "p99": 0.0}
+        return {
+            "count": len(values),
+            "mean": sum(values) / len(values),
+            "p50": _percentile(values, 0.50),
+            "p95": _percentile(values, 0.95),
+            "p99": _percentile(values, 0.99),
+        }
+
+    def snapshot(self) -> Dict[str, Any]:
+        """全メトリクスのスナップショットを返す"""
+        with self._lock:
+            counters = dict(self._counters)
+            observation_names = list(self._observations.keys())
+            gauges = dict(self._gauges)
+
+        # `.hit` / `.miss` の組からヒット率を導出
+        hit_rates = {}
+        for name in counters:
+            if name.endswith(".hit"):
+                prefix = name[: -len(".hit")]
+                hit_rates[prefix] = self.hit_rate(prefix)
+
+        return {
+            "counters": counters,
+            "gauges": gauges,
+            "hit_rates": hit_rates,
+            "latencies": {name: self.summary(name) for name in observation_names},
+        }
+
+    def reset(self) -> None:
+        """全メトリクスをリセット（ベンチマーク用）"""
+        with self._lock:
+            self._counters.clear()
+            self._observations.clear()
+            self._gauges.clear()
+
+
+# シングルトンインスタンス
+metrics = Metrics()
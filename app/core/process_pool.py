@@ -0,0 +1,30 @@
+"""
+CPU 負荷の高い画像処理用のプロセスプール
+"""
+
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+from app.core.config import settings
+
+_process_pool: Optional[ProcessPoolExecutor] = None
+_process_pool_lock = threading.Lock()
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """プロセスプールのシングルトンインスタンスを取得（初回利用時に起動）"""
+    global _process_pool
+    if _process_pool is None:
+        with _process_pool_lock:
+            if _process_pool is None:
+                _process_pool = ProcessPoolExecutor(max_workers=settings.process_pool_workers)
+    return _process_pool
+
+
+def shutdown_process_pool() -> None:
+    """プロセスプールを停止"""
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is not None:
+            _process_pool.shutdown(wait=False, cancel_futures=True)
+            _process_pool = None
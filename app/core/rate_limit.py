@@ -0,0 +1,331 @@
+"""
+トークンバケットによるレート制限
+
+1人のユーザー（や暴走したクライアントのループ）が LLM を呼ぶエンドポイントを連打して、
+共有の Gemini の割り当てを使い切らないようにする。対象のリクエストは次のバケットから
+トークンを消費し、足りない場合は 429（Retry-After 付き）を返す。
+
+    IP のバケット       接続元 IP ごと。すべてのリクエストがルートごとのコスト分を消費する
+    ユーザーのバケット   X-User-Id ヘッダーごと。ヘッダーがある場合のみ、ルートごとのコスト分を消費する
+    ルートのバケット     ルートごと（全ユーザー合計）。RATE_LIMIT_ROUTE_RATE を設定した場合のみ（既定は無効）、
+                        shared=True のルートで実際に LLM を呼ぶリクエストが1トークン消費する
+
+X-User-Id はクライアントが自由に付けられる（認証がない）ため、ヘッダーを付け替えても
+IP のバケットで制限される。IP のバケットは同じ IP の複数ユーザー（NAT など）のために大きめにする。
+ルートのバケットは上流（Gemini）の割り当てに合わせるもので、ミドルウェアでは消費せず、
+LLM の呼び出し直前に charge_route_budget() で消費する（保存済みの結果やルールで答えられる
+リクエストは消費しない）。足りない場合はその場で RouteBudgetExceeded を送出し、429 を返す。
+バケットの状態はプロセス内（memory）か、複数ワーカーで共有する Redis（redis）に置く。
+"""
+
+import logging
+import math
+import re
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+from app.core.config import settings
+from app.core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class RouteLimit:
+    name: str
+    method: str
+    pattern: "re.Pattern[str]"
+    cost: float  # ユーザーのバケットから消費するトークン数
+    shared: bool = False  # LLM を呼ぶルート（RATE_LIMIT_ROUTE_RATE を設定した場合はルート全体のバケットでも制限する）
+
+
+# 対象のエンドポイント（先に一致したものを使う。コストは設定 rate_limit_costs で上書きできる）
+ROUTE_LIMITS: List[RouteLimit] = [
+    RouteLimit("story_generate", "POST", re.compile(r"/api/story/\d+/generate"), 20, shared=True),
+    RouteLimit("story_questions", "POST", re.compile(r"/api/story/\d+/questions"), 10, shared=True),
+    RouteLimit("story_analyze", "POST", re.compile(r"/api/story/\d+/analyze"), 5, shared=True),
+    RouteLimit("story_validate", "POST", re.compile(r"/api/story/\d+/validate"), 5, shared=True),
+    RouteLimit("asset_analyze", "POST", re.compile(r"/api/assets/\d+/analyze"), 3),
+    RouteLimit("upload", "POST", re.compile(r"/upload"), 2),
+    RouteLimit("book_render", "POST", re.compile(r"/api/books/\d+/render"), 2),
+    RouteLimit("api", "*", re.compile(r"/api/.*"), 1),
+]
+
+# Redis 上で複数のバケットをまとめて確認・消費する（どれかが足りなければどれも消費しない）
+# KEYS: バケットのキー、ARGV: キーごとに rate, capacity, cost
+TOKEN_BUCKET_SCRIPT = """
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local tokens = {}
+local wait = 0
+for i, key in ipairs(KEYS) do
+  local rate = tonumber(ARGV[3 * i - 2])
+  local capacity = tonumber(ARGV[3 * i - 1])
+  local cost = tonumber(ARGV[3 * i])
+  local state = redis.call('HMGET', key, 'tokens', 'updated')
+  local current = tonumber(state[1]) or capacity
+  local updated = tonumber(state[2]) or now
+  current = math.min(capacity, current + math.max(0, now - updated) * rate)
+  tokens[i] = current
+  if current < cost then
+    wait = math.max(wait, (cost - current) / rate)
+  end
+end
+if wait > 0 then
+  return {0, tostring(wait)}
+end
+for i, key in ipairs(KEYS) do
+  local rate = tonumber(ARGV[3 * i - 2])
+  local capacity = tonumber(ARGV[3 * i - 1])
+  local cost = tonumber(ARGV[3 * i])
+  redis.call('HSET', key, 'tokens', tostring(tokens[i] - cost), 'updated', tostring(now))
+  redis.call('EXPIRE', key, math.ceil(capacity / rate) + 1)
+end
+return {1, '0'}
+"""
+
+# (キー, 毎秒の補充量, 容量, 消費量)
+Bucket = Tuple[str, float, float, float]
+
+
+def take_tokens(states: Dict[str, List[float]], buckets: Sequence[Bucket], now: float) -> float:
+    """
+    バケットをまとめて確認し、すべて足りれば消費する（TOKEN_BUCKET_SCRIPT と同じ計算）
+
+    Returns:
+        0.0（許可）または足りるようになるまでの秒数
+    """
+    current = []
+    wait = 0.0
+    for key, rate, capacity, cost in buckets:
+        state = states.get(key)
+        tokens = capacity if state is None else min(capacity, state[0] + max(0.0, now - state[1]) * rate)
+        current.append(tokens)
+        if tokens < cost:
+            wait = max(wait, (cost - tokens) / rate)
+    if wait > 0:
+        return wait
+    for (key, rate, capacity, cost), tokens in zip(buckets, current):
+        states[key] = [tokens - cost, now]
+    return 0.0
+
+
+class RouteBudgetExceeded(Exception):
+    """ルート全体のバケットが足りず、LLM を呼べない"""
+
+    def __init__(self, route: str, wait: float):
+        super().__init__(f"ルート全体のレート制限を超えました: {route}")
+        self.route = route
+        self.wait = wait
+
+
+@dataclass
+class RouteBudget:
+    """リクエストごとのルート全体のバケットの消費状況"""
+    route: str
+    charged: bool = False
+    wait: float = 0.0  # 足りなかった場合の、足りるようになるまでの秒数
+
+
+# 処理中のリクエストのルート全体のバケット（ミドルウェアが設定し、LLM の呼び出し側で消費する）
+_route_budget: ContextVar[Optional[RouteBudget]] = ContextVar("route_budget", default=None)
+
+
+async def charge_route_budget() -> None:
+    """
+    LLM を呼ぶ直前に、リクエストのルート全体のバケットから1トークン消費する
+
+    リクエストごとに1回だけ消費する（構造化出力の修正依頼やヘッジ、まとめた呼び出しでは追加で消費しない）。
+    対象外のリクエスト（バケットが無効、shared でないルート、WebSocket など）では何もしない。
+
+    Raises:
+        RouteBudgetExceeded: バケットが足りない場合
+    """
+    budget = _route_budget.get()
+    if budget is None or budget.charged:
+        return
+    bucket = (f"route:{budget.route}", settings.rate_limit_route_rate, settings.rate_limit_route_burst, 1.0)
+    wait = await get_rate_limit_store().take([bucket])
+    if wait > 0:
+        budget.wait = wait
+        raise RouteBudgetExceeded(budget.route, wait)
+    budget.charged = True
+
+
+class MemoryRateLimitStore:
+    """プロセス内のバケット（イベントループ内でのみ使う）"""
+
+    # この回数ごとに、満タンに戻っているはずのバケットを捨てる
+    SWEEP_INTERVAL = 4096
+
+    def __init__(self):
+        self._states: Dict[str, List[float]] = {}
+        self._idle: Dict[str, float] = {}  # キーごとの満タンに戻るまでの秒数
+        self._takes = 0
+
+    async def take(self, buckets: Sequence[Bucket]) -> float:
+        now = time.monotonic()
+        self._takes += 1
+        if self._takes % self.SWEEP_INTERVAL == 0:
+            self._sweep(now)
+        for key, rate, capacity, _ in buckets:
+            if key not in self._idle:
+                self._idle[key] = capacity / rate
+        return take_tokens(self._states, buckets, now)
+
+    def _sweep(self, now: float) -> None:
+        expired = [key for key, state in self._states.items() if now - state[1] > self._idle.get(key, 0.0)]
+        for key in expired:
+            del self._states[key]
+            self._idle.pop(key, None)
+
+
+class RedisRateLimitStore:
+    """
+    Redis 上のバケット（複数ワーカー・複数台で共有）
+
+    client は redis.asyncio.Redis 互換（eval を持つ）であればよい。
+    Redis に接続できない場合は制限せずに通す（レート制限の障害で API を止めない）。
+    """
+
+    def __init__(self, client, prefix: str = "ratelimit:"):
+        self.client = client
+        self.prefix = prefix
+
+    async def take(self, buckets: Sequence[Bucket]) -> float:
+        keys = [self.prefix + key for key, _, _, _ in buckets]
+        args = [value for _, rate, capacity, cost in buckets for value in (rate, capacity, cost)]
+        try:
+            allowed, wait = await self.client.eval(TOKEN_BUCKET_SCRIPT, len(keys), *keys, *args)
+        except Exception as e:
+            logger.warning(f"レート制限の確認エラー（制限せずに通します）: {str(e)}")
+            metrics.increment("rate_limit.store_errors")
+            return 0.0
+        return 0.0 if int(allowed) else float(wait)
+
+
+_store = None
+
+
+def get_rate_limit_store():
+    """設定（rate_limit_backend）に応じたバケットの置き場所のシングルトンを取得"""
+    global _store
+    if _store is None:
+        if settings.rate_limit_backend == "memory":
+            _store = MemoryRateLimitStore()
+        elif settings.rate_limit_backend == "redis":
+            try:
+                import redis.asyncio as redis
+            except ImportError:
+                raise RuntimeError("rate_limit_backend=redis には redis パッケージが必要です（pip install redis）")
+            if not settings.rate_limit_redis_url:
+                raise RuntimeError("rate_limit_backend=redis には RATE_LIMIT_REDIS_URL の設定が必要です")
+            _store = RedisRateLimitStore(redis.from_url(settings.rate_limit_redis_url))
+        else:
+            raise ValueError(f"不明な rate_limit_backend です: {settings.rate_limit_backend}（memory / redis）")
+    return _store
+
+
+def set_rate_limit_store(store) -> None:
+    """バケットの置き場所を差し替える（ベンチマーク・開発用）"""
+    global _store
+    _store = store
+
+
+def match_route(method: str, path: str) -> Optional[RouteLimit]:
+    for route in ROUTE_LIMITS:
+        if (route.method == "*" or route.method == method) and route.pattern.fullmatch(path):
+            return route
+    return None
+
+
+def client_identities(scope) -> Tuple[str, Optional[str]]:
+    """(接続元 IP, X-User-Id ヘッダー（なければ None）) のバケットのキー（ip: / user: で名前空間を分ける）"""
+    client = scope.get("client")
+    ip = "ip:" + (client[0] if client else "unknown")
+    for name, value in scope.get("headers", []):
+        if name == b"x-user-id":
+            return ip, "user:" + value.decode("latin-1")
+    return ip, None
+
+
+class RateLimitMiddleware:
+    """
+    対象のリクエストのトークンを消費し、足りなければ 429 を返す ASGI ミドルウェア
+
+    ルート全体のバケットが有効な場合は、処理中に charge_route_budget() で消費できるよう RouteBudget を設定する。
+    RouteBudgetExceeded がハンドラーの外まで送出された場合や、ハンドラーがそれを 5xx に変えた場合も 429 を返す。
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.rate_limit_enabled:
+            await self.app(scope, receive, send)
+            return
+        route = match_route(scope["method"], scope["path"])
+        if route is None:
+            await self.app(scope, receive, send)
+            return
+
+        cost = settings.rate_limit_costs.get(route.name, route.cost)
+        ip, user = client_identities(scope)
+        ip_burst = settings.rate_limit_ip_burst
+        buckets = [(ip, settings.rate_limit_ip_rate, ip_burst, min(cost, ip_burst))]
+        if user is not None:
+            user_burst = settings.rate_limit_user_burst
+            buckets.append((user, settings.rate_limit_user_rate, user_burst, min(cost, user_burst)))
+
+        wait = await get_rate_limit_store().take(buckets)
+        if wait > 0:
+            await self._reject(send, route.name, wait)
+            return
+        if not (route.shared and settings.rate_limit_route_rate > 0):
+            await self.app(scope, receive, send)
+            return
+
+        budget = RouteBudget(route.name)
+        token = _route_budget.set(budget)
+        started = False
+        replaced = False
+
+        async def send_wrapper(message):
+            nonlocal started, replaced
+            if message["type"] == "http.response.start":
+                started = True
+                if budget.wait > 0 and message["status"] >= 500:
+                    # ハンドラーが RouteBudgetExceeded を捕まえて 5xx にした場合
+                    replaced = True
+                    await self._reject(send, route.name, budget.wait)
+                    return
+            elif replaced:
+                return
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except RouteBudgetExceeded as e:
+            if started:
+                raise
+            await self._reject(send, route.name, e.wait)
+        finally:
+            _route_budget.reset(token)
+
+    @staticmethod
+    async def _reject(send, route_name: str, wait: float) -> None:
+        metrics.increment("rate_limit.limited")
+        metrics.increment(f"rate_limit.limited.{route_name}")
+        retry_after = str(max(1, math.ceil(wait))).encode()
+        body = '{"detail":"リクエストが多すぎます。しばらくしてから再送してください"}'.encode()
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", retry_after),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -1,7 +1,10 @@
 from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session, sessionmaker, declarative_base
 import os
+import threading
 from dotenv import load_dotenv
+from app.core.config import settings
 
 # .env を読み込む（backend/.env を想定）
 PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
@@ -9,15 +12,92 @@ ENV_PATH = os.path.join(PROJECT_ROOT, ".env")
 if os.path.exists(ENV_PATH):
     load_dotenv(ENV_PATH)
 
-DATABASE_URL = os.getenv("DATABASE_URL")
-if not DATABASE_URL:
-    raise RuntimeError(
-        "DATABASE_URL が設定されていません。backend/.env に MySQL の接続文字列を設定してください"
+Base = declarative_base()
+
+# エンジンは初回利用時に生成する（import 時に接続設定を評価しない）
+_engine = None
+_replica_engine = None
+_engine_lock = threading.Lock()
+
+
+def build_engine(database_url: str):
+    """接続プール設定を適用してエンジンを生成"""
+    engine_kwargs = {"pool_pre_ping": True}
+    url = make_url(database_url)
+
+    if url.get_backend_name() == "sqlite":
+        # SQLite の場合は check_same_thread を付与
+        engine_kwargs["connect_args"] = {"check_same_thread": False}
+        if not url.database or url.database == ":memory:":
+            # インメモリ DB はプール設定を受け付けない
+            return create_engine(database_url, **engine_kwargs)
+
+    engine_kwargs.update(
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_recycle=settings.db_pool_recycle,
+        pool_timeout=settings.db_pool_timeout,
     )
+    return create_engine(database_url, **engine_kwargs)
 
-# SQLite の場合は check_same_thread を付与
-engine_kwargs = {"pool_pre_ping": True}
 
-engine = create_engine(DATABASE_URL, **engine_kwargs)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-Base = declarative_base()
+def get_engine():
+    """プライマリDBエンジンのシングルトンインスタンスを取得"""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                database_url = os.getenv("DATABASE_URL")
+                if not database_url:
+                    raise RuntimeError(
+                        "DATABASE_URL が設定されていません。backend/.env に MySQL の接続文字列を設定してください"
+                    )
+                _engine = build_engine(database_url)
+    return _engine
+
+
+def get_replica_engine():
+    """リードレプリカのエンジンを取得（未設定の場合は None）"""
+    global _replica_engine
+    if _replica_engine is None and settings.database_replica_url:
+        with _engine_lock:
+            if _replica_engine is None:
+                _replica_engine = build_engine(settings.database_replica_url)
+    return _replica_engine
+
+
+class RoutingSession(Session):
+    """
+    読み取り専用セッションをリードレプリカに振り分けるセッション
+
+    info={"read_only": True} で生成されたセッションはレプリカ（未設定ならプライマリ）を使い、
+    それ以外と flush 中はプライマリを使う。
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if self.info.get("read_only") and not self._flushing:
+            replica = get_replica_engine()
+            if replica is not None:
+                return replica
+        return get_engine()
+
+
+_session_factory = sessionmaker(class_=RoutingSession, autocommit=False, autoflush=False)
+
+
+def SessionLocal(**kwargs):
+    """DBセッションを生成（書き込み・整合性が必要な読み取り用、プライマリ）"""
+    return _session_factory(**kwargs)
+
+
+def ReadSessionLocal(**kwargs):
+    """読み取り専用のDBセッションを生成（レプリカがあればレプリカ）"""
+    info = dict(kwargs.pop("info", None) or {}, read_only=True)
+    return _session_factory(info=info, **kwargs)
+
+
+def __getattr__(name):
+    # `from app.database.session import engine` の後方互換
+    if name == "engine":
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
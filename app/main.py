@@ -1,18 +1,33 @@
-import os
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
-from app.api.routes import user, upload_image, asset_analysis, story
-from app.database.session import engine, Base
+from app.api.routes import user, upload_image, asset_analysis, story, book, metrics
 from app.models import user as user_models
 from app.models import upload_image as upload_image_models
+from app.core.config import settings
+from app.core.lifespan import lifespan
+from app.core.idempotency import IdempotencyMiddleware
+from app.core.rate_limit import RateLimitMiddleware
+from app.core.body_limit import BodySizeLimitMiddleware
 
 app = FastAPI(
     title="Story Book App API",
     description="画像から物語を生成するアプリケーションのAPI",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse,  # orjson で高速にシリアライズ
+    lifespan=lifespan  # 重いクライアントの初期化と終了処理
 )
 
+# 再送の重複排除（Idempotency-Key。CORS より内側に置き、再送した応答にも CORS ヘッダーを付ける）
+app.add_middleware(IdempotencyMiddleware)
+
+# 本文のサイズ制限（大きすぎるアップロードは受信する前に 413）
+app.add_middleware(BodySizeLimitMiddleware)
+
+# レート制限（再送の記録より前に弾く）
+app.add_middleware(RateLimitMiddleware)
+
 # CORS設定
 app.add_middleware(
     CORSMiddleware,
@@ -23,13 +38,15 @@ app.add_middleware(
 )
 
 # データベーステーブル作成（必要に応じて手動実行）
-# Base.metadata.create_all(bind=engine)
+# Base.metadata.create_all(bind=get_engine())
 
 """ ルーター登録 """
 app.include_router(user.router)  # ユーザー関連のルーター
 app.include_router(upload_image.router)  # アップロード関連のルーター
 app.include_router(asset_analysis.router)  # アセット解析関連のルーター 
 app.include_router(story.router)  # 物語生成関連のルーター
+app.include_router(book.router)  # 絵本関連のルーター
+app.include_router(metrics.router)  # メトリクス関連のルーター
 
 """ 静的ファイルの配信 """
-app.mount("/uploads", StaticFiles(directory="app/uploads"), name="uploads")
+app.mount("/uploads", StaticFiles(directory=settings.upload_dir), name="uploads")
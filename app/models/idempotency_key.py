@@ -0,0 +1,18 @@
+from sqlalchemy import Column, Integer, String, DateTime, LargeBinary, UniqueConstraint, func
+from app.database.session import Base
+
+class IdempotencyKey(Base):
+    """Idempotency-Key ごとの最初の実行結果（再送時はこの応答を返す）"""
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (UniqueConstraint("scope", "key", name="uq_idempotency_keys_scope_key"),)
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    scope = Column(String(255), nullable=False)  # "POST /api/story/1/questions" など
+    key = Column(String(255), nullable=False)
+    fingerprint = Column(String(64), nullable=False)  # リクエスト内容のハッシュ
+    status = Column(String(20), nullable=False, default="processing")  # processing / completed
+    status_code = Column(Integer, nullable=True)
+    content_type = Column(String(100), nullable=True)
+    response_body = Column(LargeBinary(length=16 * 1024 * 1024), nullable=True)
+    created_at = Column(DateTime, server_default=func.now(), nullable=False, index=True)
+    completed_at = Column(DateTime, nullable=True)
@@ -7,7 +7,7 @@ class StoryAnswer(Base):
     __tablename__ = "story_answers"
     
     id = Column(Integer, primary_key=True, autoincrement=True)
-    question_id = Column(Integer, ForeignKey("story_questions.id"), nullable=False)
+    question_id = Column(Integer, ForeignKey("story_questions.id"), nullable=False, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
     answer_text = Column(Text, nullable=False)
     selected_option = Column(String(200), nullable=True)  # 選択肢型の場合
@@ -7,7 +7,7 @@ class StoryQuestion(Base):
     __tablename__ = "story_questions"
     
     id = Column(Integer, primary_key=True, autoincrement=True)
-    image_id = Column(Integer, ForeignKey("upload_images.id"), nullable=False)
+    image_id = Column(Integer, ForeignKey("upload_images.id"), nullable=False, index=True)
     target_element = Column(String(100), nullable=False)  # 主人公、舞台、問題など
     question_text = Column(String(500), nullable=False)
     question_type = Column(String(50), nullable=False)  # open, choice
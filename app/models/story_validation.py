@@ -0,0 +1,13 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, JSON, UniqueConstraint, func
+from app.database.session import Base
+
+class StoryValidation(Base):
+    """情報検証の結果（質問・回答・解析結果が同じ間は再利用する）"""
+    __tablename__ = "story_validations"
+    __table_args__ = (UniqueConstraint("image_id", "fingerprint", name="uq_story_validations_image_fingerprint"),)
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    image_id = Column(Integer, ForeignKey("upload_images.id"), nullable=False)
+    fingerprint = Column(String(64), nullable=False)  # 質問・回答・解析結果のハッシュ
+    result = Column(JSON, nullable=False)  # validation_result と meta
+    created_at = Column(DateTime, server_default=func.now(), nullable=False)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, func, true, Text
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, func, Text
 from sqlalchemy.orm import relationship
 from app.database.session import Base
 
@@ -10,9 +10,10 @@ class UploadImage(Base):
     url = Column(String(512), nullable=False)
     content_type = Column(String(100), nullable=False)
     size_bytes = Column(Integer, nullable=False)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=True)    
-    uploaded_at = Column(DateTime, server_default=func.now(), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True, index=True)
+    uploaded_at = Column(DateTime, server_default=func.now(), nullable=False, index=True)
     meta_json = Column(Text, nullable=True)  # Vision API 解析結果を JSON で保存
+    phash = Column(String(16), nullable=True)  # 知覚ハッシュ（dHash, 16進数）
 
     user = relationship("User", backref="upload_images", lazy="joined")
     
\ No newline at end of file
@@ -0,0 +1,31 @@
+from pydantic import BaseModel
+from typing import List, Optional, Dict, Any
+
+class RGB(BaseModel):
+    r: int
+    g: int
+    b: int
+
+class PaletteColor(BaseModel):
+    rgb: RGB
+    score: float
+
+class Geometry(BaseModel):
+    # プロファイルで取得していない値は None（fast / standard の画像サイズ、fast の subject_center）
+    width: Optional[int] = None
+    height: Optional[int] = None
+    subject_center: Optional[List[float]] = None
+
+class AnalysisResult(BaseModel):
+    tags: List[str] = []
+    palette: List[PaletteColor] = []
+    geometry: Geometry = Geometry()
+    profile: Optional[str] = None
+    features: List[str] = []
+    reused_from: Optional[int] = None
+    raw: Optional[Dict[str, Any]] = None  # verbose 指定時のみ
+
+class AssetAnalysisResponse(BaseModel):
+    id: int
+    status: str
+    analysis: AnalysisResult
@@ -0,0 +1,32 @@
+from pydantic import BaseModel
+from datetime import datetime
+from typing import List, Optional
+
+class BookPageResponse(BaseModel):
+    id: int
+    page_number: int
+    image_id: int
+    caption: Optional[str] = None
+    rendered_filename: Optional[str] = None
+    rendered_url: Optional[str] = None
+
+    class Config:
+        from_attributes = True
+
+class BookResponse(BaseModel):
+    id: int
+    title: str
+    user_id: Optional[int] = None
+    created_at: Optional[datetime] = None
+    pages: List[BookPageResponse] = []
+
+    class Config:
+        from_attributes = True
+
+class BookRenderResponse(BaseModel):
+    id: int
+    status: str
+    template: str
+    rendered: int
+    cached: int
+    pages: List[BookPageResponse]
@@ -0,0 +1,111 @@
+"""
+Gemini の応答のスキーマ
+
+構造化出力（response_mime_type="application/json" と response_schema）でモデルに渡し、
+受け取った応答もこのスキーマで検証する。API の応答スキーマ（app/schemas/story.py）とは分けて、
+LLM に求める形を厳しめに定義する。
+"""
+
+from typing import Any, Dict, List, Literal, Optional
+from pydantic import BaseModel, Field, model_validator
+
+StoryElementName = Literal["character", "setting", "emotion", "action", "conflict", "resolution"]
+
+
+class ElementAnalysis(BaseModel):
+    value: str = Field(..., min_length=1)
+    confidence: int = Field(..., ge=0, le=100)
+
+
+class StoryElements(BaseModel):
+    character: Optional[ElementAnalysis] = None
+    setting: Optional[ElementAnalysis] = None
+    emotion: Optional[ElementAnalysis] = None
+    action: Optional[ElementAnalysis] = None
+    conflict: Optional[ElementAnalysis] = None
+    resolution: Optional[ElementAnalysis] = None
+
+
+class StoryElementsOutput(BaseModel):
+    """物語要素の分析（analyze_story_elements）"""
+    elements: StoryElements
+    missing_elements: List[StoryElementName] = []
+
+
+class StoryElementsBatchItem(StoryElementsOutput):
+    id: str = Field(..., min_length=1)  # 要求に付けた画像の id
+
+
+class StoryElementsBatchOutput(BaseModel):
+    """複数の画像の物語要素の分析（analyze_story_elements のまとめ処理）"""
+    results: List[StoryElementsBatchItem] = Field(..., min_length=1)
+
+
+class StoryElementsBatchEnvelope(BaseModel):
+    """まとめ処理の応答の外側（results の各項目は StoryElementsBatchItem で個別に検証する）"""
+    results: List[Dict[str, Any]]
+
+
+class QuestionOutput(BaseModel):
+    target_element: str = Field(..., min_length=1)
+    reason: str = ""
+    question: str = Field(..., min_length=1)
+    type: Literal["open", "choice"] = "open"
+    options: Optional[List[str]] = None
+    followups: List[str] = []
+
+    @model_validator(mode="after")
+    def check_options(self):
+        if self.type == "choice" and len(self.options or []) < 2:
+            raise ValueError("type が choice の質問には options を2つ以上指定してください")
+        return self
+
+
+class QuestionSetOutput(BaseModel):
+    """質問の生成（generate_questions）"""
+    questions: List[QuestionOutput] = Field(..., min_length=1)
+    meta: Dict[str, Any] = {}
+
+
+class Completeness(BaseModel):
+    score: int = Field(..., ge=0, le=100)
+    missing_elements: List[str] = []
+    sufficient_elements: List[str] = []
+
+
+class AgeAppropriateness(BaseModel):
+    score: int = Field(..., ge=0, le=100)
+    issues: List[str] = []
+    strengths: List[str] = []
+
+
+class StoryCoherence(BaseModel):
+    score: int = Field(..., ge=0, le=100)
+    issues: List[str] = []
+    suggestions: List[str] = []
+
+
+class ValidationResultOutput(BaseModel):
+    overall_score: int = Field(..., ge=0, le=100)
+    completeness: Completeness
+    age_appropriateness: AgeAppropriateness
+    story_coherence: StoryCoherence
+    recommendations: List[str] = []
+    ready_for_story: bool
+
+
+class ValidationOutput(BaseModel):
+    """収集した情報の検証（validate_collected_information）"""
+    validation_result: ValidationResultOutput
+    meta: Dict[str, Any] = {}
+
+
+class OutlinePage(BaseModel):
+    page_number: int = Field(..., ge=1)
+    summary: str = Field(..., min_length=1)
+
+
+class OutlineOutput(BaseModel):
+    """絵本の構成（generate_outline）"""
+    title: str = Field(..., min_length=1)
+    pages: List[OutlinePage] = Field(..., min_length=1)
@@ -0,0 +1,81 @@
+from pydantic import BaseModel, Field
+from typing import List, Optional, Dict, Any, Union
+from datetime import datetime
+from app.schemas.asset_analysis import AnalysisResult
+from app.schemas.story_question import StoryQuestionBase
+from app.schemas.story_answer import StoryAnswerBase
+
+class StoryElement(BaseModel):
+    value: Optional[Any] = None
+    confidence: Optional[Union[int, float]] = None
+
+    class Config:
+        extra = "allow"
+
+class StoryAnalysisResponse(BaseModel):
+    id: int
+    status: str
+    story_elements: Dict[str, StoryElement] = {}
+    missing_elements: List[str] = []
+    vision_analysis: Optional[AnalysisResult] = None  # verbose 指定時のみ
+
+class GeneratedQuestion(BaseModel):
+    target_element: Optional[str] = None
+    reason: Optional[str] = None
+    question: str
+    type: str = "open"
+    options: Optional[List[str]] = None
+    followups: Optional[List[str]] = None
+
+class SavedQuestion(StoryQuestionBase):
+    id: int
+    image_id: int
+    created_at: Optional[datetime] = None
+
+class QuestionsResponse(BaseModel):
+    id: int
+    status: str
+    missing_elements: List[str]
+    saved_questions: List[SavedQuestion]
+    questions: Optional[List[GeneratedQuestion]] = None  # verbose 指定時のみ（saved_questions と同内容）
+
+class SavedAnswer(StoryAnswerBase):
+    id: int
+    question_id: int
+    user_id: Optional[int] = None
+    created_at: Optional[datetime] = None
+
+class AnswersResponse(BaseModel):
+    status: str
+    message: str
+    saved_answers: List[SavedAnswer]
+
+class ScoredSection(BaseModel):
+    score: Optional[Union[int, float]] = None
+
+    class Config:
+        extra = "allow"
+
+class ValidationResult(BaseModel):
+    overall_score: Optional[Union[int, float]] = None
+    completeness: Optional[ScoredSection] = None
+    age_appropriateness: Optional[ScoredSection] = None
+    story_coherence: Optional[ScoredSection] = None
+    recommendations: List[Any] = []
+    ready_for_story: Optional[bool] = None
+
+    class Config:
+        extra = "allow"
+
+class ValidationResponse(BaseModel):
+    status: str
+    image_id: int
+    validation_result: ValidationResult
+    meta: Dict[str, Any] = {}
+    message: str
+
+class GenerateStoryRequest(BaseModel):
+    page_count: Optional[int] = Field(None, ge=1, le=20)  # 未指定の場合は設定値
+    title: Optional[str] = None  # 未指定の場合は LLM が決める
+    user_id: Optional[int] = None
+    image_ids: Optional[List[int]] = None  # ページに使う画像（順に繰り返す）。未指定の場合はインタビューの画像
@@ -1,11 +1,17 @@
-from pydantic import BaseModel
-from typing import Optional, Dict, Any, List
+from pydantic import BaseModel, Field
+from typing import Annotated, Optional, Dict, List
 from datetime import datetime
 
+# 回答の文字数の上限（selected_option は story_answers.selected_option の列の長さ）
+ANSWER_TEXT_MAX_LENGTH = 2000
+SELECTED_OPTION_MAX_LENGTH = 200
+
+AnswerText = Annotated[str, Field(max_length=ANSWER_TEXT_MAX_LENGTH)]
+
 class StoryAnswerBase(BaseModel):
-    answer_text: str
-    selected_option: Optional[str] = None
-    followup_answers: Optional[Dict[str, str]] = None
+    answer_text: AnswerText
+    selected_option: Optional[str] = Field(None, max_length=SELECTED_OPTION_MAX_LENGTH)
+    followup_answers: Optional[Dict[AnswerText, AnswerText]] = None
 
 class StoryAnswerCreate(StoryAnswerBase):
     question_id: int
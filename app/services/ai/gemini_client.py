@@ -1,29 +1,194 @@
 # Gemini クライアント
-import os
+import asyncio
+import re
+import time
 import logging
-from typing import Dict, Any, List
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain.prompts import ChatPromptTemplate
+from functools import lru_cache
+from typing import Dict, Any, List, Tuple, Type, TypeVar
+from pydantic import BaseModel, ValidationError
 from app.core.config import settings
+from app.core.metrics import metrics
+from app.core.rate_limit import charge_route_budget
+from app.schemas.llm_output import (
+    StoryElementsBatchEnvelope, StoryElementsBatchItem, StoryElementsBatchOutput, StoryElementsOutput,
+)
+from app.services.ai.hedging import hedger
+from app.services.ai.micro_batcher import MicroBatcher
+from app.services.ai.model_router import model_router
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T", bound=BaseModel)
+
+# スキーマに合わない応答に対する修正依頼
+REPAIR_PROMPT = """直前の回答は指定した JSON スキーマに合いませんでした。
+エラー:
+{errors}
+
+内容は変えずに、エラーを直した JSON だけをもう一度出力してください。説明や ``` は不要です。"""
+
+_FENCE = re.compile(r"```(?:json)?\s*(.*?)\s*```", re.DOTALL)
+
+
+class StructuredOutputError(ValueError):
+    """修正を依頼しても応答がスキーマに合わない"""
+
+
+@lru_cache(maxsize=None)
+def response_schema(schema: Type[BaseModel]) -> Dict[str, Any]:
+    """モデルに渡す JSON スキーマ（$defs の参照を展開する）"""
+    document = schema.model_json_schema()
+    definitions = document.pop("$defs", {})
+    
+    def resolve(node):
+        if isinstance(node, dict):
+            if "$ref" in node:
+                return resolve(definitions[node["$ref"].rsplit("/", 1)[-1]])
+            return {key: resolve(value) for key, value in node.items()}
+        if isinstance(node, list):
+            return [resolve(value) for value in node]
+        return node
+    
+    return resolve(document)
+
+
+def parse_structured(text: str, schema: Type[T]) -> T:
+    """応答をスキーマで検証（``` で囲まれている・前後に説明がある場合は JSON 部分だけを使う）"""
+    fenced = _FENCE.search(text)
+    if fenced:
+        text = fenced.group(1)
+    elif not text.startswith("{"):
+        start, end = text.find("{"), text.rfind("}")
+        if start != -1 and end > start:
+            text = text[start:end + 1]
+    return schema.model_validate_json(text)
+
+
+def describe_errors(error: ValidationError, limit: int = 5) -> str:
+    """修正依頼とログ用のエラーの要約"""
+    lines = []
+    for detail in error.errors()[:limit]:
+        location = ".".join(str(part) for part in detail["loc"]) or "(全体)"
+        lines.append(f"- {location}: {detail['msg']}")
+    return "\n".join(lines)
+
+
+STORY_ELEMENTS_GUIDE = """物語に必要な要素:
+1. キャラクター（character）: 主人公や登場人物
+2. 設定（setting）: 場所や環境
+3. 感情（emotion）: 気持ちや感情
+4. 行動（action）: 出来事や行動
+5. 問題（conflict）: 課題や問題
+6. 解決（resolution）: 解決や結末
+
+画像から読み取れた要素だけを elements に入れ（confidence は 0〜100）、読み取れない要素は missing_elements に入れてください。"""
+
+STORY_ELEMENTS_PROMPT = f"""あなたは物語分析の専門家です。画像の内容を基に、物語に必要な要素を分析し、不足している要素を特定してください。
+
+{STORY_ELEMENTS_GUIDE}
+JSON形式で回答してください：
+{{
+  "elements": {{
+    "character": {{"value": "分析結果", "confidence": 80}},
+    "setting": {{"value": "分析結果", "confidence": 70}}
+  }},
+  "missing_elements": ["conflict", "resolution"]
+}}"""
+
+# 複数の画像をまとめて分析する場合（画像ごとの結果を id つきで返させる）
+STORY_ELEMENTS_BATCH_PROMPT = f"""あなたは物語分析の専門家です。複数の画像それぞれについて、画像の内容を基に物語に必要な要素を分析し、不足している要素を特定してください。
+画像どうしは関係がありません。1枚ずつ独立に分析してください。
+
+{STORY_ELEMENTS_GUIDE}
+results には入力のすべての画像について、入力と同じ id をつけて1件ずつ入れてください。
+JSON形式で回答してください：
+{{
+  "results": [
+    {{
+      "id": "1",
+      "elements": {{"character": {{"value": "分析結果", "confidence": 80}}}},
+      "missing_elements": ["conflict", "resolution"]
+    }}
+  ]
+}}"""
+
+
 class GeminiClient:
     """Gemini 2.5 Flash クライアント"""
     
-    def __init__(self):
-        if not settings.google_api_key:
-            raise ValueError("GOOGLE_API_KEY環境変数が設定されていません")
+    def __init__(self, llm=None, creative_llm=None, model_factory=None):
+        """
+        Args:
+            llm / creative_llm: ainvoke を持つモデル（テスト・負荷試験では差し替え可能）
+            model_factory: (モデル名, creative) からモデルを作る関数。実モデルを使う場合と、これを指定した場合は
+                タスクごとにモデルを選ぶ（llm / creative_llm だけを差し替えた場合は常にそのモデルを使う）
+        """
+        if model_factory is None and (llm is None or creative_llm is None):
+            if not settings.google_api_key:
+                raise ValueError("GOOGLE_API_KEY環境変数が設定されていません")
+            model_factory = self._create_model
+        self.model_factory = model_factory
+        self._models: Dict[Tuple[str, bool], Any] = {}
+        
+        self.llm = llm or self.get_model("gemini-2.0-flash-exp", creative=False)
+        # 創造性を高めるために温度を上げたLLM
+        self.creative_llm = creative_llm or self.get_model("gemini-2.5-flash", creative=True)
+        
+        self.hedger = hedger
+        self.router = model_router
+        self.element_batcher = MicroBatcher(
+            self._analyze_story_elements_batch,
+            max_size=settings.story_elements_batch_max,
+            max_wait=settings.story_elements_batch_window,
+            name="llm.story_elements",
+        )
+    
+    @staticmethod
+    def _create_model(model: str, creative: bool):
+        # LangChain は import が重いため、モデル生成時に読み込む
+        from langchain_google_genai import ChatGoogleGenerativeAI
         
-        self.llm = ChatGoogleGenerativeAI(
-            model="gemini-2.0-flash-exp",
+        return ChatGoogleGenerativeAI(
+            model=model,
             google_api_key=settings.google_api_key,
-            temperature=0.7,
+            temperature=0.9 if creative else 0.7,  # 創造的な生成は温度を上げて多様性を増す
             max_output_tokens=2048,
             convert_system_message_to_human=True
         )
     
-    async def generate_text(self, prompt: str, system_message: str = "") -> str:
+    def get_model(self, model: str, creative: bool):
+        """モデル名と温度の組ごとのモデル（初回に作成）"""
+        key = (model, creative)
+        if key not in self._models:
+            self._models[key] = self.model_factory(model, creative)
+        return self._models[key]
+    
+    async def _invoke(self, messages, task: str, creative: bool, **options):
+        """
+        ainvoke（タスクごとにモデルを選び、LLM_HEDGING_ENABLED の場合は遅い呼び出しをヘッジする）
+        
+        タスクが LLM_MODEL_ROUTES にない場合は llm / creative_llm を使う。
+        呼び出す前にリクエストのルート全体のバケットを消費する（RATE_LIMIT_ROUTE_RATE を設定した場合）。
+        """
+        await charge_route_budget()
+        model = None
+        if self.model_factory is not None and settings.llm_routing_enabled:
+            model = self.router.choose(task, sum(len(text) for _, text in messages))
+        if model is None:
+            llm = self.creative_llm if creative else self.llm
+            return await self.hedger.call(task, lambda: llm.ainvoke(messages, **options))
+        
+        llm = self.get_model(model, creative)
+        start = time.perf_counter()
+        try:
+            response = await self.hedger.call(task, lambda: llm.ainvoke(messages, **options))
+        except Exception:
+            self.router.record(model, task, time.perf_counter() - start, ok=False)
+            raise
+        self.router.record(model, task, time.perf_counter() - start, ok=True)
+        return response
+    
+    async def generate_text(self, prompt: str, system_message: str = "", task: str = "text") -> str:
         """テキスト生成"""
         try:
             messages = []
@@ -31,101 +196,140 @@ class GeminiClient:
                 messages.append(("system", system_message))
             messages.append(("human", prompt))
             
-            response = await self.llm.ainvoke(messages)
+            response = await self._invoke(messages, task, creative=False)
             return response.content.strip()
             
         except Exception as e:
             logger.error(f"Gemini生成エラー: {str(e)}")
             raise
     
-    async def generate_creative_text(self, prompt: str, system_message: str = "") -> str:
+    async def generate_creative_text(self, prompt: str, system_message: str = "", task: str = "creative_text") -> str:
         """創造的なテキスト生成（温度設定を上げて多様性を増す）"""
         try:
-            # 創造性を高めるために温度を上げたLLMを作成
-            creative_llm = ChatGoogleGenerativeAI(
-                model="gemini-2.5-flash",
-                google_api_key=settings.google_api_key,
-                temperature=0.9,  # より高い温度設定
-                max_output_tokens=2048,
-                convert_system_message_to_human=True
-            )
-            
             messages = []
             if system_message:
                 messages.append(("system", system_message))
             messages.append(("human", prompt))
             
-            response = await creative_llm.ainvoke(messages)
+            response = await self._invoke(messages, task, creative=True)
             return response.content.strip()
             
         except Exception as e:
             logger.error(f"Gemini創造的生成エラー: {str(e)}")
             raise
     
-    async def analyze_story_elements(self, vision_analysis: Dict[str, Any]) -> Dict[str, Any]:
-        """物語要素を分析"""
-        system_message = """あなたは物語分析の専門家です。画像の内容を基に、物語に必要な要素を分析し、不足している要素を特定してください。
-
-物語に必要な要素:
-1. キャラクター（character）: 主人公や登場人物
-2. 設定（setting）: 場所や環境
-3. 感情（emotion）: 気持ちや感情
-4. 行動（action）: 出来事や行動
-5. 問題（conflict）: 課題や問題
-6. 解決（resolution）: 解決や結末
-
-JSON形式で回答してください：
-{
-  "elements": {
-    "character": {"value": "分析結果", "confidence": 80},
-    "setting": {"value": "分析結果", "confidence": 70}
-  },
-  "missing_elements": ["conflict", "resolution"]
-}"""
+    async def generate_structured(self, prompt: str, system_message: str, schema: Type[T],
+                                  creative: bool = False, task: str = "structured") -> T:
+        """
+        スキーマに沿った JSON を生成して検証する
+        
+        構造化出力（JSON モードと response_schema）で生成し、応答をスキーマで1回だけ検証する。
+        検証に失敗した場合は、応答とエラー内容を添えて1回だけ修正を依頼し、それでも合わなければ
+        StructuredOutputError を送出する（呼び出しは最大2回）。
+        
+        Args:
+            creative: True の場合は温度の高いモデルを使う
+            task: モデル選択のタスク名（LLM_MODEL_ROUTES）。メトリクスは llm.<task>.calls / .parse_errors / .repaired / .failed
+        """
+        messages = []
+        if system_message:
+            messages.append(("system", system_message))
+        messages.append(("human", prompt))
+        options = self._structured_options(schema)
+        
+        metrics.increment(f"llm.{task}.calls")
+        try:
+            response = await self._invoke(messages, task, creative, **options)
+        except Exception as e:
+            logger.error(f"Gemini生成エラー ({task}): {str(e)}")
+            raise
+        content = response.content.strip()
+        try:
+            return parse_structured(content, schema)
+        except ValidationError as e:
+            metrics.increment(f"llm.{task}.parse_errors")
+            errors = describe_errors(e)
+            logger.warning(f"スキーマに合わない応答のため修正を依頼します ({task}): {errors} / 応答: {content[:200]}")
         
+        messages += [("ai", content), ("human", REPAIR_PROMPT.format(errors=errors))]
+        metrics.increment(f"llm.{task}.calls")
+        try:
+            response = await self._invoke(messages, task, creative, **options)
+        except Exception as e:
+            logger.error(f"Gemini修正依頼エラー ({task}): {str(e)}")
+            raise
+        content = response.content.strip()
+        try:
+            result = parse_structured(content, schema)
+        except ValidationError as e:
+            metrics.increment(f"llm.{task}.failed")
+            logger.error(f"修正後もスキーマに合いません ({task}): {describe_errors(e)} / 応答: {content[:500]}")
+            raise StructuredOutputError(f"{task}: 応答がスキーマに合いません") from e
+        metrics.increment(f"llm.{task}.repaired")
+        return result
+    
+    def _structured_options(self, schema: Type[BaseModel]) -> Dict[str, Any]:
+        """ainvoke に渡す構造化出力の指定（LLM_STRUCTURED_OUTPUT=false の場合はプロンプトの指示のみ）"""
+        if not settings.llm_structured_output:
+            return {}
+        return {"response_mime_type": "application/json", "response_schema": response_schema(schema)}
+    
+    async def analyze_story_elements(self, vision_analysis: Dict[str, Any]) -> Dict[str, Any]:
+        """物語要素を分析（STORY_ELEMENTS_BATCHING_ENABLED の場合は同時に届いた分析とまとめて呼び出す）"""
+        if settings.story_elements_batching_enabled:
+            # まとめた呼び出しは最初の要求の分しか消費しないため、要求ごとにここで消費する
+            await charge_route_budget()
+            return await self.element_batcher.submit(vision_analysis)
+        return await self._analyze_story_elements_one(vision_analysis)
+    
+    async def _analyze_story_elements_one(self, vision_analysis: Dict[str, Any]) -> Dict[str, Any]:
         prompt = f"画像の解析結果: {vision_analysis}"
-        response = await self.generate_text(prompt, system_message)
-        return self._parse_json_response(response)
+        result = await self.generate_structured(prompt, STORY_ELEMENTS_PROMPT, StoryElementsOutput, task="story_elements")
+        return result.model_dump(exclude_none=True)
     
-    def _parse_json_response(self, response_text: str) -> Dict[str, Any]:
-        """JSONレスポンスをパース"""
-        import json
-        import re
+    async def _analyze_story_elements_batch(self, items: List[Dict[str, Any]]) -> List[Any]:
+        """
+        複数の画像の物語要素を1回の呼び出しで分析する
         
+        応答の results を id で画像に戻し、id がない・重複する・スキーマに合わない画像だけを1件ずつ分析し直す
+        （まとめた応答全体が JSON として読めない場合は全件）。アップストリームのエラーは全件に返す。
+        """
+        if len(items) == 1:
+            return [await self._analyze_story_elements_one(items[0])]
+        
+        prompt = "\n".join(f'画像 id="{number}" の解析結果: {item}' for number, item in enumerate(items, start=1))
+        messages = [("system", STORY_ELEMENTS_BATCH_PROMPT), ("human", prompt)]
+        metrics.increment("llm.story_elements.calls")
+        response = await self._invoke(messages, "story_elements", False,
+                                      **self._structured_options(StoryElementsBatchOutput))
+        content = response.content.strip()
+        
+        analyzed: Dict[str, Dict[str, Any]] = {}
         try:
-            # ```json で囲まれている場合を処理
-            if '```json' in response_text:
-                # ```json と ``` の間の内容を抽出
-                json_match = re.search(r'```json\s*(.*?)\s*```', response_text, re.DOTALL)
-                if json_match:
-                    json_str = json_match.group(1).strip()
-                    return json.loads(json_str)
-            
-            # 通常のJSONブロックを検索
-            # より柔軟な正規表現でネストしたJSONを検出
-            json_pattern = r'\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\}'
-            json_blocks = re.findall(json_pattern, response_text, re.DOTALL)
-            
-            if json_blocks:
-                # 最も長いJSONブロックを選択
-                longest_block = max(json_blocks, key=len)
-                return json.loads(longest_block)
-            
-            # 従来の方法も試す
-            start_idx = response_text.find('{')
-            end_idx = response_text.rfind('}') + 1
-            
-            if start_idx != -1 and end_idx != -1:
-                json_str = response_text[start_idx:end_idx]
-                return json.loads(json_str)
-            else:
-                logger.warning(f"JSON形式が見つかりません: {response_text[:200]}...")
-                return {"elements": {}, "missing_elements": []}
-                
-        except json.JSONDecodeError as e:
-            logger.error(f"JSON解析エラー: {str(e)}")
-            logger.error(f"レスポンス内容: {response_text[:500]}...")
-            return {"elements": {}, "missing_elements": []}
+            envelope = parse_structured(content, StoryElementsBatchEnvelope)
+        except ValidationError as e:
+            metrics.increment("llm.story_elements.parse_errors")
+            logger.warning(f"まとめた物語要素の分析を解析できません（{len(items)}件を個別に分析）: {describe_errors(e)}")
+            envelope = StoryElementsBatchEnvelope(results=[])
+        duplicated = set()
+        for raw in envelope.results:
+            try:
+                item = StoryElementsBatchItem.model_validate(raw)
+            except ValidationError as e:
+                logger.warning(f"まとめた物語要素の分析の一部がスキーマに合いません: {describe_errors(e)}")
+                continue
+            if item.id in analyzed:
+                duplicated.add(item.id)
+            analyzed[item.id] = item.model_dump(exclude_none=True, exclude={"id"})
+        
+        retry = [number for number in range(1, len(items) + 1)
+                 if str(number) not in analyzed or str(number) in duplicated]
+        if retry:
+            metrics.increment("llm.story_elements.batch_fallback", len(retry))
+            retried = await asyncio.gather(*(self._analyze_story_elements_one(items[number - 1]) for number in retry),
+                                           return_exceptions=True)
+            analyzed.update({str(number): result for number, result in zip(retry, retried)})
+        return [analyzed[str(number)] for number in range(1, len(items) + 1)]
 
 # シングルトンインスタンス（遅延初期化）
 _gemini_client = None
@@ -135,4 +339,9 @@ def get_gemini_client():
     global _gemini_client
     if _gemini_client is None:
         _gemini_client = GeminiClient()
-    return _gemini_client
\ No newline at end of file
+    return _gemini_client
+
+def set_gemini_client(client: GeminiClient):
+    """Geminiクライアントを差し替える（テスト・負荷試験用）"""
+    global _gemini_client
+    _gemini_client = client
\ No newline at end of file
@@ -0,0 +1,117 @@
+"""
+LLM 呼び出しのヘッジ（裾の長いレイテンシ対策）
+
+最初の呼び出しが、その操作の直近のレイテンシの p90（LLM_HEDGE_PERCENTILE）を過ぎても返らない場合に
+同じ内容の呼び出しをもう1つ送り、先に返った方を使ってもう一方はキャンセルする。
+
+ヘッジの数は全体の予算（LLM_HEDGE_BUDGET、呼び出しに対する割合）で制限する。
+呼び出しごとに予算を LLM_HEDGE_BUDGET ずつ積み立て、ヘッジ1回で 1 を使う（上限 LLM_HEDGE_BURST）。
+アップストリームが全体に遅くなった場合でも、呼び出しが予算以上に増えることはない。
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Awaitable, Callable, Deque, Dict, Optional, TypeVar
+from app.core.config import settings
+from app.core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class Hedger:
+    """操作ごとのレイテンシの記録とヘッジの予算"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._latencies: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=settings.llm_hedge_window))
+        self._tokens = settings.llm_hedge_burst
+
+    def delay(self, operation: str) -> Optional[float]:
+        """ヘッジを送るまでの待ち時間（記録が足りない間は None でヘッジしない）"""
+        with self._lock:
+            values = sorted(self._latencies[operation])
+        if len(values) < settings.llm_hedge_min_samples:
+            return None
+        index = min(len(values) - 1, int(settings.llm_hedge_percentile * len(values)))
+        return max(settings.llm_hedge_min_delay, values[index])
+
+    def record(self, operation: str, elapsed: float) -> None:
+        with self._lock:
+            self._latencies[operation].append(elapsed)
+
+    def _earn(self) -> None:
+        with self._lock:
+            self._tokens = min(settings.llm_hedge_burst, self._tokens + settings.llm_hedge_budget)
+
+    def _spend(self) -> bool:
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+    async def call(self, operation: str, invoke: Callable[[], Awaitable[T]]) -> T:
+        """
+        invoke() を呼び出し、必要ならヘッジする
+
+        Args:
+            operation: レイテンシを分けて記録する単位（questions / validation など）
+            invoke: 呼び出すたびに新しいリクエストを送るコルーチン関数
+        """
+        if not settings.llm_hedging_enabled:
+            return await invoke()
+
+        self._earn()
+        delay = self.delay(operation)
+        start = time.perf_counter()
+        primary = asyncio.ensure_future(invoke())
+        if delay is None:
+            result = await primary
+            self.record(operation, time.perf_counter() - start)
+            return result
+
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if done:
+                result = primary.result()
+                self.record(operation, time.perf_counter() - start)
+                return result
+            if not self._spend():
+                metrics.increment("llm.hedge.budget_exhausted")
+                result = await primary
+                self.record(operation, time.perf_counter() - start)
+                return result
+        except BaseException:
+            primary.cancel()
+            raise
+
+        metrics.increment("llm.hedge.sent")
+        metrics.increment(f"llm.{operation}.hedged")
+        hedge_start = time.perf_counter()
+        hedge = asyncio.ensure_future(invoke())
+        pending = {primary, hedge}
+        try:
+            while True:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                succeeded = [task for task in done if task.exception() is None]
+                if not succeeded and pending:
+                    continue  # 失敗した方は捨てて、もう一方を待つ
+                winner = (succeeded or list(done))[0]
+                if winner is hedge:
+                    metrics.increment("llm.hedge.won")
+                    self.record(operation, time.perf_counter() - hedge_start)
+                else:
+                    self.record(operation, time.perf_counter() - start)
+                return winner.result()
+        finally:
+            for task in (primary, hedge):
+                task.cancel()
+
+
+# シングルトンインスタンス
+hedger = Hedger()
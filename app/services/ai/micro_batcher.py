@@ -0,0 +1,75 @@
+"""
+短い時間窓に届いた要求をまとめて処理するマイクロバッチ
+
+最初の要求から max_wait 秒、または max_size 件たまった時点で、たまった要求を handler にまとめて渡す。
+handler は要求と同じ順で結果のリストを返す（要求ごとに失敗させる場合は、その位置に例外を入れる）。
+handler 自体が例外を送出した場合は、まとめた全要求にその例外を返す。
+"""
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Generic, List, Optional, Set, Tuple, TypeVar
+from app.core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class MicroBatcher(Generic[T, R]):
+    """要求をまとめて handler に渡し、結果を要求ごとに返す"""
+
+    def __init__(self, handler: Callable[[List[T]], Awaitable[List[Any]]], max_size: int, max_wait: float, name: str):
+        """
+        Args:
+            handler: 要求のリストを受け取り、同じ順の結果（または例外）のリストを返すコルーチン関数
+            max_size: 1回にまとめる上限
+            max_wait: 最初の要求からまとめて渡すまでの待ち時間（秒）
+            name: メトリクス名（<name>.batch_size / <name>.batched）
+        """
+        self.handler = handler
+        self.max_size = max_size
+        self.max_wait = max_wait
+        self.name = name
+        self._pending: List[Tuple[T, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # 実行中のまとめ処理（イベントループは弱参照しか持たないため、完了まで参照を保持する）
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def submit(self, item: T) -> R:
+        """要求を追加し、まとめて処理された結果を待つ"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self.max_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[Tuple[T, asyncio.Future]]) -> None:
+        metrics.observe(f"{self.name}.batch_size", len(batch))
+        if len(batch) > 1:
+            metrics.increment(f"{self.name}.batched", len(batch))
+        try:
+            results = await self.handler([item for item, _ in batch])
+        except Exception as e:
+            results = [e] * len(batch)
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue  # 要求側がキャンセル済み
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
@@ -0,0 +1,122 @@
+"""
+タスクごとの Gemini モデルの選択
+
+LLM_MODEL_ROUTES にタスク（story_elements / questions / validation / outline / caption）ごとの
+候補を優先順に並べ、呼び出しのたびに次の条件で先頭から選ぶ。
+
+    プロンプトの長さ   LLM_MODEL_MAX_PROMPT_CHARS を超えるモデルは使わない（長い入力を軽量モデルに回さない）
+    レイテンシ        そのモデル・タスクの直近の p90 が LLM_LATENCY_SLO（秒）を超えていれば次の候補へ
+    エラー率          直近のエラー率が LLM_ROUTER_MAX_ERROR_RATE を超えていれば次の候補へ
+
+統計は LLM_ROUTER_STATS_TTL 秒で古いものから捨てるため、切り替えたモデルも記録が減ると
+（判定できないモデルは使える扱いになり）再び試される。どの候補も条件を満たさない場合は、
+p90 がもっとも小さい候補を使う。
+"""
+
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Deque, Dict, List, Optional, Tuple
+from app.core.config import settings
+from app.core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class ModelStats:
+    """モデル・タスクごとの直近の (時刻, レイテンシ, 成否)"""
+
+    def __init__(self):
+        self.samples: Deque[Tuple[float, float, bool]] = deque(maxlen=settings.llm_router_window)
+
+    def _expire(self, now: float) -> None:
+        while self.samples and now - self.samples[0][0] > settings.llm_router_stats_ttl:
+            self.samples.popleft()
+
+    def summary(self, now: float) -> Optional[Tuple[float, float]]:
+        """(p90 レイテンシ, エラー率)。記録が LLM_ROUTER_MIN_SAMPLES 件未満なら None"""
+        self._expire(now)
+        if len(self.samples) < settings.llm_router_min_samples:
+            return None
+        latencies = sorted(latency for _, latency, _ in self.samples)
+        errors = sum(1 for _, _, ok in self.samples if not ok)
+        return latencies[min(len(latencies) - 1, int(0.9 * len(latencies)))], errors / len(self.samples)
+
+
+class ModelRouter:
+    """タスクごとのモデルの選択と、呼び出し結果の記録"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Dict[Tuple[str, str], ModelStats] = defaultdict(ModelStats)
+        self._current: Dict[Tuple[str, Tuple[str, ...]], str] = {}  # (タスク, 使える候補) ごとの前回の選択（切り替わりのログ用）
+
+    def routes(self, task: str) -> List[str]:
+        return settings.llm_model_routes.get(task, [])
+
+    def choose(self, task: str, prompt_chars: int) -> Optional[str]:
+        """
+        モデルを選ぶ（タスクが LLM_MODEL_ROUTES にない場合は None）
+
+        Returns:
+            str: モデル名
+        """
+        candidates = self.routes(task)
+        if not candidates:
+            return None
+        now = time.monotonic()
+        slo = settings.llm_latency_slo.get(task)
+        allowed, reasons, fallback = [], [], None
+        for model in candidates:
+            limit = settings.llm_model_max_prompt_chars.get(model)
+            if limit is not None and prompt_chars > limit:
+                reasons.append(f"{model}: プロンプトが長い（{prompt_chars}字）")
+            else:
+                allowed.append(model)
+        with self._lock:
+            for model in allowed:
+                summary = self._stats[(model, task)].summary(now)
+                if summary is None:
+                    chosen = model
+                    break
+                p90, error_rate = summary
+                if fallback is None or p90 < fallback[1]:
+                    fallback = (model, p90)
+                if error_rate > settings.llm_router_max_error_rate:
+                    reasons.append(f"{model}: エラー率 {error_rate:.0%}")
+                elif slo is not None and p90 > slo:
+                    reasons.append(f"{model}: p90 {p90:.1f}秒 > SLO {slo:.1f}秒")
+                else:
+                    chosen = model
+                    break
+            else:
+                # どの候補も条件を満たさない場合は、もっとも速い候補（プロンプトがどの候補にも長すぎる場合は先頭の候補）
+                chosen = fallback[0] if fallback else candidates[0]
+                reasons.append("条件を満たす候補なし")
+            # プロンプトの長さで候補が変わる場合は別々に扱う（長さの違いだけで切り替えのログを出さない）
+            previous = self._current.get((task, tuple(allowed)))
+            self._current[(task, tuple(allowed))] = chosen
+
+        decision = "preferred" if chosen == candidates[0] else "downgraded"
+        metrics.increment(f"llm.router.{task}.{decision}")
+        metrics.set_gauge(f"llm.router.{task}.downgraded", 0 if decision == "preferred" else 1)
+        metrics.increment(f"llm.router.model.{chosen}")
+        if previous is not None and previous != chosen:
+            logger.info(f"モデルを切り替えました ({task}): {previous} → {chosen}（{'; '.join(reasons) or '優先モデルに復帰'}）")
+            metrics.increment("llm.router.switches")
+        else:
+            logger.debug(f"モデルを選択 ({task}): {chosen} {reasons}")
+        return chosen
+
+    def record(self, model: str, task: str, elapsed: float, ok: bool) -> None:
+        """呼び出しの結果を記録"""
+        with self._lock:
+            self._stats[(model, task)].samples.append((time.monotonic(), elapsed, ok))
+        metrics.observe(f"llm.model.{model}", elapsed)
+        if not ok:
+            metrics.increment(f"llm.model.{model}.errors")
+
+
+# シングルトンインスタンス
+model_router = ModelRouter()
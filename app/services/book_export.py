@@ -0,0 +1,215 @@
+import hashlib
+import io
+import logging
+import zipfile
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+from uuid import uuid4
+from PIL import Image
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.services.book_renderer import book_render_service, touch
+
+logger = logging.getLogger(__name__)
+
+EXPORTS_DIR_NAME = "exports"
+EXPORT_FORMATS = {"pdf": "application/pdf", "zip": "application/zip"}
+
+# 出力形式が変わる変更をしたら上げる（キャッシュキーに含まれる）
+EXPORT_VERSION = 1
+CHUNK_SIZE = 64 * 1024
+PDF_DPI = 150  # ページ画像の解像度（ページサイズの換算に使う）
+
+
+def _pdf_text(value: str) -> bytes:
+    """PDF の文字列（日本語を含むため UTF-16BE の16進数表記）"""
+    return b"<FEFF" + value.encode("utf-16-be").hex().upper().encode("ascii") + b">"
+
+
+def iter_pdf(pages: List[Path], title: str = "", chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    JPEG のページ画像から PDF を逐次生成する
+
+    JPEG はデコードせず DCTDecode ストリームとしてそのまま埋め込むため、
+    メモリ使用量はページ数や画像サイズによらず chunk_size 程度に収まる。
+    オブジェクト番号はページ順に決まるので、ページツリーを先に書き出せる。
+
+        1: Catalog, 2: Pages, 3: Info, 4 + 3i: Page, 5 + 3i: Contents, 6 + 3i: Image
+    """
+    offsets = []
+    position = 0
+
+    def emit(data: bytes) -> bytes:
+        nonlocal position
+        position += len(data)
+        return data
+
+    def begin_object(number: int) -> bytes:
+        offsets.append((number, position))
+        return emit(f"{number} 0 obj\n".encode("ascii"))
+
+    yield emit(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    kids = " ".join(f"{4 + 3 * i} 0 R" for i in range(len(pages)))
+    yield begin_object(1) + emit(b"<< /Type /Catalog /Pages 2 0 R >>\nendobj\n")
+    yield begin_object(2) + emit(f"<< /Type /Pages /Kids [{kids}] /Count {len(pages)} >>\nendobj\n".encode("ascii"))
+    yield begin_object(3) + emit(b"<< /Title " + _pdf_text(title) + b" /Producer (story-book-app) >>\nendobj\n")
+
+    for i, path in enumerate(pages):
+        page_number, content_number, image_number = 4 + 3 * i, 5 + 3 * i, 6 + 3 * i
+
+        # ヘッダーだけを読む（デコードしない）
+        with Image.open(path) as img:
+            if img.format != "JPEG":
+                raise ValueError(f"JPEG 以外のページ画像は埋め込めません: {path.name}")
+            width, height = img.size
+            color_space = "/DeviceGray" if img.mode == "L" else "/DeviceRGB"
+        page_width, page_height = width * 72 / PDF_DPI, height * 72 / PDF_DPI
+
+        yield begin_object(page_number) + emit((
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {page_width:.2f} {page_height:.2f}] "
+            f"/Resources << /XObject << /Im0 {image_number} 0 R >> >> /Contents {content_number} 0 R >>\nendobj\n"
+        ).encode("ascii"))
+
+        content = f"q {page_width:.2f} 0 0 {page_height:.2f} 0 0 cm /Im0 Do Q".encode("ascii")
+        yield begin_object(content_number) + emit(
+            f"<< /Length {len(content)} >>\nstream\n".encode("ascii") + content + b"\nendstream\nendobj\n"
+        )
+
+        size = path.stat().st_size
+        yield begin_object(image_number) + emit((
+            f"<< /Type /XObject /Subtype /Image /Width {width} /Height {height} /ColorSpace {color_space} "
+            f"/BitsPerComponent 8 /Filter /DCTDecode /Length {size} >>\nstream\n"
+        ).encode("ascii"))
+        with open(path, "rb") as f:
+            while chunk := f.read(chunk_size):
+                yield emit(chunk)
+        yield emit(b"\nendstream\nendobj\n")
+
+    xref_position = position
+    count = 4 + 3 * len(pages)
+    entries = dict(offsets)
+    xref = [f"xref\n0 {count}\n".encode("ascii"), b"0000000000 65535 f \n"]
+    xref += [f"{entries[number]:010d} 00000 n \n".encode("ascii") for number in range(1, count)]
+    yield emit(b"".join(xref))
+    yield emit((
+        f"trailer\n<< /Size {count} /Root 1 0 R /Info 3 0 R >>\nstartxref\n{xref_position}\n%%EOF\n"
+    ).encode("ascii"))
+
+
+class _ChunkSink(io.RawIOBase):
+    """zipfile の書き込み先（シーク不可。書き込まれたバイト列を溜めて取り出す）"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def iter_zip(pages: List[Tuple[str, Path]], chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    ページ画像の ZIP を逐次生成する
+
+    JPEG は圧縮済みなので無圧縮で格納する。書き込み先がシーク不可のため、
+    zipfile はサイズと CRC をデータ記述子として各エントリの後ろに書く。
+    """
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_STORED) as archive:
+        for name, path in pages:
+            with open(path, "rb") as src, archive.open(name, "w") as dst:
+                while chunk := src.read(chunk_size):
+                    dst.write(chunk)
+                    yield sink.drain()
+            yield sink.drain()
+    yield sink.drain()
+
+
+class BookExportService:
+    """絵本の PDF / ZIP 書き出し（書き出した結果は内容ベースのキーでキャッシュ）"""
+
+    def __init__(self, upload_dir: Path):
+        self.exports_dir = upload_dir / EXPORTS_DIR_NAME
+
+    async def prepare(self, db: Session, book_id: int, format: str, template: Optional[str] = None) -> Dict:
+        """
+        書き出しの準備（未描画のページを描画し、キャッシュ済みの出力を探す）
+
+        Args:
+            db: データベースセッション
+            book_id: 本のID
+            format: pdf / zip
+            template: 指定した場合はこのテンプレートで描画し直す（未指定の場合は描画済みのページをそのまま使う）
+
+        Returns:
+            Dict: path（キャッシュの保存先）, cached, filename（ダウンロード名）, media_type, pages, title
+        """
+        result = await book_render_service.render_book(db, book_id, template, missing_only=template is None)
+        book = result["book"]
+        if not book.pages:
+            raise ValueError(f"本 {book_id} にページがありません")
+
+        pages = [
+            (f"{page.page_number:03d}.jpg", book_render_service.rendered_path(page.rendered_filename))
+            for page in book.pages
+        ]
+        payload = "\0".join([str(EXPORT_VERSION), format, book.title] + [f"{name}:{path.name}" for name, path in pages])
+        key = hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+        path = self.exports_dir / f"{key}.{format}"
+
+        cached = path.exists()
+        if cached:
+            touch(path)
+        metrics.increment("book_export.cache.hit" if cached else "book_export.cache.miss")
+        return {
+            "path": path,
+            "cached": cached,
+            "filename": f"{book.title}.{format}",
+            "media_type": EXPORT_FORMATS[format],
+            "format": format,
+            "pages": pages,
+            "title": book.title,
+        }
+
+    def stream(self, export: Dict) -> Iterator[bytes]:
+        """出力を逐次生成しながらキャッシュファイルにも書き込む（最後まで送れた場合のみ保存）"""
+        if export["format"] == "pdf":
+            chunks = iter_pdf([path for _, path in export["pages"]], export["title"])
+        else:
+            chunks = iter_zip(export["pages"])
+
+        path: Path = export["path"]
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.{uuid4().hex}.tmp")
+        completed = False
+        try:
+            with open(tmp_path, "wb") as f:
+                for chunk in chunks:
+                    if chunk:
+                        f.write(chunk)
+                        yield chunk
+            tmp_path.replace(path)
+            completed = True
+        finally:
+            if not completed:
+                # クライアントの切断などで中断した場合
+                tmp_path.unlink(missing_ok=True)
+
+
+# シングルトンインスタンス
+book_export_service = BookExportService(Path(settings.upload_dir))
@@ -0,0 +1,165 @@
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy.orm import Session, selectinload
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.core.process_pool import get_process_pool
+from app.models.book import Book
+from app.models.book_page import BookPage
+from app.services.page_renderer import PAGE_TEMPLATES, find_font, page_cache_key, render_page
+
+logger = logging.getLogger(__name__)
+
+RENDERED_DIR_NAME = "rendered"
+
+
+@lru_cache(maxsize=4096)
+def _file_digest(path: str, mtime_ns: int, size: int) -> str:
+    """ファイル内容のハッシュ（更新時刻とサイズが同じ間はメモ化）"""
+    with open(path, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+def image_digest(path: Path) -> str:
+    stat = path.stat()
+    return _file_digest(str(path), stat.st_mtime_ns, stat.st_size)
+
+
+def touch(path: Path) -> None:
+    """キャッシュを使った時刻として更新時刻を更新（ストレージ保守の容量制限で古い順に削除する）"""
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+class BookRenderService:
+    """絵本ページの描画（結果は内容ベースのキーでキャッシュ）"""
+
+    def __init__(self, upload_dir: Path):
+        self.upload_dir = upload_dir
+        self.rendered_dir = upload_dir / RENDERED_DIR_NAME
+        self._font_path = None
+        self._font_resolved = False
+
+    @property
+    def font_path(self) -> Optional[str]:
+        if not self._font_resolved:
+            self._font_path = find_font(settings.book_font_path)
+            self._font_resolved = True
+            if self._font_path is None:
+                logger.warning("日本語フォントが見つかりません。BOOK_FONT_PATH を設定してください（Pillow 既定フォントで描画します）")
+        return self._font_path
+
+    def rendered_path(self, rendered_filename: str) -> Path:
+        return self.rendered_dir / rendered_filename
+
+    async def render_book(self, db: Session, book_id: int, template: Optional[str] = None,
+                          force: bool = False, missing_only: bool = False) -> Dict:
+        """
+        本の全ページを描画し、rendered_filename を更新する
+
+        内容（画像・キャプション・テンプレートとその版）が変わっていないページは描画済みのファイルを再利用する。
+        DB アクセスと元画像のハッシュ計算はスレッドで、描画はプロセスプールで行い、イベントループを止めない。
+
+        Args:
+            db: データベースセッション
+            book_id: 本のID
+            template: テンプレート名（未指定の場合は設定値）
+            force: True の場合はキャッシュを使わず描画し直す
+            missing_only: True の場合は描画済みのファイルがあるページをそのまま使う（テンプレートも変えない）
+
+        Returns:
+            Dict: book, template, rendered（描画したページ数）, cached（再利用したページ数）
+        """
+        template = template or settings.book_page_template
+        if template not in PAGE_TEMPLATES:
+            raise KeyError(template)
+
+        start = time.perf_counter()
+        book, page_keys, to_render, cached = await asyncio.to_thread(
+            self._plan, db, book_id, template, force, missing_only
+        )
+
+        if to_render:
+            loop = asyncio.get_running_loop()
+            await asyncio.gather(*(
+                loop.run_in_executor(
+                    get_process_pool(), render_page,
+                    str(source), caption, template, str(self.rendered_path(filename)), self.font_path,
+                )
+                for filename, (source, caption) in to_render.items()
+            ))
+
+        book = await asyncio.to_thread(self._save, db, book, page_keys)
+
+        elapsed = time.perf_counter() - start
+        metrics.observe("book_render.book", elapsed)
+        logger.info(f"本の描画完了 (book_id: {book_id}, 描画: {len(to_render)}, 再利用: {cached}, {elapsed:.2f}秒)")
+        return {"book": book, "template": template, "rendered": len(to_render), "cached": cached}
+
+    def _plan(self, db: Session, book_id: int, template: str, force: bool,
+              missing_only: bool) -> Tuple[Book, List[Tuple[BookPage, str]], Dict[str, Tuple[Path, str]], int]:
+        """
+        ページごとのキャッシュのキーを求め、描画が必要なページを選ぶ（スレッドで実行）
+
+        Returns:
+            (本, [(ページ, ファイル名)], {ファイル名: (元画像, キャプション)}（描画が必要な分）, 再利用したページ数)
+        """
+        book = db.query(Book).filter(Book.id == book_id).first()
+        if book is None:
+            raise ValueError(f"本 {book_id} が見つかりません")
+
+        self.rendered_dir.mkdir(parents=True, exist_ok=True)
+        page_keys: List[Tuple[BookPage, str]] = []
+        to_render: Dict[str, Tuple[Path, str]] = {}
+        cached = 0
+
+        for page in book.pages:
+            if missing_only and page.rendered_filename and self.rendered_path(page.rendered_filename).exists():
+                touch(self.rendered_path(page.rendered_filename))
+                page_keys.append((page, page.rendered_filename))
+                cached += 1
+                continue
+            source = self._source_path(page)
+            key = page_cache_key(image_digest(source), page.caption or "", template, self.font_path)
+            filename = f"{key}.jpg"
+            page_keys.append((page, filename))
+            if filename in to_render:
+                continue  # 同じ内容のページは一度だけ描画
+            if not force and self.rendered_path(filename).exists():
+                touch(self.rendered_path(filename))
+                cached += 1
+                metrics.increment("book_render.cache.hit")
+                continue
+            metrics.increment("book_render.cache.miss")
+            to_render[filename] = (source, page.caption or "")
+        return book, page_keys, to_render, cached
+
+    @staticmethod
+    def _save(db: Session, book: Book, page_keys: List[Tuple[BookPage, str]]) -> Book:
+        """rendered_filename を保存し、呼び出し側が使う本とページを読み直す（スレッドで実行）"""
+        for page, filename in page_keys:
+            page.rendered_filename = filename
+        db.commit()
+        # commit で期限切れになった属性を、イベントループ側で遅延読み込みしないようここで読み直す
+        return db.query(Book).options(selectinload(Book.pages)).filter(Book.id == book.id).one()
+
+    def _source_path(self, page: BookPage) -> Path:
+        """ページ画像のローカルパス"""
+        if page.image is None:
+            raise ValueError(f"ページ {page.page_number} の画像 {page.image_id} が見つかりません")
+        path = self.upload_dir / page.image.filename
+        if not path.exists():
+            raise ValueError(f"ページ {page.page_number} の画像ファイルが見つかりません: {page.image.filename}")
+        return path
+
+
+# シングルトンインスタンス
+book_render_service = BookRenderService(Path(settings.upload_dir))
@@ -0,0 +1,86 @@
+"""
+画像の幾何情報とドミナントカラーをローカルで計算する
+
+プロセスプールから呼ばれるため、DB やアプリ設定には依存しない。
+"""
+
+import io
+from typing import Dict, List, Union
+import numpy as np
+import requests
+from PIL import Image
+
+# パレット計算時の縮小サイズ
+SAMPLE_SIZE = 64
+PALETTE_SIZE = 5
+KMEANS_ITERATIONS = 10
+
+
+def _kmeans_palette(pixels: np.ndarray, k: int) -> List[Dict]:
+    """k-means でドミナントカラーを求める（割合の高い順）"""
+    if len(pixels) == 0:
+        return []
+    k = min(k, len(pixels))
+
+    # 輝度順に並べて等間隔に初期中心を取る（決定的な初期化）
+    luminance = pixels @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+    order = np.argsort(luminance)
+    centers = pixels[order[np.linspace(0, len(pixels) - 1, k).astype(int)]]
+
+    for _ in range(KMEANS_ITERATIONS):
+        distances = ((pixels[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2)
+        labels = distances.argmin(axis=1)
+        counts = np.bincount(labels, minlength=k)
+        sums = np.zeros_like(centers)
+        np.add.at(sums, labels, pixels)
+        nonempty = counts > 0
+        updated = centers.copy()
+        updated[nonempty] = sums[nonempty] / counts[nonempty, None]
+        if np.allclose(updated, centers, atol=0.5):
+            centers = updated
+            break
+        centers = updated
+
+    counts = np.bincount(labels, minlength=k)
+    palette = []
+    for index in np.argsort(-counts):
+        if counts[index] == 0:
+            continue
+        r, g, b = np.clip(np.rint(centers[index]), 0, 255).astype(int)
+        palette.append({
+            "rgb": {"r": int(r), "g": int(g), "b": int(b)},
+            "score": float(counts[index] / len(pixels))
+        })
+    return palette
+
+
+def extract_local_features(source: Union[bytes, str]) -> Dict:
+    """
+    画像サイズとドミナントカラーを計算する
+
+    Args:
+        source: 画像のバイト列、または公開URL
+
+    Returns:
+        Dict: width, height, palette
+    """
+    if isinstance(source, str):
+        response = requests.get(source, timeout=30)
+        response.raise_for_status()
+        source = response.content
+
+    with Image.open(io.BytesIO(source)) as img:
+        width, height = img.size
+        img.draft("RGB", (SAMPLE_SIZE * 2, SAMPLE_SIZE * 2))  # JPEG は縮小デコード
+        img = img.convert("RGBA")
+        img.thumbnail((SAMPLE_SIZE, SAMPLE_SIZE))
+        rgba = np.asarray(img, dtype=np.float32).reshape(-1, 4)
+
+    # 背景除去済みの透明ピクセルは除外
+    pixels = rgba[rgba[:, 3] >= 128, :3]
+
+    return {
+        "width": width,
+        "height": height,
+        "palette": _kmeans_palette(pixels, PALETTE_SIZE)
+    }
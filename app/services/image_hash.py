@@ -0,0 +1,147 @@
+import logging
+import threading
+from typing import BinaryIO, Dict, List, Optional, Tuple, Union
+from pathlib import Path
+import numpy as np
+from PIL import Image
+from app.core.config import settings
+from app.database.session import ReadSessionLocal
+from app.models.upload_image import UploadImage
+
+logger = logging.getLogger(__name__)
+
+HASH_SIZE = 8
+
+
+def compute_dhash(source: Union[str, Path, BinaryIO]) -> int:
+    """
+    差分ハッシュ（dHash, 64bit）を計算する
+
+    グレースケールで 9x8 に縮小し、隣接ピクセルの明暗差をビット列にする。
+    明るさやわずかな角度・解像度の違いではほとんど変化しない。
+    """
+    with Image.open(source) as img:
+        img.draft("L", (HASH_SIZE * 4, HASH_SIZE * 4))  # JPEG は縮小デコード
+        small = img.convert("L").resize((HASH_SIZE + 1, HASH_SIZE), Image.Resampling.LANCZOS)
+    pixels = np.asarray(small, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def hash_to_hex(value: int) -> str:
+    return f"{value:016x}"
+
+
+def hex_to_hash(value: str) -> int:
+    return int(value, 16)
+
+
+def hamming(a: int, b: int) -> int:
+    """ハミング距離"""
+    return (a ^ b).bit_count()
+
+
+class MultiIndexHash:
+    """
+    マルチインデックス・ハミング検索
+
+    64bit を (max_distance + 1) 個の区間に分割して区間ごとに索引する。
+    距離 max_distance 以内のハッシュは鳩の巣原理で少なくとも1区間が完全一致するため、
+    一致した区間の候補だけを距離計算すればよい。
+    """
+
+    def __init__(self, max_distance: int):
+        self.max_distance = max_distance
+        chunks = max_distance + 1
+        bits = HASH_SIZE * HASH_SIZE
+        bounds = [round(i * bits / chunks) for i in range(chunks + 1)]
+        self._chunks = [(bounds[i], (1 << (bounds[i + 1] - bounds[i])) - 1) for i in range(chunks)]
+        self._tables = [dict() for _ in range(chunks)]
+        self._values: Dict[int, int] = {}  # 画像ID → ハッシュ
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def add(self, value: int, image_id: int) -> None:
+        """追加（登録済みの画像IDは古いハッシュを取り除いてから登録し直す）"""
+        previous = self._values.get(image_id)
+        if previous == value:
+            return
+        if previous is not None:
+            self.remove(image_id)
+        self._values[image_id] = value
+        entry = (value, image_id)
+        for table, (shift, mask) in zip(self._tables, self._chunks):
+            table.setdefault((value >> shift) & mask, []).append(entry)
+
+    def remove(self, image_id: int) -> None:
+        value = self._values.pop(image_id, None)
+        if value is None:
+            return
+        entry = (value, image_id)
+        for table, (shift, mask) in zip(self._tables, self._chunks):
+            key = (value >> shift) & mask
+            bucket = table.get(key)
+            if bucket is None:
+                continue
+            bucket.remove(entry)
+            if not bucket:
+                del table[key]
+
+    def search(self, value: int, max_distance: Optional[int] = None) -> List[Tuple[int, int]]:
+        """距離 max_distance 以内の (距離, 画像ID) を近い順に返す"""
+        if max_distance is None or max_distance > self.max_distance:
+            max_distance = self.max_distance
+        results = {}
+        for table, (shift, mask) in zip(self._tables, self._chunks):
+            for candidate, image_id in table.get((value >> shift) & mask, ()):
+                if image_id not in results:
+                    distance = hamming(value, candidate)
+                    if distance <= max_distance:
+                        results[image_id] = distance
+        return sorted((distance, image_id) for image_id, distance in results.items())
+
+
+class NearDuplicateIndex:
+    """解析済み画像の知覚ハッシュ索引"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._table = MultiIndexHash(settings.near_duplicate_max_distance)
+        self._loaded = False
+
+    def _ensure_loaded(self) -> None:
+        if self._loaded:
+            return
+        db = ReadSessionLocal()
+        try:
+            rows = (
+                db.query(UploadImage.id, UploadImage.phash)
+                .filter(UploadImage.phash.isnot(None), UploadImage.meta_json.isnot(None))
+                .yield_per(1000)
+            )
+            for image_id, phash in rows:
+                self._table.add(hex_to_hash(phash), image_id)
+        finally:
+            db.close()
+        self._loaded = True
+        logger.info(f"知覚ハッシュ索引を読み込みました (画像数: {len(self._table)})")
+
+    def add(self, phash: str, image_id: int) -> None:
+        with self._lock:
+            if self._loaded:
+                self._table.add(hex_to_hash(phash), image_id)
+
+    def find(self, phash: str, max_distance: int, exclude_image_id: Optional[int] = None) -> Optional[Tuple[int, int]]:
+        """最も近い解析済み画像の (距離, 画像ID) を返す"""
+        with self._lock:
+            self._ensure_loaded()
+            matches = self._table.search(hex_to_hash(phash), max_distance)
+        for distance, image_id in matches:
+            if image_id != exclude_image_id:
+                return distance, image_id
+        return None
+
+
+# シングルトンインスタンス
+near_duplicate_index = NearDuplicateIndex()
@@ -0,0 +1,238 @@
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Optional, Set
+from pydantic import ValidationError
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.database.session import SessionLocal
+from app.models.story_answer import StoryAnswer
+from app.models.story_question import StoryQuestion
+from app.models.user import User
+from app.schemas.story_answer import StoryAnswerCreate
+from app.services.question_bank import normalize_element
+from app.services.validation_store import validation_store
+from app.services.vision_analysis import vision_service
+
+logger = logging.getLogger(__name__)
+
+
+def _question_dict(question: StoryQuestion) -> Dict[str, Any]:
+    return {
+        "id": question.id,
+        "target_element": question.target_element,
+        "question_text": question.question_text,
+        "question_type": question.question_type,
+        "options": question.options,
+        "followups": question.followups,
+        "reason": question.reason,
+    }
+
+
+class InterviewSession:
+    """
+    WebSocket 1接続分のインタビュー状態
+
+    解析結果・質問・回答をメモリに保持し、ステップごとの DB 読み直しをなくす。
+    回答は受け取った時点で状態に反映し、DB へはまとめて書き込む（write-behind）。
+    書き込みはバッチサイズに達したとき・一定間隔・検証の前・セッション終了時に行う。
+    """
+
+    def __init__(self, image_id: int, agent):
+        self.image_id = image_id
+        self.agent = agent
+        self.vision_analysis: Optional[Dict[str, Any]] = None
+        self.questions: List[Dict[str, Any]] = []
+        self.answers: Dict[int, Dict[str, Any]] = {}
+        self._pending: List[Dict[str, Any]] = []
+        self._known_users: Set[int] = set()  # 存在を確認済みの user_id
+        self._flush_lock = asyncio.Lock()
+        self._batch_ready = asyncio.Event()
+
+    async def start(self) -> None:
+        """解析結果・質問・既存の回答を読み込む（質問がなければ生成して保存）"""
+        self.vision_analysis = await asyncio.to_thread(vision_service.get_analysis_result, self.image_id)
+        if not self.vision_analysis:
+            raise ValueError(f"画像 {self.image_id} の解析結果が見つかりません。先に /api/assets/{self.image_id}/analyze で解析してください")
+
+        await asyncio.to_thread(self._load)
+        if not self.questions:
+            await self._generate_questions()
+        logger.info(f"インタビューセッション開始 (image_id: {self.image_id}, 質問数: {len(self.questions)}, 回答済み: {len(self.answers)})")
+
+    def _load(self) -> None:
+        db = SessionLocal()
+        try:
+            questions = db.query(StoryQuestion).filter(StoryQuestion.image_id == self.image_id).order_by(StoryQuestion.id).all()
+            self.questions = [_question_dict(question) for question in questions]
+            answers = (
+                db.query(StoryAnswer)
+                .join(StoryQuestion)
+                .filter(StoryQuestion.image_id == self.image_id)
+                .order_by(StoryAnswer.id)
+                .all()
+            )
+            for answer in answers:
+                self.answers[answer.question_id] = {
+                    "id": answer.id,
+                    "question_id": answer.question_id,
+                    "user_id": answer.user_id,
+                    "answer_text": answer.answer_text,
+                    "selected_option": answer.selected_option,
+                    "followup_answers": answer.followup_answers,
+                }
+        finally:
+            db.close()
+
+    async def _generate_questions(self) -> None:
+        analysis = await self.agent.analyze_image_for_story(self.image_id)
+        questions = await self.agent.generate_questions(self.image_id, analysis.get("missing_elements", []))
+        db = SessionLocal()
+        try:
+            saved = await self.agent.save_questions_to_db(db, self.image_id, questions)
+        finally:
+            db.close()
+        self.questions = [{key: value for key, value in question.items() if key not in ("image_id", "created_at")} for question in saved]
+
+    def next_question(self) -> Optional[Dict[str, Any]]:
+        """まだ回答されていない最初の質問"""
+        for question in self.questions:
+            if question["id"] not in self.answers:
+                return question
+        return None
+
+    async def record_answer(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        回答を検証して状態に反映し、書き込み待ちに追加する
+
+        型・長さは StoryAnswerCreate で、user_id は users に存在するかを確認してから書き込み待ちに入れる
+        （不正な回答が書き込みのバッチ全体を失敗させないようにする）。
+
+        Raises:
+            ValueError: 回答が不正な場合（書き込み待ちには追加しない）
+        """
+        try:
+            answer_data = StoryAnswerCreate.model_validate({**message, "answer_text": message.get("answer_text") or ""})
+        except ValidationError as e:
+            problems = "、".join(".".join(str(part) for part in detail["loc"]) for detail in e.errors())
+            raise ValueError(f"回答の形式が正しくありません: {problems}")
+        question_id = answer_data.question_id
+        if not any(question["id"] == question_id for question in self.questions):
+            raise ValueError(f"この画像の質問ではありません: {question_id}")
+        answer_text = answer_data.answer_text.strip()
+        if not answer_text and not answer_data.selected_option:
+            raise ValueError("回答が空です")
+        if answer_data.user_id is not None and answer_data.user_id not in self._known_users:
+            if not await asyncio.to_thread(self._user_exists, answer_data.user_id):
+                raise ValueError(f"ユーザーが見つかりません: {answer_data.user_id}")
+            self._known_users.add(answer_data.user_id)
+
+        answer = {
+            "id": None,  # 書き込み後に設定
+            "question_id": question_id,
+            "user_id": answer_data.user_id,
+            "answer_text": answer_text,
+            "selected_option": answer_data.selected_option,
+            "followup_answers": answer_data.followup_answers,
+        }
+        self.answers[question_id] = answer
+        self._pending.append(answer)
+        metrics.increment("interview.answers")
+        if len(self._pending) >= settings.interview_flush_batch_size:
+            self._batch_ready.set()
+        return answer
+
+    @staticmethod
+    def _user_exists(user_id: int) -> bool:
+        db = SessionLocal()
+        try:
+            return db.query(User.id).filter(User.id == user_id).first() is not None
+        finally:
+            db.close()
+
+    def progress(self) -> Dict[str, Any]:
+        """
+        ローカルで計算する途中経過（LLM を呼ばない）
+
+        質問が対象とする物語要素のうち、回答済みのものと未回答のものを返す。
+        """
+        targeted, covered = [], []
+        for question in self.questions:
+            element = normalize_element(question["target_element"])
+            if element and element not in targeted:
+                targeted.append(element)
+            if element and question["id"] in self.answers and element not in covered:
+                covered.append(element)
+        missing = [element for element in targeted if element not in covered]
+        return {
+            "answered": len(self.answers),
+            "total": len(self.questions),
+            "covered_elements": covered,
+            "missing_elements": missing,
+            "score": round(100 * len(covered) / len(targeted)) if targeted else 100,
+            "ready_for_story": not missing and len(self.answers) > 0,
+        }
+
+    async def validate(self, force: bool = False) -> Dict[str, Any]:
+        """保持している質問・回答で LLM 検証を行う（DB を読み直さない。force=True の場合は保存済みの結果を使わない）"""
+        await self.flush()
+        questions = [dict(question) for question in self.questions]
+        answers = [dict(answer) for answer in self.answers.values()]
+        return await self.agent.validate_collected_information(
+            self.image_id, questions, answers, vision_analysis=self.vision_analysis, force=force
+        )
+
+    async def run_flusher(self) -> None:
+        """バッチサイズに達するか一定時間が経つたびに書き込む（セッション中のバックグラウンドタスク）"""
+        while True:
+            try:
+                await asyncio.wait_for(self._batch_ready.wait(), timeout=settings.interview_flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._batch_ready.clear()
+            await self.flush()
+
+    async def flush(self) -> int:
+        """書き込み待ちの回答を1トランザクションで保存（失敗した場合は次回に再試行）"""
+        async with self._flush_lock:
+            if not self._pending:
+                return 0
+            batch, self._pending = self._pending, []
+            start = time.perf_counter()
+            try:
+                ids = await asyncio.to_thread(self._write_batch, batch)
+            except Exception as e:
+                logger.error(f"回答の書き込みエラー (image_id: {self.image_id}, 件数: {len(batch)}): {str(e)}")
+                metrics.increment("interview.flush_errors")
+                self._pending = batch + self._pending
+                return 0
+            for answer, answer_id in zip(batch, ids):
+                answer["id"] = answer_id
+            metrics.observe("interview.flush", time.perf_counter() - start)
+            metrics.increment("interview.flushes")
+            return len(batch)
+
+    def _write_batch(self, batch: List[Dict[str, Any]]) -> List[int]:
+        db = SessionLocal()
+        try:
+            rows = [
+                StoryAnswer(
+                    question_id=answer["question_id"],
+                    user_id=answer["user_id"],
+                    answer_text=answer["answer_text"],
+                    selected_option=answer["selected_option"],
+                    followup_answers=answer["followup_answers"],
+                )
+                for answer in batch
+            ]
+            db.add_all(rows)
+            db.flush()
+            ids = [row.id for row in rows]  # commit 後に読むと行ごとに再読み込みされる
+            validation_store.invalidate(db, [answer["question_id"] for answer in batch])
+            db.commit()
+            return ids
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
@@ -0,0 +1,189 @@
+"""
+ルールベースの情報検証（LLM を呼ばずに判定できる部分）
+
+質問の target_element と回答から、LLM 検証と同じ形式の validation_result を計算する。
+
+    完全性        質問が対象とする要素のうち、十分な回答がある要素の割合（InterviewSession.progress と同じ基準）
+    回答の質      空・短すぎる回答、選択肢から選ばれていない choice 質問
+    年齢適切性    ひらがなの割合、文の長さ、こわい表現
+
+判定は3通り。incomplete（質問への回答が明らかに不足）と complete（明らかに十分）の場合は LLM を呼ばずにこの結果を返し、
+uncertain の場合は判定内容を LLM に渡して、物語の一貫性と年齢適切性の確認だけを依頼する。
+質問が基本要素（主人公・舞台・問題・解決）の一部を対象にしていない場合は、画像などから補えるかを
+ルールでは判断できないため uncertain にする（回答では埋められない不足を incomplete にしない）。
+"""
+
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+from app.core.config import settings
+from app.services.question_bank import normalize_element
+
+# 物語の生成に必要な基本要素
+REQUIRED_ELEMENTS = ("character", "setting", "conflict", "resolution")
+ELEMENT_LABELS = {
+    "character": "主人公", "setting": "舞台", "emotion": "気持ち",
+    "action": "出来事", "conflict": "問題", "resolution": "解決",
+}
+
+# これより短い回答は内容が足りないとみなす（文字数、空白を除く）
+MIN_ANSWER_CHARS = 2
+# 答えになっていない回答
+NON_ANSWERS = {"わからない", "わかんない", "しらない", "ない", "なし", "?", "？", "-", "…"}
+# 3-6歳向けに避けたい表現（含まれる場合は LLM で確認する）
+SCARY_WORDS = ("死", "しぬ", "殺", "ころす", "血", "こわい")
+# 1文の長さの目安（文字数）
+MAX_SENTENCE_CHARS = 40
+
+_SENTENCE_SPLIT = re.compile(r"[。！？!?\n]")
+_HIRAGANA = re.compile(r"[ぁ-ゟ]")
+_KATAKANA = re.compile(r"[゠-ヿ]")
+_KANJI = re.compile(r"[一-鿿]")
+
+
+@dataclass
+class LocalValidation:
+    verdict: str  # incomplete / complete / uncertain
+    validation_result: Dict[str, Any]
+    meta: Dict[str, Any]
+    findings: List[str] = field(default_factory=list)  # LLM に渡す判定内容
+
+    @property
+    def decisive(self) -> bool:
+        return self.verdict != "uncertain"
+
+
+def _answer_text(answer: Dict[str, Any]) -> str:
+    return (answer.get("selected_option") or answer.get("answer_text") or "").strip()
+
+
+def _is_substantial(text: str) -> bool:
+    compact = re.sub(r"\s+", "", text)
+    return len(compact) >= MIN_ANSWER_CHARS and compact not in NON_ANSWERS
+
+
+def _age_check(texts: List[str]) -> Dict[str, Any]:
+    """ひらがなの割合・文の長さ・こわい表現から年齢適切性を採点"""
+    joined = "".join(texts)
+    hiragana = len(_HIRAGANA.findall(joined))
+    japanese = hiragana + len(_KATAKANA.findall(joined)) + len(_KANJI.findall(joined))
+    issues, strengths = [], []
+    if japanese:
+        if hiragana / japanese >= 0.6:
+            strengths.append("ひらがな中心")
+        elif len(_KANJI.findall(joined)) / japanese > 0.3:
+            issues.append("漢字が多い")
+    sentences = [sentence for text in texts for sentence in _SENTENCE_SPLIT.split(text) if sentence.strip()]
+    if sentences and max(len(sentence) for sentence in sentences) > MAX_SENTENCE_CHARS:
+        issues.append("長い文がある")
+    elif sentences:
+        strengths.append("短文")
+    scary = [word for word in SCARY_WORDS if word in joined]
+    if scary:
+        issues.append(f"こわい表現の可能性（{'、'.join(scary)}）")
+    return {"score": max(0, 100 - 15 * len(issues)), "issues": issues, "strengths": strengths}
+
+
+def pre_validate(questions: List[Dict[str, Any]], answers: List[Dict[str, Any]]) -> LocalValidation:
+    """
+    質問と回答をルールで検証する
+
+    Args:
+        questions: 質問（id, target_element, question_type, options）
+        answers: 回答（question_id, answer_text, selected_option）。同じ質問への回答は id の大きいものを使う
+
+    Returns:
+        LocalValidation: 判定と validation_result（LLM 検証と同じ形式）
+    """
+    latest: Dict[int, Dict[str, Any]] = {}
+    for answer in sorted(answers, key=lambda answer: answer.get("id") or 0):
+        latest[answer["question_id"]] = answer
+
+    targeted, covered, weak, unanswered_choices, texts = [], [], [], [], []
+    answered = 0
+    for question in questions:
+        answer = latest.get(question["id"])
+        element = normalize_element(question.get("target_element"))
+        label = ELEMENT_LABELS.get(element, question.get("target_element") or "")
+        if element and element not in targeted:
+            targeted.append(element)
+        if answer is None:
+            continue
+        text = _answer_text(answer)
+        texts.append(text)
+        if question.get("question_type") == "choice" and question.get("options"):
+            if not answer.get("selected_option") and text not in question["options"]:
+                unanswered_choices.append(label)
+        if not _is_substantial(text):
+            weak.append(label)
+            continue
+        answered += 1
+        if element and element not in covered:
+            covered.append(element)
+
+    # 完全性は質問が対象とする要素で計算する（質問のない要素は回答で埋められないため不足に数えない）
+    missing = [ELEMENT_LABELS[element] for element in targeted if element not in covered]
+    sufficient = [ELEMENT_LABELS[element] for element in covered]
+    untargeted = [ELEMENT_LABELS[element] for element in REQUIRED_ELEMENTS if element not in targeted]
+    completeness_score = round(100 * (len(targeted) - len(missing)) / len(targeted)) if targeted else 0
+    answer_score = round(100 * answered / len(questions)) if questions else 0
+    age = _age_check(texts)
+    overall = round(0.6 * completeness_score + 0.2 * answer_score + 0.2 * age["score"])
+
+    findings = []
+    if missing:
+        findings.append(f"回答のない要素: {'、'.join(missing)}")
+    if untargeted:
+        findings.append(f"質問の対象になっていない基本要素: {'、'.join(untargeted)}")
+    if weak:
+        findings.append(f"空・短すぎる回答: {'、'.join(weak)}")
+    if unanswered_choices:
+        findings.append(f"選択肢から選ばれていない質問: {'、'.join(unanswered_choices)}")
+    findings.extend(f"年齢適切性: {issue}" for issue in age["issues"])
+
+    recommendations = [f"{label}について こたえてください" for label in missing]
+    recommendations += [f"{label}の回答を もうすこし くわしく してください" for label in weak if label not in missing]
+
+    if targeted and completeness_score < settings.local_validation_incomplete_score:
+        verdict = "incomplete"
+    elif not findings and overall >= settings.local_validation_ready_score:
+        verdict = "complete"
+    else:
+        verdict = "uncertain"
+
+    validation_result = {
+        "overall_score": overall,
+        "completeness": {"score": completeness_score, "missing_elements": missing, "sufficient_elements": sufficient},
+        "age_appropriateness": age,
+        "story_coherence": {
+            # 一貫性はルールでは判定できないため、基本要素がそろっているかで代用する
+            "score": completeness_score,
+            "issues": [] if verdict == "complete" else ["要素が不足しているため判定できません"],
+            "suggestions": [],
+        },
+        "recommendations": recommendations,
+        "ready_for_story": verdict == "complete",
+    }
+    meta = {
+        "total_questions": len(questions),
+        "answered_questions": len(latest),
+        "validated_by": "local",
+        "local_verdict": verdict,
+    }
+    return LocalValidation(verdict, validation_result, meta, findings)
+
+
+def compact_interview(questions: List[Dict[str, Any]], answers: List[Dict[str, Any]]) -> str:
+    """LLM に渡すインタビューの要約（1行に 要素・質問・回答）"""
+    latest: Dict[int, Dict[str, Any]] = {}
+    for answer in sorted(answers, key=lambda answer: answer.get("id") or 0):
+        latest[answer["question_id"]] = answer
+    lines = []
+    for question in questions:
+        answer: Optional[Dict[str, Any]] = latest.get(question["id"])
+        reply = _answer_text(answer) if answer else "（未回答）"
+        line = f"- [{question.get('target_element')}] {question.get('question_text')} → {reply}"
+        if answer and answer.get("followup_answers"):
+            line += f"（補足: {answer['followup_answers']}）"
+        lines.append(line)
+    return "\n".join(lines)
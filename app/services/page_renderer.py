@@ -0,0 +1,183 @@
+"""
+絵本ページの描画（ページ画像とキャプションの合成）
+
+プロセスプールから呼ばれるため、DB やアプリ設定には依存しない。
+"""
+
+import hashlib
+import os
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from PIL import Image, ImageDraw, ImageFont, ImageOps
+
+# 描画結果が変わる変更をしたら上げる（キャッシュキーに含まれるため、全ページが再描画される）
+TEMPLATE_VERSION = 1
+
+# レイアウトテンプレート（座標はページ左上からのピクセル）
+PAGE_TEMPLATES: Dict[str, Dict] = {
+    # 画像の下にキャプション
+    "caption_bottom": {
+        "size": (1600, 1200),
+        "background": (255, 250, 240),
+        "image_box": (60, 60, 1540, 880),
+        "fit": "contain",
+        "text_box": (100, 920, 1500, 1150),
+        "text_color": (60, 40, 30),
+        "font_size": 64,
+        "band": None,
+    },
+    # 画像を全面に敷き、下部の半透明の帯にキャプション
+    "caption_overlay": {
+        "size": (1600, 1200),
+        "background": (255, 255, 255),
+        "image_box": (0, 0, 1600, 1200),
+        "fit": "cover",
+        "text_box": (100, 930, 1500, 1150),
+        "text_color": (40, 30, 20),
+        "font_size": 60,
+        "band": (255, 255, 255, 200),
+    },
+    # 正方形のページ
+    "square": {
+        "size": (1200, 1200),
+        "background": (255, 250, 240),
+        "image_box": (60, 60, 1140, 860),
+        "fit": "contain",
+        "text_box": (80, 900, 1120, 1150),
+        "text_color": (60, 40, 30),
+        "font_size": 56,
+        "band": None,
+    },
+}
+
+# 日本語を表示できるフォントの候補（Linux / macOS / Windows）
+FONT_CANDIDATES = [
+    "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/noto-cjk/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/google-noto-cjk/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/truetype/fonts-japanese-gothic.ttf",
+    "/usr/share/fonts/opentype/ipaexfont-gothic/ipaexg.ttf",
+    "/usr/share/fonts/truetype/takao-gothic/TakaoPGothic.ttf",
+    "/System/Library/Fonts/ヒラギノ丸ゴ ProN W4.ttc",
+    "/System/Library/Fonts/ヒラギノ角ゴシック W4.ttc",
+    "C:/Windows/Fonts/meiryo.ttc",
+    "C:/Windows/Fonts/msgothic.ttc",
+]
+
+# 行頭に置かない文字（禁則処理）
+NO_LINE_START = set("、。，．・：；？！ー－～）」』】〕〉》ゃゅょっぁぃぅぇぉャュョッァィゥェォ")
+
+LINE_SPACING = 1.35
+MIN_FONT_SIZE = 24
+JPEG_QUALITY = 90
+
+
+def find_font(font_path: Optional[str] = None) -> Optional[str]:
+    """使用するフォントファイルを探す（見つからない場合は None = Pillow 既定フォント）"""
+    if font_path:
+        return font_path
+    for candidate in FONT_CANDIDATES:
+        if os.path.exists(candidate):
+            return candidate
+    return None
+
+
+def page_cache_key(image_digest: str, caption: str, template: str, font_path: Optional[str]) -> str:
+    """描画キャッシュのキー（画像の内容・キャプション・テンプレートとその版が同じなら同じ結果）"""
+    font_name = Path(font_path).name if font_path else ""
+    payload = "\0".join([str(TEMPLATE_VERSION), template, font_name, image_digest, caption or ""])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+
+@lru_cache(maxsize=32)
+def _load_font(font_path: Optional[str], size: int) -> ImageFont.FreeTypeFont:
+    if font_path:
+        return ImageFont.truetype(font_path, size)
+    return ImageFont.load_default(size)
+
+
+def wrap_text(text: str, font: ImageFont.FreeTypeFont, max_width: int) -> List[str]:
+    """文字単位で折り返す（日本語は空白で区切られないため。行頭禁則文字は前の行に残す）"""
+    lines = []
+    for paragraph in (text or "").splitlines() or [""]:
+        line = ""
+        for char in paragraph:
+            if line and font.getlength(line + char) > max_width and char not in NO_LINE_START:
+                lines.append(line)
+                line = char.lstrip()
+            else:
+                line += char
+        lines.append(line)
+    return lines
+
+
+def _fit_text(text: str, font_path: Optional[str], box: Tuple[int, int, int, int],
+              font_size: int) -> Tuple[ImageFont.FreeTypeFont, List[str], int]:
+    """テキスト領域に収まるまでフォントを小さくする"""
+    width, height = box[2] - box[0], box[3] - box[1]
+    size = font_size
+    while True:
+        font = _load_font(font_path, size)
+        lines = wrap_text(text, font, width)
+        line_height = int(size * LINE_SPACING)
+        if len(lines) * line_height <= height or size <= MIN_FONT_SIZE:
+            return font, lines, line_height
+        size = max(MIN_FONT_SIZE, int(size * 0.9))
+
+
+def _place_image(page: Image.Image, source: Image.Image, box: Tuple[int, int, int, int], fit: str) -> None:
+    """画像を領域に配置（contain = 全体を収める, cover = 領域を埋めて切り抜く）"""
+    width, height = box[2] - box[0], box[3] - box[1]
+    if fit == "cover":
+        placed = ImageOps.fit(source, (width, height), Image.Resampling.LANCZOS)
+    else:
+        placed = ImageOps.contain(source, (width, height), Image.Resampling.LANCZOS)
+    offset = (box[0] + (width - placed.width) // 2, box[1] + (height - placed.height) // 2)
+    page.alpha_composite(placed, offset)
+
+
+def render_page(image_path: str, caption: str, template: str, output_path: str,
+                font_path: Optional[str] = None) -> str:
+    """
+    ページ画像を描画して JPEG で保存する
+
+    Args:
+        image_path: ページに使う画像のパス
+        caption: キャプション
+        template: PAGE_TEMPLATES のテンプレート名
+        output_path: 保存先のパス
+        font_path: フォントファイルのパス（find_font の結果）
+
+    Returns:
+        str: 保存先のパス
+    """
+    layout = PAGE_TEMPLATES[template]
+    page = Image.new("RGBA", layout["size"], layout["background"] + (255,))
+
+    with Image.open(image_path) as img:
+        box = layout["image_box"]
+        img.draft("RGB", (box[2] - box[0], box[3] - box[1]))  # JPEG は縮小デコード
+        _place_image(page, ImageOps.exif_transpose(img).convert("RGBA"), box, layout["fit"])
+
+    if caption:
+        box = layout["text_box"]
+        font, lines, line_height = _fit_text(caption, font_path, box, layout["font_size"])
+        if layout["band"]:
+            band = Image.new("RGBA", page.size, (0, 0, 0, 0))
+            ImageDraw.Draw(band).rounded_rectangle(
+                (box[0] - 40, box[1] - 30, box[2] + 40, box[3] + 30), radius=32, fill=layout["band"]
+            )
+            page.alpha_composite(band)
+
+        draw = ImageDraw.Draw(page)
+        top = box[1] + (box[3] - box[1] - len(lines) * line_height) // 2
+        center_x = (box[0] + box[2]) // 2
+        for i, line in enumerate(lines):
+            draw.text((center_x, top + i * line_height), line, font=font, fill=layout["text_color"], anchor="ma")
+
+    # 書き込み途中のファイルを配信しないよう一時ファイルから置き換える
+    tmp_path = f"{output_path}.{os.getpid()}.tmp"
+    page.convert("RGB").save(tmp_path, format="JPEG", quality=JPEG_QUALITY, optimize=True)
+    os.replace(tmp_path, output_path)
+    return output_path
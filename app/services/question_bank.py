@@ -0,0 +1,202 @@
+import json
+import logging
+import random
+import threading
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.models.story_question import StoryQuestion
+from app.models.upload_image import UploadImage
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BANK_PATH = Path(__file__).resolve().parents[1] / "data" / "question_bank.json"
+
+# 物語要素の正規化（Gemini の missing_elements は英語、質問の target_element は日本語）
+ELEMENT_ALIASES = {
+    "character": "character", "主人公": "character", "キャラクター": "character", "登場人物": "character",
+    "setting": "setting", "舞台": "setting", "場所": "setting", "設定": "setting",
+    "emotion": "emotion", "気持ち": "emotion", "感情": "emotion",
+    "action": "action", "出来事": "action", "行動": "action",
+    "conflict": "conflict", "問題": "conflict", "課題": "conflict",
+    "resolution": "resolution", "解決": "resolution", "結末": "resolution",
+}
+
+# Vision のタグを粗いカテゴリに正規化
+TAG_SYNONYMS = {
+    "person": "person", "people": "person", "man": "person", "woman": "person", "boy": "person",
+    "girl": "person", "child": "person", "human": "person", "face": "person", "smile": "person",
+    "animal": "animal", "dog": "animal", "cat": "animal", "bird": "animal", "rabbit": "animal",
+    "bear": "animal", "fish": "animal", "horse": "animal", "insect": "animal", "butterfly": "animal",
+    "house": "house", "building": "house", "home": "house", "roof": "house", "window": "house",
+    "car": "vehicle", "vehicle": "vehicle", "train": "vehicle", "bus": "vehicle", "airplane": "vehicle",
+    "boat": "vehicle", "bicycle": "vehicle", "wheel": "vehicle",
+    "tree": "plant", "plant": "plant", "flower": "plant", "grass": "plant", "leaf": "plant",
+    "sky": "sky", "sun": "sky", "cloud": "sky", "rainbow": "sky", "star": "sky", "moon": "sky",
+    "water": "water", "sea": "water", "ocean": "water", "river": "water", "lake": "water",
+    "food": "food", "fruit": "food", "cake": "food", "apple": "food",
+    "toy": "toy", "ball": "toy", "doll": "toy", "balloon": "toy",
+}
+
+
+def normalize_element(element: str) -> Optional[str]:
+    """物語要素名を正規化（不明な場合は None）"""
+    if not element:
+        return None
+    key = element.strip()
+    return ELEMENT_ALIASES.get(key) or ELEMENT_ALIASES.get(key.lower())
+
+
+def normalize_tags(tags: Iterable[str]) -> List[str]:
+    """Vision タグを正規化して重複を除去（順序は保持）"""
+    normalized = []
+    for tag in tags or []:
+        canonical = TAG_SYNONYMS.get(str(tag).strip().lower())
+        if canonical and canonical not in normalized:
+            normalized.append(canonical)
+    return normalized
+
+
+class QuestionBank:
+    """正規化タグ・不足要素で索引された質問テンプレート集"""
+
+    def __init__(self, elements: Optional[Dict[str, List[Dict[str, Any]]]] = None,
+                 tags: Optional[Dict[str, List[Dict[str, Any]]]] = None):
+        self.elements = elements or {}
+        self.tags = tags or {}
+
+    @classmethod
+    def load(cls, path: Path) -> "QuestionBank":
+        """JSON ファイルから読み込む"""
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        bank = cls(data.get("elements", {}), data.get("tags", {}))
+        logger.info(f"質問バンクを読み込みました (要素: {len(bank.elements)}, タグ: {len(bank.tags)})")
+        return bank
+
+    def save(self, path: Path) -> None:
+        """JSON ファイルに保存"""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"version": 1, "elements": self.elements, "tags": self.tags}, f, ensure_ascii=False, indent=2)
+
+    def lookup(self, tags: Iterable[str], missing_elements: List[str], seed: Optional[int] = None) -> Optional[List[Dict[str, Any]]]:
+        """
+        質問セットを検索する
+
+        Args:
+            tags: Vision 解析のタグ
+            missing_elements: 不足している物語要素
+            seed: 質問選択の乱数シード
+
+        Returns:
+            Optional[List[Dict]]: 質問リスト（カバレッジが不足する場合は None）
+        """
+        rng = random.Random(seed)
+
+        # アイスブレイク（画像のタグに基づく質問）
+        icebreakers = []
+        for tag in normalize_tags(tags):
+            candidates = self.tags.get(tag)
+            if candidates:
+                icebreakers.append(dict(rng.choice(candidates)))
+            if len(icebreakers) >= 2:
+                break
+        if len(icebreakers) < settings.question_bank_min_icebreakers:
+            return None
+
+        # 不足要素はすべてカバーできなければ Gemini にフォールバック
+        element_questions = []
+        seen = set()
+        for element in missing_elements:
+            canonical = normalize_element(element)
+            if canonical is None:
+                return None
+            if canonical in seen:
+                continue
+            seen.add(canonical)
+            candidates = self.elements.get(canonical)
+            if not candidates:
+                return None
+            element_questions.append(dict(rng.choice(candidates)))
+
+        return (icebreakers + element_questions)[:6]
+
+    @classmethod
+    def build_from_db(cls, db: Session, max_per_key: int = 3) -> "QuestionBank":
+        """
+        story_questions テーブルから質問バンクを再構築する
+
+        要素に正規化できる質問は要素索引へ、それ以外は画像のタグ索引へ登録し、
+        キーごとに出現頻度の高い質問を残す。
+        """
+        counts: Dict[str, Dict[str, Counter]] = {"elements": defaultdict(Counter), "tags": defaultdict(Counter)}
+        samples: Dict[str, Dict[str, Any]] = {}
+
+        rows = (
+            db.query(StoryQuestion, UploadImage.meta_json)
+            .join(UploadImage, StoryQuestion.image_id == UploadImage.id)
+            .yield_per(1000)
+        )
+        for question, meta_json in rows:
+            entry = {
+                "target_element": question.target_element,
+                "reason": question.reason,
+                "question": question.question_text,
+                "type": question.question_type,
+                "followups": question.followups,
+            }
+            if question.options:
+                entry["options"] = question.options
+            samples.setdefault(question.question_text, entry)
+
+            canonical = normalize_element(question.target_element)
+            if canonical:
+                counts["elements"][canonical][question.question_text] += 1
+                continue
+            try:
+                image_tags = json.loads(meta_json).get("tags", []) if meta_json else []
+            except (ValueError, AttributeError):
+                image_tags = []
+            for tag in normalize_tags(image_tags):
+                counts["tags"][tag][question.question_text] += 1
+
+        def top(index: Dict[str, Counter]) -> Dict[str, List[Dict[str, Any]]]:
+            return {
+                key: [samples[text] for text, _ in counter.most_common(max_per_key)]
+                for key, counter in index.items()
+            }
+
+        return cls(top(counts["elements"]), top(counts["tags"]))
+
+
+# シングルトンインスタンス（遅延初期化）
+_question_bank = None
+_question_bank_lock = threading.Lock()
+
+
+def get_question_bank() -> QuestionBank:
+    """質問バンクのシングルトンインスタンスを取得"""
+    global _question_bank
+    if _question_bank is None:
+        with _question_bank_lock:
+            if _question_bank is None:
+                path = Path(settings.question_bank_path) if settings.question_bank_path else DEFAULT_BANK_PATH
+                try:
+                    _question_bank = QuestionBank.load(path)
+                except (OSError, ValueError) as e:
+                    logger.warning(f"質問バンクを読み込めません ({path}): {str(e)}")
+                    _question_bank = QuestionBank()
+    return _question_bank
+
+
+def lookup_questions(asset_id: int, tags: Iterable[str], missing_elements: List[str]) -> Optional[List[Dict[str, Any]]]:
+    """質問バンクを検索し、ヒット率をメトリクスに記録"""
+    if not settings.question_bank_enabled:
+        return None
+    questions = get_question_bank().lookup(tags, missing_elements, seed=asset_id)
+    metrics.increment("question_bank.hit" if questions else "question_bank.miss")
+    return questions
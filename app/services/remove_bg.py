@@ -1,35 +1,38 @@
 import requests
-from PIL import Image
 from dotenv import load_dotenv
 from pathlib import Path
 from uuid import uuid4
+import logging
 import os
 
+logger = logging.getLogger(__name__)
+
 # .env を読み込む
 env_path = Path(__file__).resolve().parents[2] / ".env"
 load_dotenv(env_path)
 
 REMOVE_BG_API_KEY = os.getenv("REMOVE_BG_API_KEY")
 
-# 環境変数が設定されていない場合はエラー
-if not REMOVE_BG_API_KEY:
-    raise RuntimeError(
-        "REMOVE_BG_API_KEY が設定されていません。backend/.env に remove.bg の API キーを設定してください"
-    )
-
 
 # 背景を削除して保存するクラス
 class RemoveBgStorage:
 
-    # 初期化
-    def __init__(self, upload_dir: Path):
+    # 初期化（http は requests 互換の post を持つクライアント。テストでは差し替え可能）
+    def __init__(self, upload_dir: Path, http=None):
         self.upload_dir = upload_dir
         self.upload_dir.mkdir(parents=True, exist_ok=True)
+        self.http = http or requests.Session()
 
     # 背景を削除して保存
     def save_with_bg_removed(self, file_obj, orig_filename: str) -> tuple[str, int]:
+        # 環境変数が設定されていない場合はエラー（起動は妨げず、利用時に検出する）
+        if not REMOVE_BG_API_KEY:
+            raise RuntimeError(
+                "REMOVE_BG_API_KEY が設定されていません。backend/.env に remove.bg の API キーを設定してください"
+            )
+        
         # APIに送信
-        response = requests.post(
+        response = self.http.post(
             "https://api.remove.bg/v1.0/removebg",
             files={"image_file": file_obj},
             data={"size": "auto"},
@@ -44,19 +47,15 @@ class RemoveBgStorage:
         safe_name = f"{uuid4().hex}.png"
         dst = self.upload_dir / safe_name
         
-        print(f"DEBUG: 保存先パス: {dst}")
-        print(f"DEBUG: ディレクトリ存在: {self.upload_dir.exists()}")
-        print(f"DEBUG: レスポンスサイズ: {len(response.content)}")
-        
         try:
             with open(dst, "wb") as out:
                 out.write(response.content)
-            print(f"DEBUG: ファイル保存成功: {dst}")
         except Exception as e:
-            print(f"DEBUG: ファイル保存エラー: {e}")
+            logger.error(f"背景除去した画像の保存エラー ({dst}): {str(e)}")
+            dst.unlink(missing_ok=True)  # 書きかけのファイルを残さない
             raise
 
         # サイズを取得
         size = dst.stat().st_size
-        print(f"DEBUG: 保存されたファイルサイズ: {size}")
+        logger.debug(f"背景除去した画像を保存しました ({dst}, {size} bytes)")
         return safe_name, size
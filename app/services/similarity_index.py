@@ -0,0 +1,279 @@
+import json
+import logging
+import threading
+import time
+import zlib
+from array import array
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.database.session import ReadSessionLocal
+from app.models.story_question import StoryQuestion
+from app.services.question_bank import normalize_element
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INDEX_PATH = Path(__file__).resolve().parents[1] / "data" / "similarity_index.jsonl"
+
+# MinHash パラメータ（64 ハッシュ = 16 バンド × 4 行）
+NUM_PERM = 64
+NUM_BANDS = 16
+ROWS_PER_BAND = NUM_PERM // NUM_BANDS
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+# ハッシュ関数の係数（プロセスをまたいで同じ署名になるよう固定シード）
+_rng = np.random.RandomState(1)
+_PERM_A = _rng.randint(1, 1 << 31, size=NUM_PERM).astype(np.uint64)
+_PERM_B = _rng.randint(0, 1 << 31, size=NUM_PERM).astype(np.uint64)
+
+
+def _canonical_tags(tags: Iterable[str]) -> frozenset:
+    """タグ集合を小文字化して正規化"""
+    return frozenset(str(tag).strip().lower() for tag in tags or [] if str(tag).strip())
+
+
+def minhash_signature(tags: frozenset) -> np.ndarray:
+    """タグ集合の MinHash 署名を計算"""
+    hashed = np.fromiter((zlib.crc32(tag.encode("utf-8")) for tag in tags), dtype=np.uint64, count=len(tags))
+    values = (np.outer(hashed, _PERM_A) + _PERM_B) % _MERSENNE_PRIME & _MAX_HASH
+    return values.min(axis=0)
+
+
+def jaccard(a: frozenset, b: frozenset) -> float:
+    """ジャカード係数"""
+    if not a and not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class SimilarityIndex:
+    """
+    画像タグ集合の MinHash LSH インデックス
+
+    同じタグ集合を持つ画像はひとつのグループにまとめ、LSH はグループ単位で索引する。
+    候補は正確なジャカード係数で再評価する。
+
+    再解析のたびに追記ログへ記録が増えるため、置き換えられた古い記録が SIMILARITY_INDEX_COMPACT_MIN と
+    画像数の両方を超えたら（読み込み時・追記時）ログを現在の内容で書き直す。
+    """
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = path
+        self._lock = threading.RLock()
+        self._group_ids: Dict[frozenset, int] = {}
+        self._group_tags: List[frozenset] = []
+        self._group_images: List[array] = []
+        self._image_group: Dict[int, int] = {}
+        self._buckets: Dict[int, array] = defaultdict(lambda: array("I"))
+        self._records = 0  # 追記ログの記録数（置き換えられた古い記録を含む）
+
+    def __len__(self) -> int:
+        return len(self._image_group)
+
+    def _band_keys(self, signature: np.ndarray) -> List[int]:
+        raw = signature.tobytes()
+        width = ROWS_PER_BAND * signature.itemsize
+        return [hash((band, raw[band * width:(band + 1) * width])) for band in range(NUM_BANDS)]
+
+    def _group_for(self, tags: frozenset) -> int:
+        group_id = self._group_ids.get(tags)
+        if group_id is None:
+            group_id = len(self._group_tags)
+            self._group_ids[tags] = group_id
+            self._group_tags.append(tags)
+            self._group_images.append(array("I"))
+            for key in self._band_keys(minhash_signature(tags)):
+                self._buckets[key].append(group_id)
+        return group_id
+
+    def add(self, image_id: int, tags: Iterable[str], persist: bool = True) -> None:
+        """画像のタグ集合をインデックスに追加（再解析時は置き換え）"""
+        canonical = _canonical_tags(tags)
+        if not canonical:
+            return
+        with self._lock:
+            previous = self._image_group.get(image_id)
+            if previous is not None:
+                if self._group_tags[previous] == canonical:
+                    return
+                images = self._group_images[previous]
+                images.remove(image_id)
+            group_id = self._group_for(canonical)
+            self._group_images[group_id].append(image_id)
+            self._image_group[image_id] = group_id
+            if persist and self.path:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps({"image_id": image_id, "tags": sorted(canonical)}, ensure_ascii=False) + "\n")
+                self._records += 1
+                self._compact_if_needed()
+
+    def query(self, tags: Iterable[str], threshold: float, exclude_image_id: Optional[int] = None,
+              limit: int = 5) -> List[Tuple[float, int]]:
+        """
+        類似画像を検索する
+
+        Returns:
+            List[Tuple[float, int]]: (類似度, 画像ID) を類似度の高い順に
+        """
+        canonical = _canonical_tags(tags)
+        if not canonical:
+            return []
+        with self._lock:
+            buckets = [self._buckets.get(key) for key in self._band_keys(minhash_signature(canonical))]
+            buckets = [np.frombuffer(bucket, dtype=np.uint32) for bucket in buckets if bucket]
+            if not buckets:
+                return []
+
+            # 一致したバンド数で候補を絞り込む（類似度 t の期待一致数は NUM_BANDS * t^ROWS_PER_BAND）
+            group_ids, band_hits = np.unique(np.concatenate(buckets), return_counts=True)
+            min_hits = max(1, int(NUM_BANDS * threshold ** ROWS_PER_BAND) // 3)
+            candidates = group_ids[band_hits >= min_hits].tolist()
+
+            scored = []
+            for group_id in candidates:
+                similarity = jaccard(canonical, self._group_tags[group_id])
+                if similarity >= threshold:
+                    scored.append((similarity, group_id))
+            scored.sort(reverse=True)
+
+            results = []
+            for similarity, group_id in scored:
+                # 新しい画像ほど質問が揃っている可能性が高いので末尾から
+                for image_id in reversed(self._group_images[group_id]):
+                    if image_id != exclude_image_id:
+                        results.append((similarity, image_id))
+                        if len(results) >= limit:
+                            return results
+            return results
+
+    @classmethod
+    def load(cls, path: Path) -> "SimilarityIndex":
+        """追記ログからインデックスを復元"""
+        index = cls(path)
+        if path.exists():
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    index.add(entry["image_id"], entry["tags"], persist=False)
+                    index._records += 1
+        logger.info(f"類似画像インデックスを読み込みました (画像数: {len(index)}, 記録数: {index._records})")
+        index._compact_if_needed()
+        return index
+
+    def _compact_if_needed(self) -> None:
+        """置き換えられた記録が閾値と画像数の両方を超えていれば書き直す（書き直しの費用は追記1件あたり一定）"""
+        superseded = self._records - len(self._image_group)
+        if superseded > max(settings.similarity_index_compact_min, len(self._image_group)):
+            start = time.perf_counter()
+            self.compact()
+            metrics.increment("similarity_index.compactions")
+            logger.info(f"類似画像インデックスの追記ログを書き直しました (削除した記録: {superseded}, "
+                        f"{time.perf_counter() - start:.2f}秒)")
+
+    def compact(self) -> None:
+        """追記ログを現在の内容で書き直す"""
+        if not self.path:
+            return
+        with self._lock:
+            tmp_path = self.path.with_suffix(".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for image_id, group_id in self._image_group.items():
+                    f.write(json.dumps({"image_id": image_id, "tags": sorted(self._group_tags[group_id])}, ensure_ascii=False) + "\n")
+            tmp_path.replace(self.path)
+            self._records = len(self._image_group)
+
+
+# シングルトンインスタンス（遅延初期化）
+_similarity_index = None
+_similarity_index_lock = threading.Lock()
+
+
+def get_similarity_index() -> SimilarityIndex:
+    """類似画像インデックスのシングルトンインスタンスを取得"""
+    global _similarity_index
+    if _similarity_index is None:
+        with _similarity_index_lock:
+            if _similarity_index is None:
+                path = Path(settings.similarity_index_path) if settings.similarity_index_path else DEFAULT_INDEX_PATH
+                _similarity_index = SimilarityIndex.load(path)
+    return _similarity_index
+
+
+def _adapt_questions(questions: List[StoryQuestion], missing_elements: List[str]) -> Optional[List[Dict[str, Any]]]:
+    """過去の質問から今回の不足要素に合う質問を選ぶ（カバーできなければ None）"""
+    by_element: Dict[str, StoryQuestion] = {}
+    icebreakers = []
+    for question in questions:
+        canonical = normalize_element(question.target_element)
+        if canonical:
+            by_element.setdefault(canonical, question)
+        else:
+            icebreakers.append(question)
+
+    selected = icebreakers[:2]
+    seen = set()
+    for element in missing_elements:
+        canonical = normalize_element(element)
+        if canonical is None or canonical not in by_element:
+            return None
+        if canonical not in seen:
+            seen.add(canonical)
+            selected.append(by_element[canonical])
+
+    if not selected:
+        return None
+
+    adapted = []
+    for question in selected[:6]:
+        entry = {
+            "target_element": question.target_element,
+            "reason": question.reason,
+            "question": question.question_text,
+            "type": question.question_type,
+            "followups": question.followups,
+        }
+        if question.options:
+            entry["options"] = question.options
+        adapted.append(entry)
+    return adapted
+
+
+def find_similar_questions(asset_id: int, tags: Iterable[str], missing_elements: List[str]) -> Optional[List[Dict[str, Any]]]:
+    """類似した過去画像の質問を再利用する（見つからなければ None）"""
+    if not settings.similarity_index_enabled:
+        return None
+
+    start = time.perf_counter()
+    candidates = get_similarity_index().query(
+        tags, settings.similar_questions_threshold, exclude_image_id=asset_id
+    )
+    metrics.observe("similarity_index.query", time.perf_counter() - start)
+
+    if candidates:
+        db = ReadSessionLocal()
+        try:
+            for similarity, image_id in candidates:
+                questions = (
+                    db.query(StoryQuestion)
+                    .filter(StoryQuestion.image_id == image_id)
+                    .order_by(StoryQuestion.id)
+                    .all()
+                )
+                adapted = _adapt_questions(questions, missing_elements)
+                if adapted:
+                    logger.info(f"類似画像の質問を再利用します (asset_id: {asset_id}, 元画像: {image_id}, 類似度: {similarity:.2f})")
+                    metrics.increment("question_reuse.hit")
+                    return adapted
+        finally:
+            db.close()
+
+    metrics.increment("question_reuse.miss")
+    return None
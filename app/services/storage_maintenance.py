@@ -0,0 +1,230 @@
+"""
+アップロード領域の保守（孤立ファイルの削除と容量制限）
+
+uploads ディレクトリを os.scandir で逐次走査し、一定件数ごとに DB と突き合わせる
+（ファイル名の一覧をまとめてメモリに載せない）。
+
+    uploads   アップロードされた元画像。upload_images に行がなければ孤立ファイル
+    rendered  描画済みのページ（派生）。book_pages から参照されていなければ孤立ファイル
+    exports   書き出しのキャッシュ（派生）。書きかけの *.tmp が残っていれば孤立ファイル
+
+孤立ファイルは猶予時間（書き込み直後で DB 保存前のファイルを消さないため）を過ぎたものだけ削除する。
+使用量が上限を超える場合は、派生ファイルを最後に使われた順（古い順）に削除する。
+派生ファイルは再生成できるため、元画像は容量制限では削除しない。
+描画・書き出しのキャッシュは再利用時に更新時刻を更新（book_renderer.touch）し、それを最後に使われた時刻として扱う。
+"""
+
+import logging
+import os
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Set
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.database.session import SessionLocal
+from app.models.book_page import BookPage
+from app.models.upload_image import UploadImage
+from app.services.book_export import EXPORTS_DIR_NAME
+from app.services.book_renderer import RENDERED_DIR_NAME
+
+logger = logging.getLogger(__name__)
+
+# DB と突き合わせる件数
+SCAN_BATCH_SIZE = 500
+# 派生ファイルの領域（最後に使われた時刻が同じ場合は書き出しのキャッシュを先に削除）
+DERIVED_AREAS = (EXPORTS_DIR_NAME, RENDERED_DIR_NAME)
+
+
+@dataclass
+class StoredFile:
+    area: str
+    path: Path
+    size: int
+    last_used: float  # 更新時刻
+
+
+@dataclass
+class StorageReport:
+    files: int = 0
+    bytes: int = 0
+    usage: Dict[str, int] = field(default_factory=dict)  # 領域ごとのバイト数（削除後）
+    orphans: int = 0
+    orphan_bytes: int = 0
+    evicted: int = 0
+    evicted_bytes: int = 0
+    quota: int = 0
+    over_quota: bool = False
+    dry_run: bool = False
+    elapsed: float = 0.0
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+
+class StorageMaintenance:
+    """アップロード領域の走査・孤立ファイルの削除・容量制限"""
+
+    def __init__(self, upload_dir: Path):
+        self.upload_dir = upload_dir
+
+    def area_dir(self, area: str) -> Path:
+        return self.upload_dir if area == "uploads" else self.upload_dir / area
+
+    def iter_files(self, area: str) -> Iterator[StoredFile]:
+        """領域内のファイルを逐次列挙（uploads は直下のファイルのみ）"""
+        try:
+            entries = os.scandir(self.area_dir(area))
+        except FileNotFoundError:
+            return
+        with entries:
+            for entry in entries:
+                try:
+                    if not entry.is_file(follow_symlinks=False) or entry.name.startswith("."):
+                        continue
+                    stat = entry.stat(follow_symlinks=False)
+                except FileNotFoundError:
+                    continue  # 走査中に削除された
+                yield StoredFile(area, Path(entry.path), stat.st_size, stat.st_mtime)
+
+    def _batches(self, area: str) -> Iterator[List[StoredFile]]:
+        batch = []
+        for stored in self.iter_files(area):
+            batch.append(stored)
+            if len(batch) >= SCAN_BATCH_SIZE:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def _referenced(self, db, area: str, names: List[str]) -> Optional[Set[str]]:
+        """DB から参照されているファイル名（参照を持たない領域は None）"""
+        if area == "uploads":
+            rows = db.query(UploadImage.filename).filter(UploadImage.filename.in_(names))
+        elif area == RENDERED_DIR_NAME:
+            rows = db.query(BookPage.rendered_filename).filter(BookPage.rendered_filename.in_(names))
+        else:
+            return None
+        return {name for (name,) in rows}
+
+    def _delete(self, stored: StoredFile, dry_run: bool) -> bool:
+        if dry_run:
+            return True
+        try:
+            stored.path.unlink()
+            return True
+        except FileNotFoundError:
+            return False
+        except OSError as e:
+            logger.warning(f"ファイルを削除できません: {stored.path}: {str(e)}")
+            return False
+
+    def run(
+        self,
+        *,
+        dry_run: bool = False,
+        grace: Optional[float] = None,
+        quota: Optional[int] = None,
+        min_age: Optional[float] = None,
+    ) -> StorageReport:
+        """
+        孤立ファイルを削除し、容量制限を適用する
+
+        Args:
+            dry_run: True の場合は削除せずに集計だけ行う
+            grace: 孤立ファイルを削除するまでの猶予（秒。未指定の場合は設定値）
+            quota: 使用量の上限（バイト。0 は無制限。未指定の場合は設定値）
+            min_age: 容量制限で削除しない、最近使われた派生ファイルの経過時間（秒）
+
+        Returns:
+            StorageReport: 使用量と削除したファイル
+        """
+        grace = settings.storage_orphan_grace if grace is None else grace
+        quota = settings.storage_quota_bytes if quota is None else quota
+        min_age = settings.storage_eviction_min_age if min_age is None else min_age
+        report = StorageReport(quota=quota, dry_run=dry_run)
+        start = time.perf_counter()
+        now = time.time()
+        derived: List[StoredFile] = []
+
+        # 書き込み直後の行を見落とさないよう、レプリカではなくプライマリで確認する
+        db = SessionLocal()
+        try:
+            for area in ("uploads",) + DERIVED_AREAS:
+                usage = 0
+                for batch in self._batches(area):
+                    referenced = self._referenced(db, area, [stored.path.name for stored in batch])
+                    for stored in batch:
+                        orphan = (
+                            stored.path.name not in referenced if referenced is not None
+                            else stored.path.name.endswith(".tmp")
+                        )
+                        if orphan and now - stored.last_used > grace:
+                            if self._delete(stored, dry_run):
+                                report.orphans += 1
+                                report.orphan_bytes += stored.size
+                            continue
+                        report.files += 1
+                        usage += stored.size
+                        if area in DERIVED_AREAS and not orphan:
+                            derived.append(stored)
+                report.usage[area] = usage
+            report.bytes = sum(report.usage.values())
+
+            if quota and report.bytes > quota:
+                self._evict(db, report, derived, quota, now - min_age, dry_run)
+        finally:
+            db.close()
+
+        report.over_quota = bool(quota) and report.bytes > quota
+        report.elapsed = time.perf_counter() - start
+        self._record(report)
+        return report
+
+    def _evict(self, db, report: StorageReport, derived: List[StoredFile], quota: int, cutoff: float, dry_run: bool) -> None:
+        """派生ファイルを最後に使われた順に削除して上限内に収める"""
+        order = {area: index for index, area in enumerate(DERIVED_AREAS)}
+        derived.sort(key=lambda stored: (stored.last_used, order[stored.area]))
+        evicted_pages = []
+        for stored in derived:
+            if report.bytes <= quota or stored.last_used > cutoff:
+                break  # 以降はより最近使われたファイル
+            if not self._delete(stored, dry_run):
+                continue
+            report.evicted += 1
+            report.evicted_bytes += stored.size
+            report.bytes -= stored.size
+            report.usage[stored.area] -= stored.size
+            report.files -= 1
+            if stored.area == RENDERED_DIR_NAME:
+                evicted_pages.append(stored.path.name)
+
+        if evicted_pages and not dry_run:
+            # 描画済みの URL を返さないようにする（次の描画・書き出しで描画し直される）
+            for offset in range(0, len(evicted_pages), SCAN_BATCH_SIZE):
+                db.query(BookPage).filter(
+                    BookPage.rendered_filename.in_(evicted_pages[offset:offset + SCAN_BATCH_SIZE])
+                ).update({BookPage.rendered_filename: None}, synchronize_session=False)
+            db.commit()
+
+    def _record(self, report: StorageReport) -> None:
+        for area, usage in report.usage.items():
+            metrics.set_gauge(f"storage.bytes.{area}", usage)
+        metrics.set_gauge("storage.bytes", report.bytes)
+        if not report.dry_run:
+            metrics.increment("storage.orphans_deleted", report.orphans)
+            metrics.increment("storage.evicted", report.evicted)
+        metrics.observe("storage.maintenance", report.elapsed)
+        message = (
+            f"ストレージ保守{'（dry run）' if report.dry_run else ''}: {report.files} ファイル / "
+            f"{report.bytes / 1024 / 1024:.1f}MB, 孤立ファイル {report.orphans} 件 ({report.orphan_bytes / 1024 / 1024:.1f}MB), "
+            f"容量制限で削除 {report.evicted} 件 ({report.evicted_bytes / 1024 / 1024:.1f}MB), {report.elapsed:.2f}秒"
+        )
+        if report.over_quota:
+            logger.warning(f"{message} — 上限 {report.quota / 1024 / 1024:.0f}MB を超えています（元画像は削除しません）")
+        else:
+            logger.info(message)
+
+
+# シングルトンインスタンス
+storage_maintenance = StorageMaintenance(Path(settings.upload_dir))
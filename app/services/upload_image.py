@@ -1,11 +1,19 @@
+import asyncio
+import logging
 import os
-import shutil
+import time
 from uuid import uuid4
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import SQLAlchemyError
-from fastapi import HTTPException
 from pathlib import Path
+from app.core.metrics import metrics
+from app.core.process_pool import get_process_pool
+from app.database.session import SessionLocal
 from app.models.upload_image import UploadImage
+from app.services.image_hash import compute_dhash, hash_to_hex
+from app.services.upload_validation import CHUNK_SIZE, EXTENSIONS, ImageInfo, UploadValidator
+
+logger = logging.getLogger(__name__)
 
 class UploadImageService:
 
@@ -14,42 +22,84 @@ class UploadImageService:
         self.upload_dir = upload_dir
         self.upload_dir.mkdir(parents=True, exist_ok=True)
 
-    # ファイルをアップロード
-    def save_image(self, db: Session, *, file, filename: str, content_type: str, public_base: str) -> UploadImage:
-        # 拡張子チェック
-        lower = filename.lower()
-        if not lower.endswith((".png", ".jpg", ".jpeg")):
-            raise ValueError("Invalid file type")
-
-        # ユニークファイル名生成
-        ext = Path(filename).suffix or ".bin"
-        safe_name = f"{uuid4().hex}{ext}"
-        dst = self.upload_dir / safe_name
+    # ファイルをアップロード（書き込みと DB 保存はスレッドで行い、イベントループを止めない）
+    async def save_image(self, db: Session, *, file, public_base: str) -> UploadImage:
+        start = time.perf_counter()
+        info, safe_name = await asyncio.to_thread(self.write_validated, file)
+        metrics.observe("upload.write", time.perf_counter() - start)
 
-        with open(dst, "wb") as f:
-            shutil.copyfileobj(file, f)
-
-        size = dst.stat().st_size
+        # DB保存（形式はファイル名や Content-Type ではなく先頭のバイト列で判定したもの）
         url = f"{public_base.rstrip('/')}/uploads/{safe_name}"
+        try:
+            return await self.create_record(
+                db, filename=safe_name, url=url, content_type=info.content_type, size_bytes=info.size_bytes
+            )
+        except SQLAlchemyError:
+            os.remove(self.upload_dir / safe_name)
+            raise
 
-        # DB保存
-        img = UploadImage(
-            filename=safe_name,
-            url=url,
-            content_type=content_type or "application/octet-stream",
-            size_bytes=size,
-            user_id=None
-        )
+    # 保存済みのファイルの行を追加（知覚ハッシュは応答の後に update_phash で設定する）
+    async def create_record(self, db: Session, **fields) -> UploadImage:
+        start = time.perf_counter()
+        img = await asyncio.to_thread(self._insert, db, UploadImage(user_id=None, **fields))
+        metrics.observe("upload.db", time.perf_counter() - start)
+        return img
+
+    def _insert(self, db: Session, img: UploadImage) -> UploadImage:
         db.add(img)
         try:
             db.commit()
-            db.refresh(img)
+            db.refresh(img)  # 応答のシリアライズ時にイベントループ上で再読み込みしないよう、ここで読み込む
         except SQLAlchemyError:
             db.rollback()
-            os.remove(dst)
             raise
-
         return img
 
+    # 検証しながらチャンク単位で書き込む（不正な場合は書きかけのファイルを削除して UploadRejected）
+    def write_validated(self, file) -> tuple[ImageInfo, str]:
+        validator = UploadValidator()
+        first = file.read(CHUNK_SIZE)
+        validator.feed(first)  # 形式が不正ならファイルを作る前に弾く
+
+        # ユニークファイル名生成（拡張子は判定した形式に合わせる）
+        safe_name = f"{uuid4().hex}{EXTENSIONS[validator.kind] if validator.kind else '.bin'}"
+        dst = self.upload_dir / safe_name
+        try:
+            with open(dst, "wb") as f:
+                chunk = first
+                while chunk:
+                    f.write(chunk)
+                    chunk = file.read(CHUNK_SIZE)
+                    validator.feed(chunk)
+                # 応答を返す前にディスクへ確実に書き出す
+                f.flush()
+                os.fsync(f.fileno())
+            info = validator.finish(dst)
+        except BaseException:
+            dst.unlink(missing_ok=True)
+            raise
+        return info, safe_name
+
+    # 知覚ハッシュを計算して保存（応答の後にバックグラウンドで実行。読めない画像は None のまま。
+    # 先に解析された場合は、解析時に vision_analysis が計算して保存する）
+    async def update_phash(self, image_id: int, path: Path) -> None:
+        start = time.perf_counter()
+        try:
+            value = await asyncio.get_running_loop().run_in_executor(get_process_pool(), compute_dhash, str(path))
+            await asyncio.to_thread(self._store_phash, image_id, hash_to_hex(value))
+        except Exception as e:
+            logger.warning(f"知覚ハッシュの計算エラー (image_id: {image_id}): {str(e)}")
+            metrics.increment("upload.phash_errors")
+            return
+        metrics.observe("upload.phash", time.perf_counter() - start)
+
+    def _store_phash(self, image_id: int, phash: str) -> None:
+        db = SessionLocal()
+        try:
+            db.query(UploadImage).filter(UploadImage.id == image_id).update({UploadImage.phash: phash})
+            db.commit()
+        finally:
+            db.close()
+
     def list_images(self, db: Session) -> list[UploadImage]:
-        return db.query(UploadImage).order_by(UploadImage.uploaded_at.desc()).all()
\ No newline at end of file
+        return db.query(UploadImage).order_by(UploadImage.uploaded_at.desc()).all()
@@ -0,0 +1,159 @@
+"""
+アップロード画像の逐次検証
+
+受け取ったチャンクを順に渡し、ディスクへの書き込みや remove.bg への送信、DB 保存の前に不正なファイルを弾く。
+
+    - 先頭バイト（マジックナンバー）で PNG / JPEG を判定（拡張子や Content-Type は信用しない）
+    - 受け取りながらサイズを数え、上限を超えた時点で中断
+    - Pillow でヘッダーだけを読み、幅・高さと総画素数（解凍爆弾）を確認
+"""
+
+import io
+import warnings
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO, Optional, Union
+from PIL import Image
+from app.core.config import settings
+
+CHUNK_SIZE = 1024 * 1024
+# 先頭のこのバイト数でヘッダーを読む（JPEG は EXIF の後ろに寸法があるため、足りなければ全体を書き込んだ後に読む）
+HEADER_BYTES = 64 * 1024
+
+IMAGE_SIGNATURES = {
+    "png": b"\x89PNG\r\n\x1a\n",
+    "jpeg": b"\xff\xd8\xff",
+}
+CONTENT_TYPES = {"png": "image/png", "jpeg": "image/jpeg"}
+EXTENSIONS = {"png": ".png", "jpeg": ".jpg"}
+PIL_FORMATS = {"PNG": "png", "JPEG": "jpeg", "MPO": "jpeg"}  # MPO は複数画像を持つ JPEG
+
+
+class UploadRejected(ValueError):
+    """アップロードを受け付けない（status_code は返す HTTP ステータス）"""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+@dataclass
+class ImageInfo:
+    kind: str  # png / jpeg
+    width: int
+    height: int
+    size_bytes: int
+
+    @property
+    def content_type(self) -> str:
+        return CONTENT_TYPES[self.kind]
+
+    @property
+    def extension(self) -> str:
+        return EXTENSIONS[self.kind]
+
+
+def sniff_image_type(head: bytes) -> str:
+    for kind, signature in IMAGE_SIGNATURES.items():
+        if head.startswith(signature):
+            return kind
+    raise UploadRejected("PNG または JPEG の画像をアップロードしてください", status_code=415)
+
+
+def read_dimensions(source: Union[bytes, Path, BinaryIO], kind: str, max_pixels: int) -> Optional[tuple]:
+    """
+    ヘッダーだけを読んで幅・高さを確認（画素データは展開しない）
+
+    Args:
+        source: 先頭のバイト列、または全体（ファイルのパス・ファイルオブジェクト）
+
+    Returns:
+        (幅, 高さ)。先頭のバイト列だけでは寸法を読めない場合は None
+    """
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("error", Image.DecompressionBombWarning)
+            with Image.open(io.BytesIO(source) if isinstance(source, bytes) else source) as img:
+                width, height = img.size
+                format = img.format
+    except (Image.DecompressionBombError, Image.DecompressionBombWarning):
+        raise UploadRejected("画像の画素数が大きすぎます", status_code=413)
+    except Exception:
+        if isinstance(source, bytes):
+            return None
+        raise UploadRejected("画像を読み込めません")
+
+    if PIL_FORMATS.get(format) != kind:
+        raise UploadRejected("画像の形式が先頭のバイト列と一致しません")
+    if width <= 0 or height <= 0:
+        raise UploadRejected("画像の寸法が不正です")
+    if width * height > max_pixels:
+        raise UploadRejected(f"画像の画素数が大きすぎます（{width}x{height}、上限 {max_pixels} 画素）", status_code=413)
+    return width, height
+
+
+class UploadValidator:
+    """
+    チャンクを受け取りながら画像を検証する
+
+        validator = UploadValidator()
+        for chunk in chunks:
+            validator.feed(chunk)   # 形式・サイズ・寸法が不正なら UploadRejected
+            out.write(chunk)
+        info = validator.finish(path)
+    """
+
+    def __init__(self, max_bytes: Optional[int] = None, max_pixels: Optional[int] = None):
+        self.max_bytes = max_bytes or settings.upload_max_bytes
+        self.max_pixels = max_pixels or settings.upload_max_pixels
+        self.size = 0
+        self.kind: Optional[str] = None
+        self.dimensions: Optional[tuple] = None
+        self._head = bytearray()
+
+    def feed(self, chunk: bytes) -> None:
+        self.size += len(chunk)
+        if self.size > self.max_bytes:
+            raise UploadRejected(f"ファイルサイズが上限（{self.max_bytes // (1024 * 1024)}MB）を超えています", status_code=413)
+        if self.dimensions is not None or len(self._head) >= HEADER_BYTES:
+            return
+
+        self._head += chunk[:HEADER_BYTES - len(self._head)]
+        if self.kind is None:
+            if len(self._head) < len(IMAGE_SIGNATURES["png"]):
+                return  # 判定に必要なバイト数がまだ届いていない（短いファイルは finish で判定）
+            self.kind = sniff_image_type(bytes(self._head))
+        self.dimensions = read_dimensions(bytes(self._head), self.kind, self.max_pixels)
+
+    def finish(self, source: Union[Path, BinaryIO, None] = None) -> ImageInfo:
+        """
+        全体を受け取った後の確認
+
+        Args:
+            source: 書き込んだファイル（先頭だけでは寸法を読めなかった場合にヘッダーを読み直す）
+        """
+        if self.kind is None:
+            self.kind = sniff_image_type(bytes(self._head))
+        if self.dimensions is None:
+            if source is None:
+                raise UploadRejected("画像を読み込めません")
+            self.dimensions = read_dimensions(source, self.kind, self.max_pixels)
+        width, height = self.dimensions
+        return ImageInfo(kind=self.kind, width=width, height=height, size_bytes=self.size)
+
+
+def validate_file(file_obj: BinaryIO, max_bytes: Optional[int] = None) -> ImageInfo:
+    """
+    ファイルオブジェクトを読み通して検証し、先頭に戻す（ディスクに書かずに外部 API へ送る場合）
+    """
+    validator = UploadValidator(max_bytes)
+    file_obj.seek(0)
+    while True:
+        chunk = file_obj.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        validator.feed(chunk)
+    file_obj.seek(0)
+    info = validator.finish(file_obj)
+    file_obj.seek(0)
+    return info
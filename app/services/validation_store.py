@@ -0,0 +1,97 @@
+"""
+情報検証の結果の保存と再利用
+
+検証結果は質問・回答・画像解析結果から求めたフィンガープリントと組にして story_validations に保存し、
+同じフィンガープリントで再度検証を求められた場合は LLM を呼ばずに保存済みの結果を返す
+（フロントエンドは回答が変わっていなくても検証をポーリングする）。
+回答を保存したときは、その画像の保存済みの結果を同じトランザクションで削除する。
+"""
+
+import hashlib
+import json
+import logging
+from typing import Any, Dict, Iterable, List, Optional
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.orm import Session
+from app.core.metrics import metrics
+from app.database.session import SessionLocal
+from app.models.story_question import StoryQuestion
+from app.models.story_validation import StoryValidation
+
+logger = logging.getLogger(__name__)
+
+# 検証のプロンプトや結果の形式を変えたら上げる（フィンガープリントに含まれる）
+VALIDATION_VERSION = 3
+
+QUESTION_FIELDS = ("id", "target_element", "question_text", "question_type", "options", "followups", "reason")
+ANSWER_FIELDS = ("id", "question_id", "answer_text", "selected_option", "followup_answers")
+
+
+def validation_fingerprint(questions: List[Dict[str, Any]], answers: List[Dict[str, Any]],
+                           vision_analysis: Optional[Dict[str, Any]]) -> str:
+    """検証の入力（質問・回答・解析結果）のフィンガープリント（並び順には依存しない）"""
+    payload = {
+        "version": VALIDATION_VERSION,
+        "questions": sorted(([question.get(field) for field in QUESTION_FIELDS] for question in questions), key=repr),
+        "answers": sorted(([answer.get(field) for field in ANSWER_FIELDS] for answer in answers), key=repr),
+        "vision_analysis": vision_analysis,
+    }
+    serialized = json.dumps(payload, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+
+class ValidationStore:
+    """画像ごとの最新の検証結果"""
+
+    def get(self, image_id: int, fingerprint: str) -> Optional[Dict[str, Any]]:
+        """フィンガープリントが一致する保存済みの結果（なければ None）"""
+        db = SessionLocal()
+        try:
+            row = (
+                db.query(StoryValidation.result)
+                .filter(StoryValidation.image_id == image_id, StoryValidation.fingerprint == fingerprint)
+                .first()
+            )
+        except SQLAlchemyError as e:
+            logger.warning(f"保存済みの検証結果の取得エラー (image_id: {image_id}): {str(e)}")
+            row = None
+        finally:
+            db.close()
+        metrics.increment("story.validation_cache.hit" if row else "story.validation_cache.miss")
+        return row.result if row else None
+
+    def save(self, image_id: int, fingerprint: str, result: Dict[str, Any]) -> None:
+        """結果を保存（同じ画像の古い結果は削除）"""
+        db = SessionLocal()
+        try:
+            db.query(StoryValidation).filter(
+                StoryValidation.image_id == image_id, StoryValidation.fingerprint != fingerprint
+            ).delete(synchronize_session=False)
+            db.add(StoryValidation(image_id=image_id, fingerprint=fingerprint, result=result))
+            db.commit()
+        except IntegrityError:
+            db.rollback()  # 同時に検証した別のリクエストが保存済み
+        except SQLAlchemyError as e:
+            db.rollback()
+            logger.warning(f"検証結果の保存エラー (image_id: {image_id}): {str(e)}")
+        finally:
+            db.close()
+
+    def invalidate(self, db: Session, question_ids: Iterable[int]) -> int:
+        """回答した質問の画像の保存済みの結果を削除（呼び出し側のトランザクションで commit する）"""
+        image_ids = (
+            db.query(StoryQuestion.image_id)
+            .filter(StoryQuestion.id.in_(set(question_ids)))
+            .distinct()
+            .scalar_subquery()
+        )
+        deleted = db.query(StoryValidation).filter(
+            StoryValidation.image_id.in_(image_ids)
+        ).delete(synchronize_session=False)
+        if deleted:
+            metrics.increment("story.validation_cache.invalidated", deleted)
+        return deleted
+
+
+# シングルトンインスタンス
+validation_store = ValidationStore()
@@ -1,21 +1,52 @@
+from __future__ import annotations
+
 import json
 import logging
 import os
-from typing import Dict, List, Optional, Tuple
-from google.cloud import vision
-from google.cloud.vision_v1 import types
+import time
+from typing import TYPE_CHECKING, Dict, List, Optional
 from sqlalchemy.orm import Session
 from app.models.upload_image import UploadImage
-from app.database.session import SessionLocal
+from app.database.session import SessionLocal, ReadSessionLocal, get_replica_engine
+from app.services.similarity_index import get_similarity_index
+from app.services.image_hash import compute_dhash, hash_to_hex, near_duplicate_index
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.core.process_pool import get_process_pool
+from app.services.image_features import extract_local_features
+
+if TYPE_CHECKING:
+    from google.cloud.vision_v1 import types
 
 logger = logging.getLogger(__name__)
 
 
+# 解析で取得できる特徴（palette はローカル計算、それ以外は Vision API）
+VISION_FEATURES = {
+    "labels": "LABEL_DETECTION",
+    "objects": "OBJECT_LOCALIZATION",
+}
+LOCAL_FEATURES = {"palette"}
+
+# 解析プロファイル（フローに必要な特徴だけを取得する）
+ANALYSIS_PROFILES = {
+    "fast": ["labels"],
+    "standard": ["labels", "objects"],
+    "full": ["labels", "objects", "palette"],
+}
+DEFAULT_PROFILE = "full"
+
+
 class VisionAnalysisService:
     """Google Cloud Vision API を使用した画像解析サービス"""
     
-    def __init__(self):
-        # 認証ファイルのパスを明示的に設定
+    def __init__(self, client=None):
+        # クライアントは初回利用時（または lifespan のウォームアップ）に生成（テスト・ベンチマークでは差し替え可能）
+        self._client = client
+    
+    @staticmethod
+    def _configure_credentials() -> None:
+        """認証ファイルのパスを明示的に設定"""
         credentials_path = os.path.join(os.path.dirname(__file__), "..", "secrets", "ayu1104-9462987945cd.json")
         credentials_path = os.path.abspath(credentials_path)
         
@@ -24,19 +55,36 @@ class VisionAnalysisService:
             logger.info(f"Google Cloud認証ファイルを設定: {credentials_path}")
         else:
             logger.warning(f"認証ファイルが見つかりません: {credentials_path}")
-        
-        self.client = vision.ImageAnnotatorClient()
     
-    def analyze_image(self, asset_id: int) -> Dict:
+    @property
+    def client(self):
+        if self._client is None:
+            # gRPC クライアントは import・生成ともに重いため初回利用時に生成
+            self._configure_credentials()
+            from google.cloud import vision
+            self._client = vision.ImageAnnotatorClient()
+        return self._client
+    
+    @client.setter
+    def client(self, client):
+        self._client = client
+    
+    def analyze_image(self, asset_id: int, profile: str = DEFAULT_PROFILE) -> Dict:
         """
         画像を解析してメタデータを返す
         
+        保存済みの解析結果がある場合は、プロファイルに不足している特徴だけを追加で取得する。
+        
         Args:
             asset_id: アップロードされた画像のID
+            profile: 解析プロファイル（fast / standard / full）
             
         Returns:
-            Dict: 解析結果（tags, palette, geometry）
+            Dict: 解析結果（tags, palette, geometry, profile, features）
         """
+        if profile not in ANALYSIS_PROFILES:
+            raise KeyError(f"不明な解析プロファイルです: {profile}")
+        
         try:
             # データベースから画像情報を取得
             db = SessionLocal()
@@ -45,55 +93,28 @@ class VisionAnalysisService:
                 if not upload_image:
                     raise ValueError(f"Asset ID {asset_id} が見つかりません")
                 
-                # Vision API で画像を解析
-                # ローカルファイルの場合は直接読み込み
-                if upload_image.url.startswith('http://127.0.0.1:8000/uploads/'):
-                    # ローカルファイルパスを取得
-                    filename = upload_image.filename
-                    file_path = os.path.join(os.path.dirname(__file__), "..", "uploads", filename)
-                    file_path = os.path.abspath(file_path)
-                    
-                    if os.path.exists(file_path):
-                        # ファイルを直接読み込み
-                        with open(file_path, 'rb') as image_file:
-                            image_content = image_file.read()
-                        
-                        image = types.Image()
-                        image.content = image_content
-                    else:
-                        raise ValueError(f"画像ファイルが見つかりません: {file_path}")
-                else:
-                    # 公開URLの場合はそのまま使用
-                    image_uri = upload_image.url
-                    image = types.Image()
-                    image.source.image_uri = image_uri
+                # 保存済みの結果、または撮り直しなどの類似画像の結果を起点にする
+                existing = json.loads(upload_image.meta_json) if upload_image.meta_json else None
+                if existing is None:
+                    existing = self._find_near_duplicate_result(db, upload_image)
+                existing = existing or {}
                 
-                # 複数の解析を並行実行
-                responses = self.client.batch_annotate_images({
-                    'requests': [
-                        {
-                            'image': image,
-                            'features': [
-                                {'type': types.Feature.Type.OBJECT_LOCALIZATION},
-                                {'type': types.Feature.Type.LABEL_DETECTION},
-                                {'type': types.Feature.Type.IMAGE_PROPERTIES},
-                            ]
-                        }
-                    ]
-                })
+                raw = dict(existing.get("raw", {}))
+                fetched = set(existing.get("features", []))
+                needed = [feature for feature in ANALYSIS_PROFILES[profile] if feature not in fetched]
+                if not needed:
+                    return existing
                 
-                response = responses.responses[0]
+                image, local_source = self._load_image(upload_image)
+                fetched_raw = self.fetch_features(image, local_source, needed)
+                raw.update(fetched_raw)
                 
-                # 解析結果を処理
-                tags = self._extract_tags(response)
-                palette = self._extract_palette(response)
-                geometry = self._extract_geometry(response)
-                
-                return {
-                    "tags": tags,
-                    "palette": palette,
-                    "geometry": geometry
-                }
+                # ローカル計算に失敗した特徴は取得済みにしない（次に full を指定したときに取り直す）
+                obtained = {feature for feature in needed if feature not in LOCAL_FEATURES or "local" in fetched_raw}
+                result = self._build_result(raw, fetched | obtained)
+                if "reused_from" in existing:
+                    result["reused_from"] = existing["reused_from"]
+                return result
                 
             finally:
                 db.close()
@@ -102,64 +123,174 @@ class VisionAnalysisService:
             logger.error(f"画像解析エラー (asset_id: {asset_id}): {str(e)}")
             raise
     
-    def _extract_tags(self, response: types.AnnotateImageResponse) -> List[str]:
-        """タグを抽出（オブジェクト検出を優先、なければラベル検出）"""
-        tags = []
+    def _load_image(self, upload_image: UploadImage):
+        """Vision API 用の画像と、ローカル計算用の入力（バイト列またはURL）を用意"""
+        from google.cloud.vision_v1 import types
         
-        # オブジェクト検出を優先
-        if response.localized_object_annotations:
-            for obj in response.localized_object_annotations:
-                tags.append(obj.name.lower())
+        # ローカルファイルパスを取得
+        file_path = os.path.abspath(os.path.join(settings.upload_dir, upload_image.filename))
         
-        # オブジェクトが見つからない場合はラベル検出を使用
-        if not tags and response.label_annotations:
-            for label in response.label_annotations[:10]:  # 上位10個
-                tags.append(label.description.lower())
+        # ローカルファイルの場合は直接読み込み
+        if os.path.exists(file_path):
+            # ファイルを直接読み込み
+            with open(file_path, 'rb') as image_file:
+                image_content = image_file.read()
+            
+            image = types.Image()
+            image.content = image_content
+            return image, image_content
         
-        return list(set(tags))  # 重複を除去
+        # 公開URLの場合はそのまま使用
+        image = types.Image()
+        image.source.image_uri = upload_image.url
+        return image, upload_image.url
     
-    def _extract_palette(self, response: types.AnnotateImageResponse) -> List[Dict]:
-        """ドミナントカラーを抽出（上位5色）"""
-        palette = []
+    def fetch_features(self, image: types.Image, local_source, features: List[str]) -> Dict:
+        """
+        指定された特徴だけを取得する
+        
+        Args:
+            image: Vision API 用の画像
+            local_source: ローカル計算用の画像（バイト列またはURL）
+            features: 取得する特徴名のリスト
+            
+        Returns:
+            Dict: 特徴名ごとの生データ（ローカル計算に失敗した場合は local を含めない）
+        """
+        raw = {}
+        
+        # 画像サイズとパレットはプロセスプールでローカル計算（Vision API と並行実行）
+        local_future = None
+        if "palette" in features:
+            local_future = get_process_pool().submit(extract_local_features, local_source)
         
-        if response.image_properties_annotation and response.image_properties_annotation.dominant_colors:
-            colors = response.image_properties_annotation.dominant_colors.colors
+        from google.cloud.vision_v1 import types
+        
+        vision_features = [
+            types.Feature.Type[VISION_FEATURES[feature]] for feature in features if feature in VISION_FEATURES
+        ]
+        if vision_features:
+            start = time.perf_counter()
+            responses = self.client.batch_annotate_images({
+                'requests': [
+                    {
+                        'image': image,
+                        'features': [{'type': feature_type} for feature_type in vision_features]
+                    }
+                ]
+            })
+            metrics.observe("vision.annotate", time.perf_counter() - start)
+            response = responses.responses[0]
             
-            for color in colors[:5]:  # 上位5色
-                palette.append({
-                    "rgb": {
-                        "r": int(color.color.red),
-                        "g": int(color.color.green),
-                        "b": int(color.color.blue)
-                    },
-                    "score": color.score
-                })
+            if "labels" in features:
+                raw["labels"] = [
+                    {"description": label.description.lower(), "score": label.score}
+                    for label in response.label_annotations[:10]  # 上位10個
+                ]
+            if "objects" in features:
+                raw["objects"] = [
+                    {
+                        "name": obj.name.lower(),
+                        "score": obj.score,
+                        "area": self._calculate_area(obj.bounding_poly),
+                        "center": self._calculate_center(obj.bounding_poly),
+                    }
+                    for obj in response.localized_object_annotations
+                ]
+        
+        if local_future is not None:
+            try:
+                raw["local"] = local_future.result()
+            except Exception as e:
+                logger.warning(f"ローカル画像特徴の計算エラー: {str(e)}")
         
-        return palette
+        return raw
     
-    def _extract_geometry(self, response: types.AnnotateImageResponse) -> Dict:
-        """画像の幾何学情報を抽出"""
-        geometry = {
-            "width": 0,
-            "height": 0,
-            "subject_center": [0.5, 0.5]  # デフォルト値
+    def _build_result(self, raw: Dict, features) -> Dict:
+        """生データから解析結果を組み立てる"""
+        local = raw.get("local", {})
+        features = sorted(features)
+        return {
+            "tags": self._extract_tags(raw),
+            "palette": local.get("palette", []),
+            "geometry": self._extract_geometry(raw, local.get("width"), local.get("height")),
+            "profile": self._profile_for(features),
+            "features": features,
+            "raw": raw,
         }
+    
+    def _profile_for(self, features: List[str]) -> str:
+        """取得済みの特徴を満たす最も詳細なプロファイル名"""
+        covered = [
+            name for name, required in ANALYSIS_PROFILES.items()
+            if set(required) <= set(features)
+        ]
+        return max(covered, key=lambda name: len(ANALYSIS_PROFILES[name])) if covered else "custom"
+    
+    def _find_near_duplicate_result(self, db: Session, upload_image: UploadImage) -> Optional[Dict]:
+        """
+        知覚ハッシュが近い解析済み画像の結果を取得（なければ None）
+
+        知覚ハッシュはアップロード時に保存する。それ以前の行などで未計算の場合は、ここで計算して保存する
+        （解析結果の保存時に索引へ追加される）。
+        """
+        if not settings.near_duplicate_enabled:
+            return None
+        if not upload_image.phash:
+            file_path = os.path.join(settings.upload_dir, upload_image.filename)
+            try:
+                upload_image.phash = hash_to_hex(compute_dhash(file_path))
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                logger.warning(f"知覚ハッシュの計算エラー (asset_id: {upload_image.id}): {str(e)}")
+                return None
         
-        # 画像サイズを取得
-        if response.image_properties_annotation:
-            # Vision API のレスポンスから画像サイズを取得する方法を確認
-            # 通常は別途画像ファイルを読み込む必要がある
-            pass
+        start = time.perf_counter()
+        match = near_duplicate_index.find(
+            upload_image.phash, settings.near_duplicate_max_distance, exclude_image_id=upload_image.id
+        )
+        metrics.observe("vision.near_duplicate.lookup", time.perf_counter() - start)
         
-        # 最大オブジェクトの中心を計算
-        if response.localized_object_annotations:
-            largest_object = max(
-                response.localized_object_annotations,
-                key=lambda obj: self._calculate_area(obj.bounding_poly)
-            )
-            
-            center = self._calculate_center(largest_object.bounding_poly)
-            geometry["subject_center"] = center
+        if match is not None:
+            distance, image_id = match
+            source = db.query(UploadImage).filter(UploadImage.id == image_id).first()
+            if source is not None and source.meta_json:
+                logger.info(f"類似画像の解析結果を再利用します (asset_id: {upload_image.id}, 元画像: {image_id}, 距離: {distance})")
+                metrics.increment("vision.near_duplicate.hit")
+                result = json.loads(source.meta_json)
+                result["reused_from"] = image_id
+                return result
+        
+        metrics.increment("vision.near_duplicate.miss")
+        return None
+    
+    def _extract_tags(self, raw: Dict) -> List[str]:
+        """タグを抽出（オブジェクト検出とラベル検出を統合、オブジェクトを先頭に）"""
+        tags = []
+        for obj in raw.get("objects", []):
+            tags.append(obj["name"])
+        for label in raw.get("labels", []):
+            tags.append(label["description"])
+        
+        return list(dict.fromkeys(tags))  # 重複を除去（順序は保持）
+    
+    def _extract_geometry(self, raw: Dict, width: Optional[int], height: Optional[int]) -> Dict:
+        """
+        画像の幾何学情報を抽出（画像サイズはローカルで計算した値）
+        
+        プロファイルで取得していない値は含めない（fast / standard の画像サイズ、fast の subject_center）。
+        """
+        geometry = {}
+        if width is not None and height is not None:
+            geometry["width"] = width
+            geometry["height"] = height
+        
+        # 最大オブジェクトの中心を計算（オブジェクトが検出されなければ画像の中心）
+        if "objects" in raw:
+            objects = raw["objects"]
+            largest_object = max(objects, key=lambda obj: obj["area"]) if objects else None
+            geometry["subject_center"] = largest_object["center"] if largest_object else [0.5, 0.5]
         
         return geometry
     
@@ -218,6 +349,14 @@ class VisionAnalysisService:
                 db.commit()
                 
                 logger.info(f"解析結果を保存しました (asset_id: {asset_id})")
+                
+                # 類似画像インデックスを更新
+                try:
+                    get_similarity_index().add(asset_id, analysis_result.get("tags", []))
+                    if upload_image.phash:
+                        near_duplicate_index.add(upload_image.phash, asset_id)
+                except Exception as e:
+                    logger.warning(f"類似画像インデックス更新エラー (asset_id: {asset_id}): {str(e)}")
                 return True
                 
             finally:
@@ -227,35 +366,49 @@ class VisionAnalysisService:
             logger.error(f"解析結果保存エラー (asset_id: {asset_id}): {str(e)}")
             return False
     
-    def get_analysis_result(self, asset_id: int) -> Optional[Dict]:
+    def get_analysis_result(self, asset_id: int, include_raw: bool = False) -> Optional[Dict]:
         """
         保存済みの解析結果を取得
         
+        Vision の生データ（raw）は特徴の追加取得のために保存しているだけで、
+        プロンプトに入れるとトークンが増えるため include_raw を指定した場合のみ含める。
+        
         Args:
             asset_id: アップロードされた画像のID
+            include_raw: raw も返すかどうか
             
         Returns:
             Optional[Dict]: 解析結果（保存されていない場合はNone）
         """
         try:
-            db = SessionLocal()
-            try:
-                upload_image = db.query(UploadImage).filter(UploadImage.id == asset_id).first()
-                if not upload_image:
-                    raise ValueError(f"Asset ID {asset_id} が見つかりません")
-                
-                if upload_image.meta_json:
-                    return json.loads(upload_image.meta_json)
-                else:
-                    return None
-                    
-            finally:
-                db.close()
+            # リードレプリカから読み、未反映（レプリケーション遅延）の場合はプライマリで再確認
+            for session_factory in (ReadSessionLocal, SessionLocal):
+                db = session_factory()
+                try:
+                    upload_image = db.query(UploadImage).filter(UploadImage.id == asset_id).first()
+                    if upload_image and upload_image.meta_json:
+                        result = json.loads(upload_image.meta_json)
+                        return result if include_raw else analysis_payload(result)
+                    if get_replica_engine() is None:
+                        break
+                finally:
+                    db.close()
+            
+            if not upload_image:
+                raise ValueError(f"Asset ID {asset_id} が見つかりません")
+            return None
                 
         except Exception as e:
             logger.error(f"解析結果取得エラー (asset_id: {asset_id}): {str(e)}")
             return None
 
 
+def analysis_payload(analysis_result: Dict, verbose: bool = False) -> Dict:
+    """レスポンス用の解析結果（Vision の生データ raw は verbose 指定時のみ含める）"""
+    if verbose:
+        return analysis_result
+    return {key: value for key, value in analysis_result.items() if key != "raw"}
+
+
 # シングルトンインスタンス
 vision_service = VisionAnalysisService()
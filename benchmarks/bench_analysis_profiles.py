@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+解析プロファイルごとのレイテンシを計測するベンチマーク
+
+特徴ごとに遅延を持つ偽の Vision クライアントを使い、プロファイル別の解析時間と
+fast → full へのアップグレード時間を計測する。
+
+    python benchmarks/bench_analysis_profiles.py --runs 20
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from google.cloud.vision_v1 import types
+
+from app.services.vision_analysis import ANALYSIS_PROFILES, VisionAnalysisService
+
+SAMPLE_IMAGE = os.path.join(os.path.dirname(__file__), "..", "app", "uploads", "image-1.jpeg")
+
+
+class FakeAnnotator:
+    """要求された特徴ごとの遅延を合計して返す偽の ImageAnnotatorClient"""
+
+    def __init__(self, delays):
+        self.delays = delays
+
+    def batch_annotate_images(self, request):
+        features = [feature["type"] for feature in request["requests"][0]["features"]]
+        time.sleep(sum(self.delays[feature] for feature in features))
+        response = types.AnnotateImageResponse()
+        if types.Feature.Type.LABEL_DETECTION in features:
+            response.label_annotations = [
+                types.EntityAnnotation(description=name, score=0.9) for name in ("Cartoon", "Dog", "Tree")
+            ]
+        if types.Feature.Type.OBJECT_LOCALIZATION in features:
+            poly = types.BoundingPoly(normalized_vertices=[
+                types.NormalizedVertex(x=0.2, y=0.2), types.NormalizedVertex(x=0.6, y=0.2),
+                types.NormalizedVertex(x=0.6, y=0.7), types.NormalizedVertex(x=0.2, y=0.7),
+            ])
+            response.localized_object_annotations = [
+                types.LocalizedObjectAnnotation(name="Dog", score=0.8, bounding_poly=poly)
+            ]
+        return SimpleNamespace(responses=[response])
+
+
+def timed(func):
+    start = time.perf_counter()
+    func()
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="解析プロファイル別のレイテンシ計測")
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--labels-delay", type=float, default=0.25)
+    parser.add_argument("--objects-delay", type=float, default=0.45)
+    args = parser.parse_args()
+
+    service = VisionAnalysisService(client=FakeAnnotator({
+        types.Feature.Type.LABEL_DETECTION: args.labels_delay,
+        types.Feature.Type.OBJECT_LOCALIZATION: args.objects_delay,
+    }))
+    with open(SAMPLE_IMAGE, "rb") as f:
+        content = f.read()
+    image = types.Image(content=content)
+
+    # プロセスプールのウォームアップ
+    service.fetch_features(image, content, ["palette"])
+
+    for profile, features in ANALYSIS_PROFILES.items():
+        samples = [timed(lambda: service.fetch_features(image, content, features)) for _ in range(args.runs)]
+        print(f"{profile:>8}: {statistics.median(samples):7.1f} ms (特徴: {', '.join(features)})")
+
+    upgrade = [f for f in ANALYSIS_PROFILES["full"] if f not in ANALYSIS_PROFILES["fast"]]
+    samples = [timed(lambda: service.fetch_features(image, content, upgrade)) for _ in range(args.runs)]
+    print(f"fast→full: {statistics.median(samples):7.1f} ms (追加取得: {', '.join(upgrade)})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+絵本の書き出し（PDF / ZIP）のピークメモリを計測するベンチマーク
+
+一時ディレクトリの SQLite とサンプル画像で本を作って描画した後、次を計測する。
+
+    stream    逐次生成（エンドポイントと同じ）を読み捨てたときのピーク RSS の増分
+    buffered  同じ出力をメモリ上に連結した場合（比較用）
+
+ピーク RSS は /proc/self/clear_refs で計測ごとにリセットする（Linux のみ）。
+あわせて PDF の相互参照表・ZIP の整合性と、キャッシュ済み出力への Range リクエストを確認する。
+
+    python benchmarks/bench_book_export.py --pages 50
+"""
+
+import argparse
+import asyncio
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+import zipfile
+from pathlib import Path
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+SAMPLE_DIR = Path(__file__).resolve().parents[1] / "app" / "uploads"
+
+
+def _status(field: str) -> int:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field):
+                return int(line.split()[1])  # kB
+    return 0
+
+
+def reset_peak() -> None:
+    with open("/proc/self/clear_refs", "w") as f:
+        f.write("5")
+
+
+def measure(label: str, func) -> None:
+    reset_peak()
+    before = _status("VmRSS:")
+    start = time.perf_counter()
+    size = func()
+    elapsed = time.perf_counter() - start
+    peak = _status("VmHWM:")
+    print(f"{label:24s} {size / 1024 / 1024:8.1f} MB {elapsed * 1000:8.0f}ms   ピーク RSS 増分 {(peak - before) / 1024:7.1f} MB")
+
+
+def check_pdf(data: bytes, pages: int) -> None:
+    """相互参照表の各オフセットがオブジェクトの先頭を指していることを確認"""
+    xref = int(re.search(rb"startxref\n(\d+)\n", data).group(1))
+    lines = data[xref:].split(b"\n")
+    count = int(lines[1].split()[1])
+    assert count == 4 + 3 * pages, count
+    for number in range(1, count):
+        offset = int(lines[2 + number].split()[0])
+        assert data[offset:].startswith(f"{number} 0 obj".encode()), number
+
+
+def setup(workdir: Path, pages: int) -> int:
+    from app.core.process_pool import shutdown_process_pool
+    from app.database.session import Base, SessionLocal, get_engine
+    from app.models import story_answer, story_question, upload_image, user  # noqa: F401
+    from app.models.book import Book
+    from app.models.book_page import BookPage
+    from app.models.upload_image import UploadImage
+    from app.services.book_renderer import book_render_service
+
+    Base.metadata.create_all(bind=get_engine())
+    samples = sorted(p for p in SAMPLE_DIR.iterdir() if p.suffix.lower() in (".png", ".jpg", ".jpeg"))
+
+    db = SessionLocal()
+    book = Book(title="ポチの ぼうけん")
+    db.add(book)
+    for i in range(pages):
+        sample = samples[i % len(samples)]
+        filename = f"page-{i}{sample.suffix}"
+        shutil.copy(sample, workdir / "uploads" / filename)
+        image = UploadImage(filename=filename, url=filename, content_type="image/jpeg", size_bytes=sample.stat().st_size)
+        db.add(image)
+        db.flush()
+        book.pages.append(BookPage(image_id=image.id, page_number=i + 1, caption=f"ページ {i + 1} の おはなし"))
+    db.commit()
+    book_id = book.id
+
+    start = time.perf_counter()
+    try:
+        asyncio.run(book_render_service.render_book(db, book_id))
+    finally:
+        shutdown_process_pool()
+        db.close()
+    print(f"{pages} ページを描画しました ({time.perf_counter() - start:.1f}秒)")
+    return book_id
+
+
+def main():
+    parser = argparse.ArgumentParser(description="絵本の書き出しのピークメモリ計測")
+    parser.add_argument("--pages", type=int, default=50, help="ページ数")
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="storybook-export-"))
+    (workdir / "uploads").mkdir()
+    os.environ["DATABASE_URL"] = f"sqlite:///{workdir / 'bench.db'}"
+    os.environ["UPLOAD_DIR"] = str(workdir / "uploads")
+    try:
+        book_id = setup(workdir, args.pages)
+
+        from app.database.session import SessionLocal
+        from app.services.book_export import book_export_service, iter_pdf, iter_zip
+
+        db = SessionLocal()
+        exports = {fmt: asyncio.run(book_export_service.prepare(db, book_id, fmt)) for fmt in ("pdf", "zip")}
+        db.close()
+        pdf_pages = [path for _, path in exports["pdf"]["pages"]]
+        total = sum(path.stat().st_size for path in pdf_pages)
+        print(f"ページ画像の合計: {total / 1024 / 1024:.1f} MB\n")
+
+        def drain(chunks):
+            return sum(len(chunk) for chunk in chunks)
+
+        measure("pdf stream", lambda: drain(iter_pdf(pdf_pages, "ポチの ぼうけん")))
+        measure("pdf buffered", lambda: len(b"".join(iter_pdf(pdf_pages, "ポチの ぼうけん"))))
+        measure("zip stream", lambda: drain(iter_zip(exports["zip"]["pages"])))
+        measure("zip buffered", lambda: len(b"".join(iter_zip(exports["zip"]["pages"]))))
+
+        check_pdf(b"".join(iter_pdf(pdf_pages, "ポチの ぼうけん")), len(pdf_pages))
+        zip_path = workdir / "check.zip"
+        zip_path.write_bytes(b"".join(iter_zip(exports["zip"]["pages"])))
+        with zipfile.ZipFile(zip_path) as archive:
+            assert archive.testzip() is None and len(archive.namelist()) == len(pdf_pages)
+        print("\nPDF 相互参照表・ZIP の整合性: OK")
+
+        # エンドポイント: 初回は逐次生成、2回目はキャッシュから Range 対応で返す
+        from fastapi.testclient import TestClient
+        from app.main import app
+
+        with TestClient(app) as client:
+            first = client.get(f"/api/books/{book_id}/export", params={"format": "pdf"})
+            assert first.status_code == 200 and first.content.startswith(b"%PDF"), first.status_code
+            second = client.get(f"/api/books/{book_id}/export", params={"format": "pdf"}, headers={"Range": "bytes=100-199"})
+            assert second.status_code == 206 and second.content == first.content[100:200], second.status_code
+            print(f"エンドポイント: 初回 {first.status_code}（逐次生成）/ 2回目 Range {second.status_code} "
+                  f"{second.headers['content-range']}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
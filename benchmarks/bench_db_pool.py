@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+接続プールとリードレプリカ振り分けのベンチマーク
+
+1. 2つの SQLite ファイルをプライマリ／レプリカに見立てて振り分けを確認する
+   （読み取り専用セッションはレプリカ、書き込みと通常セッションはプライマリ）
+2. プールサイズを変えながら、接続を保持するスレッドを同時に走らせて
+   チェックアウト待ち時間とタイムアウト件数を計測する（プール枯渇）
+
+    python benchmarks/bench_db_pool.py --threads 32 --hold-ms 50
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+
+def check_routing(workdir: Path):
+    """プライマリ／レプリカの振り分けを確認"""
+    primary_path, replica_path = workdir / "primary.db", workdir / "replica.db"
+    os.environ["DATABASE_URL"] = f"sqlite:///{primary_path}"
+
+    from app.core.config import settings
+    settings.database_replica_url = f"sqlite:///{replica_path}"
+
+    from app.database.session import Base, ReadSessionLocal, SessionLocal, get_engine, get_replica_engine
+    from app.models import story_answer, story_question, upload_image, user  # noqa: F401
+    from app.models.upload_image import UploadImage
+    from app.models.user import User
+    from app.services.vision_analysis import vision_service
+
+    for engine in (get_engine(), get_replica_engine()):
+        Base.metadata.create_all(bind=engine)
+
+    # レプリカにだけ存在するユーザー（レプリケーション済みの古いデータ）
+    with get_replica_engine().begin() as connection:
+        connection.execute(User.__table__.insert().values(username="replica-only", email="r@example.com"))
+
+    # 通常セッションの書き込みはプライマリへ
+    db = SessionLocal()
+    db.add(User(username="primary-only", email="p@example.com"))
+    db.add(UploadImage(filename="a.png", url="u", content_type="image/png", size_bytes=1,
+                       meta_json=json.dumps({"tags": ["dog"]})))
+    db.commit()
+    db.close()
+
+    db = ReadSessionLocal()
+    read_users = [u.username for u in db.query(User).all()]
+    # 読み取り専用セッションでも flush はプライマリへ
+    db.add(User(username="written-from-read-session", email="w@example.com"))
+    db.commit()
+    db.close()
+
+    db = SessionLocal()
+    primary_users = [u.username for u in db.query(User).all()]
+    db.close()
+
+    assert read_users == ["replica-only"], read_users
+    assert primary_users == ["primary-only", "written-from-read-session"], primary_users
+    # レプリカ未反映の解析結果はプライマリから取得される
+    assert vision_service.get_analysis_result(1) == {"tags": ["dog"]}
+    print("振り分け: OK（読み取り → レプリカ、書き込み・未反映時の再確認 → プライマリ）")
+
+
+def pool_exhaustion(workdir: Path, pool_size: int, threads: int, hold_ms: float, timeout: float):
+    """pool_size の接続を threads 個のスレッドで奪い合う"""
+    from sqlalchemy import text
+    from app.core.config import settings
+    from app.database.session import build_engine
+
+    settings.db_pool_size = pool_size
+    settings.db_max_overflow = 0
+    settings.db_pool_timeout = timeout
+    engine = build_engine(f"sqlite:///{workdir / f'pool-{pool_size}.db'}")
+
+    waits, timeouts = [], 0
+    lock = threading.Lock()
+    barrier = threading.Barrier(threads)
+
+    def worker():
+        nonlocal timeouts
+        barrier.wait()
+        start = time.perf_counter()
+        try:
+            with engine.connect() as connection:
+                waited = time.perf_counter() - start
+                connection.execute(text("SELECT 1"))
+                time.sleep(hold_ms / 1000)
+            with lock:
+                waits.append(waited)
+        except Exception:
+            with lock:
+                timeouts += 1
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    start = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    elapsed = time.perf_counter() - start
+    engine.dispose()
+
+    waits_ms = sorted(w * 1000 for w in waits) or [0.0]
+    p99 = waits_ms[min(len(waits_ms) - 1, int(0.99 * (len(waits_ms) - 1)))]
+    print(f"pool_size={pool_size:>3}: 待ち p50 {statistics.median(waits_ms):7.1f} ms / p99 {p99:7.1f} ms / "
+          f"タイムアウト {timeouts:>3} / 全体 {elapsed * 1000:7.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="接続プールとリードレプリカ振り分けのベンチマーク")
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--hold-ms", type=float, default=50)
+    parser.add_argument("--timeout", type=float, default=0.5, help="プールのチェックアウト待ち上限（秒）")
+    parser.add_argument("--pool-sizes", type=int, nargs="+", default=[1, 5, 10, 32])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="storybook-dbpool-") as workdir:
+        check_routing(Path(workdir))
+        for pool_size in args.pool_sizes:
+            pool_exhaustion(Path(workdir), pool_size, args.threads, args.hold_ms, args.timeout)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+LLM 呼び出しのヘッジによる裾のレイテンシの改善を確認するベンチマーク
+
+偽 Gemini のレイテンシは、ほとんどが中央値 2.5 秒付近（対数正規分布）で、--tail-rate の割合で
+中央値 15 秒の遅い応答が混ざる分布にする（--time-scale 倍に縮めて実行）。
+generate_creative_text を --concurrency 並行で --requests 回呼び、応答時間の分布と実際の呼び出し回数を比べる。
+
+    off    LLM_HEDGING_ENABLED=false
+    on     直近の p90 を過ぎたらヘッジ（予算 --budget）
+
+    python benchmarks/bench_hedging.py --requests 3000 --concurrency 50 --budget 0.1
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from benchmarks.loadtest.fakes import LatencyModel
+
+
+class TailLatencyModel(LatencyModel):
+    """対数正規分布に、一定の割合で桁違いに遅い応答が混ざる"""
+
+    def __init__(self, median: float, sigma: float, tail_rate: float, tail_median: float, seed: int):
+        super().__init__(median, sigma, "lognormal", seed=seed)
+        self.tail_rate = tail_rate
+        self.tail_median = tail_median
+        self._tail_rng = random.Random(seed + 1)
+
+    def sample(self) -> float:
+        with self._lock:
+            if self._tail_rng.random() < self.tail_rate:
+                return self.tail_median * self._tail_rng.lognormvariate(0, self.sigma)
+        return super().sample()
+
+
+def percentile(values: list, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+async def run(client, requests: int, concurrency: int) -> list:
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            start = time.perf_counter()
+            await client.generate_creative_text("おはなしを かいて", "絵本の文章作家")
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(one() for _ in range(requests)))
+    return latencies
+
+
+async def main_async(args):
+    from benchmarks.loadtest.fakes import FakeChatModel
+    from app.core.config import settings
+    from app.core.metrics import metrics
+    from app.services.ai.gemini_client import GeminiClient
+    from app.services.ai.hedging import Hedger
+
+    scale = args.time_scale
+    settings.llm_hedge_budget = args.budget
+    settings.llm_hedge_min_delay = settings.llm_hedge_min_delay * scale
+    print(f"{args.requests} 回 / 並行 {args.concurrency} / 遅い応答 {args.tail_rate:.0%}（中央値 {args.tail_median:.0f}秒）"
+          f" / 時間を {scale} 倍に縮めて実行（表示は実時間に換算）")
+    print(f"{'':5s} {'p50':>8s} {'p90':>8s} {'p99':>8s} {'最大':>8s} {'LLM 呼出':>8s} {'ヘッジ':>6s} {'勝ち':>6s} {'予算切れ':>8s}")
+
+    results = {}
+    for label, enabled in (("off", False), ("on", True)):
+        settings.llm_hedging_enabled = enabled
+        metrics.reset()
+        model = FakeChatModel(TailLatencyModel(2.5 * scale, args.sigma, args.tail_rate, args.tail_median * scale, args.seed))
+        client = GeminiClient(llm=model, creative_llm=model)
+        client.hedger = Hedger()
+        latencies = [latency / scale for latency in await run(client, args.requests, args.concurrency)]
+        results[label] = latencies
+        print(f"{label:5s} {percentile(latencies, 0.5):7.2f}s {percentile(latencies, 0.9):7.2f}s "
+              f"{percentile(latencies, 0.99):7.2f}s {max(latencies):7.2f}s {model.calls:8d} "
+              f"{metrics.counter('llm.hedge.sent'):6.0f} {metrics.counter('llm.hedge.won'):6.0f} "
+              f"{metrics.counter('llm.hedge.budget_exhausted'):8.0f}")
+        if enabled:
+            extra = model.calls / args.requests - 1
+
+    before, after = percentile(results["off"], 0.99), percentile(results["on"], 0.99)
+    print(f"\np99: {before:.2f}秒 → {after:.2f}秒（{1 - after / before:.0%} 短縮）, 追加の呼び出し: {extra:.1%}")
+    assert extra <= args.budget + settings.llm_hedge_burst / args.requests, "ヘッジが予算を超えています"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LLM 呼び出しのヘッジ")
+    parser.add_argument("--requests", type=int, default=3000, help="呼び出し回数")
+    parser.add_argument("--concurrency", type=int, default=50, help="同時に呼び出す数")
+    parser.add_argument("--sigma", type=float, default=0.25, help="レイテンシの分布の形状")
+    parser.add_argument("--tail-rate", type=float, default=0.03, help="遅い応答の割合")
+    parser.add_argument("--tail-median", type=float, default=15.0, help="遅い応答の中央値（秒）")
+    parser.add_argument("--budget", type=float, default=0.1, help="ヘッジの上限（呼び出しに対する割合）")
+    parser.add_argument("--time-scale", type=float, default=0.02, help="レイテンシに掛ける倍率（短時間で実行するため）")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    os.environ.setdefault("DATABASE_URL", "sqlite://")  # DB は使わない
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Idempotency-Key による再送の重複排除を確認するベンチマーク
+
+タイムアウトしたモバイルクライアントの再送を模して、同じリクエストを
+同時に --retries 本 + 完了後にもう1本送り、LLM 呼び出し・保存された行・ファイルの数を数える。
+
+    no key     Idempotency-Key なし（再送のたびに実行される）
+    memory     プロセス内の記録
+    database   idempotency_keys テーブル
+
+あわせて、キーが異なる（重複しない）リクエストでのオーバーヘッドと、
+同じキーを内容の異なるリクエストに使った場合の 422 を確認する。
+
+    python benchmarks/bench_idempotency.py --retries 5 --llm-latency 0.3
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+
+class CountingChatModel:
+    """呼び出し回数を数える偽モデル"""
+
+    def __init__(self, inner):
+        self.inner = inner
+        self.calls = 0
+
+    async def ainvoke(self, messages, **kwargs):
+        self.calls += 1
+        return await self.inner.ainvoke(messages, **kwargs)
+
+
+def setup() -> tuple:
+    from app.database.session import Base, SessionLocal, get_engine
+    from app.models import book, book_page, idempotency_key, story_answer, story_question, story_validation, upload_image, user  # noqa: F401
+    from app.models.story_question import StoryQuestion
+    from app.models.upload_image import UploadImage
+
+    Base.metadata.create_all(bind=get_engine())
+    db = SessionLocal()
+    image = UploadImage(filename="a.png", url="a.png", content_type="image/png", size_bytes=1,
+                        meta_json=json.dumps({"tags": ["dog", "tree"], "palette": [], "geometry": {}}))
+    db.add(image)
+    db.flush()
+    question = StoryQuestion(image_id=image.id, target_element="主人公", question_text="しゅじんこうは だれ？", question_type="open")
+    db.add(question)
+    db.commit()
+    ids = image.id, question.id
+    db.close()
+    return ids
+
+
+def count_rows() -> dict:
+    from app.database.session import SessionLocal
+    from app.models.story_answer import StoryAnswer
+    from app.models.story_question import StoryQuestion
+    from app.models.upload_image import UploadImage
+
+    db = SessionLocal()
+    try:
+        return {
+            "questions": db.query(StoryQuestion).count(),
+            "answers": db.query(StoryAnswer).count(),
+            "uploads": db.query(UploadImage).count(),
+        }
+    finally:
+        db.close()
+
+
+def png_bytes() -> bytes:
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 64), (200, 120, 40)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+async def retry_storm(client, retries: int, use_key: bool, send) -> list:
+    """同時に retries 本送り、完了後にもう1本送る"""
+    headers = {"Idempotency-Key": str(uuid.uuid4())} if use_key else {}
+    responses = list(await asyncio.gather(*(send(client, headers) for _ in range(retries))))
+    responses.append(await send(client, headers))
+    for response in responses:
+        assert response.status_code == 200, response.text
+    return responses
+
+
+async def run_backend(client, label, use_key, retries, image_id, question_id, workdir, model, png):
+    async def questions(client, headers):
+        return await client.post(f"/api/story/{image_id}/questions", json={"missing_elements": ["主人公"]}, headers=headers)
+
+    async def answers(client, headers):
+        return await client.post("/api/story/answers", json={"answers": [{"question_id": question_id, "answer_text": "いぬの ポチ"}]},
+                                 headers=headers)
+
+    async def upload(client, headers):
+        return await client.post("/upload", files={"file": ("pochi.png", png, "image/png")}, headers=headers)
+
+    before, files_before, calls_before = count_rows(), len(list((workdir / "uploads").iterdir())), model.calls
+    start = time.perf_counter()
+    results = {}
+    for name, send in (("questions", questions), ("answers", answers), ("upload", upload)):
+        responses = await retry_storm(client, retries, use_key, send)
+        results[name] = sum(response.headers.get("idempotent-replayed") == "true" for response in responses)
+        if use_key:
+            assert len({response.content for response in responses}) == 1, f"{name}: 応答が一致しません"
+    elapsed = time.perf_counter() - start
+    after = count_rows()
+    files = len(list((workdir / "uploads").iterdir())) - files_before
+    print(f"{label:10s} {model.calls - calls_before:8d} {after['questions'] - before['questions']:8d} "
+          f"{after['answers'] - before['answers']:8d} {after['uploads'] - before['uploads']:8d} {files:8d} "
+          f"{sum(results.values()):8d} {elapsed * 1000:8.0f}ms")
+
+
+async def overhead(client, question_id, requests: int, use_key: bool) -> float:
+    latencies = []
+    for _ in range(requests):
+        headers = {"Idempotency-Key": str(uuid.uuid4())} if use_key else {}
+        start = time.perf_counter()
+        response = await client.post("/api/story/answers", json={"answers": [{"question_id": question_id, "answer_text": "ポチ"}]},
+                                     headers=headers)
+        latencies.append(time.perf_counter() - start)
+        assert response.status_code == 200, response.text
+    return statistics.median(latencies)
+
+
+async def main_async(args, workdir: Path):
+    import httpx
+    from benchmarks.loadtest.fakes import FakeChatModel, LatencyModel
+    from app.core.config import settings
+    from app.core.idempotency import DatabaseIdempotencyStore, MemoryIdempotencyStore, set_idempotency_store
+    from app.main import app
+    from app.services.ai.gemini_client import GeminiClient, set_gemini_client
+
+    image_id, question_id = setup()
+    settings.question_bank_enabled = False
+    settings.similarity_index_enabled = False
+    model = CountingChatModel(FakeChatModel(LatencyModel(args.llm_latency, distribution="fixed")))
+    set_gemini_client(GeminiClient(llm=model, creative_llm=model))
+    png = png_bytes()
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        print(f"同時再送 {args.retries} 本 + 完了後に1本 / 偽 Gemini {args.llm_latency * 1000:.0f}ms")
+        print(f"{'':10s} {'LLM 呼出':>8s} {'質問行':>8s} {'回答行':>8s} {'画像行':>8s} {'ファイル':>8s} {'再送応答':>8s} {'全体':>10s}")
+        stores = {
+            "memory": MemoryIdempotencyStore(settings.idempotency_ttl),
+            "database": DatabaseIdempotencyStore(settings.idempotency_ttl, settings.idempotency_lock_timeout),
+        }
+        await run_backend(client, "no key", False, args.retries, image_id, question_id, workdir, model, png)
+        for label, store in stores.items():
+            set_idempotency_store(store)
+            await run_backend(client, label, True, args.retries, image_id, question_id, workdir, model, png)
+
+        # 同じキーを別の内容に使うと 422
+        headers = {"Idempotency-Key": "reused-key"}
+        first = await client.post("/api/story/answers", json={"answers": [{"question_id": question_id, "answer_text": "A"}]}, headers=headers)
+        second = await client.post("/api/story/answers", json={"answers": [{"question_id": question_id, "answer_text": "B"}]}, headers=headers)
+        assert first.status_code == 200 and second.status_code == 422, (first.status_code, second.status_code)
+        print(f"\n内容の異なる再利用: {second.status_code}")
+
+        print(f"\n重複しないリクエストの応答時間 p50（POST /api/story/answers x {args.requests}）")
+        baseline = await overhead(client, question_id, args.requests, False)
+        print(f"{'no key':10s} {baseline * 1000:7.2f}ms")
+        for label, store in stores.items():
+            set_idempotency_store(store)
+            latency = await overhead(client, question_id, args.requests, True)
+            print(f"{label:10s} {latency * 1000:7.2f}ms (+{(latency - baseline) * 1000:.2f}ms)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Idempotency-Key による再送の重複排除")
+    parser.add_argument("--retries", type=int, default=5, help="同時に送る同一リクエストの数")
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="偽 Gemini のレイテンシ（秒）")
+    parser.add_argument("--requests", type=int, default=200, help="オーバーヘッド計測のリクエスト数")
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="storybook-idempotency-"))
+    (workdir / "uploads").mkdir()
+    os.environ["DATABASE_URL"] = f"sqlite:///{workdir / 'bench.db'}"
+    os.environ["UPLOAD_DIR"] = str(workdir / "uploads")
+    os.environ["WARMUP_MODE"] = "off"
+    os.environ["RATE_LIMIT_ENABLED"] = "false"  # 同じクライアントから連続で送るため
+    try:
+        asyncio.run(main_async(args, workdir))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
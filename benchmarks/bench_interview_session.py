@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+インタビューの HTTP フローと WebSocket セッションを比較するベンチマーク
+
+同じ画像・質問に対して、1問ずつ回答して最後に検証するインタビューを実行し、
+実行された SQL 文の数と所要時間を比較する（Gemini は偽モデル）。
+
+    http       回答ごとに POST /api/story/answers、最後に POST /api/story/{id}/validate
+    websocket  /api/story/{id}/interview で回答を送り、全問回答時の検証結果を受け取る
+
+回答の応答時間は、HTTP では保存完了まで、WebSocket では ack まで（保存は後からまとめて行う）。
+
+    python benchmarks/bench_interview_session.py --questions 6 --llm-latency 0.2
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+
+def setup(question_count: int) -> list:
+    from app.database.session import Base, SessionLocal, get_engine
+    from app.models import book, book_page, story_answer, story_question, story_validation, upload_image, user  # noqa: F401
+    from app.models.story_question import StoryQuestion
+    from app.models.upload_image import UploadImage
+
+    Base.metadata.create_all(bind=get_engine())
+    db = SessionLocal()
+    elements = ["主人公", "舞台", "気持ち", "出来事", "問題", "解決"]
+    images = []
+    for _ in range(2):  # HTTP 用と WebSocket 用
+        image = UploadImage(filename="a.png", url="a.png", content_type="image/png", size_bytes=1,
+                            meta_json=json.dumps({"tags": ["dog", "tree"], "palette": [], "geometry": {}}))
+        db.add(image)
+        db.flush()
+        for i in range(question_count):
+            db.add(StoryQuestion(image_id=image.id, target_element=elements[i % len(elements)],
+                                 question_text=f"しつもん {i + 1}", question_type="open"))
+        images.append(image)
+    db.commit()
+    image_ids = [image.id for image in images]
+    db.close()
+    return image_ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description="インタビューの HTTP / WebSocket 比較")
+    parser.add_argument("--questions", type=int, default=6, help="質問数")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="偽 Gemini のレイテンシ（秒）")
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="storybook-interview-"))
+    os.environ["DATABASE_URL"] = f"sqlite:///{workdir / 'bench.db'}"
+    os.environ["WARMUP_MODE"] = "off"
+    try:
+        http_image_id, ws_image_id = setup(args.questions)
+
+        from fastapi.testclient import TestClient
+        from sqlalchemy import event
+        from benchmarks.loadtest.fakes import FakeChatModel, LatencyModel
+        from app.database.session import get_engine
+        from app.main import app
+        from app.models.story_question import StoryQuestion
+        from app.database.session import SessionLocal
+        from app.services.ai.gemini_client import GeminiClient, set_gemini_client
+
+        model = FakeChatModel(LatencyModel(args.llm_latency, distribution="fixed"))
+        set_gemini_client(GeminiClient(llm=model, creative_llm=model))
+
+        statements = []
+        event.listen(get_engine(), "before_cursor_execute", lambda *a, **k: statements.append(1))
+
+        def question_ids_for(image_id):
+            db = SessionLocal()
+            try:
+                return [q.id for q in db.query(StoryQuestion).filter(StoryQuestion.image_id == image_id).order_by(StoryQuestion.id)]
+            finally:
+                db.close()
+
+        question_ids = question_ids_for(http_image_id)
+
+        with TestClient(app) as client:
+            # HTTP: 回答ごとにリクエスト
+            statements.clear()
+            start = time.perf_counter()
+            http_answer = []
+            for question_id in question_ids:
+                answer_start = time.perf_counter()
+                response = client.post("/api/story/answers", json={"answers": [{"question_id": question_id, "answer_text": "いぬの ポチ"}]})
+                http_answer.append(time.perf_counter() - answer_start)
+                assert response.status_code == 200, response.text
+            response = client.post(f"/api/story/{http_image_id}/validate")
+            assert response.status_code == 200, response.text
+            http_time, http_statements = time.perf_counter() - start, len(statements)
+
+            # WebSocket: 1本の接続で回答（全問回答で検証結果が届く）
+            question_ids = question_ids_for(ws_image_id)
+            statements.clear()
+            start = time.perf_counter()
+            with client.websocket_connect(f"/api/story/{ws_image_id}/interview") as ws:
+                messages = [ws.receive_json()]
+                while messages[-1]["type"] != "question":
+                    messages.append(ws.receive_json())
+                ws_answer = []
+                for question_id in question_ids:
+                    answer_start = time.perf_counter()
+                    ws.send_json({"type": "answer", "question_id": question_id, "answer_text": "いぬの ポチ"})
+                    while True:
+                        message = ws.receive_json()
+                        if message["type"] == "ack":
+                            ws_answer.append(time.perf_counter() - answer_start)
+                        assert message["type"] != "error", message
+                        if message["type"] in ("question", "validation"):
+                            break
+                assert message["type"] == "validation", message
+                ws.send_json({"type": "end"})
+                end = ws.receive_json()
+                assert end["type"] == "end" and end["answered"] == len(question_ids), end
+            ws_time, ws_statements = time.perf_counter() - start, len(statements)
+
+        db = SessionLocal()
+        from app.models.story_answer import StoryAnswer
+        saved = db.query(StoryAnswer).count()
+        db.close()
+        assert saved == 2 * len(question_ids), saved
+
+        print(f"質問数 {len(question_ids)} / 偽 Gemini {args.llm_latency * 1000:.0f}ms")
+        print(f"{'':10s} {'SQL 文':>6s} {'回答の応答 p50':>14s} {'全体':>8s}")
+        print(f"{'http':10s} {http_statements:8d} {statistics.median(http_answer) * 1000:14.1f}ms {http_time * 1000:8.0f}ms")
+        print(f"{'websocket':10s} {ws_statements:8d} {statistics.median(ws_answer) * 1000:14.1f}ms {ws_time * 1000:8.0f}ms")
+        print(f"回答はすべて保存されました（{saved} 件）")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
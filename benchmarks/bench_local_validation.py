@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+ルールによる情報検証（LLM を呼ばない判定）の割合と削減できた時間を計測するベンチマーク
+
+--interviews 件のインタビューを作り、回答を1件受け取るたびに検証する（フロントエンドの途中確認を模す）。
+回答には、短すぎる回答・「わからない」・選択肢から選ばれていない choice 回答・長い文を一定の割合で混ぜる。
+
+    llm     LOCAL_VALIDATION_ENABLED=false（すべて LLM で検証）
+    local   明らかに不足・明らかに十分な場合はルールで判定し、それ以外は判定内容を渡して LLM で検証
+
+保存済みの結果の再利用（VALIDATION_CACHE_ENABLED）は無効にし、DB を使わずにエージェントを直接呼ぶ。
+
+    python benchmarks/bench_local_validation.py --interviews 20 --llm-latency 1.2
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+ELEMENTS = ("主人公", "舞台", "気持ち", "出来事", "問題", "解決")
+GOOD_ANSWERS = {
+    "主人公": ["いぬの ポチ", "おんなのこの はな", "くまの もこ"],
+    "舞台": ["こうえん", "もりの なか", "うみの そば"],
+    "気持ち": ["うれしい", "どきどき", "わくわく"],
+    "出来事": ["ボールを おいかけた", "ともだちに あった"],
+    "問題": ["ことりが すに かえれない", "ボールが きに ひっかかった"],
+    "解決": ["みんなで たすけた", "はしごを つかって とった"],
+}
+LONG_ANSWER = "ポチは公園でボールを追いかけていたけれど、途中で大きな木に引っかかってしまい、どうしても取れなくて困っていました"
+
+
+class PromptRecorder:
+    """呼び出し回数とプロンプトの長さを記録する偽モデル"""
+
+    def __init__(self, inner):
+        self.inner = inner
+        self.calls = 0
+        self.prompt_chars = []
+
+    async def ainvoke(self, messages, **kwargs):
+        self.calls += 1
+        self.prompt_chars.append(sum(len(text) for role, text in messages if role != "system"))
+        return await self.inner.ainvoke(messages, **kwargs)
+
+
+def make_interviews(count: int, seed: int) -> list:
+    """(質問, 回答を受け取った順) の一覧"""
+    rng = random.Random(seed)
+    interviews = []
+    next_id = 1
+    for _ in range(count):
+        questions = []
+        for element in ELEMENTS:
+            choice = element == "気持ち"
+            questions.append({
+                "id": next_id, "target_element": element, "question_text": f"{element}は なに？",
+                "question_type": "choice" if choice else "open",
+                "options": GOOD_ANSWERS[element] if choice else None, "followups": [], "reason": "",
+            })
+            next_id += 1
+        answers = []
+        for question in questions:
+            roll = rng.random()
+            element = question["target_element"]
+            answer = {"id": next_id, "question_id": question["id"], "selected_option": None, "followup_answers": None}
+            if roll < 0.08:
+                answer["answer_text"] = "うん"
+            elif roll < 0.12:
+                answer["answer_text"] = "わからない"
+            elif roll < 0.18:
+                answer["answer_text"] = LONG_ANSWER
+            elif question["question_type"] == "choice" and roll < 0.26:
+                answer["answer_text"] = "ふつう"  # 選択肢にない
+            else:
+                answer["answer_text"] = rng.choice(GOOD_ANSWERS[element])
+                if question["question_type"] == "choice":
+                    answer["selected_option"] = answer["answer_text"]
+            answers.append(answer)
+            next_id += 1
+        interviews.append((questions, answers))
+    return interviews
+
+
+async def run(interviews: list, agent, vision_analysis: dict) -> tuple:
+    latencies, verdicts = [], Counter()
+    for questions, answers in interviews:
+        for received in range(1, len(answers) + 1):
+            start = time.perf_counter()
+            result = await agent.validate_collected_information(1, questions, answers[:received], vision_analysis=vision_analysis)
+            latencies.append(time.perf_counter() - start)
+            assert result["status"] == "success", result
+            meta = result["meta"]
+            verdicts[meta.get("local_verdict", "-") if meta.get("validated_by") == "local" else "llm"] += 1
+    return latencies, verdicts
+
+
+async def main_async(args):
+    from benchmarks.loadtest.fakes import FakeChatModel, LatencyModel
+    from app.core.config import settings
+    from app.core.metrics import metrics
+    from app.services.ai.gemini_client import GeminiClient, set_gemini_client
+    from app.agents.story_agent import StoryAgent
+
+    settings.validation_cache_enabled = False
+    vision_analysis = {"tags": ["dog", "tree", "ball"], "palette": [], "geometry": {}}
+    interviews = make_interviews(args.interviews, args.seed)
+    total = sum(len(answers) for _, answers in interviews)
+    print(f"インタビュー {args.interviews} 件 x 回答 {len(ELEMENTS)} 件（回答ごとに検証: {total} 回）/ 偽 Gemini {args.llm_latency * 1000:.0f}ms")
+    print(f"{'':6s} {'LLM 呼出':>8s} {'ルール':>8s} {'平均':>10s} {'合計':>10s} {'プロンプト':>10s}")
+
+    results = {}
+    for label, enabled in (("llm", False), ("local", True)):
+        settings.local_validation_enabled = enabled
+        metrics.reset()
+        model = PromptRecorder(FakeChatModel(LatencyModel(args.llm_latency, distribution="fixed")))
+        set_gemini_client(GeminiClient(llm=model, creative_llm=model))
+        latencies, verdicts = await run(interviews, StoryAgent(), vision_analysis)
+        prompt = statistics.mean(model.prompt_chars) if model.prompt_chars else 0
+        results[label] = (model.calls, sum(latencies), prompt, verdicts)
+        print(f"{label:6s} {model.calls:8d} {total - model.calls:8d} {statistics.mean(latencies) * 1000:8.1f}ms "
+              f"{sum(latencies):8.1f}秒 {prompt:8.0f}字")
+
+    calls, elapsed, prompt, verdicts = results["local"]
+    base_calls, base_elapsed, base_prompt, _ = results["llm"]
+    print(f"\nルールで判定: {(total - calls) / total:.0%}（不足 {verdicts['incomplete']} / 十分 {verdicts['complete']}）, "
+          f"LLM で検証: {verdicts['llm']}")
+    print(f"削減: LLM 呼び出し {base_calls - calls} 回, 時間 {base_elapsed - elapsed:.1f}秒（{1 - elapsed / base_elapsed:.0%}）, "
+          f"LLM に送るプロンプト {1 - prompt / base_prompt:.0%} 短縮")
+    print(f"ルールでの判定時間 p50: {metrics.summary('story.local_validation')['p50'] * 1e6:.0f}µs")
+    assert calls == verdicts["llm"] and base_calls == total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ルールによる情報検証")
+    parser.add_argument("--interviews", type=int, default=20, help="インタビューの件数")
+    parser.add_argument("--llm-latency", type=float, default=1.2, help="偽 Gemini のレイテンシ（秒）")
+    parser.add_argument("--seed", type=int, default=0, help="回答の乱数シード")
+    args = parser.parse_args()
+    os.environ.setdefault("DATABASE_URL", "sqlite://")  # DB は使わない
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+タスクごとのモデル選択（遅くなったモデルから速いモデルへの切り替え）を確認するベンチマーク
+
+偽 Gemini をモデル名ごとに用意し（gemini-2.5-flash は中央値 2.5 秒、gemini-2.5-flash-lite は 0.8 秒）、
+質問の生成（questions）を --workers 並行で呼び続ける。途中で gemini-2.5-flash だけを中央値 --degraded 秒に遅くし、
+その後元に戻す。呼び出しの --long-ratio の割合は LLM_MODEL_MAX_PROMPT_CHARS を超える長いプロンプトにする。
+
+    off    LLM_ROUTING_ENABLED=false（常に gemini-2.5-flash）
+    on     直近の p90 が LLM_LATENCY_SLO を超えたら gemini-2.5-flash-lite に切り替え
+
+時間は --time-scale 倍に縮めて実行し（SLO・統計の保持時間も同じ倍率）、表示は実時間に換算する。
+
+    python benchmarks/bench_model_routing.py --phase-seconds 600 --workers 20
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+from collections import Counter, defaultdict
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+PREFERRED, FAST = "gemini-2.5-flash", "gemini-2.5-flash-lite"
+PHASES = ("healthy", "degraded", "recovered")
+
+
+def percentile(values: list, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+
+class NamedModel:
+    """呼び出されたモデル名を (フェーズ, モデル名) で記録する"""
+
+    def __init__(self, name: str, inner, log: Counter, phase_box: list):
+        self.name = name
+        self.inner = inner
+        self.log = log
+        self.phase_box = phase_box
+
+    async def ainvoke(self, messages, **kwargs):
+        self.log[(self.phase_box[0], self.name)] += 1
+        return await self.inner.ainvoke(messages, **kwargs)
+
+
+async def run(client, latencies: dict, args, phase_box: list) -> dict:
+    from app.schemas.llm_output import QuestionSetOutput
+
+    system = "穴うめインタビュアー"
+    short, long = "画像解析: dog, tree", "画像解析: " + "いぬ " * 5000
+    results = defaultdict(list)
+    counter = 0
+    deadline = time.perf_counter() + args.phase_seconds * args.time_scale * len(PHASES)
+
+    async def worker():
+        nonlocal counter
+        while time.perf_counter() < deadline:
+            counter += 1
+            prompt = long if counter % round(1 / args.long_ratio) == 0 else short
+            phase = phase_box[0]
+            start = time.perf_counter()
+            await client.generate_structured(prompt, system, QuestionSetOutput, creative=True, task="questions")
+            results[phase].append(((time.perf_counter() - start) / args.time_scale, prompt is long))
+
+    async def timeline():
+        for phase in PHASES:
+            phase_box[0] = phase
+            latencies[PREFERRED].median = args.degraded * args.time_scale if phase == "degraded" else 2.5 * args.time_scale
+            await asyncio.sleep(args.phase_seconds * args.time_scale)
+
+    await asyncio.gather(timeline(), *(worker() for _ in range(args.workers)))
+    return results
+
+
+async def main_async(args):
+    from benchmarks.loadtest.fakes import FakeChatModel, LatencyModel
+    from app.core.config import settings
+    from app.core.metrics import metrics
+    from app.services.ai.gemini_client import GeminiClient
+    from app.services.ai.hedging import Hedger
+    from app.services.ai.model_router import ModelRouter
+
+    scale = args.time_scale
+    slo = settings.llm_latency_slo["questions"]
+    settings.llm_latency_slo = {task: value * scale for task, value in settings.llm_latency_slo.items()}
+    settings.llm_router_stats_ttl *= scale
+    print(f"フェーズ {args.phase_seconds}秒 x {len(PHASES)}（{PREFERRED}: 2.5秒 → {args.degraded}秒 → 2.5秒, {FAST}: 0.8秒）"
+          f" / 並行 {args.workers} / questions の SLO p90 {slo}秒 / 時間を {scale} 倍に縮めて実行")
+    print(f"{'':4s} {'フェーズ':10s} {'呼出':>6s} {'p50':>7s} {'p90':>7s} {'p99':>7s} {'SLO 超過':>8s} {FAST + ' の割合':>28s}")
+
+    for label, enabled in (("off", False), ("on", True)):
+        settings.llm_routing_enabled = enabled
+        metrics.reset()
+        latencies = defaultdict(lambda: LatencyModel(2.5 * scale, 0.3, seed=0))
+        latencies[PREFERRED], latencies[FAST] = LatencyModel(2.5 * scale, 0.3, seed=1), LatencyModel(0.8 * scale, 0.3, seed=2)
+        called, phase_box = Counter(), [PHASES[0]]
+        client = GeminiClient(model_factory=lambda name, creative: NamedModel(name, FakeChatModel(latencies[name]), called, phase_box))
+        client.hedger, client.router = Hedger(), ModelRouter()
+        results = await run(client, latencies, args, phase_box)
+
+        for phase in PHASES:
+            values = [latency for latency, _ in results[phase]]
+            missed = sum(1 for latency in values if latency > slo) / len(values)
+            fast = called[(phase, FAST)] / (called[(phase, FAST)] + called[(phase, PREFERRED)])
+            print(f"{label:4s} {phase:10s} {len(values):6d} {percentile(values, 0.5):6.2f}s {percentile(values, 0.9):6.2f}s "
+                  f"{percentile(values, 0.99):6.2f}s {missed:8.1%} {fast:28.1%}")
+        print(f"{'':4s} 切り替え: {metrics.counter('llm.router.switches'):.0f} 回, "
+              f"downgraded: {metrics.counter('llm.router.questions.downgraded'):.0f} / preferred: "
+              f"{metrics.counter('llm.router.questions.preferred'):.0f}")
+        if enabled:
+            assert metrics.counter("llm.router.questions.downgraded") > 0
+            # 長いプロンプトは軽量モデルに回さないため、遅くなった gemini-2.5-flash のまま処理される
+            long_latencies = [latency for latency, is_long in results["degraded"] if is_long]
+            print(f"{'':4s} degraded の長いプロンプト: {len(long_latencies)} 件（p50 {percentile(long_latencies, 0.5):.2f}s）")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="タスクごとのモデル選択")
+    parser.add_argument("--phase-seconds", type=float, default=600, help="各フェーズの長さ（実時間換算の秒）")
+    parser.add_argument("--workers", type=int, default=20, help="同時に呼び出す数")
+    parser.add_argument("--degraded", type=float, default=12.0, help="遅くなった gemini-2.5-flash のレイテンシ中央値（秒）")
+    parser.add_argument("--long-ratio", type=float, default=0.1, help="長いプロンプトの割合")
+    parser.add_argument("--time-scale", type=float, default=0.01, help="レイテンシに掛ける倍率（短時間で実行するため）")
+    args = parser.parse_args()
+    os.environ.setdefault("DATABASE_URL", "sqlite://")  # DB は使わない
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger("app.services.ai.model_router").setLevel(logging.INFO)  # 切り替えのログを表示
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+類似画像（撮り直し）検出のベンチマーク
+
+合成した絵を明るさ・角度・解像度・JPEG 再圧縮で撮り直し風に加工し、
+dHash + マルチインデックス検索 による再利用率・誤検出率・検索レイテンシを計測する。
+
+    python benchmarks/bench_near_duplicate.py --drawings 200 --population 100000
+"""
+
+import argparse
+import io
+import os
+import sys
+import time
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageEnhance
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from app.services.image_hash import MultiIndexHash, compute_dhash
+
+
+def synthetic_drawing(rng: np.random.Generator) -> Image.Image:
+    """クレヨン画風のランダムな図形を描く"""
+    img = Image.new("RGB", (800, 600), "white")
+    draw = ImageDraw.Draw(img)
+    for _ in range(rng.integers(5, 15)):
+        x0, y0 = rng.integers(0, 700), rng.integers(0, 500)
+        x1, y1 = x0 + rng.integers(20, 300), y0 + rng.integers(20, 300)
+        color = tuple(int(c) for c in rng.integers(0, 255, size=3))
+        if rng.random() < 0.5:
+            draw.ellipse((x0, y0, x1, y1), fill=color)
+        else:
+            draw.rectangle((x0, y0, x1, y1), fill=color)
+    return img
+
+
+def retake(img: Image.Image, rng: np.random.Generator) -> io.BytesIO:
+    """撮り直し風の加工（明るさ・回転・縮小・JPEG 再圧縮）"""
+    img = ImageEnhance.Brightness(img).enhance(rng.uniform(0.8, 1.2))
+    img = img.rotate(rng.uniform(-3, 3), fillcolor="white")
+    img = img.resize((int(img.width * rng.uniform(0.6, 1.0)), int(img.height * rng.uniform(0.6, 1.0))))
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=int(rng.integers(60, 90)))
+    buf.seek(0)
+    return buf
+
+
+def main():
+    parser = argparse.ArgumentParser(description="知覚ハッシュによる類似画像検出のベンチマーク")
+    parser.add_argument("--drawings", type=int, default=200)
+    parser.add_argument("--population", type=int, default=100_000, help="索引に入れるランダムハッシュ数")
+    parser.add_argument("--max-distance", type=int, default=6)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    tree = MultiIndexHash(args.max_distance)
+    for i in range(args.population):
+        tree.add(int(rng.integers(0, 1 << 63)) | int(rng.integers(0, 2)) << 63, -(i + 1))
+
+    drawings = [synthetic_drawing(rng) for _ in range(args.drawings)]
+    for image_id, img in enumerate(drawings):
+        buf = io.BytesIO()
+        img.save(buf, format="PNG")
+        buf.seek(0)
+        tree.add(compute_dhash(buf), image_id)
+
+    latencies, reused, false_matches = [], 0, 0
+    for image_id, img in enumerate(drawings):
+        value = compute_dhash(retake(img, rng))
+        start = time.perf_counter()
+        matches = tree.search(value, args.max_distance)
+        latencies.append(time.perf_counter() - start)
+        if matches and matches[0][1] == image_id:
+            reused += 1
+        elif matches and matches[0][1] >= 0:
+            false_matches += 1
+
+    unrelated = 0
+    for _ in range(args.drawings):
+        value = compute_dhash(retake(synthetic_drawing(rng), rng))
+        if any(image_id >= 0 for _, image_id in tree.search(value, args.max_distance)):
+            unrelated += 1
+
+    latencies = np.array(latencies) * 1000
+    print(f"索引: {len(tree):,} ハッシュ / 距離しきい値 {args.max_distance}")
+    print(f"再利用率: {reused / args.drawings:.1%} / 別の絵と誤一致: {false_matches / args.drawings:.1%} / "
+          f"無関係な絵の誤検出: {unrelated / args.drawings:.1%}")
+    print(f"検索: p50 {np.percentile(latencies, 50):.3f} ms / p95 {np.percentile(latencies, 95):.3f} ms / "
+          f"p99 {np.percentile(latencies, 99):.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
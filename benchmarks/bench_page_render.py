@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+絵本ページ描画のベンチマーク
+
+一時ディレクトリの SQLite とサンプル画像で本を作り、次の3通りの所要時間を計測する。
+
+    cold    すべてのページを描画（プロセスプールで並列）
+    warm    内容が変わっていないので全ページがキャッシュから再利用される
+    edit    1ページだけキャプションを変更（そのページだけ再描画される）
+
+それぞれ、描画中にイベントループが止まった最長の時間（他のリクエストの待ち時間の目安）も表示する。
+
+    python benchmarks/bench_page_render.py --pages 12 --template caption_overlay
+    python benchmarks/bench_page_render.py --pages 6 --photo-px 6000   # 大きな写真
+"""
+
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+SAMPLE_DIR = Path(__file__).resolve().parents[1] / "app" / "uploads"
+CAPTIONS = [
+    "むかしむかし、あるところに げんきな いぬの ポチが いました。",
+    "ポチは まいにち こうえんで ともだちと あそびました。",
+    "ある ひ、おおきな きの したで ちいさな ことりが ないていました。",
+    "ポチは ことりを たすけるために、いっしょうけんめい かんがえました。",
+]
+
+
+async def main_async(args, workdir: Path):
+    os.environ["DATABASE_URL"] = f"sqlite:///{workdir / 'bench.db'}"
+
+    from app.core.process_pool import shutdown_process_pool
+    from app.database.session import Base, SessionLocal, get_engine
+    from app.models import story_answer, story_question, upload_image, user  # noqa: F401
+    from app.models.book import Book
+    from app.models.book_page import BookPage
+    from app.models.upload_image import UploadImage
+    from app.services.book_renderer import BookRenderService
+
+    Base.metadata.create_all(bind=get_engine())
+    upload_dir = workdir / "uploads"
+    upload_dir.mkdir()
+    samples = sorted(p for p in SAMPLE_DIR.iterdir() if p.suffix.lower() in (".png", ".jpg", ".jpeg"))
+
+    db = SessionLocal()
+    book = Book(title="ベンチマーク")
+    db.add(book)
+    for i in range(args.pages):
+        sample = samples[i % len(samples)]
+        filename = f"page-{i}{sample.suffix}"
+        if args.photo_px:
+            # 長辺 --photo-px の写真に拡大（ページごとに内容を変え、ハッシュのメモ化を効かせない）
+            from PIL import Image
+            with Image.open(sample) as im:
+                scale = args.photo_px / max(im.size)
+                photo = im.convert("RGB").resize((round(im.width * scale), round(im.height * scale)))
+            photo.putpixel((i, 0), (i % 256, 0, 0))
+            filename = f"page-{i}.jpg"
+            photo.save(upload_dir / filename, quality=95)
+        else:
+            shutil.copy(sample, upload_dir / filename)
+        image = UploadImage(filename=filename, url=filename, content_type="image/jpeg", size_bytes=sample.stat().st_size)
+        db.add(image)
+        db.flush()
+        book.pages.append(BookPage(image_id=image.id, page_number=i + 1, caption=CAPTIONS[i % len(CAPTIONS)] + f"（{i + 1}）"))
+    db.commit()
+    book_id = book.id
+    db.close()
+
+    service = BookRenderService(upload_dir)
+    print(f"フォント: {service.font_path or 'Pillow 既定フォント'}")
+
+    async def longest_stall(stop: asyncio.Event) -> float:
+        """1ms ごとに起き、予定より遅れた最長の時間（秒）"""
+        longest = 0.0
+        while not stop.is_set():
+            before = time.perf_counter()
+            await asyncio.sleep(0.001)
+            longest = max(longest, time.perf_counter() - before - 0.001)
+        return longest
+
+    async def run(label, edit=False):
+        db = SessionLocal()
+        try:
+            if edit:
+                page = db.query(BookPage).filter(BookPage.book_id == book_id).first()
+                page.caption = "おしまい。"
+                db.commit()
+            stop = asyncio.Event()
+            ticker = asyncio.create_task(longest_stall(stop))
+            await asyncio.sleep(0)  # 計測を始めてから描画する
+            start = time.perf_counter()
+            result = await service.render_book(db, book_id, args.template)
+            elapsed = time.perf_counter() - start
+            stop.set()
+            stall = await ticker
+        finally:
+            db.close()
+        print(f"{label:6s} {elapsed * 1000:8.0f}ms  描画 {result['rendered']:3d}  再利用 {result['cached']:3d}  "
+              f"ループ最大停止 {stall * 1000:6.1f}ms")
+
+    try:
+        await run("cold")
+        await run("warm")
+        await run("edit", edit=True)
+    finally:
+        shutdown_process_pool()
+
+    rendered = sorted((upload_dir / "rendered").glob("*.jpg"))
+    if rendered:
+        print(f"出力例: {rendered[0]} ({rendered[0].stat().st_size // 1024} KB)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="絵本ページ描画の計測")
+    parser.add_argument("--pages", type=int, default=12, help="ページ数")
+    parser.add_argument("--template", default="caption_bottom", help="レイアウトテンプレート")
+    parser.add_argument("--photo-px", type=int, default=0, help="ページ画像を長辺この大きさの写真にする（0 はサンプルのまま）")
+    parser.add_argument("--keep", action="store_true", help="出力ディレクトリを削除しない")
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="storybook-render-"))
+    try:
+        asyncio.run(main_async(args, workdir))
+    finally:
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+主要なクエリの実行計画（SQLite の EXPLAIN QUERY PLAN）を確認するベンチマーク
+
+インデックスを追加する前のリビジョン（0004）まで適用した DB に --images 件の画像と、
+画像ごとに --questions 件の質問・回答を入れ、次の API が実際に発行する SELECT を記録する。
+
+    validate   POST /api/story/{id}/validate（質問の取得と回答の結合）
+    images     GET /images（画像一覧）
+    analysis   GET /api/assets/{id}/features（解析結果の取得）
+
+記録したクエリの実行計画と実行時間を、0004 と最新（head）のマイグレーションで比べ、
+最新ではどのクエリもテーブル全体を走査せずインデックスを使うことを確認する。
+あわせて、モデル定義とマイグレーションに差分がないこと（alembic check）を確認する。
+
+    python benchmarks/bench_query_plans.py --images 5000 --questions 6
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+ROOT = Path(__file__).resolve().parents[1]
+HOT_TABLES = ("story_questions", "story_answers", "upload_images")
+BEFORE_INDEXES = "0004"  # インデックス（0005）を追加する前のリビジョン
+
+
+def alembic_config():
+    from alembic.config import Config
+
+    config = Config(str(ROOT / "alembic.ini"))
+    config.attributes["configure_logger"] = False
+    return config
+
+
+def seed(images: int, questions: int) -> None:
+    """ORM を通さずにまとめて挿入する"""
+    from sqlalchemy import text
+    from app.database.session import get_engine
+
+    meta_json = json.dumps({"tags": ["dog", "tree"], "palette": [], "geometry": {}})
+    with get_engine().begin() as connection:
+        connection.execute(
+            text("INSERT INTO upload_images (id, filename, url, content_type, size_bytes, uploaded_at, meta_json) "
+                 "VALUES (:id, :filename, :filename, 'image/png', 1, datetime('now', :age), :meta_json)"),
+            [{"id": i, "filename": f"{i}.png", "age": f"-{i} seconds", "meta_json": meta_json} for i in range(1, images + 1)],
+        )
+        rows = [(image_id, q) for image_id in range(1, images + 1) for q in range(questions)]
+        connection.execute(
+            text("INSERT INTO story_questions (id, image_id, target_element, question_text, question_type) "
+                 "VALUES (:id, :image_id, '主人公', 'しゅじんこうは だれ？', 'open')"),
+            [{"id": i, "image_id": image_id} for i, (image_id, _) in enumerate(rows, 1)],
+        )
+        connection.execute(
+            text("INSERT INTO story_answers (question_id, answer_text) VALUES (:question_id, 'いぬの ポチ')"),
+            [{"question_id": i} for i in range(1, len(rows) + 1)],
+        )
+
+
+@contextmanager
+def capture(statements: list):
+    """実行された SELECT を (SQL, パラメータ) で記録"""
+    from sqlalchemy import event
+    from app.database.session import get_engine
+
+    def listener(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT") and any(table in statement for table in HOT_TABLES):
+            statements.append((statement, parameters))
+
+    engine = get_engine()
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        yield
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+
+
+async def record_queries(image_id: int) -> dict:
+    import httpx
+    from benchmarks.loadtest.fakes import FakeChatModel, LatencyModel
+    from app.main import app
+    from app.services.ai.gemini_client import GeminiClient, set_gemini_client
+
+    model = FakeChatModel(LatencyModel(0.0, distribution="fixed"))
+    set_gemini_client(GeminiClient(llm=model, creative_llm=model))
+    calls = {
+        "validate": ("POST", f"/api/story/{image_id}/validate"),
+        "images": ("GET", "/images"),
+        "analysis": ("GET", f"/api/assets/{image_id}/features"),
+    }
+    queries = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for name, (method, url) in calls.items():
+            statements = []
+            with capture(statements):
+                response = await client.request(method, url)
+            assert response.status_code == 200, (name, response.status_code, response.text[:200])
+            queries[name] = statements
+    return queries
+
+
+def explain(connection, statement: str, parameters) -> list:
+    return [row[3] for row in connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)]
+
+
+def full_scans(plan: list) -> list:
+    """インデックスを使わずにテーブル全体を走査している行・並び替えの一時 B-tree"""
+    problems = []
+    for detail in plan:
+        match = re.match(r"SCAN (\w+)", detail)
+        if match and match.group(1) in HOT_TABLES and "USING" not in detail:
+            problems.append(detail)
+        if "USE TEMP B-TREE FOR ORDER BY" in detail:
+            problems.append(detail)
+    return problems
+
+
+def measure(connection, statement: str, parameters, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        connection.exec_driver_sql(statement, parameters).fetchall()
+    return (time.perf_counter() - start) / repeat
+
+
+def report(label: str, queries: dict, repeat: int) -> dict:
+    from app.database.session import get_engine
+
+    results = {}
+    print(f"\n[{label}]")
+    with get_engine().connect() as connection:
+        for name, statements in queries.items():
+            plans, elapsed = [], 0.0
+            for statement, parameters in statements:
+                plans.append(explain(connection, statement, parameters))
+                elapsed += measure(connection, statement, parameters, repeat)
+            problems = [problem for plan in plans for problem in full_scans(plan)]
+            results[name] = (elapsed, problems)
+            print(f"  {name:10s} {len(statements)} クエリ {elapsed * 1000:9.3f}ms")
+            for plan in plans:
+                print("      " + " / ".join(plan))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="主要なクエリの実行計画")
+    parser.add_argument("--images", type=int, default=5000, help="画像の件数")
+    parser.add_argument("--questions", type=int, default=6, help="画像ごとの質問（回答）の件数")
+    parser.add_argument("--repeat", type=int, default=20, help="実行時間の計測回数")
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="storybook-query-plans-"))
+    os.environ["DATABASE_URL"] = f"sqlite:///{workdir / 'bench.db'}"
+    os.environ["UPLOAD_DIR"] = str(workdir / "uploads")
+    os.environ["WARMUP_MODE"] = "off"
+    os.environ["RATE_LIMIT_ENABLED"] = "false"
+    try:
+        from alembic import command
+        from app.database.session import get_engine
+
+        config = alembic_config()
+        command.upgrade(config, BEFORE_INDEXES)
+        seed(args.images, args.questions)
+        print(f"画像 {args.images} 件 / 質問・回答 各 {args.images * args.questions} 件")
+
+        queries = asyncio.run(record_queries(args.images // 2))
+        before = report(f"インデックス追加前（{BEFORE_INDEXES}）", queries, args.repeat)
+
+        command.upgrade(config, "head")
+        get_engine().dispose()  # プール内の接続が古いスキーマの実行計画を使わないようにする
+        after = report("最新（head）", queries, args.repeat)
+
+        print(f"\n{'':10s} {BEFORE_INDEXES:>10s} {'head':>10s}")
+        for name in queries:
+            print(f"{name:10s} {before[name][0] * 1000:8.3f}ms {after[name][0] * 1000:8.3f}ms")
+        for name, (_, problems) in after.items():
+            assert not problems, f"{name}: インデックスを使っていません: {problems}"
+        print("\n最新のマイグレーション: すべてのクエリがインデックスを使用: OK")
+
+        command.check(config)  # モデルとマイグレーションに差分があれば例外
+        print("モデル定義とマイグレーションの差分なし（alembic check）: OK")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
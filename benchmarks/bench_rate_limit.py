@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+レート制限ミドルウェアのオーバーヘッドと挙動を確認するベンチマーク
+
+1. オーバーヘッド: 何もしないアプリの前にミドルウェアを置き、1リクエストあたりの追加時間（µs）を計測する
+   （多数のユーザーに分散させ、制限には掛からない状態）。
+       off        rate_limit_enabled=false
+       memory     プロセス内のバケット
+       shared     Redis 用のストア + ローカルの代役（往復遅延なし。実際の Redis ではこれに RTT が加わる）
+2. 挙動: 1人のユーザーが POST /api/story/{id}/questions を連打したときの 200 / 429 の数と Retry-After、
+   その間に別のユーザーが通ること、実際に呼ばれた LLM の回数を確認する（Gemini は偽モデル）。
+   X-User-Id を付け替えた連打が IP のバケットで止まること、同じ IP の1クラス分（--class-size 人）が
+   同時に POST /api/story/{id}/analyze を呼んでも（ルート全体のバケットが既定の無効の場合）通ることも確認する。
+3. ルート全体のバケット（RATE_LIMIT_ROUTE_RATE を設定した場合）: ルールで答えられる検証の呼び出しでは消費せず、
+   LLM を呼ぶ質問生成だけが消費することを確認する。
+
+    python benchmarks/bench_rate_limit.py --requests 100000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+
+async def noop_app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"{}"})
+
+
+async def measure(app, requests: int, users: int) -> float:
+    """1リクエストあたりの平均時間（µs）"""
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    scopes = [
+        {"type": "http", "method": "POST", "path": "/api/story/1/questions", "client": ("10.0.0.1", 1234),
+         "headers": [(b"content-type", b"application/json"), (b"x-user-id", str(i).encode())]}
+        for i in range(users)
+    ]
+    for scope in scopes:  # ウォームアップ
+        await app(scope, receive, send)
+    start = time.perf_counter()
+    for i in range(requests):
+        await app(scopes[i % users], receive, send)
+    return (time.perf_counter() - start) / requests * 1e6
+
+
+async def overhead(args):
+    from benchmarks.loadtest.fakes import LocalRedisStandIn
+    from app.core.config import settings
+    from app.core.rate_limit import MemoryRateLimitStore, RateLimitMiddleware, RedisRateLimitStore, set_rate_limit_store
+
+    # 制限に掛からないよう、ルート全体と IP のバケットも十分に大きくする（計測は全ユーザーが同じ IP）
+    settings.rate_limit_route_rate = settings.rate_limit_route_burst = 1e9
+    settings.rate_limit_ip_rate = settings.rate_limit_ip_burst = 1e9
+    middleware = RateLimitMiddleware(noop_app)
+
+    baseline = await measure(noop_app, args.requests, args.users)
+    print(f"1リクエストあたりの時間（{args.requests} リクエスト / {args.users} ユーザー）")
+    print(f"{'app only':10s} {baseline:7.2f}µs")
+    settings.rate_limit_enabled = False
+    print(f"{'off':10s} {await measure(middleware, args.requests, args.users) - baseline:+7.2f}µs")
+    settings.rate_limit_enabled = True
+    for label, store in (("memory", MemoryRateLimitStore()), ("shared", RedisRateLimitStore(LocalRedisStandIn()))):
+        set_rate_limit_store(store)
+        print(f"{label:10s} {await measure(middleware, args.requests, args.users) - baseline:+7.2f}µs")
+
+
+async def behaviour(args, workdir: Path):
+    import httpx
+    from benchmarks.bench_idempotency import CountingChatModel
+    from benchmarks.loadtest.fakes import FakeChatModel, LatencyModel, LocalRedisStandIn
+    from app.core.config import settings
+    from app.core.rate_limit import MemoryRateLimitStore, RedisRateLimitStore, set_rate_limit_store
+    from app.database.session import Base, SessionLocal, get_engine
+    from app.main import app
+    from app.models import book, book_page, idempotency_key, story_answer, story_question, story_validation, upload_image, user  # noqa: F401
+    from app.models.upload_image import UploadImage
+    from app.services.ai.gemini_client import GeminiClient, set_gemini_client
+
+    Base.metadata.create_all(bind=get_engine())
+    db = SessionLocal()
+    image = UploadImage(filename="a.png", url="a.png", content_type="image/png", size_bytes=1,
+                        meta_json=json.dumps({"tags": ["dog", "tree"], "palette": [], "geometry": {}}))
+    db.add(image)
+    db.commit()
+    image_id = image.id
+    db.close()
+
+    settings.question_bank_enabled = False
+    settings.similarity_index_enabled = False
+    settings.rate_limit_route_rate, settings.rate_limit_route_burst = 0.0, 20.0
+    settings.rate_limit_ip_rate, settings.rate_limit_ip_burst = 5.0, 300.0
+    model = CountingChatModel(FakeChatModel(LatencyModel(0.01, distribution="fixed")))
+    set_gemini_client(GeminiClient(llm=model, creative_llm=model))
+
+    print(f"\n1人のユーザーが質問生成を {args.burst} 回連打（容量 {settings.rate_limit_user_burst:.0f}・"
+          f"毎秒 {settings.rate_limit_user_rate:g} トークン・コスト 10）")
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        stores = (("memory", MemoryRateLimitStore), ("shared", lambda: RedisRateLimitStore(LocalRedisStandIn())))
+        for label, make_store in stores:
+            set_rate_limit_store(make_store())
+            calls_before = model.calls
+            body = {"missing_elements": ["主人公"]}
+            responses = [
+                await client.post(f"/api/story/{image_id}/questions", json=body, headers={"X-User-Id": f"{label}-loop"})
+                for _ in range(args.burst)
+            ]
+            other = await client.post(f"/api/story/{image_id}/questions", json=body, headers={"X-User-Id": f"{label}-other"})
+            statuses = [response.status_code for response in responses]
+            limited = [response for response in responses if response.status_code == 429]
+            retry_after = limited[0].headers["retry-after"] if limited else "-"
+            print(f"{label:10s} 200: {statuses.count(200):3d}  429: {statuses.count(429):3d}  Retry-After: {retry_after}s  "
+                  f"別ユーザー: {other.status_code}  LLM 呼び出し: {model.calls - calls_before}")
+            assert other.status_code == 200 and limited, statuses
+
+            # X-User-Id を毎回付け替えても IP のバケットで制限される
+            set_rate_limit_store(make_store())
+            rotating = [
+                (await client.post(f"/api/story/{image_id}/questions", json=body, headers={"X-User-Id": f"{label}-rotate-{i}"})).status_code
+                for i in range(args.rotate)
+            ]
+            print(f"{'':10s} X-User-Id を毎回変えて {args.rotate} 回: 200: {rotating.count(200):3d}  429: {rotating.count(429):3d}"
+                  f"（IP の容量 {settings.rate_limit_ip_burst:.0f}）")
+            assert 429 in rotating, rotating
+
+            # 同じ IP（学校の NAT）の1クラス分が同時に物語分析を呼ぶ
+            set_rate_limit_store(make_store())
+            classroom = await asyncio.gather(*(
+                client.post(f"/api/story/{image_id}/analyze", headers={"X-User-Id": f"{label}-child-{i}"})
+                for i in range(args.class_size)
+            ))
+            class_statuses = [response.status_code for response in classroom]
+            print(f"{'':10s} {args.class_size} 人が同時に物語分析: 200: {class_statuses.count(200):3d}  "
+                  f"429: {class_statuses.count(429):3d}")
+            assert class_statuses.count(200) == args.class_size, class_statuses
+
+            # ルート全体のバケットを有効にして、LLM を呼ばない検証の連打では消費しないことを確認する
+            set_rate_limit_store(make_store())
+            settings.rate_limit_route_rate = 5.0
+            settings.rate_limit_ip_burst = 1e9
+            polls = [
+                (await client.post(f"/api/story/{image_id}/validate", headers={"X-User-Id": f"{label}-poll-{i}"})).status_code
+                for i in range(args.burst)
+            ]
+            calls_before = model.calls
+            questions = await asyncio.gather(*(
+                client.post(f"/api/story/{image_id}/questions", json=body, headers={"X-User-Id": f"{label}-route-{i}"})
+                for i in range(args.burst)
+            ))
+            question_statuses = [response.status_code for response in questions]
+            print(f"{'':10s} ルート全体のバケット（容量 {settings.rate_limit_route_burst:.0f}）: 検証 {args.burst} 回 → "
+                  f"200: {polls.count(200):3d}, 続けて質問生成 {args.burst} 回 → 200: {question_statuses.count(200):3d}  "
+                  f"429: {question_statuses.count(429):3d}  LLM 呼び出し: {model.calls - calls_before}")
+            assert polls.count(200) == args.burst, polls
+            assert question_statuses.count(200) == settings.rate_limit_route_burst, question_statuses
+            settings.rate_limit_route_rate = 0.0
+            settings.rate_limit_ip_burst = 300.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="レート制限のオーバーヘッドと挙動")
+    parser.add_argument("--requests", type=int, default=100000, help="オーバーヘッド計測のリクエスト数")
+    parser.add_argument("--users", type=int, default=1000, help="オーバーヘッド計測のユーザー数")
+    parser.add_argument("--burst", type=int, default=30, help="1人のユーザーが連打する回数")
+    parser.add_argument("--class-size", type=int, default=30, help="同じ IP から同時に物語分析を呼ぶ人数")
+    parser.add_argument("--rotate", type=int, default=40, help="X-User-Id を付け替えながら連打する回数")
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="storybook-ratelimit-"))
+    os.environ["DATABASE_URL"] = f"sqlite:///{workdir / 'bench.db'}"
+    os.environ["WARMUP_MODE"] = "off"
+    try:
+        asyncio.run(overhead(args))
+        asyncio.run(behaviour(args, workdir))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
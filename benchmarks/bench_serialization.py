@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+レスポンスのシリアライズ時間とサイズを計測するベンチマーク
+
+同じ代表的なペイロードを返すルートを2通り用意して比較する。
+
+    before: response_model=Dict[str, Any] + JSONResponse（vision_analysis・questions の重複を含む）
+    after:  型付きレスポンスモデル + ORJSONResponse（重複は verbose 指定時のみ）
+
+アプリを ASGI で直接呼び出すため、ネットワークを含まないエンドポイント処理時間になる。
+
+    python benchmarks/bench_serialization.py --requests 2000
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from datetime import datetime
+from typing import Any, Dict
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+import httpx
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse, ORJSONResponse
+
+from app.schemas.asset_analysis import AssetAnalysisResponse
+from app.schemas.story import AnswersResponse, QuestionsResponse, StoryAnalysisResponse, ValidationResponse
+from app.services.vision_analysis import analysis_payload
+
+
+def vision_result() -> Dict[str, Any]:
+    labels = ["cartoon", "dog", "tree", "house", "sun", "person", "flower", "grass", "sky", "cloud"]
+    objects = [
+        {"name": name, "score": 0.8, "area": 0.12 * (i + 1), "center": [0.2 + 0.1 * i, 0.5]}
+        for i, name in enumerate(labels[:5])
+    ]
+    return {
+        "tags": labels[:5] + labels[5:],
+        "palette": [{"rgb": {"r": 20 * i, "g": 200 - 20 * i, "b": 128}, "score": 0.2} for i in range(5)],
+        "geometry": {"width": 1024, "height": 768, "subject_center": [0.6, 0.5]},
+        "profile": "full",
+        "features": ["labels", "objects", "palette"],
+        "raw": {
+            "labels": [{"description": name, "score": 0.9} for name in labels],
+            "objects": objects,
+            "local": {"width": 1024, "height": 768, "palette": []},
+        },
+    }
+
+
+def questions() -> list:
+    return [
+        {
+            "target_element": element, "reason": f"{element}が不明確",
+            "question": f"この おはなしの {element}は なにかな？", "type": "open",
+            "followups": ["もう すこし おしえて？"],
+        }
+        for element in ["主人公", "舞台", "気持ち", "出来事", "問題", "解決"]
+    ]
+
+
+def saved_questions(image_id: int) -> list:
+    return [
+        {
+            "id": i + 1, "image_id": image_id, "target_element": q["target_element"],
+            "question_text": q["question"], "question_type": q["type"], "options": None,
+            "followups": q["followups"], "reason": q["reason"], "created_at": datetime(2024, 1, 1),
+        }
+        for i, q in enumerate(questions())
+    ]
+
+
+PAYLOADS = {
+    "/api/assets/{id}/analyze": lambda: {"id": 1, "status": "success", "analysis": vision_result()},
+    "/api/story/{id}/analyze": lambda: {
+        "id": 1, "status": "success", "vision_analysis": vision_result(),
+        "story_elements": {
+            "character": {"value": "いぬ", "confidence": 80},
+            "setting": {"value": "こうえん", "confidence": 60},
+        },
+        "missing_elements": ["emotion", "conflict", "resolution"],
+    },
+    "/api/story/{id}/questions": lambda: {
+        "id": 1, "status": "success", "missing_elements": ["emotion", "conflict", "resolution"],
+        "questions": questions(), "saved_questions": saved_questions(1),
+    },
+    "/api/story/answers": lambda: {
+        "status": "success", "message": "6件の回答を保存しました",
+        "saved_answers": [
+            {"id": i, "question_id": i, "user_id": None, "answer_text": "いぬの ポチ",
+             "selected_option": None, "followup_answers": None, "created_at": datetime(2024, 1, 1)}
+            for i in range(1, 7)
+        ],
+    },
+    "/api/story/{id}/validate": lambda: {
+        "status": "success", "image_id": 1, "message": "情報検証が完了しました",
+        "validation_result": {
+            "overall_score": 82,
+            "completeness": {"score": 80, "missing_elements": [], "sufficient_elements": ["主人公", "問題", "解決"]},
+            "age_appropriateness": {"score": 90, "issues": [], "strengths": ["ひらがな中心"]},
+            "story_coherence": {"score": 75, "issues": [], "suggestions": []},
+            "recommendations": [], "ready_for_story": True,
+        },
+        "meta": {"total_questions": 6, "answered_questions": 6},
+    },
+}
+
+MODELS = {
+    "/api/assets/{id}/analyze": AssetAnalysisResponse,
+    "/api/story/{id}/analyze": StoryAnalysisResponse,
+    "/api/story/{id}/questions": QuestionsResponse,
+    "/api/story/answers": AnswersResponse,
+    "/api/story/{id}/validate": ValidationResponse,
+}
+
+
+def trim(path: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    """ルートの既定（verbose=False）と同じ重複の除去"""
+    if "analysis" in payload:
+        payload["analysis"] = analysis_payload(payload["analysis"])
+    payload.pop("vision_analysis", None)
+    payload.pop("questions", None)
+    return payload
+
+
+def build_before_app() -> FastAPI:
+    app = FastAPI(default_response_class=JSONResponse)
+    for path, factory in PAYLOADS.items():
+        app.add_api_route(path.replace("{id}", "1"), lambda factory=factory: factory(),
+                          methods=["POST"], response_model=Dict[str, Any])
+    return app
+
+
+def build_after_app() -> FastAPI:
+    app = FastAPI(default_response_class=ORJSONResponse)
+    for path, factory in PAYLOADS.items():
+        app.add_api_route(path.replace("{id}", "1"), lambda path=path, factory=factory: trim(path, factory()),
+                          methods=["POST"], response_model=MODELS[path], response_model_exclude_none=True)
+    return app
+
+
+async def measure(app: FastAPI, path: str, requests: int):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        url = path.replace("{id}", "1")
+        for _ in range(50):  # ウォームアップ
+            await client.post(url)
+        samples = []
+        size = 0
+        for _ in range(requests):
+            start = time.perf_counter()
+            response = await client.post(url)
+            samples.append((time.perf_counter() - start) * 1_000_000)
+            size = len(response.content)
+            assert response.status_code == 200, response.text
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.95)], size
+
+
+async def main_async(args):
+    before, after = build_before_app(), build_after_app()
+    print(f"{'endpoint':30s} {'before p50':>11s} {'after p50':>10s} {'before B':>9s} {'after B':>8s} {'bytes':>7s}")
+    total_before = total_after = 0
+    for path in PAYLOADS:
+        b_p50, _, b_size = await measure(before, path, args.requests)
+        a_p50, _, a_size = await measure(after, path, args.requests)
+        total_before += b_size
+        total_after += a_size
+        print(f"{path:30s} {b_p50:9.0f}us {a_p50:8.0f}us {b_size:9d} {a_size:8d} {a_size / b_size - 1:+7.0%}")
+    print(f"{'合計バイト数':24s} {total_before:33d} {total_after:8d} {total_after / total_before - 1:+7.0%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="レスポンスのシリアライズ時間・サイズの比較")
+    parser.add_argument("--requests", type=int, default=2000, help="エンドポイントごとのリクエスト数")
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
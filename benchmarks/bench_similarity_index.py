@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+類似画像インデックスのベンチマーク
+
+合成したタグ集合（Zipf 分布の語彙）でインデックス構築時間と検索レイテンシを計測する。
+
+    python benchmarks/bench_similarity_index.py --images 1000000
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from app.services.similarity_index import SimilarityIndex
+
+
+def synthetic_tag_sets(count: int, vocabulary: int, seed: int):
+    """Zipf 分布の語彙から 3〜8 個のタグ集合を生成"""
+    rng = np.random.default_rng(seed)
+    sizes = rng.integers(3, 9, size=count)
+    for size in sizes:
+        ids = np.unique(np.minimum(rng.zipf(1.3, size=size), vocabulary))
+        yield [f"tag{i}" for i in ids]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MinHash LSH インデックスのベンチマーク")
+    parser.add_argument("--images", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=10_000)
+    parser.add_argument("--vocabulary", type=int, default=300)
+    parser.add_argument("--threshold", type=float, default=0.8)
+    args = parser.parse_args()
+
+    index = SimilarityIndex()
+    start = time.perf_counter()
+    for image_id, tags in enumerate(synthetic_tag_sets(args.images, args.vocabulary, seed=0)):
+        index.add(image_id, tags, persist=False)
+    build_seconds = time.perf_counter() - start
+    print(f"構築: {args.images:,} 画像 / {len(index._group_tags):,} グループ / {build_seconds:.1f} 秒 "
+          f"({build_seconds / args.images * 1e6:.1f} µs/画像)")
+
+    latencies = []
+    hits = 0
+    for tags in synthetic_tag_sets(args.queries, args.vocabulary, seed=1):
+        start = time.perf_counter()
+        results = index.query(tags, args.threshold)
+        latencies.append(time.perf_counter() - start)
+        hits += bool(results)
+    latencies = np.array(latencies) * 1000
+    print(f"検索: {args.queries:,} 件 / ヒット率 {hits / args.queries:.1%} / "
+          f"p50 {np.percentile(latencies, 50):.3f} ms / p95 {np.percentile(latencies, 95):.3f} ms / "
+          f"p99 {np.percentile(latencies, 99):.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+ストレージ保守（孤立ファイルの削除と容量制限）を確認するベンチマーク
+
+一時ディレクトリに次のファイルを作り、走査時間・ピークメモリと削除結果を確認する。
+
+    uploads   --files 件。半分は upload_images に行があり、残りは孤立（うち 1/10 は猶予時間内）
+    rendered  --pages 件。半分は book_pages から参照され、残りは古い描画結果
+    exports   --exports 件の書き出しキャッシュ（最後に使われた時刻はばらばら）
+
+容量の上限は「元画像 + 派生ファイルの半分」にし、派生ファイルが古い順に削除されることを確認する。
+
+    python benchmarks/bench_storage_maintenance.py --files 20000
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from uuid import uuid4
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+HOUR = 3600
+
+
+def make_file(path: Path, size: int, age: float) -> None:
+    path.write_bytes(b"\0" * size)
+    at = time.time() - age
+    os.utime(path, (at, at))
+
+
+def setup(root: Path, args) -> dict:
+    from app.database.session import Base, SessionLocal, get_engine
+    from app.models import story_answer, story_question, user  # noqa: F401
+    from app.models.book import Book
+    from app.models.book_page import BookPage
+    from app.models.upload_image import UploadImage
+
+    Base.metadata.create_all(bind=get_engine())
+    (root / "rendered").mkdir()
+    (root / "exports").mkdir()
+    expected = {"orphans": 0, "kept_orphans": 0, "originals": 0, "derived": []}
+
+    db = SessionLocal()
+    book = Book(title="bench")
+    db.add(book)
+    for i in range(args.files):
+        name = f"{uuid4().hex}.jpg"
+        if i % 2 == 0:
+            make_file(root / name, 1024, 2 * HOUR)
+            db.add(UploadImage(filename=name, url=name, content_type="image/jpeg", size_bytes=1024))
+            expected["originals"] += 1024
+        elif i % 20 == 1:
+            make_file(root / name, 1024, 60)  # 書き込み直後（猶予時間内）
+            expected["kept_orphans"] += 1
+            expected["originals"] += 1024
+        else:
+            make_file(root / name, 1024, 2 * HOUR)
+            expected["orphans"] += 1
+    db.flush()
+
+    image = db.query(UploadImage).first()
+    for i in range(args.pages):
+        name = f"{uuid4().hex}.jpg"
+        age = (i + 1) * 60 + HOUR
+        make_file(root / "rendered" / name, 32 * 1024, age)
+        if i % 2 == 0:
+            book.pages.append(BookPage(image_id=image.id, page_number=i + 1, caption="", rendered_filename=name))
+            expected["derived"].append((age, name, 32 * 1024))
+        else:
+            expected["orphans"] += 1
+    for i in range(args.exports):
+        name = f"{uuid4().hex}.pdf"
+        age = ((i * 7919) % args.exports + 1) * 60 + 30 + HOUR  # 描画済みページと同じ時刻にならないようずらす
+        make_file(root / "exports" / name, 256 * 1024, age)
+        expected["derived"].append((age, name, 256 * 1024))
+    make_file(root / "exports" / f"{uuid4().hex}.pdf.{uuid4().hex}.tmp", 4096, 2 * HOUR)  # 中断した書き出し
+    expected["orphans"] += 1
+    db.commit()
+    db.close()
+    return expected
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ストレージ保守の確認")
+    parser.add_argument("--files", type=int, default=20000, help="uploads 直下のファイル数")
+    parser.add_argument("--pages", type=int, default=2000, help="描画済みページのファイル数")
+    parser.add_argument("--exports", type=int, default=200, help="書き出しキャッシュのファイル数")
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="storybook-storage-"))
+    root = workdir / "uploads"
+    root.mkdir()
+    os.environ["DATABASE_URL"] = f"sqlite:///{workdir / 'bench.db'}"
+    os.environ["UPLOAD_DIR"] = str(root)
+    try:
+        expected = setup(root, args)
+        from app.database.session import SessionLocal
+        from app.models.book_page import BookPage
+        from app.services.storage_maintenance import storage_maintenance
+
+        derived_bytes = sum(size for _, _, size in expected["derived"])
+        quota = expected["originals"] + derived_bytes // 2
+
+        dry = storage_maintenance.run(dry_run=True, grace=HOUR, quota=quota, min_age=0)
+        assert dry.orphans == expected["orphans"], (dry.orphans, expected["orphans"])
+        assert sum(1 for _ in root.rglob("*") if _.is_file()) == args.files + args.pages + args.exports + 1
+
+        tracemalloc.start()
+        report = storage_maintenance.run(grace=HOUR, quota=quota, min_age=0)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        print(f"ファイル {args.files + args.pages + args.exports + 1} 件を走査: {report.elapsed:.2f}秒 / ピークメモリ {peak / 1024 / 1024:.1f}MB")
+        print(f"孤立ファイル: {report.orphans} 件削除（猶予時間内の {expected['kept_orphans']} 件は残す）")
+        print(f"容量制限: 上限 {quota / 1024 / 1024:.1f}MB → {report.evicted} 件 / {report.evicted_bytes / 1024 / 1024:.1f}MB 削除、"
+              f"使用量 {report.bytes / 1024 / 1024:.1f}MB")
+
+        assert report.orphans == expected["orphans"]
+        assert not report.over_quota and report.bytes <= quota
+        # 最後に使われた時刻が古い派生ファイルから削除されている
+        remaining = {path.name for area in ("rendered", "exports") for path in (root / area).iterdir()}
+        by_age = sorted(expected["derived"], reverse=True)
+        evicted = [name not in remaining for _, name, _ in by_age]
+        assert evicted == sorted(evicted, reverse=True), "古い順に削除されていません"
+        db = SessionLocal()
+        dangling = db.query(BookPage).filter(BookPage.rendered_filename.isnot(None)).all()
+        assert all(page.rendered_filename in remaining for page in dangling)
+        db.close()
+        print("古い順の削除・削除したページの参照の解除: OK")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
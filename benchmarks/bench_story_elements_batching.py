@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+物語要素の分析のまとめ処理（マイクロバッチ）を確認するベンチマーク
+
+アップロードが集中した状況として、--bursts 回の突発（それぞれ --burst 件の analyze_story_elements を同時に呼ぶ）を
+--interval 秒おきに発生させる。偽 Gemini は同時に --upstream-concurrency 件までしか処理せず（レート制限の代わり）、
+レイテンシは 基本 --base 秒 + 出力1文字あたり --per-char 秒。入出力の文字数をトークン数の目安として数える。
+
+    off      STORY_ELEMENTS_BATCHING_ENABLED=false（1件ずつ呼び出す）
+    on       STORY_ELEMENTS_BATCH_WINDOW / STORY_ELEMENTS_BATCH_MAX でまとめて呼び出す
+    partial  on と同じで、まとめた応答の一部（--drop-rate の割合）が欠けたり壊れたりする（個別の呼び出しに戻る）
+
+時間は --time-scale 倍に縮めて実行し、表示は実時間に換算する。
+
+    python benchmarks/bench_story_elements_batching.py --bursts 5 --burst 30
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+
+def percentile(values: list, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class MeteredChatModel:
+    """同時実行数を制限し、入出力の文字数を数える偽 Gemini"""
+
+    def __init__(self, args, drop_rate: float = 0.0):
+        self.args = args
+        self.drop_rate = drop_rate
+        self.semaphore = asyncio.Semaphore(args.upstream_concurrency)
+        self.rng = random.Random(args.seed)
+        self.calls = 0
+        self.input_chars = 0
+        self.output_chars = 0
+
+    def _respond(self, messages) -> str:
+        from benchmarks.loadtest.fakes import canned_response
+
+        content = canned_response(messages)
+        data = json.loads(content)
+        if self.drop_rate and "results" in data:
+            kept = []
+            for item in data["results"]:
+                roll = self.rng.random()
+                if roll < self.drop_rate / 2:
+                    continue  # 結果の欠落
+                if roll < self.drop_rate:
+                    item = {**item, "elements": {"character": {"value": "いぬ", "confidence": 180}}}  # スキーマ違反
+                kept.append(item)
+            content = json.dumps({"results": kept}, ensure_ascii=False)
+        return content
+
+    async def ainvoke(self, messages, **kwargs):
+        async with self.semaphore:
+            self.calls += 1
+            self.input_chars += sum(len(text) for _, text in messages)
+            content = self._respond(messages)
+            self.output_chars += len(content)
+            scale = self.args.time_scale
+            await asyncio.sleep((self.args.base + self.args.per_char * len(content)) * scale)
+            return SimpleNamespace(content=content)
+
+
+async def run(client, args) -> tuple:
+    vision = {"labels": ["dog", "tree", "park"], "objects": ["dog"], "text": ""}
+    latencies, results = [], []
+
+    async def one():
+        start = time.perf_counter()
+        results.append(await client.analyze_story_elements(dict(vision)))
+        latencies.append((time.perf_counter() - start) / args.time_scale)
+
+    start = time.perf_counter()
+    tasks = []
+    for _ in range(args.bursts):
+        tasks += [asyncio.ensure_future(one()) for _ in range(args.burst)]
+        await asyncio.sleep(args.interval * args.time_scale)
+    await asyncio.gather(*tasks)
+    return latencies, results, (time.perf_counter() - start) / args.time_scale
+
+
+async def main_async(args):
+    from app.core.config import settings
+    from app.core.metrics import metrics
+    from app.services.ai.gemini_client import GeminiClient
+
+    total = args.bursts * args.burst
+    settings.story_elements_batch_window = args.window * args.time_scale
+    settings.story_elements_batch_max = args.max_batch
+    print(f"{args.bursts} 回の突発 x {args.burst} 件（{args.interval}秒おき）/ 上流の同時実行 {args.upstream_concurrency}"
+          f" / まとめる待ち時間 {args.window * 1000:.0f}ms・上限 {args.max_batch} 件 / 時間を {args.time_scale} 倍に縮めて実行")
+    print(f"{'':8s} {'LLM 呼出':>8s} {'入力文字':>9s} {'出力文字':>9s} {'件/秒':>7s} {'p50':>7s} {'p99':>7s} "
+          f"{'個別に戻した件数':>14s}")
+
+    rows = {}
+    for label, enabled, drop_rate in (("off", False, 0.0), ("on", True, 0.0), ("partial", True, args.drop_rate)):
+        settings.story_elements_batching_enabled = enabled
+        metrics.reset()
+        model = MeteredChatModel(args, drop_rate)
+        client = GeminiClient(llm=model, creative_llm=model)
+        latencies, results, elapsed = await run(client, args)
+        assert len(results) == total and all(result["elements"]["character"]["value"] == "いぬ" for result in results)
+        rows[label] = model
+        print(f"{label:8s} {model.calls:8d} {model.input_chars:9d} {model.output_chars:9d} {total / elapsed:7.1f} "
+              f"{percentile(latencies, 0.5):6.2f}s {percentile(latencies, 0.99):6.2f}s "
+              f"{metrics.counter('llm.story_elements.batch_fallback'):14.0f}")
+
+    off, on = rows["off"], rows["on"]
+    before, after = off.input_chars + off.output_chars, on.input_chars + on.output_chars
+    print(f"\nLLM 呼び出し: {off.calls} → {on.calls} 回, 入出力の文字数: {before} → {after}（{1 - after / before:.0%} 削減）")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="物語要素の分析のまとめ処理")
+    parser.add_argument("--bursts", type=int, default=5, help="突発の回数")
+    parser.add_argument("--burst", type=int, default=30, help="1回の突発で同時に届く分析の件数")
+    parser.add_argument("--interval", type=float, default=2.0, help="突発の間隔（秒）")
+    parser.add_argument("--upstream-concurrency", type=int, default=8, help="偽 Gemini が同時に処理できる数")
+    parser.add_argument("--base", type=float, default=1.5, help="偽 Gemini の基本レイテンシ（秒）")
+    parser.add_argument("--per-char", type=float, default=0.002, help="出力1文字あたりのレイテンシ（秒）")
+    parser.add_argument("--window", type=float, default=0.03, help="まとめる待ち時間（秒）")
+    parser.add_argument("--max-batch", type=int, default=10, help="1回にまとめる上限")
+    parser.add_argument("--drop-rate", type=float, default=0.1, help="partial でまとめた応答から欠けたり壊れたりする割合")
+    parser.add_argument("--time-scale", type=float, default=0.01, help="レイテンシに掛ける倍率（短時間で実行するため）")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    os.environ.setdefault("DATABASE_URL", "sqlite://")  # DB は使わない
+    logging.disable(logging.WARNING)  # partial の解析エラーのログを抑える
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+絵本生成（構成 → ページ本文の並行生成）のレイテンシを計測するベンチマーク
+
+遅延を持つ偽の Gemini を使い、ページ本文の同時実行数を変えながら
+最初のページが届くまでの時間と全体の所要時間を計測する。
+全体の所要時間は「構成 + 最も遅いページ」に近づくのが目標（同時実行数 1 は逐次生成と同じ）。
+
+    python benchmarks/bench_story_generation.py --pages 8 --latency 0.5
+"""
+
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+
+class TimedChatModel:
+    """呼び出しごとのレイテンシを記録する偽モデル"""
+
+    def __init__(self, inner):
+        self.inner = inner
+        self.latencies = []
+
+    async def ainvoke(self, messages, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await self.inner.ainvoke(messages, **kwargs)
+        finally:
+            self.latencies.append(time.perf_counter() - start)
+
+
+async def run(agent, model, page_count, concurrency):
+    from app.core.config import settings
+
+    settings.story_page_concurrency = concurrency
+    model.latencies.clear()
+    interview = [{"target_element": "主人公", "question": "しゅじんこうは だれ？", "answer": "いぬの ポチ", "followup_answers": None}]
+
+    start = time.perf_counter()
+    first_page = None
+    async for event in agent.generate_book(1, interview, page_count, [1]):
+        if event["event"] == "page" and first_page is None:
+            first_page = time.perf_counter() - start
+        if event["event"] == "error":
+            raise RuntimeError(event["message"])
+    total = time.perf_counter() - start
+
+    outline, pages = model.latencies[0], model.latencies[1:]
+    return first_page, total, outline + max(pages), outline + sum(pages)
+
+
+async def main_async(args):
+    from benchmarks.loadtest.fakes import FakeChatModel, LatencyModel
+    from app.agents.story_agent import StoryAgent
+    from app.database.session import Base, SessionLocal, get_engine
+    from app.models import book, book_page, story_answer, story_question, story_validation, upload_image, user  # noqa: F401
+    from app.models.upload_image import UploadImage
+    from app.services.ai.gemini_client import GeminiClient, set_gemini_client
+    from app.services.vision_analysis import vision_service
+
+    Base.metadata.create_all(bind=get_engine())
+    db = SessionLocal()
+    db.add(UploadImage(filename="a.png", url="a.png", content_type="image/png", size_bytes=1))
+    db.commit()
+    db.close()
+    vision_service.get_analysis_result = lambda asset_id: {"tags": ["dog", "tree"]}
+
+    model = TimedChatModel(FakeChatModel(LatencyModel(args.latency, args.sigma, seed=args.seed)))
+    set_gemini_client(GeminiClient(llm=model, creative_llm=model))
+    agent = StoryAgent()
+
+    print(f"ページ数 {args.pages} / LLM レイテンシ中央値 {args.latency * 1000:.0f}ms (sigma {args.sigma})")
+    print(f"{'同時実行数':>8s} {'最初のページ':>10s} {'全体':>8s} {'構成+最遅ページ':>14s} {'構成+全ページ合計':>14s}")
+    for concurrency in args.concurrency:
+        first_page, total, bound, serial = await run(agent, model, args.pages, concurrency)
+        print(f"{concurrency:12d} {first_page * 1000:14.0f}ms {total * 1000:8.0f}ms {bound * 1000:17.0f}ms {serial * 1000:18.0f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="絵本生成のレイテンシ計測")
+    parser.add_argument("--pages", type=int, default=6, help="ページ数（偽モデルの構成は最大6ページ）")
+    parser.add_argument("--latency", type=float, default=0.5, help="LLM レイテンシの中央値（秒）")
+    parser.add_argument("--sigma", type=float, default=0.4, help="LLM レイテンシの分布の形状")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8], help="ページ本文の同時実行数")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="storybook-generate-"))
+    os.environ["DATABASE_URL"] = f"sqlite:///{workdir / 'bench.db'}"
+    try:
+        asyncio.run(main_async(args))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
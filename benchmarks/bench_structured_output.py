@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+Gemini の応答の解析失敗率と、成功したインタビューあたりの LLM 呼び出し回数を比べるベンチマーク
+
+1件のインタビューは 物語要素の分析 → 質問の生成 → 情報の検証 → 絵本の構成 の4回の生成からなる。
+解析できなかった生成は、クライアントがその呼び出し全体を --client-attempts 回までやり直す（従来の運用）。
+
+    legacy   プロンプトの指示のみ + 旧 _parse_json_response（正規表現で JSON を探し、失敗時は空の結果）
+    schema   プロンプトの指示のみ（LLM_STRUCTURED_OUTPUT=false）+ スキーマで検証し、1回だけ修正を依頼
+    json     構造化出力（JSON モード + response_schema）+ スキーマで検証し、1回だけ修正を依頼
+
+偽 Gemini の定型応答を、実際に見られる崩れ方（``` で囲む・前後に説明・max_output_tokens での途切れ・
+型や制約の違反・必須項目の欠落・Python の辞書表記）で一定の割合で崩して返す。legacy と schema は同じ
+崩れ方の応答を受け取る。json の崩れ方（途切れと制約違反のみ）は JSON モードの仕様からの想定で、
+オフラインでは確かめられない。
+
+負荷試験で記録したカセット（benchmarks/loadtest/run.py --record）を --cassette で渡すと、
+記録された実際の応答それぞれを旧パーサとスキーマで解析した結果も表示する。
+
+    python benchmarks/bench_structured_output.py --interviews 500
+    python benchmarks/bench_structured_output.py --cassette benchmarks/cassettes/gemini.jsonl
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import re
+import sys
+from collections import Counter
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+# (タスク, システムメッセージに含める偽 Gemini の判定用の語)
+TASKS = (
+    ("story_elements", "物語分析の専門家"),
+    ("questions", "穴うめインタビュアー"),
+    ("validation", "情報品質チェッカー"),
+    ("outline", "絵本の構成作家"),
+)
+
+# タスクごとの結果の本体（missing_field で欠落させる項目）
+MAIN_FIELDS = {"story_elements": "elements", "questions": "questions", "validation": "validation_result", "outline": "pages"}
+
+# 崩れ方ごとの割合（プロンプトの指示のみ / JSON モード）
+FREE_TEXT_PROFILE = {"fenced": 0.15, "prose": 0.10, "truncated": 0.04, "invalid_value": 0.05, "missing_field": 0.03, "python_repr": 0.03}
+JSON_MODE_PROFILE = {"truncated": 0.04, "invalid_value": 0.02}
+
+
+def legacy_parse(response_text: str) -> dict:
+    """変更前の GeminiClient._parse_json_response（比較用にそのまま残す）"""
+    try:
+        if '```json' in response_text:
+            json_match = re.search(r'```json\s*(.*?)\s*```', response_text, re.DOTALL)
+            if json_match:
+                return json.loads(json_match.group(1).strip())
+        json_pattern = r'\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\}'
+        json_blocks = re.findall(json_pattern, response_text, re.DOTALL)
+        if json_blocks:
+            return json.loads(max(json_blocks, key=len))
+        start_idx = response_text.find('{')
+        end_idx = response_text.rfind('}') + 1
+        if start_idx != -1 and end_idx != -1:
+            return json.loads(response_text[start_idx:end_idx])
+        return {"elements": {}, "missing_elements": []}
+    except json.JSONDecodeError:
+        return {"elements": {}, "missing_elements": []}
+
+
+def legacy_fallback(task: str, parsed: dict) -> bool:
+    """変更前のコードがフォールバック（空の要素・既定の質問・空の検証結果・構成の生成失敗）になるか"""
+    if task == "story_elements":
+        return not parsed.get("elements")
+    if task == "questions":
+        return not parsed.get("questions")
+    if task == "validation":
+        return not parsed.get("validation_result")
+    return not [page for page in parsed.get("pages", []) if isinstance(page, dict) and page.get("summary")]
+
+
+def invalidate_value(task: str, payload: dict) -> dict:
+    """型・制約の違反（JSON としては正しい）"""
+    if task == "story_elements":
+        next(iter(payload["elements"].values()))["confidence"] = "たかい"
+    elif task == "questions":
+        choice = next(question for question in payload["questions"] if question["type"] == "choice")
+        choice.pop("options")
+    elif task == "validation":
+        payload["validation_result"]["overall_score"] = "82点"
+    else:
+        payload["pages"][-1]["summary"] = ""
+    return payload
+
+
+def corrupt(task: str, content: str, mode: str) -> str:
+    payload = json.loads(content)
+    if mode == "fenced":
+        return f"```json\n{content}\n```"
+    if mode == "prose":
+        return f"以下が結果です。\n{content}\nご確認ください。"
+    if mode == "truncated":
+        return content[:int(len(content) * 0.6)]
+    if mode == "invalid_value":
+        return json.dumps(invalidate_value(task, payload), ensure_ascii=False)
+    if mode == "missing_field":
+        payload.pop(MAIN_FIELDS[task])
+        return json.dumps(payload, ensure_ascii=False)
+    return repr(payload)  # python_repr
+
+
+class CorruptingChatModel:
+    """定型応答を一定の割合で崩して返す偽モデル（構造化出力の指定の有無で割合を変える）"""
+
+    def __init__(self, inner, seed: int):
+        self.inner = inner
+        self.rng = random.Random(seed)
+        self.calls = 0
+        self.modes = Counter()
+
+    async def ainvoke(self, messages, **kwargs):
+        self.calls += 1
+        response = await self.inner.ainvoke(messages)
+        system = " ".join(text for role, text in messages if role == "system")
+        task = next(task for task, marker in TASKS if marker in system)
+        profile = JSON_MODE_PROFILE if "response_schema" in kwargs else FREE_TEXT_PROFILE
+        roll, mode = self.rng.random(), "clean"
+        for name, rate in profile.items():
+            if roll < rate:
+                mode = name
+                break
+            roll -= rate
+        self.modes[mode] += 1
+        content = response.content if mode == "clean" else corrupt(task, response.content, mode)
+        return SimpleNamespace(content=content)
+
+
+async def run_legacy(model, schemas: dict, interviews: int, attempts: int) -> dict:
+    stats = Counter()
+    for _ in range(interviews):
+        ok = True
+        for task, marker in TASKS:
+            messages = [("system", marker), ("human", "…")]
+            for _ in range(attempts):
+                stats["generations"] += 1
+                parsed = legacy_parse((await model.ainvoke(messages)).content.strip())
+                if legacy_fallback(task, parsed):
+                    stats["parse_failures"] += 1
+                    continue
+                try:
+                    schemas[task].model_validate(parsed)
+                except ValueError:
+                    stats["silent"] += 1  # 解析できたことになるが中身が壊れている
+                    ok = False
+                break
+            else:
+                ok = False
+            if not ok:
+                break
+        stats["succeeded"] += ok
+    return stats
+
+
+async def run_structured(client, schemas: dict, interviews: int, attempts: int) -> dict:
+    from app.core.metrics import metrics
+    from app.services.ai.gemini_client import StructuredOutputError
+
+    stats = Counter()
+    for _ in range(interviews):
+        ok = True
+        for task, marker in TASKS:
+            for _ in range(attempts):
+                stats["generations"] += 1
+                try:
+                    await client.generate_structured("…", marker, schemas[task], task=task)
+                    break
+                except StructuredOutputError:
+                    continue
+            else:
+                ok = False
+                break
+        stats["succeeded"] += ok
+    for task, _ in TASKS:
+        stats["parse_failures"] += int(metrics.counter(f"llm.{task}.parse_errors"))
+        stats["repaired"] += int(metrics.counter(f"llm.{task}.repaired"))
+        stats["failed"] += int(metrics.counter(f"llm.{task}.failed"))
+    return stats
+
+
+def replay_cassette(path: Path, schemas: dict) -> None:
+    """記録された応答を旧パーサとスキーマで解析（タスクは応答の項目から判定し、本文の生成は除く）"""
+    from pydantic import ValidationError
+    from app.services.ai.gemini_client import parse_structured
+
+    results = {task: Counter() for task in MAIN_FIELDS}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            content = json.loads(line)["content"].strip()
+            task = next((task for task, key in MAIN_FIELDS.items() if f'"{key}"' in content or f"'{key}'" in content), None)
+            if task is None:
+                continue
+            counter = results[task]
+            counter["responses"] += 1
+            parsed = legacy_parse(content)
+            if legacy_fallback(task, parsed):
+                counter["legacy_fallback"] += 1
+            else:
+                try:
+                    schemas[task].model_validate(parsed)
+                except ValueError:
+                    counter["legacy_silent"] += 1
+            try:
+                parse_structured(content, schemas[task])
+            except ValidationError:
+                counter["schema_invalid"] += 1
+    print(f"\n記録された応答 ({path})")
+    print(f"{'':16s} {'応答':>6s} {'旧:空の結果':>10s} {'旧:壊れた結果':>12s} {'スキーマ違反':>12s}")
+    for task, counter in results.items():
+        print(f"{task:16s} {counter['responses']:6d} {counter['legacy_fallback']:10d} "
+              f"{counter['legacy_silent']:12d} {counter['schema_invalid']:12d}")
+
+
+async def main_async(args):
+    from benchmarks.loadtest.fakes import FakeChatModel, LatencyModel
+    from app.core.config import settings
+    from app.core.metrics import metrics
+    from app.schemas.llm_output import OutlineOutput, QuestionSetOutput, StoryElementsOutput, ValidationOutput
+    from app.services.ai.gemini_client import GeminiClient
+
+    schemas = {"story_elements": StoryElementsOutput, "questions": QuestionSetOutput,
+               "validation": ValidationOutput, "outline": OutlineOutput}
+    print(f"インタビュー {args.interviews} 件 x 生成 {len(TASKS)} 回 / クライアントのやり直し 最大 {args.client_attempts} 回")
+    print(f"{'':7s} {'解析失敗率':>10s} {'壊れた結果':>10s} {'修正成功':>8s} {'成功':>6s} {'LLM 呼出':>8s} {'呼出/成功':>10s}")
+
+    results = {}
+    for label in ("legacy", "schema", "json"):
+        metrics.reset()
+        model = CorruptingChatModel(FakeChatModel(LatencyModel(0.0, distribution="fixed")), args.seed)
+        if label == "legacy":
+            stats = await run_legacy(model, schemas, args.interviews, args.client_attempts)
+        else:
+            settings.llm_structured_output = label == "json"
+            stats = await run_structured(GeminiClient(llm=model, creative_llm=model), schemas,
+                                         args.interviews, args.client_attempts)
+        stats["calls"] = model.calls
+        results[label] = stats
+        failure_rate = stats["parse_failures"] / stats["generations"]
+        per_success = stats["calls"] / stats["succeeded"] if stats["succeeded"] else float("inf")
+        print(f"{label:7s} {failure_rate:10.1%} {stats['silent']:10d} {stats['repaired']:8d} "
+              f"{stats['succeeded']:6d} {stats['calls']:8d} {per_success:10.2f}")
+
+    legacy, structured = results["legacy"], results["json"]
+    print(f"\n成功したインタビュー: {legacy['succeeded']} → {structured['succeeded']} / {args.interviews}, "
+          f"呼び出し/成功: {legacy['calls'] / legacy['succeeded']:.2f} → {structured['calls'] / structured['succeeded']:.2f}")
+    # スキーマで検証する経路では、壊れた結果をそのまま返さない
+    assert results["schema"]["silent"] == 0 and structured["silent"] == 0
+    if args.cassette:
+        replay_cassette(args.cassette, schemas)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gemini の構造化出力と修正依頼")
+    parser.add_argument("--interviews", type=int, default=500, help="インタビューの件数")
+    parser.add_argument("--client-attempts", type=int, default=3, help="解析できなかった生成をクライアントがやり直す上限")
+    parser.add_argument("--cassette", type=Path, help="記録した Gemini の応答（JSONL）も解析する")
+    parser.add_argument("--seed", type=int, default=0, help="崩れ方の乱数シード")
+    args = parser.parse_args()
+    os.environ.setdefault("DATABASE_URL", "sqlite://")  # DB は使わない
+    logging.disable(logging.ERROR)  # 修正依頼のたびに出るログを抑える
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+同時アップロード中の他のエンドポイントの応答時間を計測するベンチマーク
+
+uvicorn（1ワーカー）を別プロセスで起動し、--uploads 件の --size-mb MB の PNG を同時にアップロードしながら、
+軽いエンドポイント（GET /api/metrics）に一定間隔でリクエストを送って応答時間を計測する。
+アップロードの処理がイベントループを止めると、その間の応答時間が伸びる。
+
+アップロードは別プロセスから送る（送信側の負荷が計測に混ざらないようにする）。
+
+    python benchmarks/bench_upload_concurrency.py --uploads 100 --size-mb 5
+"""
+
+import argparse
+import asyncio
+import io
+import multiprocessing
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def noise_png(size_mb: float) -> bytes:
+    """圧縮の効かない（ほぼ size_mb MB の）PNG"""
+    import numpy as np
+    from PIL import Image
+
+    side = int((size_mb * 1024 * 1024 / 3) ** 0.5)
+    pixels = np.random.default_rng(0).integers(0, 256, (side, side, 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format="PNG", compress_level=1)
+    return buffer.getvalue()
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def upload_worker(base_url: str, payload: bytes, count: int, queue) -> None:
+    """別プロセスで count 件を同時にアップロードし、(開始, 終了, 各応答時間, ステータス) を返す"""
+    import httpx
+
+    async def run():
+        limits = httpx.Limits(max_connections=count, max_keepalive_connections=count)
+        async with httpx.AsyncClient(base_url=base_url, timeout=None, limits=limits) as client:
+            async def one(i):
+                start = time.perf_counter()
+                response = await client.post("/upload", files={"file": (f"photo-{i}.png", payload, "image/png")})
+                return time.perf_counter() - start, response.status_code
+
+            start = time.time()
+            results = await asyncio.gather(*(one(i) for i in range(count)))
+            return start, time.time(), results
+
+    queue.put(asyncio.run(run()))
+
+
+async def probe(client, stop: asyncio.Event, interval: float) -> list:
+    samples = []
+    while not stop.is_set():
+        start = time.perf_counter()
+        response = await client.get("/api/metrics")
+        samples.append((time.time(), time.perf_counter() - start))
+        assert response.status_code == 200
+        await asyncio.sleep(interval)
+    return samples
+
+
+def summarize(label: str, latencies: list) -> None:
+    latencies = sorted(latencies)
+    q = lambda p: latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000
+    print(f"{label:22s} {len(latencies):6d} {q(0.5):8.1f}ms {q(0.95):8.1f}ms {q(0.99):8.1f}ms {latencies[-1] * 1000:8.1f}ms")
+
+
+async def main_async(args, base_url: str, payload: bytes):
+    import httpx
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=None) as client:
+        for _ in range(100):  # 起動待ち
+            try:
+                await client.get("/api/metrics")
+                break
+            except httpx.TransportError:
+                await asyncio.sleep(0.1)
+
+        stop = asyncio.Event()
+        idle_task = asyncio.create_task(probe(client, stop, args.interval))
+        await asyncio.sleep(args.idle)
+        stop.set()
+        idle = [latency for _, latency in await idle_task]
+
+        stop = asyncio.Event()
+        busy_task = asyncio.create_task(probe(client, stop, args.interval))
+        queue = multiprocessing.Queue()
+        worker = multiprocessing.Process(target=upload_worker, args=(base_url, payload, args.uploads, queue))
+        worker.start()
+        started, finished, results = await asyncio.to_thread(queue.get)
+        worker.join()
+        stop.set()
+        busy = [latency for at, latency in await busy_task if started <= at <= finished]
+
+    statuses = [status for _, status in results]
+    uploads = [elapsed for elapsed, _ in results]
+    total = finished - started
+    print(f"同時アップロード {args.uploads} 件 x {len(payload) / 1024 / 1024:.1f}MB: "
+          f"{total:.1f}秒（{args.uploads * len(payload) / 1024 / 1024 / total:.0f} MB/秒）, 200: {statuses.count(200)}/{len(statuses)}")
+    print(f"{'':22s} {'件数':>6s} {'p50':>10s} {'p95':>10s} {'p99':>10s} {'max':>10s}")
+    summarize("GET /api/metrics 平常時", idle)
+    summarize("GET /api/metrics 負荷時", busy)
+    summarize("POST /upload", uploads)
+    assert statuses.count(200) == len(statuses), statuses
+
+
+def main():
+    parser = argparse.ArgumentParser(description="同時アップロード中の応答時間")
+    parser.add_argument("--uploads", type=int, default=100, help="同時アップロード数")
+    parser.add_argument("--size-mb", type=float, default=5, help="1件の大きさ（MB）")
+    parser.add_argument("--interval", type=float, default=0.01, help="計測リクエストの間隔（秒）")
+    parser.add_argument("--idle", type=float, default=2.0, help="平常時の計測時間（秒）")
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="storybook-upload-concurrency-"))
+    (workdir / "uploads").mkdir()
+    env = dict(os.environ,
+               DATABASE_URL=f"sqlite:///{workdir / 'bench.db'}",
+               UPLOAD_DIR=str(workdir / "uploads"),
+               WARMUP_MODE="off",
+               RATE_LIMIT_ENABLED="false")
+    os.environ.update(env)
+
+    from app.database.session import Base, get_engine
+    from app.models import upload_image, user  # noqa: F401
+
+    Base.metadata.create_all(bind=get_engine())
+    payload = noise_png(args.size_mb)
+
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        asyncio.run(main_async(args, f"http://127.0.0.1:{port}", payload))
+        saved = [path for path in (workdir / "uploads").iterdir() if path.is_file()]
+        print(f"保存されたファイル: {len(saved)}")
+    finally:
+        server.terminate()
+        server.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
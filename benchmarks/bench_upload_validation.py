@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+アップロードの逐次検証を確認するベンチマーク
+
+不正なアップロードが、ディスクへの書き込み・remove.bg の呼び出し・DB 保存の前に
+安く弾かれることを確認する（remove.bg は呼び出し回数を数える偽クライアント）。
+
+    valid png / jpeg        正常な画像（200）
+    jpeg (large header)     寸法が先頭 64KB より後ろにある JPEG（書き込み後にヘッダーを読んで 200）
+    bogus                   画像ではない（415）
+    bomb                    ヘッダー上 50000x50000 の PNG（413）
+    oversized               上限を超える本文（Content-Length で 413）
+    oversized (chunked)     Content-Length なしで上限を超える本文（受信中に 413）
+
+それぞれ remove_bg=false / true で送り、応答時間・アップロード先に残ったファイル・DB の行・
+remove.bg の呼び出し回数を表示する。
+
+    python benchmarks/bench_upload_validation.py --max-mb 5 --oversized-mb 100
+"""
+
+import argparse
+import io
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import time
+import zlib
+from pathlib import Path
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+
+class CountingRemoveBgHttp:
+    def __init__(self, inner):
+        self.inner = inner
+        self.calls = 0
+
+    def post(self, *args, **kwargs):
+        self.calls += 1
+        return self.inner.post(*args, **kwargs)
+
+
+def image_bytes(format: str, size=(640, 480), **params) -> bytes:
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new("RGB", size, (120, 180, 60)).save(buffer, format=format, **params)
+    return buffer.getvalue()
+
+
+def png_bomb(width: int, height: int) -> bytes:
+    """IHDR だけが巨大な寸法を宣言する PNG（画素データはほぼ空）"""
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+    ihdr = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", ihdr) + chunk(b"IDAT", zlib.compress(b"\x00" * 64)) + chunk(b"IEND", b"")
+
+
+def count_rows() -> int:
+    from app.database.session import SessionLocal
+    from app.models.upload_image import UploadImage
+
+    db = SessionLocal()
+    try:
+        return db.query(UploadImage).count()
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="アップロードの逐次検証")
+    parser.add_argument("--max-mb", type=int, default=5, help="UPLOAD_MAX_BYTES（MB）")
+    parser.add_argument("--oversized-mb", type=int, default=100, help="上限超過として送る本文の大きさ（MB）")
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="storybook-upload-validation-"))
+    uploads = workdir / "uploads"
+    uploads.mkdir()
+    os.environ["DATABASE_URL"] = f"sqlite:///{workdir / 'bench.db'}"
+    os.environ["UPLOAD_DIR"] = str(uploads)
+    os.environ["UPLOAD_MAX_BYTES"] = str(args.max_mb * 1024 * 1024)
+    os.environ["REMOVE_BG_API_KEY"] = "bench"
+    os.environ["WARMUP_MODE"] = "off"
+    os.environ["RATE_LIMIT_ENABLED"] = "false"
+    try:
+        from fastapi.testclient import TestClient
+        from benchmarks.loadtest.fakes import FakeRemoveBgHttp, LatencyModel
+        from app.api.routes import upload_image
+        from app.database.session import Base, get_engine
+        from app.main import app
+        from app.models import upload_image as upload_image_models, user  # noqa: F401
+
+        Base.metadata.create_all(bind=get_engine())
+        remove_bg = CountingRemoveBgHttp(FakeRemoveBgHttp(LatencyModel(0.0, distribution="fixed")))
+        upload_image.remove_bg_storage.http = remove_bg
+
+        oversized = b"\x89PNG\r\n\x1a\n" + b"\0" * (args.oversized_mb * 1024 * 1024)
+
+        def chunked(data: bytes, boundary: str = "benchboundary"):
+            yield f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="big.png"\r\nContent-Type: image/png\r\n\r\n'.encode()
+            for offset in range(0, len(data), 1024 * 1024):
+                yield data[offset:offset + 1024 * 1024]
+            yield f"\r\n--{boundary}--\r\n".encode()
+
+        cases = [
+            ("valid png", 200, {"files": {"file": ("a.png", image_bytes("PNG"), "image/png")}}),
+            ("valid jpeg", 200, {"files": {"file": ("a.jpg", image_bytes("JPEG"), "image/jpeg")}}),
+            ("jpeg (large header)", 200,
+             {"files": {"file": ("a.jpg", image_bytes("JPEG", icc_profile=os.urandom(200 * 1024)), "image/jpeg")}}),
+            ("bogus", 415, {"files": {"file": ("a.png", b"<html>not an image</html>" * 1000, "image/png")}}),
+            ("bomb", 413, {"files": {"file": ("a.png", png_bomb(50000, 50000), "image/png")}}),
+            ("oversized", 413, {"files": {"file": ("big.png", oversized, "image/png")}}),
+            ("oversized (chunked)", 413,
+             {"content": lambda: chunked(oversized), "headers": {"Content-Type": "multipart/form-data; boundary=benchboundary"}}),
+        ]
+
+        print(f"上限 {args.max_mb}MB / 上限超過の本文 {args.oversized_mb}MB")
+        print(f"{'':26s} {'status':>6s} {'時間':>8s} {'残ったファイル':>12s} {'DB 行':>6s} {'remove.bg':>10s}")
+        with TestClient(app) as client:
+            for remove in (False, True):
+                for name, expected, kwargs in cases:
+                    kwargs = dict(kwargs)
+                    if callable(kwargs.get("content")):
+                        kwargs["content"] = kwargs["content"]()
+                    files_before, rows_before, calls_before = len(list(uploads.iterdir())), count_rows(), remove_bg.calls
+                    start = time.perf_counter()
+                    response = client.post("/upload", params={"remove_bg": remove}, **kwargs)
+                    elapsed = time.perf_counter() - start
+                    label = f"{name}{' +remove_bg' if remove else ''}"
+                    print(f"{label:26s} {response.status_code:6d} {elapsed * 1000:7.1f}ms "
+                          f"{len(list(uploads.iterdir())) - files_before:12d} {count_rows() - rows_before:6d} "
+                          f"{remove_bg.calls - calls_before:10d}")
+                    assert response.status_code == expected, (label, response.status_code, response.text)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
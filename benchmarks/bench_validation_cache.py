@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+情報検証の結果の再利用を確認するベンチマーク
+
+フロントエンドのポーリングを模して、回答が変わらない間に POST /api/story/{id}/validate を
+--polls 回送り、回答の追加・force=true を挟んで LLM の呼び出し回数と応答時間を比べる。
+
+    off    VALIDATION_CACHE_ENABLED=false（毎回 LLM で検証）
+    on     保存済みの結果を再利用
+
+ルールによる検証（LOCAL_VALIDATION_ENABLED）は無効にして比べる。
+
+    python benchmarks/bench_validation_cache.py --polls 20 --llm-latency 0.8
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from benchmarks.bench_idempotency import CountingChatModel
+
+
+def setup() -> tuple:
+    from app.database.session import Base, SessionLocal, get_engine
+    from app.models import book, book_page, story_answer, story_question, story_validation, upload_image, user  # noqa: F401
+    from app.models.story_answer import StoryAnswer
+    from app.models.story_question import StoryQuestion
+    from app.models.upload_image import UploadImage
+
+    Base.metadata.create_all(bind=get_engine())
+    db = SessionLocal()
+    image = UploadImage(filename="a.png", url="a.png", content_type="image/png", size_bytes=1,
+                        meta_json=json.dumps({"tags": ["dog", "tree"], "palette": [], "geometry": {}}))
+    db.add(image)
+    db.flush()
+    questions = [
+        StoryQuestion(image_id=image.id, target_element=element, question_text=f"{element}は？", question_type="open")
+        for element in ("主人公", "舞台", "問題", "解決")
+    ]
+    db.add_all(questions)
+    db.flush()
+    db.add_all(StoryAnswer(question_id=question.id, answer_text="いぬの ポチ") for question in questions[:3])
+    db.commit()
+    ids = image.id, questions[-1].id
+    db.close()
+    return ids
+
+
+async def poll(client, image_id: int, count: int, force: bool = False) -> list:
+    latencies = []
+    for _ in range(count):
+        start = time.perf_counter()
+        response = await client.post(f"/api/story/{image_id}/validate", params={"force": "true"} if force else None)
+        latencies.append(time.perf_counter() - start)
+        assert response.status_code == 200, response.text
+    return latencies
+
+
+async def scenario(client, image_id: int, question_id: int, model, polls: int) -> dict:
+    """ポーリング → 回答を追加 → ポーリング → force=true"""
+    calls = model.calls
+    first = await poll(client, image_id, polls)
+    response = await client.post("/api/story/answers", json={"answers": [{"question_id": question_id, "answer_text": "みんなで たすける"}]})
+    assert response.status_code == 200, response.text
+    second = await poll(client, image_id, polls)
+    forced = await poll(client, image_id, 1, force=True)
+    return {
+        "calls": model.calls - calls,
+        "requests": 2 * polls + 1,
+        "after_answer": second[0],
+        "repeat": statistics.median(first[1:] + second[1:]),
+        "forced": forced[0],
+    }
+
+
+async def main_async(args):
+    import httpx
+    from benchmarks.loadtest.fakes import FakeChatModel, LatencyModel
+    from app.core.config import settings
+    from app.core.metrics import metrics
+    from app.database.session import SessionLocal
+    from app.main import app
+    from app.models.story_validation import StoryValidation
+    from app.services.ai.gemini_client import GeminiClient, set_gemini_client
+
+    model = CountingChatModel(FakeChatModel(LatencyModel(args.llm_latency, distribution="fixed")))
+    set_gemini_client(GeminiClient(llm=model, creative_llm=model))
+    settings.local_validation_enabled = False  # すべての検証で LLM を呼ぶ条件で比べる
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        print(f"ポーリング {args.polls} 回 → 回答を追加 → ポーリング {args.polls} 回 → force=true / 偽 Gemini {args.llm_latency * 1000:.0f}ms")
+        print(f"{'':6s} {'LLM 呼出':>8s} {'リクエスト':>10s} {'同じ回答での再検証':>18s} {'回答追加後':>10s} {'force':>10s}")
+        for label, enabled in (("off", False), ("on", True)):
+            settings.validation_cache_enabled = enabled
+            metrics.reset()
+            image_id, question_id = setup()
+            result = await scenario(client, image_id, question_id, model, args.polls)
+            print(f"{label:6s} {result['calls']:8d} {result['requests']:10d} {result['repeat'] * 1000:16.1f}ms "
+                  f"{result['after_answer'] * 1000:8.1f}ms {result['forced'] * 1000:8.1f}ms")
+
+        hit_rate = metrics.hit_rate("story.validation_cache")
+        print(f"\nヒット率: {hit_rate:.0%} (hit {metrics.counter('story.validation_cache.hit'):.0f}, "
+              f"miss {metrics.counter('story.validation_cache.miss'):.0f}, "
+              f"bypass {metrics.counter('story.validation_cache.bypass'):.0f}, "
+              f"invalidated {metrics.counter('story.validation_cache.invalidated'):.0f})")
+        # 回答を追加した直後・force=true・最初の検証の 3 回だけ LLM を呼ぶ
+        assert result["calls"] == 3, result["calls"]
+        db = SessionLocal()
+        try:
+            rows = db.query(StoryValidation).filter(StoryValidation.image_id == image_id).count()
+        finally:
+            db.close()
+        assert rows == 1, rows
+        print("保存済みの結果は画像ごとに1件: OK")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="情報検証の結果の再利用")
+    parser.add_argument("--polls", type=int, default=20, help="回答が変わらない間のポーリング回数")
+    parser.add_argument("--llm-latency", type=float, default=0.8, help="偽 Gemini のレイテンシ（秒）")
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="storybook-validation-cache-"))
+    os.environ["DATABASE_URL"] = f"sqlite:///{workdir / 'bench.db'}"
+    os.environ["UPLOAD_DIR"] = str(workdir / "uploads")
+    os.environ["WARMUP_MODE"] = "off"
+    os.environ["RATE_LIMIT_ENABLED"] = "false"  # 同じクライアントから連続で送るため
+    try:
+        asyncio.run(main_async(args))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+"""
+負荷試験用の偽アップストリーム（Gemini / Vision / remove.bg）と Redis の代役
+
+レイテンシ分布とエラー率を設定でき、Gemini は実応答の記録・再生にも対応する。
+"""
+
+import asyncio
+import hashlib
+import io
+import json
+import random
+import re
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Dict, Optional
+
+from google.cloud.vision_v1 import types
+from PIL import Image
+
+
+class UpstreamError(RuntimeError):
+    """偽アップストリームが注入するエラー"""
+
+
+class LatencyModel:
+    """
+    レイテンシ分布とエラー率
+
+    distribution:
+        fixed     常に median 秒
+        lognormal 中央値 median、形状 sigma の対数正規分布（裾が重い）
+        uniform   median * (1 ± sigma) の一様分布
+    """
+
+    def __init__(self, median: float, sigma: float = 0.5, distribution: str = "lognormal",
+                 error_rate: float = 0.0, seed: Optional[int] = None):
+        self.median = median
+        self.sigma = sigma
+        self.distribution = distribution
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self) -> float:
+        with self._lock:
+            if self.distribution == "fixed":
+                return self.median
+            if self.distribution == "uniform":
+                return max(0.0, self.median * self._rng.uniform(1 - self.sigma, 1 + self.sigma))
+            return self.median * self._rng.lognormvariate(0, self.sigma)
+
+    def should_fail(self) -> bool:
+        with self._lock:
+            return self._rng.random() < self.error_rate
+
+    def describe(self) -> Dict:
+        return {
+            "median": self.median, "sigma": self.sigma,
+            "distribution": self.distribution, "error_rate": self.error_rate,
+        }
+
+
+# --- Gemini ---
+
+CANNED_RESPONSES = {
+    "物語分析の専門家": {
+        "elements": {
+            "character": {"value": "いぬ", "confidence": 80},
+            "setting": {"value": "こうえん", "confidence": 60},
+        },
+        "missing_elements": ["emotion", "conflict", "resolution"],
+    },
+    "穴うめインタビュアー": {
+        "questions": [
+            {"target_element": "主人公", "reason": "主人公が不明確", "question": "この おはなしの しゅじんこうは だれ？", "type": "open", "followups": ["なまえは なに？"]},
+            {"target_element": "気持ち", "reason": "感情が不明確", "question": "この こは どんな きもち？", "type": "choice", "options": ["うれしい", "かなしい"], "followups": []},
+            {"target_element": "問題", "reason": "問題が不明確", "question": "なにか こまったことは あった？", "type": "open", "followups": []},
+            {"target_element": "解決", "reason": "結末が不明確", "question": "さいごは どうなるのかな？", "type": "open", "followups": []},
+        ],
+        "meta": {"icebreakers": True, "age_range": "3-6", "total_questions": 4},
+    },
+    "情報品質チェッカー": {
+        "validation_result": {
+            "overall_score": 82,
+            "completeness": {"score": 80, "missing_elements": [], "sufficient_elements": ["主人公", "問題", "解決"]},
+            "age_appropriateness": {"score": 90, "issues": [], "strengths": ["ひらがな中心"]},
+            "story_coherence": {"score": 75, "issues": [], "suggestions": []},
+            "recommendations": [],
+            "ready_for_story": True,
+        },
+        "meta": {"total_questions": 4, "answered_questions": 4},
+    },
+    "絵本の構成作家": {
+        "title": "ポチの だいぼうけん",
+        "pages": [
+            {"page_number": 1, "summary": "こうえんで いぬの ポチが あそんでいる"},
+            {"page_number": 2, "summary": "ポチが ないている ことりを みつける"},
+            {"page_number": 3, "summary": "ことりは すに かえれなくて こまっている"},
+            {"page_number": 4, "summary": "ポチは ともだちと いっしょに かんがえる"},
+            {"page_number": 5, "summary": "みんなで ことりを すまで おくりとどける"},
+            {"page_number": 6, "summary": "ポチと ことりは なかよしに なった"},
+        ],
+    },
+}
+
+
+def _messages_key(messages) -> str:
+    """メッセージ列から記録・再生用のキーを作る"""
+    payload = json.dumps([list(message) for message in messages], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def canned_response(messages) -> str:
+    """システムメッセージから用途を判定して定型応答を返す"""
+    system = " ".join(text for role, text in messages if role == "system")
+    if "複数の画像" in system:
+        # 物語要素のまとめ処理: 入力の画像 id ごとに結果を返す
+        human = " ".join(text for role, text in messages if role == "human")
+        results = [{"id": image_id, **CANNED_RESPONSES["物語分析の専門家"]} for image_id in re.findall(r'画像 id="([^"]+)"', human)]
+        return json.dumps({"results": results}, ensure_ascii=False)
+    for marker, response in CANNED_RESPONSES.items():
+        if marker in system:
+            return json.dumps(response, ensure_ascii=False)
+    return "むかしむかし、あるところに げんきな いぬが いました。"
+
+
+class FakeChatModel:
+    """ChatGoogleGenerativeAI 互換の偽モデル（ainvoke のみ）"""
+
+    def __init__(self, latency: LatencyModel):
+        self.latency = latency
+        self.calls = 0
+
+    async def ainvoke(self, messages, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.latency.sample())
+        if self.latency.should_fail():
+            raise UpstreamError("fake gemini error")
+        return SimpleNamespace(content=canned_response(messages))
+
+
+class Cassette:
+    """Gemini の応答を JSONL で記録・再生する"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.entries: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        if path.exists():
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    entry = json.loads(line)
+                    self.entries[entry["key"]] = entry
+
+    def get(self, messages) -> Optional[Dict]:
+        return self.entries.get(_messages_key(messages))
+
+    def put(self, messages, content: str, elapsed: float) -> None:
+        entry = {"key": _messages_key(messages), "content": content, "elapsed": elapsed}
+        with self._lock:
+            self.entries[entry["key"]] = entry
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+class RecordingChatModel:
+    """実モデルを呼び出し、応答と所要時間をカセットに記録する"""
+
+    def __init__(self, inner, cassette: Cassette):
+        self.inner = inner
+        self.cassette = cassette
+
+    async def ainvoke(self, messages, **kwargs):
+        start = time.perf_counter()
+        response = await self.inner.ainvoke(messages, **kwargs)
+        self.cassette.put(messages, response.content, time.perf_counter() - start)
+        return response
+
+
+class ReplayChatModel:
+    """
+    カセットから応答を再生する
+
+    記録済みのプロンプトは記録時の応答（と所要時間）を返し、未記録のものは定型応答で代替する。
+    """
+
+    def __init__(self, cassette: Cassette, latency: LatencyModel, use_recorded_latency: bool = True):
+        self.cassette = cassette
+        self.latency = latency
+        self.use_recorded_latency = use_recorded_latency
+        self.misses = 0
+
+    async def ainvoke(self, messages, **kwargs):
+        entry = self.cassette.get(messages)
+        if entry is None:
+            self.misses += 1
+            delay, content = self.latency.sample(), canned_response(messages)
+        else:
+            delay = entry["elapsed"] if self.use_recorded_latency else self.latency.sample()
+            content = entry["content"]
+        await asyncio.sleep(delay)
+        if self.latency.should_fail():
+            raise UpstreamError("fake gemini error")
+        return SimpleNamespace(content=content)
+
+
+# --- Vision ---
+
+class FakeVisionAnnotator:
+    """ImageAnnotatorClient 互換の偽クライアント（同期 API なので time.sleep で待つ）"""
+
+    LABELS = ["cartoon", "dog", "tree", "house", "sun", "person", "flower"]
+
+    def __init__(self, latency: LatencyModel, seed: int = 0):
+        self.latency = latency
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def batch_annotate_images(self, request):
+        features = [feature["type"] for feature in request["requests"][0]["features"]]
+        time.sleep(self.latency.sample())
+        if self.latency.should_fail():
+            raise UpstreamError("fake vision error")
+
+        with self._lock:
+            labels = self._rng.sample(self.LABELS, 3)
+        response = types.AnnotateImageResponse()
+        if types.Feature.Type.LABEL_DETECTION in features:
+            response.label_annotations = [types.EntityAnnotation(description=name, score=0.9) for name in labels]
+        if types.Feature.Type.OBJECT_LOCALIZATION in features:
+            poly = types.BoundingPoly(normalized_vertices=[
+                types.NormalizedVertex(x=0.2, y=0.2), types.NormalizedVertex(x=0.6, y=0.2),
+                types.NormalizedVertex(x=0.6, y=0.7), types.NormalizedVertex(x=0.2, y=0.7),
+            ])
+            response.localized_object_annotations = [
+                types.LocalizedObjectAnnotation(name=labels[1], score=0.8, bounding_poly=poly)
+            ]
+        return SimpleNamespace(responses=[response])
+
+
+# --- remove.bg ---
+
+class FakeRemoveBgHttp:
+    """requests.Session 互換の偽 remove.bg クライアント（入力画像を PNG にして返す）"""
+
+    def __init__(self, latency: LatencyModel):
+        self.latency = latency
+
+    def post(self, url, files=None, data=None, headers=None, **kwargs):
+        time.sleep(self.latency.sample())
+        if self.latency.should_fail():
+            return SimpleNamespace(status_code=500, text="fake remove.bg error", content=b"")
+        with Image.open(files["image_file"]) as img:
+            buf = io.BytesIO()
+            img.convert("RGBA").save(buf, format="PNG")
+        return SimpleNamespace(status_code=200, text="", content=buf.getvalue())
+
+
+# --- Redis（レート制限の共有バケット） ---
+
+class LocalRedisStandIn:
+    """
+    redis.asyncio.Redis の eval だけを持つ代役（RedisRateLimitStore の確認用）
+
+    Lua は実行できないため、トークンバケットのスクリプトと同じ計算（take_tokens）を
+    ロック付きで行う。latency を指定すると往復の遅延を模擬する。
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.states: Dict[str, list] = {}
+        self._lock = threading.Lock()
+
+    async def eval(self, script, numkeys, *args):
+        from app.core.rate_limit import TOKEN_BUCKET_SCRIPT, take_tokens
+
+        assert script == TOKEN_BUCKET_SCRIPT
+        keys, values = args[:numkeys], [float(value) for value in args[numkeys:]]
+        buckets = [(key, *values[3 * i:3 * i + 3]) for i, key in enumerate(keys)]
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        with self._lock:
+            wait = take_tokens(self.states, buckets, time.time())
+        return [0, str(wait).encode()] if wait > 0 else [1, b"0"]
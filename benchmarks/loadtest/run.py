@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""
+オフライン負荷試験ハーネス
+
+FastAPI アプリを SQLite 上で起動し、Gemini / Vision / remove.bg を偽アップストリームに
+差し替えて、インタビューのシナリオ（アップロード → 解析 → 質問 → 回答 → 検証）を
+指定した並行数で実行する。エンドポイントごとのスループットと p50/p95/p99 を表示し、
+結果を JSON で保存して前回の結果と比較する。
+
+    python benchmarks/loadtest/run.py --interviews 200 --concurrency 20
+    python benchmarks/loadtest/run.py --replay benchmarks/cassettes/gemini.jsonl
+    python benchmarks/loadtest/run.py --record benchmarks/cassettes/gemini.jsonl  # 実 Gemini を呼ぶ
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(ROOT))
+
+SAMPLE_IMAGES = sorted((ROOT / "app" / "uploads").glob("*.jp*g"))
+DEFAULT_RESULTS_DIR = ROOT / "benchmarks" / "results"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="偽アップストリームを使ったオフライン負荷試験")
+    parser.add_argument("--interviews", type=int, default=100, help="実行するインタビュー数")
+    parser.add_argument("--concurrency", type=int, default=10, help="同時に進行するインタビュー数")
+    parser.add_argument("--remove-bg-ratio", type=float, default=0.2, help="背景除去付きアップロードの割合")
+    parser.add_argument("--profile", default="full", help="アセット解析のプロファイル")
+    parser.add_argument("--no-question-bank", action="store_true", help="質問バンク・類似画像の再利用を無効化")
+    parser.add_argument("--generate-book", action="store_true", help="検証の後に絵本の生成まで実行")
+    parser.add_argument("--rate-limit", action="store_true", help="レート制限を有効にする（既定では無効にしてアプリ自体を計測）")
+    for name, median, sigma in (("llm", 2.0, 0.6), ("vision", 0.4, 0.4), ("remove-bg", 1.0, 0.4)):
+        parser.add_argument(f"--{name}-latency", type=float, default=median, help=f"{name} のレイテンシ中央値（秒）")
+        parser.add_argument(f"--{name}-sigma", type=float, default=sigma, help=f"{name} のレイテンシ分布の形状")
+        parser.add_argument(f"--{name}-distribution", default="lognormal", choices=["fixed", "lognormal", "uniform"])
+        parser.add_argument(f"--{name}-error-rate", type=float, default=0.0, help=f"{name} のエラー率")
+    parser.add_argument("--time-scale", type=float, default=1.0, help="全レイテンシに掛ける倍率（短時間の試験用）")
+    parser.add_argument("--record", type=Path, help="実 Gemini を呼び出して応答をこのカセットに記録")
+    parser.add_argument("--replay", type=Path, help="このカセットの Gemini 応答を再生")
+    parser.add_argument("--results-dir", type=Path, default=DEFAULT_RESULTS_DIR)
+    parser.add_argument("--label", default="", help="結果ファイルに付けるラベル")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+
+def configure_environment(workdir: Path):
+    """アプリの import 前に SQLite とダミーの認証情報を設定"""
+    os.environ["DATABASE_URL"] = f"sqlite:///{workdir / 'loadtest.db'}"
+    os.environ["UPLOAD_DIR"] = str(workdir / "uploads")
+    os.environ["SIMILARITY_INDEX_PATH"] = str(workdir / "similarity_index.jsonl")
+    os.environ.setdefault("REMOVE_BG_API_KEY", "loadtest")
+    os.environ.setdefault("GOOGLE_API_KEY", "loadtest")
+    (workdir / "uploads").mkdir(parents=True, exist_ok=True)
+
+
+def latency_model(args, name: str, seed: int):
+    from benchmarks.loadtest.fakes import LatencyModel
+
+    key = name.replace("-", "_")
+    return LatencyModel(
+        median=getattr(args, f"{key}_latency") * args.time_scale,
+        sigma=getattr(args, f"{key}_sigma"),
+        distribution=getattr(args, f"{key}_distribution"),
+        error_rate=getattr(args, f"{key}_error_rate"),
+        seed=seed,
+    )
+
+
+def install_fakes(args):
+    """アプリのシングルトンを偽アップストリームに差し替える"""
+    from benchmarks.loadtest.fakes import (
+        Cassette, FakeChatModel, FakeRemoveBgHttp, FakeVisionAnnotator, RecordingChatModel, ReplayChatModel,
+    )
+    from app.api.routes import upload_image
+    from app.core.config import settings
+    from app.services.ai.gemini_client import GeminiClient, set_gemini_client
+    from app.services.vision_analysis import vision_service
+
+    llm_latency = latency_model(args, "llm", args.seed)
+    if args.record:
+        cassette = Cassette(args.record)
+        real = GeminiClient()
+        # タスクごとに選ばれたモデルの応答を記録する
+        set_gemini_client(GeminiClient(model_factory=lambda model, creative: RecordingChatModel(real.get_model(model, creative), cassette)))
+    else:
+        if args.replay:
+            llm = creative_llm = ReplayChatModel(Cassette(args.replay), llm_latency)
+        else:
+            llm = creative_llm = FakeChatModel(llm_latency)
+        set_gemini_client(GeminiClient(llm=llm, creative_llm=creative_llm))
+
+    vision_service.client = FakeVisionAnnotator(latency_model(args, "vision", args.seed + 1), seed=args.seed)
+    upload_image.remove_bg_storage.http = FakeRemoveBgHttp(latency_model(args, "remove-bg", args.seed + 2))
+
+    settings.rate_limit_enabled = args.rate_limit
+
+    if args.no_question_bank:
+        settings.question_bank_enabled = False
+        settings.similarity_index_enabled = False
+
+
+def create_schema():
+    from app.database.session import Base, engine
+    from app.models import book, book_page, idempotency_key, story_answer, story_question, story_validation, upload_image, user  # noqa: F401
+
+    Base.metadata.create_all(bind=engine)
+
+
+class Recorder:
+    """エンドポイントごとのレイテンシとステータスを記録"""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+
+    async def call(self, client, name: str, method: str, url: str, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except Exception:
+            self.errors[name] += 1
+            self.statuses[name]["exception"] += 1
+            raise
+        finally:
+            self.latencies[name].append(time.perf_counter() - start)
+        self.statuses[name][str(response.status_code)] += 1
+        if response.status_code >= 400:
+            self.errors[name] += 1
+        return response
+
+
+async def run_interview(client, recorder: Recorder, rng: random.Random, args) -> bool:
+    """1 件のインタビューを実行（途中で失敗したら False）"""
+    image_path = rng.choice(SAMPLE_IMAGES)
+    remove_bg = rng.random() < args.remove_bg_ratio
+    with open(image_path, "rb") as f:
+        files = {"file": (image_path.name, f.read(), "image/jpeg")}
+    response = await recorder.call(client, "POST /upload", "POST", "/upload",
+                                   params={"remove_bg": str(remove_bg).lower()}, files=files)
+    if response.status_code != 200:
+        return False
+    image_id = response.json()["id"]
+
+    response = await recorder.call(client, "POST /api/assets/{id}/analyze", "POST",
+                                   f"/api/assets/{image_id}/analyze", params={"profile": args.profile})
+    if response.status_code != 200:
+        return False
+
+    response = await recorder.call(client, "POST /api/story/{id}/analyze", "POST", f"/api/story/{image_id}/analyze")
+    if response.status_code != 200:
+        return False
+    missing_elements = response.json().get("missing_elements", [])
+
+    response = await recorder.call(client, "POST /api/story/{id}/questions", "POST",
+                                   f"/api/story/{image_id}/questions", json={"missing_elements": missing_elements})
+    if response.status_code != 200:
+        return False
+    questions = response.json().get("saved_questions", [])
+
+    answers = [
+        {"question_id": question["id"], "answer_text": rng.choice(["いぬの ポチ", "こうえん", "うれしい", "みんなで たすけた"])}
+        for question in questions
+    ]
+    response = await recorder.call(client, "POST /api/story/answers", "POST", "/api/story/answers", json={"answers": answers})
+    if response.status_code != 200:
+        return False
+
+    response = await recorder.call(client, "POST /api/story/{id}/validate", "POST", f"/api/story/{image_id}/validate")
+    if response.status_code != 200 or not args.generate_book:
+        return response.status_code == 200
+
+    response = await recorder.call(client, "POST /api/story/{id}/generate", "POST", f"/api/story/{image_id}/generate", json={})
+    if response.status_code != 200:
+        return False
+    events = [json.loads(line) for line in response.text.splitlines() if line]
+    return bool(events) and events[-1]["event"] == "book"
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def summarize(recorder: Recorder, elapsed: float, completed: int, args) -> dict:
+    endpoints = {}
+    for name, values in recorder.latencies.items():
+        endpoints[name] = {
+            "count": len(values),
+            "errors": recorder.errors[name],
+            "throughput_rps": len(values) / elapsed,
+            "p50_ms": percentile(values, 0.50) * 1000,
+            "p95_ms": percentile(values, 0.95) * 1000,
+            "p99_ms": percentile(values, 0.99) * 1000,
+            "mean_ms": statistics.fmean(values) * 1000,
+            "statuses": dict(recorder.statuses[name]),
+        }
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "label": args.label,
+        "config": {
+            key: (str(value) if isinstance(value, Path) else value)
+            for key, value in vars(args).items() if key != "results_dir"
+        },
+        "elapsed_s": elapsed,
+        "interviews": {"requested": args.interviews, "completed": completed,
+                       "throughput_per_s": completed / elapsed},
+        "endpoints": endpoints,
+    }
+
+
+def print_report(result: dict, previous: dict = None):
+    print(f"\nインタビュー: {result['interviews']['completed']}/{result['interviews']['requested']} 完了 / "
+          f"{result['elapsed_s']:.1f} 秒 / {result['interviews']['throughput_per_s']:.2f} 件/秒")
+    header = f"{'endpoint':<34}{'count':>7}{'err':>6}{'rps':>8}{'p50':>10}{'p95':>10}{'p99':>10}"
+    if previous:
+        header += f"{'Δp95':>10}"
+    print(header)
+    for name, stats in result["endpoints"].items():
+        line = (f"{name:<34}{stats['count']:>7}{stats['errors']:>6}{stats['throughput_rps']:>8.2f}"
+                f"{stats['p50_ms']:>9.0f}ms{stats['p95_ms']:>8.0f}ms{stats['p99_ms']:>8.0f}ms")
+        before = (previous or {}).get("endpoints", {}).get(name)
+        if before:
+            delta = (stats["p95_ms"] - before["p95_ms"]) / before["p95_ms"] * 100 if before["p95_ms"] else 0
+            line += f"{delta:>+9.1f}%"
+        print(line)
+
+
+def latest_result(results_dir: Path):
+    files = sorted(results_dir.glob("loadtest-*.json"))
+    if not files:
+        return None
+    with open(files[-1], "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+async def main_async(args):
+    import httpx
+    from app.main import app
+
+    recorder = Recorder()
+    rng = random.Random(args.seed)
+    queue = asyncio.Queue()
+    for _ in range(args.interviews):
+        queue.put_nowait(None)
+    completed = 0
+
+    async def worker(client):
+        nonlocal completed
+        while True:
+            try:
+                queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                if await run_interview(client, recorder, rng, args):
+                    completed += 1
+            except Exception as e:
+                print(f"インタビュー失敗: {e}", file=sys.stderr)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://testserver", timeout=None) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - start
+
+    return summarize(recorder, elapsed, completed, args)
+
+
+def main():
+    args = parse_args()
+    if not SAMPLE_IMAGES:
+        sys.exit("サンプル画像が見つかりません (app/uploads/*.jpg)")
+
+    with tempfile.TemporaryDirectory(prefix="storybook-loadtest-") as workdir:
+        configure_environment(Path(workdir))
+        create_schema()
+        install_fakes(args)
+        result = asyncio.run(main_async(args))
+
+        from app.core.process_pool import shutdown_process_pool
+        shutdown_process_pool()
+
+    previous = latest_result(args.results_dir)
+    print_report(result, previous)
+
+    args.results_dir.mkdir(parents=True, exist_ok=True)
+    suffix = f"-{args.label}" if args.label else ""
+    path = args.results_dir / f"loadtest-{datetime.now().strftime('%Y%m%d-%H%M%S')}{suffix}.json"
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"\n結果を保存しました: {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,37 @@
 #!/usr/bin/env python3
 """
 データベーステーブル作成スクリプト
+
+スキーマは Alembic のマイグレーション（migrations/versions）で管理する。
+create_all で作成済みの DB（alembic_version テーブルがない）は、
+ベースライン（0001。マイグレーション導入前のスキーマ）を stamp してから残りのマイグレーションを適用する。
+create_all で先に作成されていた列・テーブル（upload_images.phash など）は各リビジョンが確認して作成を省く。
 """
 
-from app.database.session import engine, Base
-from app.models import user as user_models
-from app.models import upload_image as upload_image_models
-from app.models.story_question import StoryQuestion
-from app.models.story_answer import StoryAnswer
+import os
+
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import inspect
+
+from app.database.session import engine
+
+ALEMBIC_INI = os.path.join(os.path.dirname(os.path.abspath(__file__)), "alembic.ini")
+BASELINE_REVISION = "0001"
+
+def alembic_config() -> Config:
+    return Config(ALEMBIC_INI)
 
 def create_tables():
-    """データベーステーブルを作成"""
+    """マイグレーションを最新まで適用"""
     try:
         print("データベーステーブルを作成中...")
-        Base.metadata.create_all(bind=engine)
+        config = alembic_config()
+        tables = set(inspect(engine).get_table_names())
+        if "alembic_version" not in tables and "upload_images" in tables:
+            print(f"既存のテーブルをベースライン（{BASELINE_REVISION}）として記録します")
+            command.stamp(config, BASELINE_REVISION)
+        command.upgrade(config, "head")
         print("✅ データベーステーブルの作成が完了しました")
     except Exception as e:
         print(f"❌ エラーが発生しました: {str(e)}")
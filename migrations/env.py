@@ -0,0 +1,64 @@
+"""
+Alembic の実行環境
+
+接続先はアプリと同じく DATABASE_URL（backend/.env）から取得し、
+比較対象のメタデータは app.models の全モデルを読み込んだ Base.metadata を使う。
+"""
+
+import os
+from logging.config import fileConfig
+
+from alembic import context
+from sqlalchemy.engine import make_url
+
+from app.database.session import Base, get_engine
+from app.models import book, book_page, idempotency_key, story_answer, story_question, story_validation, upload_image, user  # noqa: F401
+
+config = context.config
+if config.config_file_name is not None and config.attributes.get("configure_logger", True):
+    fileConfig(config.config_file_name, disable_existing_loggers=False)
+
+target_metadata = Base.metadata
+
+
+def run_migrations_offline() -> None:
+    """SQL を出力するだけのモード（alembic upgrade head --sql）"""
+    url = os.getenv("DATABASE_URL")
+    if not url:
+        raise RuntimeError("DATABASE_URL が設定されていません")
+    context.configure(
+        url=url,
+        target_metadata=target_metadata,
+        literal_binds=True,
+        dialect_opts={"paramstyle": "named"},
+        render_as_batch=make_url(url).get_backend_name() == "sqlite",
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online() -> None:
+    """DB に接続してマイグレーションを適用"""
+    connection = config.attributes.get("connection")
+    if connection is None:
+        with get_engine().connect() as connection:
+            _run(connection)
+    else:
+        _run(connection)
+
+
+def _run(connection) -> None:
+    context.configure(
+        connection=connection,
+        target_metadata=target_metadata,
+        # SQLite は ALTER TABLE が限られるため、テーブルを作り直す batch モードで変更する
+        render_as_batch=connection.dialect.name == "sqlite",
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
@@ -0,0 +1,91 @@
+"""baseline: create_all で作成していた既存のスキーマ
+
+マイグレーション導入前の create_tables.py（Base.metadata.create_all）が作成していた
+users / upload_images / story_questions / story_answers のみ。以降に追加した列・テーブルは
+0002 以降のリビジョンで追加する。create_all で作成済みの DB は、このリビジョンを stamp してから
+以降のマイグレーションを適用する。
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "users",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("username", sa.String(length=100), nullable=False),
+        sa.Column("email", sa.String(length=255), nullable=False),
+        sa.Column("hashed_password", sa.String(length=255), nullable=True),
+        sa.Column("is_active", sa.Boolean(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), server_default=sa.func.now(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), server_default=sa.func.now(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_users_id", "users", ["id"])
+    op.create_index("ix_users_username", "users", ["username"], unique=True)
+    op.create_index("ix_users_email", "users", ["email"], unique=True)
+
+    op.create_table(
+        "upload_images",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("filename", sa.String(length=255), nullable=False),
+        sa.Column("url", sa.String(length=512), nullable=False),
+        sa.Column("content_type", sa.String(length=100), nullable=False),
+        sa.Column("size_bytes", sa.Integer(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=True),
+        sa.Column("uploaded_at", sa.DateTime(), server_default=sa.func.now(), nullable=False),
+        sa.Column("meta_json", sa.Text(), nullable=True),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_upload_images_id", "upload_images", ["id"])
+
+    op.create_table(
+        "story_questions",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("image_id", sa.Integer(), nullable=False),
+        sa.Column("target_element", sa.String(length=100), nullable=False),
+        sa.Column("question_text", sa.String(length=500), nullable=False),
+        sa.Column("question_type", sa.String(length=50), nullable=False),
+        sa.Column("options", sa.JSON(), nullable=True),
+        sa.Column("followups", sa.JSON(), nullable=True),
+        sa.Column("reason", sa.String(length=500), nullable=True),
+        sa.Column("created_at", sa.DateTime(), server_default=sa.func.now(), nullable=False),
+        sa.ForeignKeyConstraint(["image_id"], ["upload_images.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+
+    op.create_table(
+        "story_answers",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("question_id", sa.Integer(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=True),
+        sa.Column("answer_text", sa.Text(), nullable=False),
+        sa.Column("selected_option", sa.String(length=200), nullable=True),
+        sa.Column("followup_answers", sa.JSON(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), server_default=sa.func.now(), nullable=False),
+        sa.ForeignKeyConstraint(["question_id"], ["story_questions.id"]),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("story_answers")
+    op.drop_table("story_questions")
+    op.drop_index("ix_upload_images_id", table_name="upload_images")
+    op.drop_table("upload_images")
+    op.drop_index("ix_users_email", table_name="users")
+    op.drop_index("ix_users_username", table_name="users")
+    op.drop_index("ix_users_id", table_name="users")
+    op.drop_table("users")
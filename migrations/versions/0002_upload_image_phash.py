@@ -0,0 +1,33 @@
+"""upload_images.phash（近い重複画像の検出に使う知覚ハッシュ）
+
+create_all で作成した DB には列が既にある場合があるため、その場合は何もしない。
+phash は起動時に全件を読み込んで索引するだけで、列での検索はしないためインデックスは作らない。
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19
+"""
+
+from alembic import context, op
+import sqlalchemy as sa
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def has_column(table: str, column: str) -> bool:
+    if context.is_offline_mode():
+        return False  # --sql では DB を調べられないため常に追加する
+    return column in {c["name"] for c in sa.inspect(op.get_bind()).get_columns(table)}
+
+
+def upgrade() -> None:
+    if not has_column("upload_images", "phash"):
+        op.add_column("upload_images", sa.Column("phash", sa.String(length=16), nullable=True))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("upload_images") as batch_op:
+        batch_op.drop_column("phash")
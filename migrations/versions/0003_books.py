@@ -0,0 +1,57 @@
+"""絵本（books / book_pages）のテーブル
+
+モデルはベースラインからあったが、マイグレーション導入前の create_tables.py では作成していなかった
+（book_pages.image_id の外部キーも存在しない images テーブルを指していた）。
+create_all で作成済みの場合は何もしない。
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19
+"""
+
+from alembic import context, op
+import sqlalchemy as sa
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def has_table(table: str) -> bool:
+    if context.is_offline_mode():
+        return False  # --sql では DB を調べられないため常に作成する
+    return sa.inspect(op.get_bind()).has_table(table)
+
+
+def upgrade() -> None:
+    if not has_table("books"):
+        op.create_table(
+            "books",
+            sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+            sa.Column("user_id", sa.Integer(), nullable=True),
+            sa.Column("title", sa.String(length=255), nullable=False),
+            sa.Column("created_at", sa.DateTime(), server_default=sa.func.now(), nullable=False),
+            sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+            sa.PrimaryKeyConstraint("id"),
+        )
+
+    if not has_table("book_pages"):
+        op.create_table(
+            "book_pages",
+            sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+            sa.Column("book_id", sa.Integer(), nullable=False),
+            sa.Column("image_id", sa.Integer(), nullable=False),
+            sa.Column("page_number", sa.Integer(), nullable=False),
+            sa.Column("caption", sa.String(length=1000), nullable=True),
+            sa.Column("rendered_filename", sa.String(length=255), nullable=True),
+            sa.Column("created_at", sa.DateTime(), server_default=sa.func.now(), nullable=False),
+            sa.ForeignKeyConstraint(["book_id"], ["books.id"]),
+            sa.ForeignKeyConstraint(["image_id"], ["upload_images.id"]),
+            sa.PrimaryKeyConstraint("id"),
+        )
+
+
+def downgrade() -> None:
+    op.drop_table("book_pages")
+    op.drop_table("books")
@@ -0,0 +1,52 @@
+"""インタビュー・画像一覧のクエリ用のインデックス
+
+    story_questions.image_id     画像の質問の取得・回答との結合（questions / answers / validate / generate）
+    story_answers.question_id    質問と回答の結合
+    upload_images.user_id        ユーザーの画像の取得
+    upload_images.uploaded_at    画像一覧の並び替え（GET /images）
+
+MySQL（InnoDB）は外部キーの列に暗黙のインデックスを作成済みだが、
+明示的なインデックスを作るとそちらが外部キーに使われ、暗黙のものは削除される。
+そのため MySQL の downgrade では外部キーの列のインデックスは残す（外部キーに必要なため削除できない）。
+upgrade は既にあるインデックスを作らない（MySQL で downgrade した後の upgrade で名前が重複しないように）。
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-19
+"""
+
+import sqlalchemy as sa
+from alembic import context, op
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+# (インデックス名, テーブル, 列, 外部キーの列か)
+INDEXES = (
+    ("ix_story_questions_image_id", "story_questions", "image_id", True),
+    ("ix_story_answers_question_id", "story_answers", "question_id", True),
+    ("ix_upload_images_user_id", "upload_images", "user_id", True),
+    ("ix_upload_images_uploaded_at", "upload_images", "uploaded_at", False),
+)
+
+
+def has_index(table: str, name: str) -> bool:
+    if context.is_offline_mode():
+        return False  # --sql では DB を調べられないため常に作成する
+    return name in {index["name"] for index in sa.inspect(op.get_bind()).get_indexes(table)}
+
+
+def upgrade() -> None:
+    for name, table, column, _ in INDEXES:
+        if not has_index(table, name):
+            op.create_index(name, table, [column])
+
+
+def downgrade() -> None:
+    mysql = op.get_bind().dialect.name == "mysql"
+    for name, table, _, foreign_key in reversed(INDEXES):
+        if mysql and foreign_key:
+            continue
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,32 @@
+"""情報検証の結果を保存するテーブル
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-19
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "story_validations",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("image_id", sa.Integer(), nullable=False),
+        sa.Column("fingerprint", sa.String(length=64), nullable=False),
+        sa.Column("result", sa.JSON(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), server_default=sa.func.now(), nullable=False),
+        sa.ForeignKeyConstraint(["image_id"], ["upload_images.id"]),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("image_id", "fingerprint", name="uq_story_validations_image_fingerprint"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("story_validations")
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+質問バンク再構築スクリプト
+
+story_questions テーブルに蓄積された質問から質問バンク（JSON）を作り直す。
+"""
+
+import argparse
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.database.session import ReadSessionLocal
+from app.models import user as user_models
+from app.models import story_answer as story_answer_models
+from app.services.question_bank import QuestionBank, DEFAULT_BANK_PATH
+
+def build_question_bank(output: Path, max_per_key: int):
+    """DBから質問バンクを構築して保存"""
+    db = ReadSessionLocal()
+    try:
+        bank = QuestionBank.build_from_db(db, max_per_key=max_per_key)
+    finally:
+        db.close()
+
+    if not bank.elements and not bank.tags:
+        print("❌ 質問が見つからないため、質問バンクを更新しませんでした")
+        return
+
+    bank.save(output)
+    print(f"✅ 質問バンクを保存しました: {output} (要素: {len(bank.elements)}, タグ: {len(bank.tags)})")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="story_questions から質問バンクを再構築")
+    parser.add_argument("--output", type=Path, default=DEFAULT_BANK_PATH, help="出力先 JSON ファイル")
+    parser.add_argument("--max-per-key", type=int, default=3, help="キーごとに残す質問数")
+    args = parser.parse_args()
+    build_question_bank(args.output, args.max_per_key)
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+類似画像インデックス再構築スクリプト
+
+upload_images.meta_json の解析結果から類似画像インデックス（追記ログ）を作り直す。
+"""
+
+import argparse
+import json
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.database.session import ReadSessionLocal
+from app.models import user as user_models
+from app.models import story_answer as story_answer_models
+from app.models.upload_image import UploadImage
+from app.services.similarity_index import SimilarityIndex, DEFAULT_INDEX_PATH
+
+def build_similarity_index(output: Path):
+    """DBから類似画像インデックスを構築して保存"""
+    index = SimilarityIndex(output)
+    db = ReadSessionLocal()
+    try:
+        rows = (
+            db.query(UploadImage.id, UploadImage.meta_json)
+            .filter(UploadImage.meta_json.isnot(None))
+            .yield_per(1000)
+        )
+        for image_id, meta_json in rows:
+            try:
+                tags = json.loads(meta_json).get("tags", [])
+            except (ValueError, AttributeError):
+                continue
+            index.add(image_id, tags, persist=False)
+    finally:
+        db.close()
+
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.touch()
+    index.compact()
+    print(f"✅ 類似画像インデックスを保存しました: {output} (画像数: {len(index)})")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="upload_images から類似画像インデックスを再構築")
+    parser.add_argument("--output", type=Path, default=DEFAULT_INDEX_PATH, help="出力先 JSONL ファイル")
+    args = parser.parse_args()
+    build_similarity_index(args.output)
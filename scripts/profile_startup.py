@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+起動時間プロファイルスクリプト
+
+新しいプロセスで `import app.main` を繰り返し計測し、コールドスタート時間と
+import に時間のかかっているモジュールを表示する。--warmup を付けると
+lifespan のウォームアップ（DB・Vision・Gemini・索引）の所要時間も計測する。
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+IMPORT_SNIPPET = """
+import time
+start = time.perf_counter()
+import app.main
+print(f"IMPORT {time.perf_counter() - start:.6f}")
+"""
+
+WARMUP_SNIPPET = IMPORT_SNIPPET + """
+import asyncio
+from app.core.lifespan import warm_up
+start = time.perf_counter()
+asyncio.run(warm_up())
+print(f"WARMUP {time.perf_counter() - start:.6f}")
+"""
+
+def run_once(snippet: str, importtime: bool = False):
+    """子プロセスで計測し、(結果, stderr) を返す"""
+    command = [sys.executable]
+    if importtime:
+        command += ["-X", "importtime"]
+    command += ["-c", snippet]
+    env = dict(os.environ)
+    env.setdefault("DATABASE_URL", "sqlite://")
+    completed = subprocess.run(command, cwd=PROJECT_ROOT, env=env, capture_output=True, text=True, check=True)
+    results = {}
+    for line in completed.stdout.splitlines():
+        key, _, value = line.partition(" ")
+        if key in ("IMPORT", "WARMUP"):
+            results[key] = float(value)
+    return results, completed.stderr
+
+def slowest_modules(importtime_log: str, limit: int):
+    """-X importtime の出力から累積時間の大きいトップレベル近くのモジュールを抽出"""
+    rows = []
+    for line in importtime_log.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, cumulative_us, name = line.replace("import time:", "").split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        if depth <= 2:
+            rows.append((int(cumulative_us), name.strip()))
+    rows.sort(reverse=True)
+    return rows[:limit]
+
+def main():
+    parser = argparse.ArgumentParser(description="コールドスタート時間の計測")
+    parser.add_argument("--runs", type=int, default=5, help="計測回数")
+    parser.add_argument("--top", type=int, default=15, help="表示するモジュール数")
+    parser.add_argument("--warmup", action="store_true", help="lifespan のウォームアップ時間も計測")
+    args = parser.parse_args()
+
+    snippet = WARMUP_SNIPPET if args.warmup else IMPORT_SNIPPET
+    samples = [run_once(snippet)[0] for _ in range(args.runs)]
+
+    imports = [sample["IMPORT"] for sample in samples]
+    print(f"import app.main: 中央値 {statistics.median(imports) * 1000:.0f} ms "
+          f"(最小 {min(imports) * 1000:.0f} ms / 最大 {max(imports) * 1000:.0f} ms, {args.runs} 回)")
+    if args.warmup:
+        warmups = [sample["WARMUP"] for sample in samples]
+        print(f"ウォームアップ: 中央値 {statistics.median(warmups) * 1000:.0f} ms")
+
+    _, log = run_once(IMPORT_SNIPPET, importtime=True)
+    print(f"\n累積 import 時間の上位 {args.top} モジュール:")
+    for cumulative_us, name in slowest_modules(log, args.top):
+        print(f"  {cumulative_us / 1000:8.1f} ms  {name}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+ストレージ保守スクリプト
+
+uploads ディレクトリを走査して DB に行のない孤立ファイルを削除し、
+使用量が上限を超える場合は派生ファイル（描画済みのページ・書き出しのキャッシュ）を古い順に削除する。
+"""
+
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.models import user as user_models
+from app.models import book as book_models
+from app.models import story_answer as story_answer_models
+from app.services.storage_maintenance import storage_maintenance
+
+def run_storage_maintenance(dry_run: bool, grace, quota_mb, min_age, as_json: bool):
+    """保守を実行して結果を表示"""
+    quota = None if quota_mb is None else int(quota_mb * 1024 * 1024)
+    report = storage_maintenance.run(dry_run=dry_run, grace=grace, quota=quota, min_age=min_age)
+
+    if as_json:
+        print(json.dumps(report.to_dict(), ensure_ascii=False, indent=2))
+        return
+
+    mb = lambda value: f"{value / 1024 / 1024:.1f}MB"
+    print(f"{'🔍 dry run（削除していません）' if dry_run else '✅ ストレージ保守が完了しました'} ({report.elapsed:.2f}秒)")
+    print(f"  使用量: {report.files} ファイル / {mb(report.bytes)} "
+          f"({', '.join(f'{area} {mb(usage)}' for area, usage in report.usage.items())})")
+    print(f"  孤立ファイル: {report.orphans} 件 / {mb(report.orphan_bytes)}")
+    print(f"  容量制限で削除: {report.evicted} 件 / {mb(report.evicted_bytes)}")
+    if report.over_quota:
+        print(f"❌ 上限 {mb(report.quota)} を超えています（元画像は削除しません）")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="uploads の孤立ファイル削除と容量制限")
+    parser.add_argument("--dry-run", action="store_true", help="削除せずに集計だけ行う")
+    parser.add_argument("--grace", type=float, help="孤立ファイルを削除するまでの猶予（秒。未指定の場合は STORAGE_ORPHAN_GRACE）")
+    parser.add_argument("--quota-mb", type=float, help="使用量の上限（MB。0 は無制限。未指定の場合は STORAGE_QUOTA_BYTES）")
+    parser.add_argument("--min-age", type=float, help="容量制限で削除しない、最近使われた派生ファイルの経過時間（秒）")
+    parser.add_argument("--json", action="store_true", help="結果を JSON で出力")
+    args = parser.parse_args()
+    run_storage_maintenance(args.dry_run, args.grace, args.quota_mb, args.min_age, args.json)